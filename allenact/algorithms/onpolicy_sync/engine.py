@@ -60,6 +60,7 @@ from allenact.utils.experiment_utils import (
     set_deterministic_cudnn,
     ScalarMeanTracker,
 )
+from allenact.utils.prefetch_utils import PrefetchingIterator
 from allenact.utils.system import get_logger
 from allenact.utils.tensor_utils import (
     batch_observations,
@@ -170,6 +171,7 @@ class OnPolicyRLEngine(object):
 
         self.sensor_preprocessor_graph = None
         self.actor_critic: Optional[ActorCriticModel] = None
+        self.compiled_action_space: Optional[su.CompiledSpace] = None
         if self.num_samplers > 0:
             create_model_kwargs = {}
             if self.machine_params.sensor_preprocessor_graph is not None:
@@ -184,6 +186,9 @@ class OnPolicyRLEngine(object):
             self.actor_critic = cast(
                 ActorCriticModel, self.config.create_model(**create_model_kwargs),
             ).to(self.device)
+            self.compiled_action_space = su.CompiledSpace(
+                self.actor_critic.action_space
+            )
 
         if initial_model_state_dict is not None:
             if isinstance(initial_model_state_dict, int):
@@ -442,7 +447,7 @@ class OnPolicyRLEngine(object):
                 step_observation,
                 memory,
                 prev_actions,
-                rollouts.masks[rollouts.step : rollouts.step + 1],
+                rollouts.pick_masks_step(rollouts.step),
             )
 
             distr = actor_critic_output.distributions
@@ -516,7 +521,7 @@ class OnPolicyRLEngine(object):
         )
 
         # Flatten actions
-        flat_actions = su.flatten(self.actor_critic.action_space, actions)
+        flat_actions = self.compiled_action_space.flatten(actions)
 
         assert len(flat_actions.shape) == 3, (
             "Distribution samples must include step and task sampler dimensions [step, sampler, ...]. The simplest way"
@@ -526,7 +531,7 @@ class OnPolicyRLEngine(object):
 
         # Convert flattened actions into list of actions and send them
         outputs: List[RLStepResult] = self.vector_tasks.step(
-            su.action_list(self.actor_critic.action_space, flat_actions)
+            self.compiled_action_space.action_list(flat_actions)
         )
 
         # Save after task completion metrics
@@ -576,7 +581,7 @@ class OnPolicyRLEngine(object):
             observations=self._preprocess_observations(batch)
             if len(keep) > 0
             else batch,
-            memory=self._active_memory(memory, keep),
+            memory=self._active_memory(memory, keep) if npaused > 0 else memory,
             actions=flat_actions[0, keep],
             action_log_probs=actor_critic_output.distributions.log_prob(actions)[
                 0, keep
@@ -615,6 +620,21 @@ class OnPolicyRLEngine(object):
                 else:
                     raise NotImplementedError()
 
+        if (
+            "_offpolicy_data_iterator" in self.__dict__
+            and self._offpolicy_data_iterator is not None
+        ):
+            try:
+                self.close_offpolicy_iterator(self._offpolicy_data_iterator)
+            except Exception as e:
+                logif(
+                    "{} worker {} Exception raised when closing the off-policy data iterator:".format(
+                        self.mode, self.worker_id
+                    )
+                )
+                logif(e)
+            self._offpolicy_data_iterator = None
+
         if "_vector_tasks" in self.__dict__ and self._vector_tasks is not None:
             try:
                 logif(
@@ -740,6 +760,8 @@ class OnPolicyTrainer(OnPolicyRLEngine):
             self.distributed_preemption_threshold = 1.0
             self.offpolicy_epoch_done = None
 
+        self._offpolicy_data_iterator: Optional[Iterator] = None
+
         # Keeping track of training state
         self.tracking_info: Dict[str, List] = defaultdict(lambda: [])
         self.former_steps: Optional[int] = None
@@ -979,6 +1001,7 @@ class OnPolicyTrainer(OnPolicyRLEngine):
                 adv_mean=adv_mean,
                 adv_std=adv_std,
                 num_mini_batch=self.training_pipeline.current_stage.num_mini_batch,
+                bptt_chunk_length=self.training_pipeline.current_stage.bptt_chunk_length,
             )
 
             for bit, batch in enumerate(data_generator):
@@ -1012,6 +1035,12 @@ class OnPolicyTrainer(OnPolicyRLEngine):
                         step_count=self.step_count,
                         batch=batch,
                         actor_critic_output=actor_critic_output,
+                        epoch=e,
+                        num_epochs=(
+                            loss_update_repeats
+                            if loss_update_repeats is not None
+                            else self.training_pipeline.current_stage.update_repeats
+                        ),
                     )
 
                     per_epoch_info = {}
@@ -1102,6 +1131,15 @@ class OnPolicyTrainer(OnPolicyRLEngine):
         )
 
         offpolicy_iterator = data_iterator_builder(**kwargs)
+        if stage.offpolicy_component.num_prefetch_batches > 0:
+            offpolicy_iterator = PrefetchingIterator(
+                offpolicy_iterator,
+                num_prefetch=stage.offpolicy_component.num_prefetch_batches,
+                device=self.device,
+            )
+
+        # Closed (with any background thread of its own) when the engine is
+        self._offpolicy_data_iterator = offpolicy_iterator
 
         stage.offpolicy_memory.clear()
         if stage.offpolicy_epochs is None:
@@ -1115,6 +1153,14 @@ class OnPolicyTrainer(OnPolicyRLEngine):
 
         return offpolicy_iterator
 
+    @staticmethod
+    def close_offpolicy_iterator(data_iterator: Iterator):
+        """Closes `data_iterator` (e.g. stopping its prefetching threads), if it
+        can be closed."""
+        close = getattr(data_iterator, "close", None)
+        if callable(close):
+            close()
+
     def backprop_step(
         self, total_loss: torch.Tensor, local_to_global_batch_size_ratio: float = 1.0,
     ):
@@ -1176,10 +1222,12 @@ class OnPolicyTrainer(OnPolicyRLEngine):
                     batch = None
 
             if batch is None:
+                self.close_offpolicy_iterator(data_iterator)
                 data_iterator = self.make_offpolicy_iterator(data_iterator_builder)
                 # TODO: (batch, bsize) from iterator instead of waiting for the loss?
                 batch = next(data_iterator)
 
+            # No-op for batches already moved to `self.device` by a `PrefetchingIterator`
             batch = to_device_recursively(batch, device=self.device, inplace=True)
 
             info: Dict[str, float] = dict()
@@ -1395,10 +1443,8 @@ class OnPolicyTrainer(OnPolicyRLEngine):
                 actor_critic_output, _ = self.actor_critic(
                     observations=rollouts.pick_observation_step(-1),
                     memory=rollouts.pick_memory_step(-1),
-                    prev_actions=su.unflatten(
-                        self.actor_critic.action_space, rollouts.prev_actions[-1:]
-                    ),
-                    masks=rollouts.masks[-1:],
+                    prev_actions=rollouts.pick_prev_actions_step(-1),
+                    masks=rollouts.pick_masks_step(-1),
                 )
 
             if self.is_distributed:
@@ -1498,6 +1544,11 @@ class OnPolicyTrainer(OnPolicyRLEngine):
                     actor_critic=self.actor_critic
                     if isinstance(self.actor_critic, ActorCriticModel)
                     else cast(ActorCriticModel, self.actor_critic.module),
+                    # Truncated BPTT restarts from intermediate memory
+                    only_store_first_and_last_in_memory=all(
+                        stage.bptt_chunk_length is None
+                        for stage in self.training_pipeline.pipeline_stages
+                    ),
                 )
             )
 
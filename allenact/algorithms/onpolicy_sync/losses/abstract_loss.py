@@ -35,7 +35,8 @@ class AbstractActorCriticLoss(Loss):
             `RolloutStorage.recurrent_generator`.
         actor_critic_output : The output of calling an ActorCriticModel on the observations in `batch`.
         args : Extra args.
-        kwargs : Extra kwargs.
+        kwargs : Extra kwargs. When training, the engine provides the `epoch` (i.e. update repeat) in which the
+            loss is computed and the number of epochs `num_epochs` for which it is computed on every rollout.
 
         # Returns
 
@@ -3,6 +3,8 @@
 TODO: this code is not supported as it currently lacks an implementation for recurrent models.
 """
 import math
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
 
 import torch
 import torch.nn as nn
@@ -13,44 +15,39 @@ from allenact.base_abstractions.distributions import AddBias
 
 
 # TODO: In order to make this code faster:
-# 1) Implement _extract_patches as a single cuda kernel
-# 2) Compute QR decomposition in a separate process
-# 3) Actually make a general KFAC optimizer so it fits PyTorch
+# 1) Actually make a general KFAC optimizer so it fits PyTorch
 
 
 def _extract_patches(x, kernel_size, stride, padding):
-    if padding[0] + padding[1] > 0:
-        x = F.pad(
-            x, [padding[1], padding[1], padding[0], padding[0]]
-        ).data  # Actually check dims
-    x = x.unfold(2, kernel_size[0], stride[0])
-    x = x.unfold(3, kernel_size[1], stride[1])
-    x = x.transpose_(1, 2).transpose_(2, 3).contiguous()
-    x = x.view(x.size(0), x.size(1), x.size(2), x.size(3) * x.size(4) * x.size(5))
-    return x
-
-
-def compute_cov_a(a, classname, layer_info, fast_cnn):
+    # `[batch, channels * kernel_h * kernel_w, out_h * out_w]` patches (in a
+    # single op instead of two `unfold`s and a transposed copy)
+    patches = F.unfold(x, kernel_size, padding=padding, stride=stride)
+    out_h = (x.size(2) + 2 * padding[0] - kernel_size[0]) // stride[0] + 1
+    out_w = (x.size(3) + 2 * padding[1] - kernel_size[1]) // stride[1] + 1
+    return patches.transpose(1, 2).reshape(x.size(0), out_h, out_w, patches.size(1))
+
+
+def compute_cov_a(a, classname, layer_info, fast_cnn, diagonal=False):
     batch_size = a.size(0)
 
     if classname == "Conv2d":
         if fast_cnn:
             a = _extract_patches(a, *layer_info)
-            a = a.view(a.size(0), -1, a.size(-1))
+            a = a.reshape(a.size(0), -1, a.size(-1))
             a = a.mean(1)
         else:
             a = _extract_patches(a, *layer_info)
-            a = a.view(-1, a.size(-1)).div_(a.size(1)).div_(a.size(2))
+            a = a.reshape(-1, a.size(-1)).div_(a.size(1)).div_(a.size(2))
     elif classname == "AddBias":
-        is_cuda = a.is_cuda
-        a = torch.ones(a.size(0), 1)
-        if is_cuda:
-            a = a.cuda()
+        a = torch.ones(a.size(0), 1, device=a.device)
+
+    if diagonal:
+        return (a * (a / batch_size)).sum(0)
 
     return a.t() @ (a / batch_size)
 
 
-def compute_cov_g(g, classname, layer_info, fast_cnn):
+def compute_cov_g(g, classname, layer_info, fast_cnn, diagonal=False):
     batch_size = g.size(0)
 
     if classname == "Conv2d":
@@ -65,6 +62,10 @@ def compute_cov_g(g, classname, layer_info, fast_cnn):
         g = g.sum(-1)
 
     g_ = g * batch_size
+
+    if diagonal:
+        return (g_ * (g_ / g.size(0))).sum(0)
+
     return g_.t() @ (g_ / g.size(0))
 
 
@@ -75,6 +76,34 @@ def update_running_stat(aa, m_aa, momentum):
     m_aa *= 1 - momentum
 
 
+def _symeig(m: torch.Tensor) -> Tuple[torch.Tensor, torch.Tensor]:
+    # `torch.symeig` is deprecated in favour of `torch.linalg.eigh` (torch>=1.8)
+    if hasattr(torch, "linalg") and hasattr(torch.linalg, "eigh"):
+        return torch.linalg.eigh(m)
+    return torch.symeig(m, eigenvectors=True)
+
+
+def _factor_eig(
+    cov: torch.Tensor, approximation: Optional[str], low_rank_dim: int
+) -> Tuple[Optional[torch.Tensor], torch.Tensor]:
+    """Eigendecomposition `(Q, d)` of a Kronecker factor with (running)
+    covariance `cov`.
+
+    With a `"diagonal"` approximation `cov` only holds the diagonal of the
+    covariance (and `Q` is `None`), with a `"low_rank"` one only the (approximate)
+    top `low_rank_dim` eigenvectors and eigenvalues are returned.
+    """
+    if approximation == "diagonal":
+        q, d = None, cov.clone()
+    elif approximation == "low_rank" and low_rank_dim < cov.size(0):
+        q, d, _ = torch.svd_lowrank(cov, q=low_rank_dim)
+    else:
+        d, q = _symeig(cov)
+
+    d.mul_((d > 1e-6).float())
+    return q, d
+
+
 class SplitBias(nn.Module):
     def __init__(self, module):
         super(SplitBias, self).__init__()
@@ -89,6 +118,46 @@ class SplitBias(nn.Module):
 
 
 class KFACOptimizer(optim.Optimizer):  # type: ignore
+    """KFAC optimizer (as used by ACKTR).
+
+    Besides the running Kronecker factors (updated every `Ts` steps), the
+    eigendecompositions of the factors and the damped eigenvalue products used
+    to precondition the gradients are cached and only recomputed every `Tf`
+    (i.e. `Tinv`) steps. As these updates dominate the cost of an optimizer
+    step, they can be spread over the steps of the period
+    (`stagger_inverse_updates`) and/or computed on a background thread
+    (`async_inverse_updates`), in which case the last available (possibly stale)
+    decomposition of a layer is used until the new one is ready. Factors larger
+    than `large_factor_dim` can moreover use a `large_factor_approximation`,
+    either `"diagonal"` (only the diagonal statistics of the factor are
+    accumulated) or `"low_rank"` (only the top `low_rank_dim` eigenvectors of
+    the factor are computed, the remaining eigenvalues are treated as zero).
+
+    # Parameters
+
+    model : The model to optimize (its biases are split into `AddBias` layers).
+    lr : The learning rate.
+    momentum : The momentum of the inner SGD optimizer.
+    stat_decay : The decay of the running Kronecker factors.
+    kl_clip : The trust region (KL clipping) parameter.
+    damping : The Tikhonov damping.
+    weight_decay : The weight decay.
+    fast_cnn : Whether to average the input patches of `Conv2d` layers over
+        spatial locations before computing their covariance.
+    Ts : Period (in steps) of the statistics updates.
+    Tf : Period (in steps) of the inverse (eigendecomposition) updates.
+    stagger_inverse_updates : Whether to spread the inverse updates of the
+        different layers over the `Tf` steps of the period (after the initial
+        step, which computes all of them) instead of updating all layers at once.
+    async_inverse_updates : Whether to compute the inverse updates on a
+        background thread. Call `close` to stop it.
+    large_factor_approximation : Approximation (`"diagonal"` or `"low_rank"`)
+        of the factors larger than `large_factor_dim`, `None` to use exact
+        factors for all layers.
+    large_factor_dim : See `large_factor_approximation`.
+    low_rank_dim : The rank of the `"low_rank"` approximation.
+    """
+
     def __init__(
         self,
         model,
@@ -101,7 +170,14 @@ class KFACOptimizer(optim.Optimizer):  # type: ignore
         fast_cnn=False,
         Ts=1,
         Tf=10,
+        stagger_inverse_updates: bool = False,
+        async_inverse_updates: bool = False,
+        large_factor_approximation: Optional[str] = None,
+        large_factor_dim: int = 1024,
+        low_rank_dim: int = 64,
     ):
+        assert large_factor_approximation in [None, "diagonal", "low_rank"]
+
         defaults = dict()
 
         def split_bias(module):
@@ -129,6 +205,9 @@ class KFACOptimizer(optim.Optimizer):  # type: ignore
         self.m_aa, self.m_gg = {}, {}
         self.Q_a, self.Q_g = {}, {}
         self.d_a, self.d_g = {}, {}
+        # Cached `d_g d_a^T + la` for every module and the damping `la` used
+        self.eig_denominators: Dict[nn.Module, torch.Tensor] = {}
+        self.eig_dampings: Dict[nn.Module, float] = {}
 
         self.momentum = momentum
         self.stat_decay = stat_decay
@@ -143,6 +222,15 @@ class KFACOptimizer(optim.Optimizer):  # type: ignore
         self.Ts = Ts
         self.Tf = Tf
 
+        self.stagger_inverse_updates = stagger_inverse_updates
+        self.async_inverse_updates = async_inverse_updates
+        self.large_factor_approximation = large_factor_approximation
+        self.large_factor_dim = large_factor_dim
+        self.low_rank_dim = low_rank_dim
+
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._futures: Dict[nn.Module, Future] = {}
+
         self.optim = optim.SGD(
             model.parameters(), lr=self.lr * (1 - self.momentum), momentum=self.momentum
         )
@@ -155,7 +243,11 @@ class KFACOptimizer(optim.Optimizer):  # type: ignore
                 layer_info = (module.kernel_size, module.stride, module.padding)
 
             aa = compute_cov_a(
-                input_to_save[0].data, classname, layer_info, self.fast_cnn
+                input_to_save[0].data,
+                classname,
+                layer_info,
+                self.fast_cnn,
+                diagonal=self._factor_approximation(module, "a") == "diagonal",
             )
 
             # Initialize buffers
@@ -173,7 +265,11 @@ class KFACOptimizer(optim.Optimizer):  # type: ignore
                 layer_info = (module.kernel_size, module.stride, module.padding)
 
             gg = compute_cov_g(
-                grad_output[0].data, classname, layer_info, self.fast_cnn
+                grad_output[0].data,
+                classname,
+                layer_info,
+                self.fast_cnn,
+                diagonal=self._factor_approximation(module, "g") == "diagonal",
             )
 
             # Initialize buffers
@@ -194,11 +290,104 @@ class KFACOptimizer(optim.Optimizer):  # type: ignore
                 module.register_forward_pre_hook(self._save_input)
                 module.register_backward_hook(self._save_grad_output)
 
+    def _factor_approximation(self, module, factor: str) -> Optional[str]:
+        p = next(module.parameters())
+        # Weights are `[out, in, ...]` (and biases `[out, 1]`)
+        dim = p.size(0) if factor == "g" else p[0].numel()
+        if dim > self.large_factor_dim:
+            return self.large_factor_approximation
+        return None
+
+    def _compute_eigs(
+        self, module, m_aa: torch.Tensor, m_gg: torch.Tensor
+    ) -> Tuple[
+        Optional[torch.Tensor], torch.Tensor, Optional[torch.Tensor], torch.Tensor
+    ]:
+        q_a, d_a = _factor_eig(
+            m_aa, self._factor_approximation(module, "a"), self.low_rank_dim
+        )
+        q_g, d_g = _factor_eig(
+            m_gg, self._factor_approximation(module, "g"), self.low_rank_dim
+        )
+        return q_a, d_a, q_g, d_g
+
+    def _set_eigs(self, module, eigs) -> None:
+        self.Q_a[module], self.d_a[module], self.Q_g[module], self.d_g[module] = eigs
+        # Invalidate the cached denominator
+        self.eig_dampings.pop(module, None)
+
+    def _inverse_update_due(self, i: int) -> bool:
+        offset = 0
+        if self.stagger_inverse_updates:
+            offset = (i * self.Tf) // len(self.modules)
+        return (self.steps + offset) % self.Tf == 0
+
+    def _update_eigs(self, i: int, m) -> None:
+        future = self._futures.get(m)
+        if future is not None and future.done():
+            self._set_eigs(m, future.result())
+            del self._futures[m]
+            future = None
+
+        if m not in self.d_a:
+            # No decomposition to fall back on yet, compute it right away
+            if future is not None:
+                self._set_eigs(m, future.result())
+                del self._futures[m]
+            else:
+                self._set_eigs(m, self._compute_eigs(m, self.m_aa[m], self.m_gg[m]))
+        elif self._inverse_update_due(i):
+            if not self.async_inverse_updates:
+                self._set_eigs(m, self._compute_eigs(m, self.m_aa[m], self.m_gg[m]))
+            elif future is None:
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=1)
+                # The running statistics are updated in place, so decompose copies
+                self._futures[m] = self._executor.submit(
+                    self._compute_eigs, m, self.m_aa[m].clone(), self.m_gg[m].clone()
+                )
+
+    def _precondition(self, m, p_grad_mat: torch.Tensor, la: float) -> torch.Tensor:
+        q_a, d_a, q_g, d_g = self.Q_a[m], self.d_a[m], self.Q_g[m], self.d_g[m]
+
+        if self.eig_dampings.get(m) != la:
+            self.eig_denominators[m] = d_g.unsqueeze(1) * d_a.unsqueeze(0) + la
+            self.eig_dampings[m] = la
+
+        # Low rank factors only span part of the space, along the remaining
+        # eigenvectors (with zero eigenvalues) the gradient is scaled by `1 / la`
+        low_rank = (q_a is not None and q_a.size(1) < q_a.size(0)) or (
+            q_g is not None and q_g.size(1) < q_g.size(0)
+        )
+
+        v1 = p_grad_mat
+        if q_g is not None:
+            v1 = q_g.t() @ v1
+        if q_a is not None:
+            v1 = v1 @ q_a
+        v2 = v1 / self.eig_denominators[m]
+        if low_rank:
+            v2 = v2 - v1 / la
+        v = v2
+        if q_g is not None:
+            v = q_g @ v
+        if q_a is not None:
+            v = v @ q_a.t()
+        if low_rank:
+            v = v + p_grad_mat / la
+        return v
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self._futures.clear()
+
     def step(self, closure=None):
         # Add weight decay
         if self.weight_decay > 0:
             for p in self.model.parameters():
-                p.grad.data.add_(self.weight_decay, p.data)
+                p.grad.data.add_(p.data, alpha=self.weight_decay)
 
         updates = {}
         for i, m in enumerate(self.modules):
@@ -210,23 +399,14 @@ class KFACOptimizer(optim.Optimizer):  # type: ignore
 
             la = self.damping + self.weight_decay
 
-            if self.steps % self.Tf == 0:
-                # My asynchronous implementation exists, I will add it later.
-                # Experimenting with different ways to this in PyTorch.
-                self.d_a[m], self.Q_a[m] = torch.symeig(self.m_aa[m], eigenvectors=True)
-                self.d_g[m], self.Q_g[m] = torch.symeig(self.m_gg[m], eigenvectors=True)
-
-                self.d_a[m].mul_((self.d_a[m] > 1e-6).float())
-                self.d_g[m].mul_((self.d_g[m] > 1e-6).float())
+            self._update_eigs(i, m)
 
             if classname == "Conv2d":
                 p_grad_mat = p.grad.data.view(p.grad.data.size(0), -1)
             else:
                 p_grad_mat = p.grad.data
 
-            v1 = self.Q_g[m].t() @ p_grad_mat @ self.Q_a[m]
-            v2 = v1 / (self.d_g[m].unsqueeze(1) * self.d_a[m].unsqueeze(0) + la)
-            v = self.Q_g[m] @ v2 @ self.Q_a[m].t()
+            v = self._precondition(m, p_grad_mat, la)
 
             v = v.view(p.grad.data.size())
             updates[p] = v
@@ -1,5 +1,6 @@
 """Defining the PPO loss for actor critic type models."""
 
+import functools
 from typing import Dict, Optional, Callable, cast, Tuple
 
 import torch
@@ -12,6 +13,269 @@ from allenact.base_abstractions.distributions import CategoricalDistr
 from allenact.base_abstractions.misc import ActorCriticOutput
 
 
+def _add_trailing_dims(t: torch.Tensor, like: torch.Tensor) -> torch.Tensor:
+    assert t.dim() <= like.dim()
+    return t.view(list(t.shape) + [1] * (like.dim() - t.dim()))
+
+
+def _fused_ppo_loss(
+    values: torch.Tensor,
+    logits: Optional[torch.Tensor],
+    action_log_probs: Optional[torch.Tensor],
+    dist_entropy: Optional[torch.Tensor],
+    actions: Optional[torch.Tensor],
+    old_action_log_probs: torch.Tensor,
+    old_values: torch.Tensor,
+    returns: torch.Tensor,
+    advantages: torch.Tensor,
+    clip_param: float,
+    value_loss_coef: float,
+    entropy_coef: float,
+    use_clipped_value_loss: bool,
+    logits_min: float,
+) -> Tuple[
+    torch.Tensor,
+    torch.Tensor,
+    torch.Tensor,
+    torch.Tensor,
+    torch.Tensor,
+    torch.Tensor,
+    torch.Tensor,
+    torch.Tensor,
+    torch.Tensor,
+    Optional[torch.Tensor],
+]:
+    """Computes the same losses as `PPO.loss_per_step` followed by the
+    reductions of `PPO.loss` (with the same operations) along with their
+    derivatives.
+
+    Either `action_log_probs` and `dist_entropy` or the (normalized) `logits` of a
+    categorical distribution and the `actions` should be given, the log
+    probabilities and entropies being computed as in `torch.distributions.Categorical`
+    in the latter case (`logits_min` being the smallest finite value of the dtype of
+    the logits).
+
+    # Returns
+    The total, value, action and entropy losses, the ratios, clamped ratios and used
+    ratios, the derivatives of the action loss w.r.t. the (broadcast) log probabilities,
+    of the value loss w.r.t. the (broadcast) values and, if `logits` were given, of the
+    entropies w.r.t. the logits.
+    """
+    entropy_logits_grads: Optional[torch.Tensor] = None
+    if logits is not None:
+        assert actions is not None
+        if actions.dim() == logits.dim():  # actions with a trailing singleton dim
+            action_log_probs = logits.gather(-1, actions.long())
+        else:
+            action_log_probs = logits.gather(-1, actions.long().unsqueeze(-1)).squeeze(
+                -1
+            )
+        probs = torch.softmax(logits, dim=-1)
+        clamped_logits = torch.clamp(logits, min=logits_min)
+        entropies = -(clamped_logits * probs).sum(-1)
+        dist_entropy = entropies
+        entropy_logits_grads = -probs * (
+            (logits >= logits_min).to(probs.dtype)
+            + clamped_logits
+            + entropies.unsqueeze(-1)
+        )
+    assert action_log_probs is not None and dist_entropy is not None
+
+    ratio = _add_trailing_dims(
+        torch.exp(action_log_probs - old_action_log_probs), advantages
+    )
+    clamped_ratio = torch.clamp(ratio, 1.0 - clip_param, 1.0 + clip_param)
+
+    surr1 = ratio * advantages
+    surr2 = clamped_ratio * advantages
+
+    use_clamped = surr2 < surr1
+    used_surr = torch.where(use_clamped, surr2, surr1)
+    action_loss = -used_surr.mean()
+    ratio_in_range = (ratio >= 1.0 - clip_param) & (ratio <= 1.0 + clip_param)
+    action_loss_grads = (
+        -(advantages * ratio)
+        * torch.where(
+            use_clamped, ratio_in_range.to(ratio.dtype), torch.ones_like(ratio)
+        )
+        / used_surr.numel()
+    )
+
+    if use_clipped_value_loss:
+        value_diffs = values - old_values
+        value_pred_clipped = old_values + value_diffs.clamp(-clip_param, clip_param)
+        value_losses = (values - returns).pow(2)
+        value_losses_clipped = (value_pred_clipped - returns).pow(2)
+        value_loss = (0.5 * torch.max(value_losses, value_losses_clipped)).mean()
+
+        unclipped_grads = values - returns
+        clipped_grads = (value_pred_clipped - returns) * (
+            (value_diffs >= -clip_param) & (value_diffs <= clip_param)
+        ).to(values.dtype)
+        value_loss_grads = torch.where(
+            value_losses > value_losses_clipped,
+            unclipped_grads,
+            torch.where(
+                value_losses < value_losses_clipped,
+                clipped_grads,
+                0.5 * (unclipped_grads + clipped_grads),
+            ),
+        )
+    else:
+        value_loss = (0.5 * (returns - values).pow(2)).mean()
+        value_loss_grads = values - returns
+    value_loss_grads = value_loss_grads / value_loss_grads.numel()
+
+    entropy_loss = (-_add_trailing_dims(dist_entropy, advantages)).mean()
+
+    total_loss = (
+        value_loss * value_loss_coef + action_loss + entropy_loss * entropy_coef
+    )
+
+    return (
+        total_loss,
+        value_loss,
+        action_loss,
+        entropy_loss,
+        ratio,
+        clamped_ratio,
+        torch.where(use_clamped, clamped_ratio, ratio),
+        action_loss_grads,
+        value_loss_grads,
+        entropy_logits_grads,
+    )
+
+
+@functools.lru_cache(1)
+def _scripted_fused_ppo_loss():
+    # Only compiled when first used
+    return torch.jit.script(_fused_ppo_loss)
+
+
+class _FusedPPOLoss(torch.autograd.Function):
+    """The PPO losses (see `_fused_ppo_loss`), as a single autograd node
+    whose backward pass uses the derivatives computed along with the
+    losses."""
+
+    @staticmethod
+    def forward(  # type: ignore
+        ctx,
+        values: torch.Tensor,
+        logits: Optional[torch.Tensor],
+        action_log_probs: Optional[torch.Tensor],
+        dist_entropy: Optional[torch.Tensor],
+        actions: Optional[torch.Tensor],
+        old_action_log_probs: torch.Tensor,
+        old_values: torch.Tensor,
+        returns: torch.Tensor,
+        advantages: torch.Tensor,
+        clip_param: float,
+        value_loss_coef: float,
+        entropy_coef: float,
+        use_clipped_value_loss: bool,
+    ):
+        (
+            total_loss,
+            value_loss,
+            action_loss,
+            entropy_loss,
+            ratio,
+            clamped_ratio,
+            used_ratio,
+            action_loss_grads,
+            value_loss_grads,
+            entropy_logits_grads,
+        ) = _scripted_fused_ppo_loss()(
+            values=values,
+            logits=logits,
+            action_log_probs=action_log_probs,
+            dist_entropy=dist_entropy,
+            actions=actions,
+            old_action_log_probs=old_action_log_probs,
+            old_values=old_values,
+            returns=returns,
+            advantages=advantages,
+            clip_param=clip_param,
+            value_loss_coef=value_loss_coef,
+            entropy_coef=entropy_coef,
+            use_clipped_value_loss=use_clipped_value_loss,
+            logits_min=(
+                float(torch.finfo(logits.dtype).min) if logits is not None else 0.0
+            ),
+        )
+
+        if logits is not None:
+            log_probs_shape = actions.shape
+            entropy_shape = logits.shape[:-1]
+        else:
+            log_probs_shape = action_log_probs.shape
+            entropy_shape = dist_entropy.shape
+        ctx.log_probs_shape = log_probs_shape
+        ctx.broadcast_log_probs_shape = tuple(log_probs_shape) + (1,) * (
+            advantages.dim() - len(log_probs_shape)
+        )
+        ctx.entropy_shape = entropy_shape
+        ctx.values_shape = values.shape
+        ctx.value_loss_coef = value_loss_coef
+        ctx.entropy_coef = entropy_coef
+        ctx.save_for_backward(
+            action_loss_grads, value_loss_grads, entropy_logits_grads, actions
+        )
+        ctx.mark_non_differentiable(ratio, clamped_ratio, used_ratio)
+
+        return (
+            total_loss,
+            value_loss,
+            action_loss,
+            entropy_loss,
+            ratio,
+            clamped_ratio,
+            used_ratio,
+        )
+
+    @staticmethod
+    @torch.autograd.function.once_differentiable
+    def backward(  # type: ignore
+        ctx, total_grad, value_grad, action_grad, entropy_grad, *ratio_grads
+    ):
+        (
+            action_loss_grads,
+            value_loss_grads,
+            entropy_logits_grads,
+            actions,
+        ) = ctx.saved_tensors
+
+        # The total loss is `value_loss_coef * value + action + entropy_coef * entropy`
+        log_probs_grads = (
+            (action_loss_grads * (total_grad + action_grad))
+            .sum_to_size(ctx.broadcast_log_probs_shape)
+            .view(ctx.log_probs_shape)
+        )
+        values_grads = (
+            value_loss_grads * (ctx.value_loss_coef * total_grad + value_grad)
+        ).sum_to_size(ctx.values_shape)
+        # The entropy loss is the mean of the negated entropies
+        num_entropies = 1
+        for size in ctx.entropy_shape:
+            num_entropies *= size
+        entropy_grads = (
+            -(ctx.entropy_coef * total_grad + entropy_grad) / num_entropies
+        ).expand(ctx.entropy_shape)
+
+        no_grads = (None,) * 9
+        if entropy_logits_grads is None:
+            return (values_grads, None, log_probs_grads, entropy_grads) + no_grads
+
+        logits_grads = entropy_logits_grads * entropy_grads.unsqueeze(-1)
+        if actions.dim() == logits_grads.dim():
+            logits_grads.scatter_add_(-1, actions.long(), log_probs_grads)
+        else:
+            logits_grads.scatter_add_(
+                -1, actions.long().unsqueeze(-1), log_probs_grads.unsqueeze(-1)
+            )
+        return (values_grads, logits_grads, None, None) + no_grads
+
+
 class PPO(AbstractActorCriticLoss):
     """Implementation of the Proximal Policy Optimization loss.
 
@@ -27,6 +291,10 @@ class PPO(AbstractActorCriticLoss):
     show_ratios : If True, adds tracking for the PPO ratio (linear, clamped, and used) in each
                   epoch to be logged by the engine.
     normalize_advantage: Whether or not to use normalized advantage. Default is True.
+    use_fused_loss : If True, `loss` computes the (same) losses, and their derivatives, with a single TorchScript
+                     function and backpropagates through them as a single autograd node rather than calling
+                     `loss_per_step` and reducing its outputs. This reduces the per-operation overhead dominating
+                     the update time of small models. Subclasses overriding `loss_per_step` should not use it.
     """
 
     def __init__(
@@ -39,6 +307,7 @@ class PPO(AbstractActorCriticLoss):
         entropy_method_name: str = "entropy",
         normalize_advantage: bool = True,
         show_ratios: bool = False,
+        use_fused_loss: bool = False,
         *args,
         **kwargs
     ):
@@ -54,6 +323,7 @@ class PPO(AbstractActorCriticLoss):
         self.clip_decay = clip_decay if clip_decay is not None else (lambda x: 1.0)
         self.entropy_method_name = entropy_method_name
         self.show_ratios = show_ratios
+        self.use_fused_loss = use_fused_loss
         if normalize_advantage:
             self.adv_key = "norm_adv_targ"
         else:
@@ -134,6 +404,13 @@ class PPO(AbstractActorCriticLoss):
         *args,
         **kwargs
     ):
+        if self.use_fused_loss:
+            return self.fused_loss(
+                step_count=step_count,
+                batch=batch,
+                actor_critic_output=actor_critic_output,
+            )
+
         losses_per_step, ratio_info = self.loss_per_step(
             step_count=step_count, batch=batch, actor_critic_output=actor_critic_output,
         )
@@ -158,6 +435,77 @@ class PPO(AbstractActorCriticLoss):
 
         return result if self.show_ratios else result[:2]
 
+    def fused_loss(
+        self,
+        step_count: int,
+        batch: ObservationType,
+        actor_critic_output: ActorCriticOutput[CategoricalDistr],
+    ):
+        """Computes the same outputs as `loss` (when `use_fused_loss` is
+        False) with a single TorchScript function and autograd node."""
+        actions = cast(torch.LongTensor, batch["actions"])
+        distributions = actor_critic_output.distributions
+
+        logits: Optional[torch.Tensor] = None
+        action_log_probs: Optional[torch.Tensor] = None
+        dist_entropy: Optional[torch.Tensor] = None
+        if (
+            type(distributions) == CategoricalDistr
+            and self.entropy_method_name == "entropy"
+            and actions.shape
+            in [distributions.logits.shape[:-1], distributions.logits.shape[:-1] + (1,)]
+        ):
+            # Log probabilities and entropies (and their derivatives) are computed
+            # in the fused function
+            logits = distributions.logits
+        else:
+            action_log_probs = distributions.log_prob(actions)
+            dist_entropy = getattr(distributions, self.entropy_method_name)()
+
+        (
+            total_loss,
+            value_loss,
+            action_loss,
+            entropy_loss,
+            ratio,
+            clamped_ratio,
+            used_ratio,
+        ) = _FusedPPOLoss.apply(
+            actor_critic_output.values,
+            logits,
+            action_log_probs,
+            dist_entropy,
+            actions if logits is not None else None,
+            batch["old_action_log_probs"],
+            batch["values"],
+            batch["returns"],
+            batch[self.adv_key],
+            float(self.clip_param * self.clip_decay(step_count)),
+            float(self.value_loss_coef),
+            float(self.entropy_coef),
+            bool(self.use_clipped_value_loss),
+        )
+
+        result = (
+            total_loss,
+            {
+                "ppo_total": total_loss.item(),
+                "value": value_loss.item(),
+                "action": action_loss.item(),
+                "entropy": entropy_loss.item(),
+            },
+        )
+        if not self.show_ratios:
+            return result
+
+        return result + (
+            {
+                "ratio": float(ratio.mean().item()),
+                "ratio_clamped": float(clamped_ratio.mean().item()),
+                "ratio_used": float(used_ratio.mean().item()),
+            },
+        )
+
 
 class PPOValue(AbstractActorCriticLoss):
     """Implementation of the Proximal Policy Optimization loss.
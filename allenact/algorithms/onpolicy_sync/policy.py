@@ -35,8 +35,13 @@ class ActorCriticModel(Generic[DistributionType], nn.Module):
 
     action_space : The space of actions available to the agent. This is of type `gym.spaces.Space`.
     observation_space: The observation space expected by the agent. This is of type `gym.spaces.dict`.
+    accepts_flat_observations: If True, the rollout storage skips rebuilding nested observation dictionaries and
+        passes observations to `forward` as a one-level map keyed by flattened names (nested keys joined with
+        `RolloutStorage.FLATTEN_SEPARATOR`). Defaults to False.
     """
 
+    accepts_flat_observations: bool = False
+
     def __init__(self, action_space: gym.Space, observation_space: SpaceDict):
         """Initializer.
 
@@ -4,7 +4,17 @@
 # LICENSE file in the root directory of this source tree.
 import random
 from collections import defaultdict
-from typing import Union, List, Dict, Tuple, DefaultDict, Sequence, cast, Optional
+from typing import (
+    Union,
+    List,
+    Dict,
+    Tuple,
+    DefaultDict,
+    Sequence,
+    cast,
+    Optional,
+    Any,
+)
 
 import numpy as np
 import torch
@@ -31,10 +41,18 @@ class RolloutStorage(object):
         num_samplers: int,
         actor_critic: ActorCriticModel,
         only_store_first_and_last_in_memory: bool = True,
+        sampler_compaction_threshold: float = 0.5,
     ):
         self.num_steps = num_steps
         self.only_store_first_and_last_in_memory = only_store_first_and_last_in_memory
 
+        # Paused samplers are excluded through an index view over the stored sampler dimension (see
+        # `sampler_select`) and storage is only compacted once the fraction of paused samplers exceeds this value.
+        self.sampler_compaction_threshold = sampler_compaction_threshold
+        self._active_samplers: Optional[List[int]] = None
+        self._active_index: Optional[torch.Tensor] = None
+        self.flat_observations = actor_critic.accepts_flat_observations
+
         self.flattened_to_unflattened: Dict[str, Dict[str, List[str]]] = {
             "memory": dict(),
             "observations": dict(),
@@ -44,6 +62,24 @@ class RolloutStorage(object):
             "observations": dict(),
         }
 
+        # Compiled flatten/unflatten plans, built once per observation (or memory) structure
+        self._flatten_plans: Dict[
+            str, Optional[Tuple[Tuple[str, Tuple[str, ...]], ...]]
+        ] = {
+            "memory": None,
+            "observations": None,
+        }
+        # Number of keys of every (nested) dictionary the plans were compiled for
+        self._flatten_plan_dict_sizes: Dict[
+            str, Optional[Tuple[Tuple[Tuple[str, ...], int], ...]]
+        ] = {
+            "memory": None,
+            "observations": None,
+        }
+        self._unflatten_plans: Dict[
+            Tuple[str, ...], Tuple[Tuple[bool, int, str, str], ...]
+        ] = {}
+
         self.dim_names = ["step", "sampler", None]
 
         self.memory: Memory = self.create_memory(
@@ -61,8 +97,9 @@ class RolloutStorage(object):
         self.masks = torch.zeros(num_steps + 1, num_samplers, 1)
 
         self.action_space = actor_critic.action_space
+        self.compiled_action_space = su.CompiledSpace(self.action_space)
 
-        action_flat_dim = su.flatdim(self.action_space)
+        action_flat_dim = self.compiled_action_space.flatdim
         self.actions = torch.zeros(num_steps, num_samplers, action_flat_dim,)
         self.prev_actions = torch.zeros(num_steps + 1, num_samplers, action_flat_dim,)
 
@@ -118,6 +155,9 @@ class RolloutStorage(object):
         self.prev_actions = self.prev_actions.to(device)
         self.masks = self.masks.to(device)
 
+        if self._active_index is not None:
+            self._active_index = self._active_index.to(device)
+
         if self.rewards is not None:
             self.rewards = self.rewards.to(device)
             self.value_preds = self.value_preds.to(device)
@@ -129,10 +169,115 @@ class RolloutStorage(object):
     def insert_observations(
         self, observations: ObservationType, time_step: int = 0,
     ):
+        if len(self.observations) == 0:
+            # Observation storage is allocated from the inserted (active) samplers
+            self.compact()
+
         self.insert_tensors(
             storage_name="observations", unflattened=observations, time_step=time_step
         )
 
+    @staticmethod
+    def _nested_structure(unflattened: Dict) -> Tuple:
+        """The (nested) keys of `unflattened`, with `None` for leaves."""
+        return tuple(
+            (
+                name,
+                RolloutStorage._nested_structure(value)
+                if isinstance(value, Dict)
+                else None,
+            )
+            for name, value in unflattened.items()
+        )
+
+    def _compile_flatten_plan(self, storage_name: str, unflattened: Dict):
+        structure = self._nested_structure(unflattened)
+
+        leaf_paths: List[Tuple[str, ...]] = []
+        dict_sizes: List[Tuple[Tuple[str, ...], int]] = []
+
+        def visit(current_structure: Tuple, path: Tuple[str, ...]):
+            dict_sizes.append((path, len(current_structure)))
+            for name, children in current_structure:
+                if children is None:
+                    leaf_paths.append(path + (name,))
+                else:
+                    visit(children, path + (name,))
+
+        visit(structure, ())
+
+        self._flatten_plans[storage_name] = tuple(
+            (self.unflattened_to_flattened[storage_name][full_path], full_path)
+            for full_path in leaf_paths
+        )
+        self._flatten_plan_dict_sizes[storage_name] = tuple(dict_sizes)
+
+    def _insert_tensors_compiled(
+        self,
+        storage_name: str,
+        unflattened: Union[ObservationType, Memory],
+        time_step: int,
+    ) -> bool:
+        """Copies `unflattened` into storage following the compiled flatten
+        plan.
+
+        Returns False (without copying anything) if `unflattened` does not
+        match the (nested) structure the plan was compiled for, e.g. if it is
+        the empty list of observations of a step in which all samplers are
+        paused.
+        """
+        plan = self._flatten_plans[storage_name]
+        if plan is None or not isinstance(unflattened, Dict) or len(unflattened) == 0:
+            return False
+
+        # Every leaf is looked up before copying anything, and (since missing
+        # keys are found by the lookups) only new keys remain to be checked
+        # for through the number of keys of each dictionary
+        leaves = []
+        try:
+            for _, path in plan:
+                current_data = unflattened
+                for part in path:
+                    current_data = current_data[part]
+                if isinstance(current_data, Dict):
+                    return False
+                leaves.append(current_data)
+            for path, size in self._flatten_plan_dict_sizes[storage_name]:
+                current_data = unflattened
+                for part in path:
+                    current_data = current_data[part]
+                if len(current_data) != size:
+                    return False
+        except (KeyError, TypeError, IndexError):
+            return False
+
+        storage = getattr(self, storage_name)
+        for (flatten_name, _), current_data in zip(plan, leaves):
+            if isinstance(current_data, tuple):
+                current_data = current_data[0]
+            self._insert_leaf(
+                storage_name, storage[flatten_name], current_data, time_step
+            )
+        return True
+
+    def _insert_leaf(
+        self,
+        storage_name: str,
+        stored: Tuple[torch.Tensor, int],
+        current_data: torch.Tensor,
+        time_step: int,
+    ):
+        tensor, sampler_dim = stored
+        if storage_name == "observations":
+            # current_data has a step dimension
+            assert time_step >= 0
+            self._copy_to_active(
+                tensor[time_step : time_step + 1], sampler_dim, current_data
+            )
+        else:
+            # current_data does not have a step dimension
+            self._copy_to_active(tensor[time_step], sampler_dim - 1, current_data)
+
     def insert_memory(
         self, memory: Optional[Memory], time_step: int,
     ):
@@ -155,6 +300,11 @@ class RolloutStorage(object):
         path: Sequence[str] = (),
         time_step: int = 0,
     ):
+        if len(path) == 0:
+            if self._insert_tensors_compiled(storage_name, unflattened, time_step):
+                return
+            num_flattened = len(self.flattened_to_unflattened[storage_name])
+
         storage = getattr(self, storage_name)
         path = list(path)
 
@@ -201,13 +351,20 @@ class RolloutStorage(object):
                     tuple(path + [name])
                 ] = flatten_name
 
-            if storage_name == "observations":
-                # current_data has a step dimension
-                assert time_step >= 0
-                storage[flatten_name][0][time_step : time_step + 1].copy_(current_data)
-            else:
-                # current_data does not have a step dimension
-                storage[flatten_name][0][time_step].copy_(current_data)
+            self._insert_leaf(
+                storage_name, storage[flatten_name], current_data, time_step
+            )
+
+        if (
+            len(path) == 0
+            and isinstance(unflattened, Dict)
+            and len(unflattened) > 0
+            and (
+                self._flatten_plans[storage_name] is None
+                or len(self.flattened_to_unflattened[storage_name]) != num_flattened
+            )
+        ):
+            self._compile_flatten_plan(storage_name, unflattened)
 
     def create_tensor_storage(
         self, num_steps: int, template: torch.Tensor
@@ -224,15 +381,19 @@ class RolloutStorage(object):
         rewards: torch.Tensor,
         masks: torch.Tensor,
     ):
+        if self.rewards is None:
+            # Reward, value and log-prob storage is allocated from the inserted (active) samplers
+            self.compact()
+
         self.insert_observations(observations, time_step=self.step + 1)
         self.insert_memory(memory, time_step=self.step + 1)
 
-        assert actions.shape == self.actions[self.step].shape
+        assert actions.shape == (self.num_active_samplers,) + self.actions.shape[2:]
 
-        self.actions[self.step].copy_(actions)  # type:ignore
-        self.prev_actions[self.step + 1].copy_(actions)  # type:ignore
+        self._copy_to_active(self.actions[self.step], 0, actions)
+        self._copy_to_active(self.prev_actions[self.step + 1], 0, actions)
 
-        self.masks[self.step + 1].copy_(masks)  # type:ignore
+        self._copy_to_active(self.masks[self.step + 1], 0, masks)
 
         if self.rewards is None:
             # We delay the instantiation of storage for `rewards`, `value_preds`, `action_log_probs` and `returns`
@@ -254,30 +415,152 @@ class RolloutStorage(object):
                 self.num_steps, action_log_probs.unsqueeze(0)
             )
 
-        self.value_preds[self.step].copy_(value_preds)  # type:ignore
-        self.rewards[self.step].copy_(rewards)  # type:ignore
-        self.action_log_probs[self.step].copy_(  # type:ignore
-            action_log_probs
-        )
+        self._copy_to_active(self.value_preds[self.step], 0, value_preds)
+        self._copy_to_active(self.rewards[self.step], 0, rewards)
+        self._copy_to_active(self.action_log_probs[self.step], 0, action_log_probs)
 
         self.step = (self.step + 1) % self.num_steps
 
+    @property
+    def num_active_samplers(self) -> int:
+        if self._active_samplers is None:
+            return self.actions.shape[1]  # samplers dim
+        return len(self._active_samplers)
+
+    def stored_sampler_index(self, active_sampler: int) -> int:
+        """Index along the stored sampler dimension of the `active_sampler`-th
+        active (i.e. non-paused) sampler."""
+        if self._active_samplers is None:
+            return active_sampler
+        return self._active_samplers[active_sampler]
+
+    def _set_active_samplers(self, active_samplers: Optional[List[int]]):
+        self._active_samplers = active_samplers
+        self._active_index = (
+            torch.as_tensor(active_samplers, dtype=torch.int64, device=self.device)
+            if active_samplers is not None
+            else None
+        )
+
+    def _copy_to_active(
+        self, target: torch.Tensor, sampler_dim: int, data: torch.Tensor
+    ):
+        if self._active_index is None:
+            target.copy_(data)
+        else:
+            shape = list(target.shape)
+            shape[sampler_dim] = len(self._active_samplers)
+            target.index_copy_(sampler_dim, self._active_index, data.reshape(shape))
+
+    def _active_view(self, memory: Memory) -> Memory:
+        if self._active_index is None:
+            return memory
+        return Memory(
+            [
+                (
+                    key,
+                    (
+                        memory.tensor(key).index_select(
+                            memory.sampler_dim(key), self._active_index
+                        ),
+                        memory.sampler_dim(key),
+                    ),
+                )
+                for key in memory
+            ]
+        )
+
     def sampler_select(self, keep_list: Sequence[int]):
+        """Keeps only the samplers in `keep_list`, given as indices into the
+        currently active samplers.
+
+        Stored data is not copied: paused samplers are excluded through an
+        index view until the fraction of paused samplers exceeds
+        `sampler_compaction_threshold`, at which point storage is compacted.
+        """
         keep_list = list(keep_list)
-        if self.actions.shape[1] == len(keep_list):  # samplers dim
+        if self.num_active_samplers == len(keep_list):
             return  # we are keeping everything, no need to copy
 
-        self.observations = self.observations.sampler_select(keep_list)
-        self.memory = self.memory.sampler_select(keep_list)
-        self.actions = self.actions[:, keep_list]
-        self.prev_actions = self.prev_actions[:, keep_list]
-        self.action_log_probs = self.action_log_probs[:, keep_list]
-        self.masks = self.masks[:, keep_list]
+        active_samplers = [self.stored_sampler_index(it) for it in keep_list]
+        num_stored_samplers = self.actions.shape[1]  # samplers dim
+        self._set_active_samplers(active_samplers)
+        if (
+            1.0 - len(active_samplers) / num_stored_samplers
+            > self.sampler_compaction_threshold
+        ):
+            self.compact()
 
-        if self.rewards is not None:
-            self.value_preds = self.value_preds[:, keep_list]
-            self.rewards = self.rewards[:, keep_list]
-            self.returns = self.returns[:, keep_list]
+    def _compact_tensor(
+        self,
+        tensor: torch.Tensor,
+        sampler_dim: int,
+        keep_index: torch.Tensor,
+        stash_keys: Sequence[Tuple[str, ...]],
+    ) -> torch.Tensor:
+        """Compacts `tensor` along its `sampler_dim` together with the
+        (un-narrowed) tensors it was narrowed from, if any.
+
+        Narrowed tensors are prefixes (along the step dimension) of the
+        tensors stored for `unnarrow`, permanently narrowed ones being
+        prefixes of the full tensors. The outermost one is compacted and the
+        others are re-derived from it as narrowed views, so that `unnarrow`
+        restores tensors with the compacted sampler dimension.
+        """
+        stashes = []
+        for unnarrow_data in [self.permanent_unnarrow_data, self.unnarrow_data]:
+            container = unnarrow_data
+            for key in stash_keys[:-1]:
+                container = container.get(key, {})
+            if stash_keys[-1] in container:
+                stashes.append((container, stash_keys[-1]))
+
+        base = stashes[0][0][stashes[0][1]] if len(stashes) > 0 else tensor
+        compacted = base.index_select(sampler_dim, keep_index.to(base.device))
+        for container, key in stashes:
+            container[key] = compacted.narrow(0, 0, container[key].shape[0])
+        return compacted.narrow(0, 0, tensor.shape[0])
+
+    def compact(self):
+        """Drops paused samplers from storage (copying the data of the active
+        ones), including the un-narrowed storage restored by `unnarrow`."""
+        if self._active_samplers is None:
+            return
+
+        keep_index = self._active_index
+        self._set_active_samplers(None)
+
+        for storage_name in ["observations", "memory"]:
+            storage: Memory = getattr(self, storage_name)
+            for key in storage:
+                sampler_dim = storage.sampler_dim(key)
+                storage[key] = (
+                    self._compact_tensor(
+                        storage.tensor(key),
+                        sampler_dim,
+                        keep_index,
+                        stash_keys=(storage_name, key),
+                    ),
+                    sampler_dim,
+                )
+
+        for name in [
+            "actions",
+            "prev_actions",
+            "masks",
+            "action_log_probs",
+            "value_preds",
+            "rewards",
+            "returns",
+        ]:
+            if getattr(self, name) is not None:
+                setattr(
+                    self,
+                    name,
+                    self._compact_tensor(
+                        getattr(self, name), 1, keep_index, stash_keys=(name,)
+                    ),
+                )
 
     def narrow(self, num_steps=None):
         """This function is used by the training engine to temporarily (after
@@ -411,6 +694,8 @@ class RolloutStorage(object):
     def compute_returns(
         self, next_value: torch.Tensor, use_gae: bool, gamma: float, tau: float
     ):
+        self.compact()
+
         extended_mask = self._extend_tensor(self.masks)
         extended_rewards = self._extend_tensor(self.rewards)
 
@@ -439,9 +724,19 @@ class RolloutStorage(object):
         adv_mean: torch.Tensor,
         adv_std: torch.Tensor,
         num_mini_batch: int,
+        bptt_chunk_length: Optional[int] = None,
     ):
         normalized_advantages = (advantages - adv_mean) / (adv_std + 1e-5)
 
+        if bptt_chunk_length is not None:
+            yield from self._chunked_recurrent_generator(
+                advantages=advantages,
+                normalized_advantages=normalized_advantages,
+                num_mini_batch=num_mini_batch,
+                bptt_chunk_length=bptt_chunk_length,
+            )
+            return
+
         num_samplers = self.rewards.shape[1]
         assert num_samplers >= num_mini_batch, (
             "The number of task samplers ({}) "
@@ -497,8 +792,10 @@ class RolloutStorage(object):
             yield {
                 "observations": observations_batch,
                 "memory": memory_batch,
-                "actions": su.unflatten(self.action_space, actions_batch),
-                "prev_actions": su.unflatten(self.action_space, prev_actions_batch),
+                "actions": self.compiled_action_space.unflatten(actions_batch),
+                "prev_actions": self.compiled_action_space.unflatten(
+                    prev_actions_batch
+                ),
                 "values": value_preds_batch,
                 "returns": return_batch,
                 "masks": masks_batch,
@@ -507,25 +804,215 @@ class RolloutStorage(object):
                 "norm_adv_targ": norm_adv_targ,
             }
 
+    def _chunked_recurrent_generator(
+        self,
+        advantages: torch.Tensor,
+        normalized_advantages: torch.Tensor,
+        num_mini_batch: int,
+        bptt_chunk_length: int,
+    ):
+        """Yields `num_mini_batch` mini-batches over (sampler, chunk) pairs,
+        where each sampler's rollout is split into chunks of at most
+        `bptt_chunk_length` steps starting from the stored intermediate memory
+        (truncated BPTT).
+
+        The pairs in a mini-batch share their chunk length and every step is
+        in exactly one mini-batch. As only the last chunk of a rollout may be
+        shorter, the pairs are split into (at most) two groups of mini-batches
+        with different chunk lengths. With a single mini-batch, rollouts whose
+        length is not a multiple of `bptt_chunk_length` are instead split into
+        equal chunks, of the largest length not exceeding `bptt_chunk_length`
+        that divides the rollout length.
+
+        The number of mini-batches does not depend on the (possibly narrowed)
+        rollout length or the number of active samplers, so that distributed
+        workers always run the same number of updates.
+        """
+        assert not self.only_store_first_and_last_in_memory, (
+            "Truncated backpropagation through time requires storing the memory for every step"
+            " (i.e. `only_store_first_and_last_in_memory=False`)."
+        )
+        assert bptt_chunk_length > 0, "`bptt_chunk_length` must be positive"
+
+        num_steps, num_samplers = self.rewards.shape[:2]
+        if num_mini_batch == 1 and num_steps % bptt_chunk_length != 0:
+            bptt_chunk_length = max(
+                length
+                for length in range(1, min(bptt_chunk_length, num_steps) + 1)
+                if num_steps % length == 0
+            )
+
+        chunks = [
+            (start, min(start + bptt_chunk_length, num_steps))
+            for start in range(0, num_steps, bptt_chunk_length)
+        ]
+        num_units = num_samplers * len(chunks)
+        assert num_units >= num_mini_batch, (
+            "The number of (task sampler, chunk) pairs ({}) "
+            "must be greater than or equal to the number of "
+            "mini batches ({}).".format(num_units, num_mini_batch)
+        )
+
+        # Pairs in a mini-batch must share the chunk length (only the last chunk may be shorter)
+        length_to_units: DefaultDict[int, List[Tuple[int, int, int]]] = defaultdict(
+            list
+        )
+        for start, end in chunks:
+            for sampler in range(num_samplers):
+                length_to_units[end - start].append((sampler, start, end))
+        groups = list(length_to_units.values())
+        assert len(groups) <= num_mini_batch
+
+        # Split the mini-batches between groups proportionally to their sizes
+        num_group_batches = [
+            min(len(units), max(1, (num_mini_batch * len(units)) // num_units))
+            for units in groups
+        ]
+        while sum(num_group_batches) < num_mini_batch:
+            group = max(
+                (
+                    it
+                    for it, units in enumerate(groups)
+                    if num_group_batches[it] < len(units)
+                ),
+                key=lambda it: len(groups[it]) / num_group_batches[it],
+            )
+            num_group_batches[group] += 1
+        assert sum(num_group_batches) == num_mini_batch
+
+        batches = []
+        for units, num_batches in zip(groups, num_group_batches):
+            random.shuffle(units)
+            inds = np.round(
+                np.linspace(0, len(units), num_batches + 1, endpoint=True)
+            ).astype(np.int32)
+            batches.extend(
+                units[start_ind:end_ind]
+                for start_ind, end_ind in zip(inds[:-1], inds[1:])
+            )
+        random.shuffle(batches)
+
+        for units in batches:
+            memory_batch = Memory()
+            for key in self.memory:
+                tensor, sampler_dim = self.memory[key]
+                memory_batch.check_append(
+                    key,
+                    torch.stack(
+                        [
+                            tensor[start].select(sampler_dim - 1, sampler)
+                            for sampler, start, _ in units
+                        ],
+                        dim=sampler_dim - 1,
+                    ),
+                    sampler_dim - 1,
+                )
+
+            observations_batch = Memory()
+            for key in self.observations:
+                tensor, sampler_dim = self.observations[key]
+                observations_batch.check_append(
+                    key,
+                    torch.stack(
+                        [
+                            tensor[start:end].select(sampler_dim, sampler)
+                            for sampler, start, end in units
+                        ],
+                        dim=sampler_dim,
+                    ),
+                    sampler_dim,
+                )
+
+            def chunk_batch(tensor: torch.Tensor) -> torch.Tensor:
+                return torch.stack(
+                    [tensor[start:end, sampler] for sampler, start, end in units], 1
+                )
+
+            yield {
+                "observations": self.unflatten_observations(observations_batch),
+                "memory": memory_batch,
+                "actions": self.compiled_action_space.unflatten(
+                    chunk_batch(self.actions)
+                ),
+                "prev_actions": self.compiled_action_space.unflatten(
+                    chunk_batch(self.prev_actions)
+                ),
+                "values": chunk_batch(self.value_preds),
+                "returns": chunk_batch(self.returns),
+                "masks": chunk_batch(self.masks),
+                "old_action_log_probs": chunk_batch(self.action_log_probs),
+                "adv_targ": chunk_batch(advantages),
+                "norm_adv_targ": chunk_batch(normalized_advantages),
+            }
+
+    def _compile_unflatten_plan(
+        self, flat_names: Tuple[str, ...]
+    ) -> Tuple[Tuple[bool, int, str, str], ...]:
+        """Compiles the sequence of dictionary creations and assignments
+        required to rebuild the nested observations from `flat_names`.
+
+        Each plan entry is `(is_leaf, parent_container_index, key, flat_name)`,
+        where containers are indexed in creation order (0 is the root).
+        """
+        plan: List[Tuple[bool, int, str, str]] = []
+        container_inds: Dict[Tuple[str, ...], int] = {(): 0}
+        for name in flat_names:
+            full_path = tuple(self.flattened_to_unflattened["observations"][name])
+            for depth in range(1, len(full_path)):
+                if full_path[:depth] not in container_inds:
+                    plan.append(
+                        (
+                            False,
+                            container_inds[full_path[: depth - 1]],
+                            full_path[depth - 1],
+                            "",
+                        )
+                    )
+                    container_inds[full_path[:depth]] = len(container_inds)
+            plan.append((True, container_inds[full_path[:-1]], full_path[-1], name))
+        return tuple(plan)
+
     def unflatten_observations(self, flattened_batch: Memory) -> ObservationType:
+        if self.flat_observations:
+            return {name: flattened_batch[name][0] for name in flattened_batch}
+
+        flat_names = tuple(flattened_batch.keys())
+        plan = self._unflatten_plans.get(flat_names)
+        if plan is None:
+            plan = self._unflatten_plans[flat_names] = self._compile_unflatten_plan(
+                flat_names
+            )
+
         result: ObservationType = {}
-        for name in flattened_batch:
-            full_path = self.flattened_to_unflattened["observations"][name]
-            cur_dict = result
-            for part in full_path[:-1]:
-                if part not in cur_dict:
-                    cur_dict[part] = {}
-                cur_dict = cast(ObservationType, cur_dict[part])
-            cur_dict[full_path[-1]] = flattened_batch[name][0]
+        containers: List[Dict[str, Any]] = [result]
+        for is_leaf, parent_ind, key, name in plan:
+            if is_leaf:
+                containers[parent_ind][key] = flattened_batch[name][0]
+            else:
+                containers[parent_ind][key] = {}
+                containers.append(containers[parent_ind][key])
         return result
 
+    def _step_slice(self, tensor: torch.Tensor, step: int) -> torch.Tensor:
+        step_slice = tensor[step : step + 1] if step != -1 else tensor[step:]
+        if self._active_index is None:
+            return step_slice
+        return step_slice.index_select(1, self._active_index)  # samplers dim
+
     def pick_observation_step(self, step: int) -> ObservationType:
-        return self.unflatten_observations(self.observations.step_select(step))
+        return self.unflatten_observations(
+            self._active_view(self.observations.step_select(step))
+        )
 
     def pick_memory_step(self, step: int) -> Memory:
         if self.only_store_first_and_last_in_memory and step > 0:
             step = 1
-        return self.memory.step_squeeze(step)
+        return self._active_view(self.memory.step_squeeze(step))
 
     def pick_prev_actions_step(self, step: int) -> ActionType:
-        return su.unflatten(self.action_space, self.prev_actions[step : step + 1])
+        return self.compiled_action_space.unflatten(
+            self._step_slice(self.prev_actions, step)
+        )
+
+    def pick_masks_step(self, step: int) -> torch.Tensor:
+        return self._step_slice(self.masks, step)
@@ -9,10 +9,9 @@ Several of the losses defined in this file are modified versions of those found
 """
 
 
-from typing import Dict, cast, Tuple, List
+from typing import Any, Dict, cast, Tuple, List, Optional, Sequence
 import abc
 
-import numpy as np
 import torch
 import torch.nn as nn
 
@@ -68,17 +67,95 @@ class MultiAuxTaskNegEntropyLoss(AbstractActorCriticLoss):
         )
 
 
+def _subsample_rollout_inputs(inputs: Any, step_inds: slice, sampler_inds: Any):
+    """Indexes the (T, N, *) tensors of (nested dictionaries of) inputs with
+    `step_inds` and `sampler_inds`, leaving other inputs (e.g. models)
+    unchanged."""
+    if isinstance(inputs, torch.Tensor) and inputs.dim() >= 2:
+        return inputs[step_inds][:, sampler_inds]
+    if isinstance(inputs, dict):
+        return {
+            k: _subsample_rollout_inputs(v, step_inds, sampler_inds)
+            for k, v in inputs.items()
+        }
+    return inputs
+
+
 class AuxiliaryLoss(AbstractActorCriticLoss):
     """
     Base class of auxiliary loss. 
     Any auxiliary task loss should inherit from it, and implement
         the `get_aux_loss` function.
+
+    To bound the compute spent on auxiliary losses, these can be evaluated on a random
+        subset of the samplers and/or on a random window of the steps of every
+        minibatch, and/or only in the first of the `update_repeats` epochs of every
+        rollout (see `__init__`).
     """
 
-    def __init__(self, auxiliary_uuid: str, *args, **kwargs):
+    def __init__(
+        self,
+        auxiliary_uuid: str,
+        sampler_subsample_fraction: Optional[float] = None,
+        max_subsampled_steps: Optional[int] = None,
+        first_epoch_only: bool = False,
+        *args,
+        **kwargs
+    ):
+        """
+        # Parameters
+        auxiliary_uuid : The uuid of the auxiliary task (i.e. of its entry in the `extras` of the
+            actor critic outputs).
+        sampler_subsample_fraction : If not `None`, the loss is only evaluated on this (random) fraction
+            of the samplers of every minibatch (at least one of them).
+        max_subsampled_steps : If not `None`, the loss is only evaluated on a random window of (at most)
+            this many consecutive steps of every minibatch. Windows, rather than arbitrary steps, are used
+            as auxiliary losses depend on sequences of steps.
+        first_epoch_only : If `True`, the loss is only evaluated in the first epoch of every rollout (and
+            zero in later epochs, where it is skipped). To keep its contribution to the updates unchanged in
+            expectation, the loss is then weighted by the number of epochs.
+
+        As the auxiliary losses are averages over their valid samples, those computed on a uniformly sampled
+        subset of samplers/steps are (noisier) estimates of the same quantities and are not reweighted.
+        """
         super().__init__(*args, **kwargs)
 
+        assert sampler_subsample_fraction is None or 0 < sampler_subsample_fraction <= 1
+        assert max_subsampled_steps is None or max_subsampled_steps > 0
+
         self.auxiliary_uuid = auxiliary_uuid
+        self.sampler_subsample_fraction = sampler_subsample_fraction
+        self.max_subsampled_steps = max_subsampled_steps
+        self.first_epoch_only = first_epoch_only
+
+    def subsample_rollout_inputs(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        """Restricts the (T, N, *) inputs of `get_aux_loss` to a random
+        window of steps and subset of samplers (see `__init__`)."""
+        num_steps, num_samplers = inputs["masks"].shape[:2]
+
+        step_inds = slice(0, num_steps)
+        if (
+            self.max_subsampled_steps is not None
+            and self.max_subsampled_steps < num_steps
+        ):
+            start = int(
+                torch.randint(num_steps - self.max_subsampled_steps + 1, (1,)).item()
+            )
+            step_inds = slice(start, start + self.max_subsampled_steps)
+
+        sampler_inds: Any = slice(0, num_samplers)
+        if self.sampler_subsample_fraction is not None:
+            num_subsampled = max(
+                1, int(round(self.sampler_subsample_fraction * num_samplers))
+            )
+            if num_subsampled < num_samplers:
+                sampler_inds = torch.sort(
+                    torch.randperm(num_samplers)[:num_subsampled]
+                )[0].to(inputs["masks"].device)
+
+        if step_inds == slice(0, num_steps) and isinstance(sampler_inds, slice):
+            return inputs
+        return _subsample_rollout_inputs(inputs, step_inds, sampler_inds)
 
     def loss(  # type: ignore
         self,
@@ -88,14 +165,29 @@ class AuxiliaryLoss(AbstractActorCriticLoss):
         *args,
         **kwargs
     ) -> Tuple[torch.FloatTensor, Dict[str, float]]:
+        # `epoch` and `num_epochs` are provided by the engine (when
+        # called otherwise, the loss is evaluated and not reweighted)
+        num_epochs = kwargs.get("num_epochs")
+        epoch_weight = 1.0
+        if self.first_epoch_only and num_epochs is not None:
+            if kwargs.get("epoch", 0) > 0:
+                return batch["masks"].new_zeros(()), {}
+            epoch_weight = float(num_epochs)
 
         # auxiliary loss
-        return self.get_aux_loss(
-            **actor_critic_output.extras[self.auxiliary_uuid],
-            observations=batch["observations"],
-            actions=batch["actions"],
-            masks=batch["masks"],
+        loss_return = self.get_aux_loss(
+            **self.subsample_rollout_inputs(
+                dict(
+                    **actor_critic_output.extras[self.auxiliary_uuid],
+                    observations=batch["observations"],
+                    actions=batch["actions"],
+                    masks=batch["masks"],
+                )
+            )
         )
+        if epoch_weight == 1.0:
+            return loss_return
+        return (epoch_weight * loss_return[0],) + tuple(loss_return[1:])
 
     @abc.abstractmethod
     def get_aux_loss(
@@ -115,28 +207,43 @@ class AuxiliaryLoss(AbstractActorCriticLoss):
 def _propagate_final_beliefs_to_all_steps(
     beliefs: torch.Tensor, masks: torch.Tensor, num_sampler: int, num_steps: int,
 ):
-    final_beliefs = torch.zeros_like(beliefs)  # (T, B, *)
-    start_locs_list = []
-    end_locs_list = []
-
-    for i in range(num_sampler):
-        # right shift: to locate the 1 before 0 and ignore the 1st element
-        end_locs = torch.where(masks[1:, i] == 0)[0]  # maybe [], dtype=torch.Long
-
-        start_locs = torch.cat(
-            [torch.tensor([0]).to(end_locs), end_locs + 1]
-        )  # add the first element
-        start_locs_list.append(start_locs)
-
-        end_locs = torch.cat(
-            [end_locs, torch.tensor([num_steps - 1]).to(end_locs)]
-        )  # add the last element
-        end_locs_list.append(end_locs)
-
-        for st, ed in zip(start_locs, end_locs):
-            final_beliefs[st : ed + 1, i] = beliefs[ed, i]
-
-    return final_beliefs, start_locs_list, end_locs_list
+    """Replaces the beliefs of every step by those of the final step of its
+    episode.
+
+    # Parameters
+    beliefs : The (T, B, *) beliefs.
+    masks : The (T, B) masks (zeros marking the first step of an episode).
+
+    # Returns
+    The (T, B, *) final beliefs and the (M, 3) locations of the M episodes of the
+    batch, ordered by sampler and then by time: in the sampler `locs_batch[m, 0]`,
+    the m-th episode starts at step `locs_batch[m, 1]` and ends at step
+    `locs_batch[m, 2]` (included).
+    """
+    # an episode starts at the first step and wherever masks are 0, and ends at the
+    # last step and right before another one starts
+    starts = masks == 0  # (T, B)
+    starts[0] = True
+    ends = torch.ones_like(starts)
+    ends[:-1] = starts[1:]
+
+    # episodes are enumerated in sampler-major order
+    start_locs = starts.t().nonzero()  # (M, 2), [sampler, step]
+    end_locs = ends.t().nonzero()  # (M, 2)
+    locs_batch = torch.cat([start_locs, end_locs[:, 1:]], dim=-1)  # (M, 3)
+
+    episode_ids = (
+        torch.cumsum(starts.t().reshape(-1).long(), dim=0)
+        .view(num_sampler, num_steps)
+        .t()
+        - 1
+    )  # (T, B)
+    final_beliefs = beliefs[
+        locs_batch[episode_ids, 2],
+        torch.arange(num_sampler, device=beliefs.device).view(1, num_sampler),
+    ]  # (T, B, *)
+
+    return final_beliefs, locs_batch
 
 
 class InverseDynamicsLoss(AuxiliaryLoss):
@@ -181,7 +288,7 @@ class InverseDynamicsLoss(AuxiliaryLoss):
         # we did not compute loss here as model.forward is compute-heavy
         masks = masks.squeeze(-1)  # (T, B)
 
-        final_beliefs, _, _ = _propagate_final_beliefs_to_all_steps(
+        final_beliefs, _ = _propagate_final_beliefs_to_all_steps(
             beliefs, masks, num_sampler, num_steps,
         )
 
@@ -273,32 +380,14 @@ class TemporalDistanceLoss(AuxiliaryLoss):
         # we did not compute loss here as model.forward is compute-heavy
         masks = masks.squeeze(-1)  # (T, B)
 
-        (
-            final_beliefs,
-            start_locs_list,
-            end_locs_list,
-        ) = _propagate_final_beliefs_to_all_steps(
-            beliefs, masks, num_sampler, num_steps,
-        )
-
         ## also find the locs_batch of shape (M, 3)
         # the last dim: [0] is on num_sampler loc, [1] and [2] is start and end locs
         # of one episode
         # in other words: at locs_batch[m, 0] in num_sampler dim, there exists one episode
         # starting from locs_batch[m, 1], ends at locs_batch[m, 2] (included)
-        locs_batch = []
-        for i in range(num_sampler):
-            locs_batch.append(
-                torch.stack(
-                    [
-                        i * torch.ones_like(start_locs_list[i]),
-                        start_locs_list[i],
-                        end_locs_list[i],
-                    ],
-                    dim=-1,
-                )
-            )  # shape (M[i], 3)
-        locs_batch = torch.cat(locs_batch)  # shape (M, 3)
+        final_beliefs, locs_batch = _propagate_final_beliefs_to_all_steps(
+            beliefs, masks, num_sampler, num_steps,
+        )
 
         temporal_dist_max = (
             locs_batch[:, 2] - locs_batch[:, 1]
@@ -312,16 +401,20 @@ class TemporalDistanceLoss(AuxiliaryLoss):
 
         # sample valid pairs: sampled_pairs shape (M, num_pairs, 3)
         # where M is the num of total episodes in the batch
-        locs = locs_batch.cpu().numpy()  # as torch.randint only support int, not tensor
-        sampled_pairs = np.random.randint(
-            np.repeat(locs[:, [1]], 2 * self.num_pairs, axis=-1),  # (M, 2*k)
-            np.repeat(locs[:, [2]] + 1, 2 * self.num_pairs, axis=-1),  # (M, 2*k)
-        ).reshape(
+        # steps are sampled uniformly within their episodes, i.e. in [start, end]
+        episode_lens = (temporal_dist_max + 1).unsqueeze(-1)  # (M, 1)
+        sampled_offsets = torch.min(
+            torch.floor(
+                torch.rand(
+                    locs_batch.shape[0], 2 * self.num_pairs, device=locs_batch.device
+                )
+                * episode_lens
+            ),
+            episode_lens - 1,
+        ).long()  # (M, 2*k)
+        sampled_pairs_batch = (locs_batch[:, [1]] + sampled_offsets).view(
             -1, self.num_pairs, 2
         )  # (M, k, 2)
-        sampled_pairs_batch = torch.from_numpy(sampled_pairs).to(
-            locs_batch
-        )  # (M, k, 2)
 
         num_sampler_batch = locs_batch[:, [0]].expand(
             -1, 2 * self.num_pairs
@@ -360,6 +453,152 @@ class TemporalDistanceLoss(AuxiliaryLoss):
         )
 
 
+def _cpca_valid_masks(masks: torch.Tensor, planning_steps: int) -> torch.Tensor:
+    """Masks of the valid CPC|A predictions.
+
+    The `j`-step prediction from timestep `t`, i.e. that of z_{t+j} from
+    GRU(b_t, a_{t:t+j-1}), is valid iff z_{t+j} is in the batch (t + j < T) and
+    no new episode starts in timesteps t+1, ..., t+j.
+
+    # Parameters
+    masks : The (T, N) masks (zeros marking the first step of an episode).
+    planning_steps : The maximum number of steps k of the predictions.
+
+    # Returns
+    The (T, k, N, 1) float masks.
+    """
+    num_steps, num_sampler = masks.shape
+
+    # number of episode starts within timesteps 1, ..., t
+    num_starts = torch.cat(
+        (
+            torch.zeros(1, num_sampler, dtype=torch.long, device=masks.device),
+            torch.cumsum((masks[1:] == 0).long(), dim=0),
+        ),
+        dim=0,
+    )  # (T, N)
+
+    targets = torch.arange(num_steps, device=masks.device).view(-1, 1) + torch.arange(
+        1, planning_steps + 1, device=masks.device
+    ).view(
+        1, -1
+    )  # (T, k), t + j
+    in_batch = (targets < num_steps).unsqueeze(1)  # (T, 1, k)
+    same_episode = num_starts[targets.clamp(max=num_steps - 1)].permute(
+        0, 2, 1
+    ) == num_starts.unsqueeze(
+        -1
+    )  # (T, N, k)
+
+    # the masks are laid out as (T, N, 1, k) so that subsampling them (see
+    # `_bernoulli_subsample_mask_like`) draws the same random numbers as in previous versions
+    return (
+        (in_batch & same_episode).contiguous().unsqueeze(2).float().permute(0, 3, 1, 2)
+    )
+
+
+def _cpca_losses(
+    aux_model: nn.Module,
+    obs_embeds: torch.FloatTensor,
+    actions: torch.FloatTensor,
+    beliefs: torch.FloatTensor,
+    masks: torch.FloatTensor,
+    planning_steps: int,
+    cross_entropy_loss: nn.Module,
+) -> Tuple[torch.Tensor, torch.Tensor, torch.Tensor]:
+    """Unmasked positive/negative CPC|A losses of all the 1, ..., k-step
+    predictions (along with the masks of the valid ones, see
+    `_cpca_valid_masks`).
+
+    As the context model is auto-regressive, the first j steps of the
+    k-step unrolled contexts are the j-step unrolled contexts, so all the
+    horizons up to k are covered by this single pass.
+
+    # Returns
+    The (T, k, N, 1) positive losses, negative losses and valid masks.
+    """
+    # prepare for autoregressive inputs: c_{t+1:t+k} = GRU(b_t, a_{t:t+k-1}) <-> z_{t+k}
+    ## where b_t = RNN(b_{t-1}, z_t, a_{t-1}), prev action is optional
+    num_steps, num_sampler, obs_embed_size = obs_embeds.shape  # T, N, H_O
+    assert 0 < planning_steps <= num_steps
+
+    ## prepare positive and negatives that sample from all the batch
+    positives = obs_embeds  # (T, N, -1)
+    negative_inds = torch.randperm(num_steps * num_sampler).to(positives.device)
+    negatives = torch.gather(  # input[index[i,j]][j]
+        positives.view(num_steps * num_sampler, -1),
+        dim=0,
+        index=negative_inds.view(num_steps * num_sampler, 1).expand(
+            num_steps * num_sampler, positives.size(-1)
+        ),
+    ).view(
+        num_steps, num_sampler, -1
+    )  # (T, N, -1)
+
+    ## prepare action sequences and initial beliefs
+    action_embedding = aux_model.action_embedder(actions)  # (T, N, -1)
+    action_embed_size = action_embedding.size(-1)
+    action_padding = torch.zeros(planning_steps - 1, num_sampler, action_embed_size).to(
+        action_embedding
+    )  # (k-1, N, -1)
+    action_padded = torch.cat(
+        (action_embedding, action_padding), dim=0
+    )  # (T+k-1, N, -1)
+    ## unfold function will create consecutive action sequences
+    action_seq = (
+        action_padded.unfold(dimension=0, size=planning_steps, step=1)
+        .permute(3, 0, 1, 2)
+        .reshape(planning_steps, num_steps * num_sampler, action_embed_size)
+    )  # (k, T*N, -1)
+    beliefs = beliefs.view(num_steps * num_sampler, -1).unsqueeze(0)  # (1, T*N, -1)
+
+    # get future contexts c_{t+1:t+k} = GRU(b_t, a_{t:t+k-1})
+    future_contexts_all, _ = aux_model.context_model(
+        action_seq, beliefs
+    )  # (k, T*N, -1)
+    ## NOTE: future_contexts_all starting from next step t+1 to t+k, not t to t+k-1
+    future_contexts_all = future_contexts_all.view(
+        planning_steps, num_steps, num_sampler, -1
+    ).permute(
+        1, 0, 2, 3
+    )  # (T, k, N, -1)
+
+    # get all the classifier scores I(c_{t+1:t+k}; z_{t+1:t+k}), positives and
+    # negatives are scored with a single call of the classifier
+    samples = torch.stack((positives, negatives), dim=0)  # (2, T, N, -1)
+    samples_padding = torch.zeros(2, planning_steps, num_sampler, obs_embed_size).to(
+        samples
+    )  # (2, k, N, -1)
+    samples_padded = torch.cat(
+        (samples[:, 1:], samples_padding), dim=1
+    )  # (2, T+k-1, N, -1)
+    samples_expanded = samples_padded.unfold(
+        dimension=1, size=planning_steps, step=1
+    ).permute(
+        0, 1, 4, 2, 3
+    )  # (2, T, k, N, -1)
+    logits = aux_model.classifier(
+        torch.cat(
+            [
+                samples_expanded,
+                future_contexts_all.unsqueeze(0).expand(2, -1, -1, -1, -1),
+            ],
+            -1,
+        )
+    )  # (2, T, k, N, 1)
+    positive_loss = cross_entropy_loss(
+        logits[0], torch.ones_like(logits[0])
+    )  # (T, k, N, 1)
+    negative_loss = cross_entropy_loss(
+        logits[1], torch.zeros_like(logits[1])
+    )  # (T, k, N, 1)
+
+    # Masking to get valid scores
+    valid_masks = _cpca_valid_masks(masks.squeeze(-1), planning_steps)  # (T, k, N, 1)
+
+    return positive_loss, negative_loss, valid_masks
+
+
 class CPCALoss(AuxiliaryLoss):
     """
     Auxiliary task of CPC|A
@@ -373,6 +612,11 @@ class CPCALoss(AuxiliaryLoss):
         self, planning_steps: int = 8, subsample_rate: float = 0.2, *args, **kwargs
     ):
         super().__init__(auxiliary_uuid=self.UUID, *args, **kwargs)
+        # The predictions of every step span the next `planning_steps` steps
+        assert (
+            self.max_subsampled_steps is None
+            or self.max_subsampled_steps >= planning_steps
+        ), "`max_subsampled_steps` should be at least `planning_steps`."
         self.planning_steps = planning_steps
         self.subsample_rate = subsample_rate
         self.cross_entropy_loss = nn.BCEWithLogitsLoss(reduction="none")
@@ -388,146 +632,16 @@ class CPCALoss(AuxiliaryLoss):
         *args,
         **kwargs
     ):
-        # prepare for autoregressive inputs: c_{t+1:t+k} = GRU(b_t, a_{t:t+k-1}) <-> z_{t+k}
-        ## where b_t = RNN(b_{t-1}, z_t, a_{t-1}), prev action is optional
-        num_steps, num_sampler, obs_embed_size = obs_embeds.shape  # T, N, H_O
-        assert 0 < self.planning_steps <= num_steps
-
-        ## prepare positive and negatives that sample from all the batch
-        positives = obs_embeds  # (T, N, -1)
-        negative_inds = torch.randperm(num_steps * num_sampler).to(positives.device)
-        negatives = torch.gather(  # input[index[i,j]][j]
-            positives.view(num_steps * num_sampler, -1),
-            dim=0,
-            index=negative_inds.view(num_steps * num_sampler, 1).expand(
-                num_steps * num_sampler, positives.size(-1)
-            ),
-        ).view(
-            num_steps, num_sampler, -1
-        )  # (T, N, -1)
-
-        ## prepare action sequences and initial beliefs
-        action_embedding = aux_model.action_embedder(actions)  # (T, N, -1)
-        action_embed_size = action_embedding.size(-1)
-        action_padding = torch.zeros(
-            self.planning_steps - 1, num_sampler, action_embed_size
-        ).to(
-            action_embedding
-        )  # (k-1, N, -1)
-        action_padded = torch.cat(
-            (action_embedding, action_padding), dim=0
-        )  # (T+k-1, N, -1)
-        ## unfold function will create consecutive action sequences
-        action_seq = (
-            action_padded.unfold(dimension=0, size=self.planning_steps, step=1)
-            .permute(3, 0, 1, 2)
-            .view(self.planning_steps, num_steps * num_sampler, action_embed_size)
-        )  # (k, T*N, -1)
-        beliefs = beliefs.view(num_steps * num_sampler, -1).unsqueeze(0)  # (1, T*N, -1)
-
-        # get future contexts c_{t+1:t+k} = GRU(b_t, a_{t:t+k-1})
-        future_contexts_all, _ = aux_model.context_model(
-            action_seq, beliefs
-        )  # (k, T*N, -1)
-        ## NOTE: future_contexts_all starting from next step t+1 to t+k, not t to t+k-1
-        future_contexts_all = future_contexts_all.view(
-            self.planning_steps, num_steps, num_sampler, -1
-        ).permute(
-            1, 0, 2, 3
-        )  # (k, T, N, -1)
-
-        # get all the classifier scores I(c_{t+1:t+k}; z_{t+1:t+k})
-        positives_padding = torch.zeros(
-            self.planning_steps, num_sampler, obs_embed_size
-        ).to(
-            positives
-        )  # (k, N, -1)
-        positives_padded = torch.cat(
-            (positives[1:], positives_padding), dim=0
-        )  # (T+k-1, N, -1)
-        positives_expanded = positives_padded.unfold(
-            dimension=0, size=self.planning_steps, step=1
-        ).permute(
-            0, 3, 1, 2
-        )  # (T, k, N, -1)
-        positives_logits = aux_model.classifier(
-            torch.cat([positives_expanded, future_contexts_all], -1)
-        )  # (T, k, N, 1)
-        positive_loss = self.cross_entropy_loss(
-            positives_logits, torch.ones_like(positives_logits)
-        )  # (T, k, N, 1)
-
-        negatives_padding = torch.zeros(
-            self.planning_steps, num_sampler, obs_embed_size
-        ).to(
-            negatives
-        )  # (k, N, -1)
-        negatives_padded = torch.cat(
-            (negatives[1:], negatives_padding), dim=0
-        )  # (T+k-1, N, -1)
-        negatives_expanded = negatives_padded.unfold(
-            dimension=0, size=self.planning_steps, step=1
-        ).permute(
-            0, 3, 1, 2
-        )  # (T, k, N, -1)
-        negatives_logits = aux_model.classifier(
-            torch.cat([negatives_expanded, future_contexts_all], -1)
-        )  # (T, k, N, 1)
-        negative_loss = self.cross_entropy_loss(
-            negatives_logits, torch.zeros_like(negatives_logits)
+        positive_loss, negative_loss, valid_masks = _cpca_losses(
+            aux_model=aux_model,
+            obs_embeds=obs_embeds,
+            actions=actions,
+            beliefs=beliefs,
+            masks=masks,
+            planning_steps=self.planning_steps,
+            cross_entropy_loss=self.cross_entropy_loss,
         )  # (T, k, N, 1)
 
-        # Masking to get valid scores
-        ## masks: Note which timesteps [1, T+k+1] could have valid queries, at distance (k) (note offset by 1)
-        ## we will extract the **diagonals** as valid_masks from masks later as below
-        ## the vertical axis is (absolute) real timesteps, the horizontal axis is (relative) planning timesteps
-        ## | - - - - - |
-        ## | .         |
-        ## | , .       |
-        ## | . , .     |
-        ## | , . , .   |
-        ## |   , . , . |
-        ## |     , . , |
-        ## |       , . |
-        ## |         , |
-        ## | - - - - - |
-        masks = masks.squeeze(-1)  # (T, N)
-        pred_masks = torch.ones(
-            num_steps + self.planning_steps,
-            self.planning_steps,
-            num_sampler,
-            1,
-            dtype=torch.bool,
-        ).to(
-            beliefs.device
-        )  # (T+k, k, N, 1)
-
-        pred_masks[
-            num_steps - 1 :
-        ] = False  # GRU(b_t, a_{t:t+k-1}) is invalid when t >= T, as we don't have real z_{t+1}
-        for j in range(1, self.planning_steps + 1):  # for j-step predictions
-            pred_masks[
-                : j - 1, j - 1
-            ] = False  # Remove the upper triangle above the diagnonal (but I think this is unnecessary for valid_masks)
-            for n in range(num_sampler):
-                has_zeros_batch = torch.where(masks[:, n] == 0)[0]
-                # in j-step prediction, timesteps z -> z + j are disallowed as those are the first j timesteps of a new episode
-                # z-> z-1 because of pred_masks being offset by 1
-                for z in has_zeros_batch:
-                    pred_masks[
-                        z - 1 : z - 1 + j, j - 1, n
-                    ] = False  # can affect j timesteps
-
-        # instead of the whole range, we actually are only comparing a window i:i+k for each query/target i - for each, select the appropriate k
-        # we essentially gather diagonals from this full mask, t of them, k long
-        valid_diagonals = [
-            torch.diagonal(pred_masks, offset=-i) for i in range(num_steps)
-        ]  # pull the appropriate k per timestep
-        valid_masks = (
-            torch.stack(valid_diagonals, dim=0).permute(0, 3, 1, 2).float()
-        )  # (T, N, 1, k) -> (T, k, N, 1)
-        # print(valid_masks.int().squeeze(-1)); print(masks) # verify its correctness
-
         loss_masks = valid_masks * _bernoulli_subsample_mask_like(
             valid_masks, self.subsample_rate
         )  # (T, k, N, 1)
@@ -551,6 +665,114 @@ class CPCALoss(AuxiliaryLoss):
         )
 
 
+class MultiHorizonCPCALoss(AuxiliaryLoss):
+    """
+    Several CPC|A auxiliary tasks (see `CPCALoss`), with different numbers of
+        planning steps, computed together.
+
+    The losses of all the horizons share the auxiliary model, a single unrolled pass
+        of its context model (that of the longest horizon, which covers the shorter
+        ones), the negatives and the subsampling of the predictions. The loss of every
+        horizon is the one `CPCALoss` would compute with the same auxiliary model,
+        negatives and subsampling, and the total loss is their weighted sum.
+    """
+
+    UUID = "CPCA_multi_horizon"
+
+    def __init__(
+        self,
+        planning_steps: Sequence[int] = (1, 2, 4, 8, 16),
+        planning_steps_weights: Optional[Sequence[float]] = None,
+        subsample_rate: float = 0.2,
+        *args,
+        **kwargs
+    ):
+        """
+        # Parameters
+        planning_steps : The numbers of planning steps of the CPC|A tasks.
+        planning_steps_weights : The weights of the losses of the tasks in the total loss
+            (defaults to 1 for all of them).
+        subsample_rate : See `CPCALoss`.
+        """
+        super().__init__(auxiliary_uuid=self.UUID, *args, **kwargs)
+        assert len(planning_steps) > 0 and len(set(planning_steps)) == len(
+            planning_steps
+        ), "`planning_steps` should be non-empty, without duplicates."
+        if planning_steps_weights is None:
+            planning_steps_weights = [1.0] * len(planning_steps)
+        assert len(planning_steps_weights) == len(planning_steps)
+        assert self.max_subsampled_steps is None or self.max_subsampled_steps >= max(
+            planning_steps
+        ), "`max_subsampled_steps` should be at least the largest `planning_steps`."
+
+        self.planning_steps = list(planning_steps)
+        self.planning_steps_weights = list(planning_steps_weights)
+        self.subsample_rate = subsample_rate
+        self.cross_entropy_loss = nn.BCEWithLogitsLoss(reduction="none")
+
+    def get_aux_loss(
+        self,
+        aux_model: nn.Module,
+        observations: ObservationType,
+        obs_embeds: torch.FloatTensor,
+        actions: torch.FloatTensor,
+        beliefs: torch.FloatTensor,
+        masks: torch.FloatTensor,
+        *args,
+        **kwargs
+    ):
+        max_planning_steps = max(self.planning_steps)
+        positive_loss, negative_loss, valid_masks = _cpca_losses(
+            aux_model=aux_model,
+            obs_embeds=obs_embeds,
+            actions=actions,
+            beliefs=beliefs,
+            masks=masks,
+            planning_steps=max_planning_steps,
+            cross_entropy_loss=self.cross_entropy_loss,
+        )  # (T, K, N, 1)
+
+        loss_masks = valid_masks * _bernoulli_subsample_mask_like(
+            valid_masks, self.subsample_rate
+        )  # (T, K, N, 1)
+
+        # Sums over the (valid) predictions up to j steps ahead, for j = 1, ..., K
+        cum_num_valid_losses = torch.cumsum(
+            (loss_masks != 0).sum(dim=(0, 2, 3)), dim=0
+        )  # (K,)
+        cum_positive_loss = torch.cumsum(
+            (positive_loss * loss_masks).sum(dim=(0, 2, 3)), dim=0
+        )  # (K,)
+        cum_negative_loss = torch.cumsum(
+            (negative_loss * loss_masks).sum(dim=(0, 2, 3)), dim=0
+        )  # (K,)
+
+        horizon_inds = torch.tensor(
+            [steps - 1 for steps in self.planning_steps], device=loss_masks.device
+        )
+        num_valid_losses = torch.clamp(cum_num_valid_losses[horizon_inds], min=1.0)
+        avg_positive_losses = cum_positive_loss[horizon_inds] / num_valid_losses
+        avg_negative_losses = cum_negative_loss[horizon_inds] / num_valid_losses
+        avg_losses = avg_positive_losses + avg_negative_losses
+
+        total_loss = (
+            avg_losses * torch.tensor(self.planning_steps_weights).to(avg_losses)
+        ).sum()
+
+        outputs = {"total": cast(torch.Tensor, total_loss).item()}
+        for steps, avg_loss, avg_positive_loss, avg_negative_loss in zip(
+            self.planning_steps,
+            avg_losses.tolist(),
+            avg_positive_losses.tolist(),
+            avg_negative_losses.tolist(),
+        ):
+            outputs["total_{}".format(steps)] = avg_loss
+            outputs["positive_loss_{}".format(steps)] = avg_positive_loss
+            outputs["negative_loss_{}".format(steps)] = avg_negative_loss
+
+        return total_loss, outputs
+
+
 class CPCA1Loss(CPCALoss):
     UUID = "CPCA_1"
 
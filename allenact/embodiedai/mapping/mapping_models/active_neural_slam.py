@@ -22,7 +22,7 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 import math
-from typing import Optional, Tuple, Dict, Any
+from typing import Optional, Tuple, Dict, Any, Callable, Hashable
 
 import numpy as np
 import torch
@@ -40,6 +40,122 @@ def _inv_sigmoid(x: torch.Tensor):
     return torch.log(x) - torch.log1p(-x)
 
 
+def _rotation_matrices(degrees: torch.Tensor) -> torch.Tensor:
+    """(# batches)x2x2 matrices `[[cos, -sin], [sin, cos]]` of the given
+    rotations."""
+    theta = degrees * DEGREES_TO_RADIANS
+    cos_theta = torch.cos(theta)
+    sin_theta = torch.sin(theta)
+    return torch.stack(
+        (
+            torch.stack((cos_theta, -sin_theta), -1),
+            torch.stack((sin_theta, cos_theta), -1),
+        ),
+        1,
+    )
+
+
+class _RotationGridCache(object):
+    """Cache of the sampling grids (see `F.affine_grid`) of affine
+    transformations whose linear part only depends on a rotation.
+
+    Agents taking discrete actions are only ever rotated by multiples of some
+    increment (e.g. 90 or 30 degrees). For such rotations the grid of the linear
+    part of the transformation is computed once (for all multiples of
+    `increment_in_degrees` at once) and the translation is simply added to it.
+    Grids of batches containing other rotations are computed as usual.
+    """
+
+    def __init__(self, increment_in_degrees: float):
+        num_rotations = 360.0 / increment_in_degrees
+        assert (
+            abs(num_rotations - round(num_rotations)) < 1e-6
+        ), "The rotation increment should divide 360 degrees."
+
+        self.increment_in_degrees = increment_in_degrees
+        self.num_rotations = int(round(num_rotations))
+        self._grids: Dict[Hashable, torch.Tensor] = {}
+
+    def affine_grid(
+        self,
+        key: Hashable,
+        linear_fn: Callable[[torch.Tensor], torch.Tensor],
+        rotations: torch.Tensor,
+        offsets: torch.Tensor,
+        output_height_width: Tuple[int, int],
+    ) -> torch.Tensor:
+        """Returns the `F.affine_grid` sampling grids of the transformations
+        `[linear_fn(rotations) | offsets]`.
+
+        # Parameters
+        key : Identifies `linear_fn` (e.g. its name and the shapes it depends on).
+        linear_fn : Function mapping (# batches) rotations (in degrees) to (# batches)x2x2 matrices.
+        rotations : The (# batches) rotations.
+        offsets : The (# batches)x2 translations.
+        output_height_width : The height/width of the grids.
+        """
+        nbatch = rotations.shape[0]
+        height, width = output_height_width
+
+        rotation_inds = rotations / self.increment_in_degrees
+        rounded_rotation_inds = torch.round(rotation_inds)
+        if nbatch == 0 or (rotation_inds - rounded_rotation_inds).abs().max() > 1e-4:
+            return _affine_grid(
+                linear=linear_fn(rotations),
+                offsets=offsets,
+                output_height_width=output_height_width,
+            )
+
+        cache_key = (key, height, width, rotations.device, rotations.dtype)
+        if cache_key not in self._grids:
+            all_rotations = self.increment_in_degrees * torch.arange(
+                self.num_rotations, device=rotations.device, dtype=rotations.dtype
+            )
+            linear = linear_fn(all_rotations)
+            self._grids[cache_key] = _affine_grid(
+                linear=linear,
+                offsets=linear.new_zeros((self.num_rotations, 2)),
+                output_height_width=output_height_width,
+            )
+
+        return self._grids[cache_key][
+            torch.remainder(rounded_rotation_inds.long(), self.num_rotations)
+        ] + offsets.view(nbatch, 1, 1, 2)
+
+
+def _affine_grid(
+    linear: torch.Tensor, offsets: torch.Tensor, output_height_width: Tuple[int, int]
+) -> torch.Tensor:
+    return F.affine_grid(
+        torch.cat((linear, offsets.unsqueeze(-1)), dim=-1),
+        [linear.shape[0], 1, *output_height_width],
+        align_corners=False,
+    )
+
+
+def _rotation_affine_grid(
+    linear_fn: Callable[[torch.Tensor], torch.Tensor],
+    rotations: torch.Tensor,
+    offsets: torch.Tensor,
+    output_height_width: Tuple[int, int],
+    rotation_grid_cache: Optional[_RotationGridCache] = None,
+    cache_key: Optional[Hashable] = None,
+):
+    if rotation_grid_cache is None:
+        return _affine_grid(
+            linear=linear_fn(rotations),
+            offsets=offsets,
+            output_height_width=output_height_width,
+        )
+    return rotation_grid_cache.affine_grid(
+        key=cache_key,
+        linear_fn=linear_fn,
+        rotations=rotations,
+        offsets=offsets,
+        output_height_width=output_height_width,
+    )
+
+
 class ActiveNeuralSLAM(nn.Module):
     """Active Neural SLAM module.
 
@@ -74,6 +190,8 @@ class ActiveNeuralSLAM(nn.Module):
         pretrained_resnet: bool = True,
         freeze_resnet_batchnorm: bool = True,
         use_resnet_layernorm: bool = False,
+        use_cropped_map_transforms: bool = False,
+        grid_cache_rotation_increment_in_degrees: Optional[float] = None,
     ):
         """Initialize an Active Neural SLAM module.
 
@@ -104,6 +222,16 @@ class ActiveNeuralSLAM(nn.Module):
         use_resnet_layernorm : If you've enabled `freeze_resnet_batchnorm` (recommended) you'll likely want
             to normalize the output from the ResNet18 model as we've found that these values can otherwise
             grow quite large harming learning.
+        use_cropped_map_transforms : If `True`, the egocentric/allocentric map transformations (in
+            `allocentric_map_to_egocentric_view` and when updating allocentric maps in `forward`) only
+            resample the bounded region of the map around the agent which can be observed, fusing
+            rotation and translation into a single grid sample. This is much cheaper for large maps. Note that,
+            when moving egocentric views into allocentric maps, this single grid sample means that the
+            results will differ slightly from the default (rotate-then-translate) transformation for rotations
+            that are not multiples of 90 degrees.
+        grid_cache_rotation_increment_in_degrees : If not `None` (and `use_cropped_map_transforms` is `True`),
+            the sampling grids for rotations which are multiples of this increment (e.g. 90 or 30) are cached
+            rather than recomputed on every call.
         """
         super(ActiveNeuralSLAM, self).__init__()
         self.frame_height = frame_height
@@ -116,6 +244,13 @@ class ActiveNeuralSLAM(nn.Module):
         self.dropout = 0.5
         self.use_pose_estimation = use_pose_estimation
         self.freeze_resnet_batchnorm = freeze_resnet_batchnorm
+        self.use_cropped_map_transforms = use_cropped_map_transforms
+        self.rotation_grid_cache = (
+            _RotationGridCache(grid_cache_rotation_increment_in_degrees)
+            if use_cropped_map_transforms
+            and grid_cache_rotation_increment_in_degrees is not None
+            else None
+        )
 
         self.max_abs_map_logit_value = 20
 
@@ -281,6 +416,11 @@ class ActiveNeuralSLAM(nn.Module):
         self, allocentric_map: torch.Tensor, xzr: torch.Tensor, padding_mode: str
     ):
         # Index the egocentric viewpoints at the given xzr locations
+        if self.use_cropped_map_transforms:
+            return self._cropped_allocentric_map_to_egocentric_view(
+                allocentric_map=allocentric_map, xzr=xzr, padding_mode=padding_mode
+            )
+
         with torch.no_grad():
             allocentric_map = allocentric_map.float()
             xzr = xzr.float()
@@ -323,6 +463,57 @@ class ActiveNeuralSLAM(nn.Module):
             cropped = ego_map[:, :, :vr, (center - half_vr) : (center + half_vr)]
             return cropped
 
+    def _cropped_allocentric_map_to_egocentric_view(
+        self, allocentric_map: torch.Tensor, xzr: torch.Tensor, padding_mode: str
+    ):
+        """Equivalent to the default `allocentric_map_to_egocentric_view` but
+        only grid samples the (cropped) egocentric view rather than a full-size
+        egocentric map."""
+        with torch.no_grad():
+            allocentric_map = allocentric_map.float()
+            xzr = xzr.float()
+            allo_h, allo_w = allocentric_map.shape[-2:]
+
+            vr = self.vision_range
+            half_vr = vr // 2
+            center = self.map_size_in_cm // (2 * self.resolution_in_cm)
+            crop_h, crop_w = vr, 2 * half_vr
+
+            # The (normalized) coordinates p of the cropped view correspond to the coordinates
+            # `crop_scale * p + crop_offset` of the full-size egocentric map
+            crop_scale = xzr.new([crop_w / allo_w, crop_h / allo_h])
+            crop_offset = xzr.new(
+                [(2 * (center - half_vr) + crop_w) / allo_w - 1, crop_h / allo_h - 1]
+            )
+
+            def linear_fn(rotations: torch.Tensor):
+                return _rotation_matrices(rotations) * crop_scale.view(1, 1, 2)
+
+            # As in `allocentric_map_to_egocentric_view`, the translation centers the
+            # agent and then moves the view in the direction the agent is facing
+            rot_mat = _rotation_matrices(xzr[:, 2])
+            scaler = 2 * (100 / (self.resolution_in_cm * self.map_size))
+            offsets = (
+                (rot_mat @ crop_offset.view(1, 2, 1)).squeeze(-1)
+                + rot_mat[:, :, 1]
+                + scaler * xzr[:, :2]
+                - 1
+            )
+
+            return F.grid_sample(
+                allocentric_map,
+                _rotation_affine_grid(
+                    linear_fn=linear_fn,
+                    rotations=xzr[:, 2],
+                    offsets=offsets,
+                    output_height_width=(crop_h, crop_w),
+                    rotation_grid_cache=self.rotation_grid_cache,
+                    cache_key=("egocentric_view", allo_h, allo_w, crop_h, crop_w),
+                ),
+                padding_mode=padding_mode,
+                align_corners=False,
+            )
+
     def estimate_egocentric_dx_dz_dr(
         self,
         map_probs_egocentric: torch.Tensor,
@@ -500,6 +691,8 @@ class ActiveNeuralSLAM(nn.Module):
                     xzrs_allocentric=updated_xzrs_allocentrc,
                     allocentric_map_height_width=(self.map_size, self.map_size),
                     resolution_in_cm=self.resolution_in_cm,
+                    use_cropped_transform=self.use_cropped_map_transforms,
+                    rotation_grid_cache=self.rotation_grid_cache,
                 )
 
                 map_probs_allocentric = torch.max(
@@ -523,6 +716,8 @@ def _move_egocentric_map_view_into_allocentric_position(
     xzrs_allocentric: torch.Tensor,
     allocentric_map_height_width: Tuple[int, int],
     resolution_in_cm: float,
+    use_cropped_transform: bool = False,
+    rotation_grid_cache: Optional[_RotationGridCache] = None,
 ):
     """Translate/rotate an egocentric map view into an allocentric map.
 
@@ -559,6 +754,12 @@ def _move_egocentric_map_view_into_allocentric_position(
     resolution_in_cm : Resolution (in cm) of map to be returned (and of map_probs_egocentric). I.e.
         `map_probs_egocentric[0,0,0:1,0:1]` should correspond to a `resolution_in_cm x resolution_in_cm`
         square on the ground plane in the world.
+    use_cropped_transform : If `True`, rather than placing the egocentric map views into full-size maps
+        and rotating/translating these with two full-size grid samples, the egocentric map views are
+        rotated/translated (with a single grid sample) into the bounded windows of the allocentric map
+        which they can overlap. This is much cheaper for large allocentric maps.
+    rotation_grid_cache : Optional cache of the sampling grids of (discrete) rotations, only used
+        when `use_cropped_transform` is `True`.
 
     # Returns
     `(# batches) x (# channels) x (# allocentric_map_height_width[0]) x (# allocentric_map_height_width[1])`
@@ -594,6 +795,18 @@ def _move_egocentric_map_view_into_allocentric_position(
     x2 = x1 + ego_w
     z1 = allo_h // 2
     z2 = z1 + ego_h
+
+    if use_cropped_transform:
+        return _move_egocentric_map_view_into_allocentric_window(
+            map_probs_egocentric=map_probs_egocentric,
+            xzrs_allocentric=xzrs_allocentric,
+            full_size_ego_map_update_probs=full_size_ego_map_update_probs,
+            ego_top_left_in_full_size_map=(z1, x1),
+            max_view_range=max_view_range,
+            resolution_in_cm=resolution_in_cm,
+            rotation_grid_cache=rotation_grid_cache,
+        )
+
     full_size_ego_map_update_probs[:, :, z1:z2, x1:x2] = map_probs_egocentric
 
     # Now we'll rotate and translate `full_size_ego_map_update_probs`
@@ -645,3 +858,127 @@ def _move_egocentric_map_view_into_allocentric_position(
         padding_mode="zeros",
         align_corners=False,
     )
+
+
+def _move_egocentric_map_view_into_allocentric_window(
+    map_probs_egocentric: torch.Tensor,
+    xzrs_allocentric: torch.Tensor,
+    full_size_ego_map_update_probs: torch.Tensor,
+    ego_top_left_in_full_size_map: Tuple[int, int],
+    max_view_range: float,
+    resolution_in_cm: float,
+    rotation_grid_cache: Optional[_RotationGridCache],
+):
+    """Cropped version of `_move_egocentric_map_view_into_allocentric_position`
+    writing the rotated/translated egocentric views into the (zero-filled)
+    `full_size_ego_map_update_probs`.
+
+    The two affine transformations of the full-size version (a rotation
+    followed by a translation) are composed, along with the affine maps from the
+    (normalized) coordinates of a window around the agent to those of the full-
+    size map and from the coordinates of the full-size map to those of the
+    egocentric view, so that each egocentric view is sampled into its window
+    with a single grid sample.
+    """
+    nbatch, c, ego_h, ego_w = map_probs_egocentric.shape
+    allo_h, allo_w = full_size_ego_map_update_probs.shape[-2:]
+    z1, x1 = ego_top_left_in_full_size_map
+
+    # The egocentric views cover a disk of radius `max_view_range` around the agent,
+    # with some margin for the bilinear interpolation
+    half_window = int(math.ceil(max_view_range)) + 2
+    win_h, win_w = min(2 * half_window, allo_h), min(2 * half_window, allo_w)
+
+    xzrs = xzrs_allocentric.detach().float()
+    rotations = -xzrs[:, 2]  # Notice the negative sign, as in the full-size version
+
+    # The (normalized) translation `t` of the full-size version
+    translations = torch.stack(
+        (
+            xzrs[:, 0] * (100.0 / resolution_in_cm) / (allo_w / 2) - 1.0,
+            xzrs[:, 1] * (100.0 / resolution_in_cm) / (allo_h / 2) - 1.0,
+        ),
+        dim=-1,
+    )
+
+    # The agent is at (normalized) position `-t` in the allocentric map, windows are
+    # centered on the agent and kept within the map (which is fine as the parts of
+    # the windows that would have been outside of the map would be discarded anyway)
+    agent_rows = ((1.0 - translations[:, 1]) * allo_h - 1.0) / 2.0
+    agent_cols = ((1.0 - translations[:, 0]) * allo_w - 1.0) / 2.0
+    row_starts = torch.clamp(
+        torch.floor(agent_rows).long() - win_h // 2 + 1, 0, allo_h - win_h
+    )
+    col_starts = torch.clamp(
+        torch.floor(agent_cols).long() - win_w // 2 + 1, 0, allo_w - win_w
+    )
+
+    # Window coordinates p correspond to coordinates `window_scale * p + window_offsets`
+    # of the full-size map ...
+    window_scale = xzrs.new([win_w / allo_w, win_h / allo_h])
+    window_offsets = torch.stack(
+        (
+            (2 * col_starts.float() + win_w) / allo_w - 1.0,
+            (2 * row_starts.float() + win_h) / allo_h - 1.0,
+        ),
+        dim=-1,
+    )
+    # ... and full-size map coordinates q correspond to coordinates `ego_scale * q + ego_offset`
+    # of the egocentric views
+    ego_scale = xzrs.new([allo_w / ego_w, allo_h / ego_h])
+    ego_offset = xzrs.new(
+        [(allo_w - 2 * x1) / ego_w - 1.0, (allo_h - 2 * z1) / ego_h - 1.0]
+    )
+
+    def linear_fn(rots: torch.Tensor):
+        return (
+            ego_scale.view(1, 2, 1)
+            * _rotation_matrices(rots)
+            * window_scale.view(1, 1, 2)
+        )
+
+    offsets = (
+        ego_scale.view(1, 2)
+        * (
+            _rotation_matrices(rotations)
+            @ (window_offsets + translations).unsqueeze(-1)
+        ).squeeze(-1)
+        + ego_offset
+    )
+
+    windows = F.grid_sample(
+        map_probs_egocentric.float(),
+        _rotation_affine_grid(
+            linear_fn=linear_fn,
+            rotations=rotations,
+            offsets=offsets,
+            output_height_width=(win_h, win_w),
+            rotation_grid_cache=rotation_grid_cache,
+            cache_key=(
+                "allocentric_window",
+                ego_h,
+                ego_w,
+                allo_h,
+                allo_w,
+                win_h,
+                win_w,
+            ),
+        ),
+        padding_mode="zeros",
+        align_corners=False,
+    )
+
+    # Paste the windows into the full-size maps
+    device = full_size_ego_map_update_probs.device
+    batch_inds = torch.arange(nbatch, device=device).view(-1, 1, 1)
+    row_inds = row_starts.to(device).view(-1, 1, 1) + torch.arange(
+        win_h, device=device
+    ).view(1, -1, 1)
+    col_inds = col_starts.to(device).view(-1, 1, 1) + torch.arange(
+        win_w, device=device
+    ).view(1, 1, -1)
+    full_size_ego_map_update_probs.permute(0, 2, 3, 1)[
+        batch_inds, row_inds, col_inds
+    ] = windows.permute(0, 2, 3, 1).to(full_size_ego_map_update_probs.dtype)
+
+    return full_size_ego_map_update_probs
@@ -22,8 +22,9 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import math
 import random
-from typing import Optional, Sequence, Union, Dict
+from typing import Callable, Dict, Iterator, Optional, Sequence, Tuple, Union
 
 import cv2
 import numpy as np
@@ -36,6 +37,198 @@ from allenact.embodiedai.mapping.mapping_utils.point_cloud_utils import (
 )
 
 
+class TiledMap(object):
+    """A `(height, width, channels)` map stored as fixed-size `(tile_size,
+    tile_size, channels)` tiles which are only allocated once written to.
+
+    Agents only ever observe a small part of large (e.g. 40m at a 5cm resolution)
+    maps, storing these maps as tiles allocated on first touch (rather than as
+    dense arrays) hence greatly reduces the memory used by map builders (see the
+    `tile_size_in_map_units` parameter of `BinnedPointCloudMapBuilder` and
+    `SemanticMapBuilder`). Tiles which were never written to are implicitly zero.
+
+    # Attributes
+
+    shape : The `(height, width, channels)` shape of the map.
+    dtype : The data type of the map.
+    tile_size : The number of rows/columns of a tile (tiles at the bottom/right
+        border of the map may be smaller).
+    tiles : Dictionary mapping `(tile_row, tile_col)` indices to allocated tiles.
+    """
+
+    def __init__(
+        self, shape: Sequence[int], dtype: np.dtype, tile_size: int = 64,
+    ):
+        assert len(shape) == 3 and tile_size > 0
+
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.tile_size = tile_size
+        self.tiles: Dict[Tuple[int, int], np.ndarray] = {}
+
+    @property
+    def nbytes(self) -> int:
+        return sum(tile.nbytes for tile in self.tiles.values())
+
+    def clear(self):
+        self.tiles = {}
+
+    def _tile_windows(
+        self, rows: slice, cols: slice
+    ) -> Iterator[Tuple[Tuple[int, int], Tuple[slice, slice], Tuple[slice, slice]]]:
+        """Iterates over the tiles overlapping the `[rows, cols]` window of the
+        map, yielding their indices, the overlapping slices of the tile and the
+        corresponding slices of the window."""
+        row_start, row_end, _ = rows.indices(self.shape[0])
+        col_start, col_end, _ = cols.indices(self.shape[1])
+        ts = self.tile_size
+        for tile_row in range(row_start // ts, (row_end - 1) // ts + 1):
+            r0 = max(row_start, tile_row * ts)
+            r1 = min(row_end, (tile_row + 1) * ts)
+            for tile_col in range(col_start // ts, (col_end - 1) // ts + 1):
+                c0 = max(col_start, tile_col * ts)
+                c1 = min(col_end, (tile_col + 1) * ts)
+                yield (
+                    (tile_row, tile_col),
+                    (
+                        slice(r0 - tile_row * ts, r1 - tile_row * ts),
+                        slice(c0 - tile_col * ts, c1 - tile_col * ts),
+                    ),
+                    (
+                        slice(r0 - row_start, r1 - row_start),
+                        slice(c0 - col_start, c1 - col_start),
+                    ),
+                )
+
+    def _get_or_create_tile(self, tile_index: Tuple[int, int]) -> np.ndarray:
+        tile = self.tiles.get(tile_index)
+        if tile is None:
+            tile_row, tile_col = tile_index
+            tile = np.zeros(
+                (
+                    min(self.tile_size, self.shape[0] - tile_row * self.tile_size),
+                    min(self.tile_size, self.shape[1] - tile_col * self.tile_size),
+                    self.shape[2],
+                ),
+                dtype=self.dtype,
+            )
+            self.tiles[tile_index] = tile
+        return tile
+
+    def window(self, rows: slice, cols: slice) -> np.ndarray:
+        """Returns a dense copy of the `[rows, cols]` window of the map."""
+        row_start, row_end, _ = rows.indices(self.shape[0])
+        col_start, col_end, _ = cols.indices(self.shape[1])
+        out = np.zeros(
+            (max(row_end - row_start, 0), max(col_end - col_start, 0), self.shape[2],),
+            dtype=self.dtype,
+        )
+        if out.size == 0:
+            return out
+        for tile_index, tile_slices, window_slices in self._tile_windows(rows, cols):
+            tile = self.tiles.get(tile_index)
+            if tile is not None:
+                out[window_slices] = tile[tile_slices]
+        return out
+
+    def to_dense(self) -> np.ndarray:
+        return self.window(slice(None), slice(None))
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        dense = self.to_dense()
+        return dense if dtype is None else dense.astype(dtype)
+
+    def update_(
+        self,
+        update: np.ndarray,
+        op: Callable = np.add,
+        window: Optional[Tuple[slice, slice]] = None,
+    ):
+        """Applies `op(map, update)` in place, where `update` is a dense array
+        with the map's shape (or with the shape of the `(rows, cols)` `window`
+        of the map, if given, in which case `update` is zero outside of this
+        window), only touching the tiles where `update` is non-zero (so that
+        `op(x, 0)` should equal `x`)."""
+        if window is None:
+            window = (slice(None), slice(None))
+        row_start, row_end, _ = window[0].indices(self.shape[0])
+        col_start, col_end, _ = window[1].indices(self.shape[1])
+        assert update.shape == (
+            max(row_end - row_start, 0),
+            max(col_end - col_start, 0),
+            self.shape[2],
+        )
+
+        nonzero = update.any(-1)
+        nonzero_rows = np.flatnonzero(nonzero.any(1))
+        if len(nonzero_rows) == 0:
+            return
+        nonzero_cols = np.flatnonzero(nonzero.any(0))
+        update = update[
+            nonzero_rows[0] : nonzero_rows[-1] + 1,
+            nonzero_cols[0] : nonzero_cols[-1] + 1,
+        ]
+        rows = slice(row_start + nonzero_rows[0], row_start + nonzero_rows[-1] + 1)
+        cols = slice(col_start + nonzero_cols[0], col_start + nonzero_cols[-1] + 1)
+
+        for tile_index, tile_slices, window_slices in self._tile_windows(rows, cols):
+            update_window = update[window_slices]
+            if update_window.any():
+                tile = self._get_or_create_tile(tile_index)[tile_slices]
+                op(tile, update_window, out=tile, casting="unsafe")
+
+    def add_(self, update: np.ndarray, window: Optional[Tuple[slice, slice]] = None):
+        self.update_(update, op=np.add, window=window)
+
+    def logical_or_(
+        self, update: np.ndarray, window: Optional[Tuple[slice, slice]] = None
+    ):
+        self.update_(update, op=np.logical_or, window=window)
+
+    def set_channel_(self, channel: int, values: np.ndarray):
+        """Sets the `channel`-th channel of the map to the (`height x width`)
+        `values`."""
+        assert values.shape == self.shape[:2]
+
+        for tile_index, tile_slices, window_slices in self._tile_windows(
+            slice(None), slice(None)
+        ):
+            values_window = values[window_slices]
+            if tile_index in self.tiles or values_window.any():
+                self._get_or_create_tile(tile_index)[
+                    tile_slices + (channel,)
+                ] = values_window
+
+
+def _vision_range_window(
+    camera_xyz: np.ndarray,
+    vision_range_in_map_units: int,
+    fov: float,
+    resolution_in_cm: int,
+    map_size: int,
+) -> Tuple[slice, slice]:
+    """The (non-empty) `(rows, cols)` window of a map containing every point
+    observed by a camera at `camera_xyz` (relative to the map's `min_xyz`)
+    whose depth is within the vision range."""
+    # The camera space rays of all pixels have x/y coordinates within
+    # `tan(fov / 2)` (for a z coordinate of 1), bounding the distance of points
+    radius = vision_range_in_map_units * math.sqrt(
+        1 + 2 * math.tan(math.radians(fov / 2)) ** 2
+    )
+
+    def limits(center: float) -> slice:
+        start = min(max(int(math.floor(center - radius)) - 1, 0), map_size - 1)
+        return slice(
+            start, max(min(int(math.ceil(center + radius)) + 2, map_size), start + 1)
+        )
+
+    # Rows correspond to z and columns to x (see `flip_row_col`)
+    return (
+        limits(100 * float(camera_xyz[2]) / resolution_in_cm),
+        limits(100 * float(camera_xyz[0]) / resolution_in_cm),
+    )
+
+
 class BinnedPointCloudMapBuilder(object):
     """Class used to iteratively construct a map of "free space" based on input
     depth maps (i.e. pointclouds).
@@ -66,6 +259,9 @@ class BinnedPointCloudMapBuilder(object):
         calling `reset(...)`.
     device : A `torch.device` on which to run computations. If this device is a GPU you can potentially
         obtain significant speed-ups.
+    tile_size_in_map_units : If not `None`, the map is stored as a `TiledMap` with tiles of this size
+        (only allocated once the agent observes them) rather than as a dense array. This greatly reduces
+        the memory used for large maps while `update` returns the same (dense) outputs.
     """
 
     def __init__(
@@ -76,6 +272,7 @@ class BinnedPointCloudMapBuilder(object):
         resolution_in_cm: int,
         height_bins: Sequence[float],
         device: torch.device = torch.device("cpu"),
+        tile_size_in_map_units: Optional[int] = None,
     ):
         assert vision_range_in_cm % resolution_in_cm == 0
 
@@ -85,15 +282,22 @@ class BinnedPointCloudMapBuilder(object):
         self.resolution_in_cm = resolution_in_cm
         self.height_bins = height_bins
         self.device = device
+        self.tile_size_in_map_units = tile_size_in_map_units
 
-        self.binned_point_cloud_map = np.zeros(
-            (
-                self.map_size_in_cm // self.resolution_in_cm,
-                self.map_size_in_cm // self.resolution_in_cm,
-                len(self.height_bins) + 1,
-            ),
-            dtype=np.float32,
+        map_shape = (
+            self.map_size_in_cm // self.resolution_in_cm,
+            self.map_size_in_cm // self.resolution_in_cm,
+            len(self.height_bins) + 1,
         )
+        self.binned_point_cloud_map: Union[np.ndarray, TiledMap]
+        if self.tile_size_in_map_units is None:
+            self.binned_point_cloud_map = np.zeros(map_shape, dtype=np.float32)
+        else:
+            self.binned_point_cloud_map = TiledMap(
+                shape=map_shape,
+                dtype=np.float32,
+                tile_size=self.tile_size_in_map_units,
+            )
 
         self.min_xyz: Optional[np.ndarray] = None
 
@@ -103,6 +307,7 @@ class BinnedPointCloudMapBuilder(object):
         camera_xyz: np.ndarray,
         camera_rotation: float,
         camera_horizon: float,
+        ego_only: bool = False,
     ) -> Dict[str, np.ndarray]:
         """Updates the map with the input depth frame from the agent.
 
@@ -126,11 +331,27 @@ class BinnedPointCloudMapBuilder(object):
              is what is used to update the internally stored representation of the map.
         *  `"map"` -  A `(map_size)x(map_size)x(len(self.height_bins) + 1)` tensor corresponding
             to the sum of all `"allocentric_update"` values since the last `reset()`.
+
+        If `ego_only` is `True`, only `"egocentric_update"` is returned (so that, if the map is stored
+        as a `TiledMap`, no map-sized array is built).
         ```
         """
         with torch.no_grad():
             assert self.min_xyz is not None, "Please call `reset` before `update`."
 
+            map_size = self.binned_point_cloud_map.shape[0]
+            # The (dense) map is updated as a whole while only the window of a tiled
+            # map within the agent's vision range is updated
+            window = (slice(None), slice(None))
+            if isinstance(self.binned_point_cloud_map, TiledMap):
+                window = _vision_range_window(
+                    camera_xyz=camera_xyz - self.min_xyz,
+                    vision_range_in_map_units=self.vision_range_in_map_units,
+                    fov=self.fov,
+                    resolution_in_cm=self.resolution_in_cm,
+                    map_size=map_size,
+                )
+
             camera_xyz = (
                 torch.from_numpy(camera_xyz - self.min_xyz).float().to(self.device)
             )
@@ -139,7 +360,7 @@ class BinnedPointCloudMapBuilder(object):
             depth_frame[
                 depth_frame
                 > self.vision_range_in_map_units * self.resolution_in_cm / 100
-            ] = np.NaN
+            ] = np.nan
 
             world_space_point_cloud = depth_frame_to_world_space_xyz(
                 depth_frame=depth_frame,
@@ -153,9 +374,10 @@ class BinnedPointCloudMapBuilder(object):
                 xyz_points=world_space_point_cloud,
                 bin_axis="y",
                 bins=self.height_bins,
-                map_size=self.binned_point_cloud_map.shape[0],
+                map_size=map_size,
                 resolution_in_cm=self.resolution_in_cm,
                 flip_row_col=True,
+                map_window=window,
             )
 
             # Center the cloud on the agent
@@ -181,31 +403,45 @@ class BinnedPointCloudMapBuilder(object):
                 [xoffset, 0, 0]
             ).to(self.device)
 
-            allocentric_update_numpy = world_binned_map_update.cpu().numpy()
-            self.binned_point_cloud_map = (
-                self.binned_point_cloud_map + allocentric_update_numpy
-            )
+            world_update_numpy = world_binned_map_update.cpu().numpy()
+            if isinstance(self.binned_point_cloud_map, TiledMap):
+                self.binned_point_cloud_map.add_(world_update_numpy, window=window)
+            else:
+                self.binned_point_cloud_map = (
+                    self.binned_point_cloud_map + world_update_numpy
+                )
 
+            # Only the agent's vision range is projected
+            vr = self.vision_range_in_map_units
+            vr_div_2 = self.vision_range_in_map_units // 2
+            width_div_2 = map_size // 2
             agent_centric_binned_map = project_point_cloud_to_map(
                 xyz_points=agent_centric_point_cloud,
                 bin_axis="y",
                 bins=self.height_bins,
-                map_size=self.binned_point_cloud_map.shape[0],
+                map_size=map_size,
                 resolution_in_cm=self.resolution_in_cm,
                 flip_row_col=True,
+                map_window=(
+                    slice(0, vr),
+                    slice(width_div_2 - vr_div_2, width_div_2 + vr_div_2),
+                ),
             )
-            vr = self.vision_range_in_map_units
-            vr_div_2 = self.vision_range_in_map_units // 2
-            width_div_2 = agent_centric_binned_map.shape[1] // 2
-            agent_centric_binned_map = agent_centric_binned_map[
-                :vr, (width_div_2 - vr_div_2) : (width_div_2 + vr_div_2), :
-            ]
 
-            return {
-                "egocentric_update": agent_centric_binned_map.cpu().numpy(),
-                "allocentric_update": allocentric_update_numpy,
-                "map": self.binned_point_cloud_map,
-            }
+            outputs = {"egocentric_update": agent_centric_binned_map.cpu().numpy()}
+            if ego_only:
+                return outputs
+
+            if isinstance(self.binned_point_cloud_map, TiledMap):
+                outputs["allocentric_update"] = np.zeros(
+                    self.binned_point_cloud_map.shape, dtype=world_update_numpy.dtype
+                )
+                outputs["allocentric_update"][window] = world_update_numpy
+                outputs["map"] = self.binned_point_cloud_map.to_dense()
+            else:
+                outputs["allocentric_update"] = world_update_numpy
+                outputs["map"] = self.binned_point_cloud_map
+            return outputs
 
     def reset(self, min_xyz: np.ndarray):
         """Reset the map.
@@ -218,7 +454,10 @@ class BinnedPointCloudMapBuilder(object):
             will have been normalized so the (0,0,:) entry corresponds to these minimum values.
         """
         self.min_xyz = min_xyz
-        self.binned_point_cloud_map = np.zeros_like(self.binned_point_cloud_map)
+        if isinstance(self.binned_point_cloud_map, TiledMap):
+            self.binned_point_cloud_map.clear()
+        else:
+            self.binned_point_cloud_map = np.zeros_like(self.binned_point_cloud_map)
 
 
 class ObjectHull2d:
@@ -246,6 +485,78 @@ class ObjectHull2d:
         )
 
 
+def _xzs_to_colrows(
+    xzs: np.ndarray,
+    min_xyz: np.ndarray,
+    resolution_in_cm: int,
+    map_shape: Sequence[int],
+):
+    height, width = map_shape[:2]
+    return np.clip(
+        np.int32(
+            ((100 / resolution_in_cm) * (xzs - np.array([[min_xyz[0], min_xyz[2]]])))
+        ),
+        a_min=0,
+        a_max=np.array(
+            [width - 1, height - 1]
+        ),  # width then height as we're returns cols then rows
+    )
+
+
+def _build_ground_truth_semantic_map(
+    semantic_map: Union[np.ndarray, TiledMap],
+    object_hulls: Sequence[ObjectHull2d],
+    object_type_to_index: Dict[str, int],
+    min_xyz: np.ndarray,
+    resolution_in_cm: int,
+):
+    """Fills the (`uint8`) `semantic_map` in place with the projections of the
+    given object hulls (see `SemanticMapBuilder.build_ground_truth_map`)."""
+    if isinstance(semantic_map, TiledMap):
+        # Rasterize one channel at a time so that no dense copy of the full map is needed
+        semantic_map.clear()
+        channel = np.zeros((*semantic_map.shape[:2], 1), dtype=np.uint8)
+        for ind in sorted(set(object_type_to_index.values())):
+            channel_object_hulls = [
+                object_hull
+                for object_hull in object_hulls
+                if object_type_to_index.get(object_hull.object_type) == ind
+            ]
+            if len(channel_object_hulls) == 0:
+                continue
+
+            _build_ground_truth_semantic_map(
+                semantic_map=channel,
+                object_hulls=channel_object_hulls,
+                object_type_to_index={
+                    object_hull.object_type: 0 for object_hull in channel_object_hulls
+                },
+                min_xyz=min_xyz,
+                resolution_in_cm=resolution_in_cm,
+            )
+            semantic_map.set_channel_(ind, channel[:, :, 0])
+        return
+
+    semantic_map.fill(0)
+
+    for object_hull in object_hulls:
+        ot = object_hull.object_type
+
+        if ot in object_type_to_index:
+            ind = object_type_to_index[ot]
+
+            semantic_map[:, :, ind : (ind + 1)] = cv2.fillConvexPoly(
+                img=np.array(semantic_map[:, :, ind : (ind + 1)], dtype=np.uint8),
+                points=_xzs_to_colrows(
+                    xzs=np.array(object_hull.hull_points),
+                    min_xyz=min_xyz,
+                    resolution_in_cm=resolution_in_cm,
+                    map_shape=semantic_map.shape,
+                ),
+                color=255,
+            )
+
+
 class SemanticMapBuilder(object):
     """Class used to iteratively construct a semantic map based on input depth
     maps (i.e. pointclouds).
@@ -265,7 +576,8 @@ class SemanticMapBuilder(object):
     only attribute present in this class that is not present in `BinnedPointCloudMapBuilder` is
     `ordered_object_types` which corresponds to a list of unique object types where
     object type `ordered_object_types[i]` will correspond to the `i`th channel of the map
-    generated by this class.
+    generated by this class. If `tile_size_in_map_units` is not `None`, both the ground truth
+    semantic map and the explored mask are stored as `TiledMap`s.
     """
 
     def __init__(
@@ -276,6 +588,7 @@ class SemanticMapBuilder(object):
         resolution_in_cm: int,
         ordered_object_types: Sequence[str],
         device: torch.device = torch.device("cpu"),
+        tile_size_in_map_units: Optional[int] = None,
     ):
         self.fov = fov
         self.vision_range_in_map_units = vision_range_in_cm // resolution_in_cm
@@ -283,27 +596,32 @@ class SemanticMapBuilder(object):
         self.resolution_in_cm = resolution_in_cm
         self.ordered_object_types = tuple(ordered_object_types)
         self.device = device
+        self.tile_size_in_map_units = tile_size_in_map_units
 
         self.object_type_to_index = {
             ot: i for i, ot in enumerate(self.ordered_object_types)
         }
 
-        self.ground_truth_semantic_map = np.zeros(
-            (
-                self.map_size_in_cm // self.resolution_in_cm,
-                self.map_size_in_cm // self.resolution_in_cm,
-                len(self.ordered_object_types),
-            ),
-            dtype=np.uint8,
-        )
-        self.explored_mask = np.zeros(
-            (
-                self.map_size_in_cm // self.resolution_in_cm,
-                self.map_size_in_cm // self.resolution_in_cm,
-                1,
-            ),
-            dtype=bool,
-        )
+        map_size = self.map_size_in_cm // self.resolution_in_cm
+        semantic_map_shape = (map_size, map_size, len(self.ordered_object_types))
+        self.ground_truth_semantic_map: Union[np.ndarray, TiledMap]
+        self.explored_mask: Union[np.ndarray, TiledMap]
+        if self.tile_size_in_map_units is None:
+            self.ground_truth_semantic_map = np.zeros(
+                semantic_map_shape, dtype=np.uint8
+            )
+            self.explored_mask = np.zeros((map_size, map_size, 1), dtype=bool)
+        else:
+            self.ground_truth_semantic_map = TiledMap(
+                shape=semantic_map_shape,
+                dtype=np.uint8,
+                tile_size=self.tile_size_in_map_units,
+            )
+            self.explored_mask = TiledMap(
+                shape=(map_size, map_size, 1),
+                dtype=bool,
+                tile_size=self.tile_size_in_map_units,
+            )
 
         self.min_xyz: Optional[np.ndarray] = None
 
@@ -331,40 +649,68 @@ class SemanticMapBuilder(object):
         )
 
     def _xzs_to_colrows(self, xzs: np.ndarray):
-        height, width, _ = self.ground_truth_semantic_map.shape
-        return np.clip(
-            np.int32(
-                (
-                    (100 / self.resolution_in_cm)
-                    * (xzs - np.array([[self.min_xyz[0], self.min_xyz[2]]]))
-                )
-            ),
-            a_min=0,
-            a_max=np.array(
-                [width - 1, height - 1]
-            ),  # width then height as we're returns cols then rows
+        return _xzs_to_colrows(
+            xzs=xzs,
+            min_xyz=self.min_xyz,
+            resolution_in_cm=self.resolution_in_cm,
+            map_shape=self.ground_truth_semantic_map.shape,
         )
 
     def build_ground_truth_map(self, object_hulls: Sequence[ObjectHull2d]):
-        self.ground_truth_semantic_map.fill(0)
-
-        height, width, _ = self.ground_truth_semantic_map.shape
-        for object_hull in object_hulls:
-            ot = object_hull.object_type
+        _build_ground_truth_semantic_map(
+            semantic_map=self.ground_truth_semantic_map,
+            object_hulls=object_hulls,
+            object_type_to_index=self.object_type_to_index,
+            min_xyz=self.min_xyz,
+            resolution_in_cm=self.resolution_in_cm,
+        )
 
-            if ot in self.object_type_to_index:
-                ind = self.object_type_to_index[ot]
+    def _windowed_sampling_grid(
+        self,
+        rotation_and_translate_mat: torch.Tensor,
+        out_rows: slice,
+        out_cols: slice,
+        window: Tuple[slice, slice],
+    ) -> torch.Tensor:
+        """The `F.affine_grid(rotation_and_translate_mat, ...)` sampling grid
+        of a map-sized output, restricted to its `[out_rows, out_cols]` window
+        and expressed in the (`align_corners=False`) normalized coordinates of
+        the `window` of the map (rather than of the whole map)."""
+        map_size = self.ground_truth_semantic_map.shape[0]
+
+        def normalized(indices: slice):
+            return (
+                2
+                * torch.arange(indices.start, indices.stop, device=self.device).float()
+                + 1
+            ) / map_size - 1
+
+        rows = normalized(out_rows)
+        cols = normalized(out_cols)
+        grid = (
+            torch.stack(
+                (
+                    cols.view(1, -1).expand(len(rows), -1),
+                    rows.view(-1, 1).expand(-1, len(cols)),
+                ),
+                dim=-1,
+            )
+            @ rotation_and_translate_mat[:, :2].T
+            + rotation_and_translate_mat[:, 2]
+        )
 
-                self.ground_truth_semantic_map[
-                    :, :, ind : (ind + 1)
-                ] = cv2.fillConvexPoly(
-                    img=np.array(
-                        self.ground_truth_semantic_map[:, :, ind : (ind + 1)],
-                        dtype=np.uint8,
-                    ),
-                    points=self._xzs_to_colrows(np.array(object_hull.hull_points)),
-                    color=255,
-                )
+        window_start = torch.FloatTensor([window[1].start, window[0].start]).to(
+            self.device
+        )
+        window_size = (
+            torch.FloatTensor([window[1].stop, window[0].stop]).to(self.device)
+            - window_start
+        )
+        return (
+            grid * (map_size / window_size)
+            + (map_size - 2 * window_start) / window_size
+            - 1
+        ).unsqueeze(0)
 
     def update(
         self,
@@ -372,6 +718,7 @@ class SemanticMapBuilder(object):
         camera_xyz: np.ndarray,
         camera_rotation: float,
         camera_horizon: float,
+        ego_only: bool = False,
     ) -> Dict[str, np.ndarray]:
         """Updates the map with the input depth frame from the agent.
 
@@ -382,19 +729,34 @@ class SemanticMapBuilder(object):
         returns two masks with keys `"egocentric_mask"` and `"mask"`
         that can be used to determine what portions of the map have been
         observed by the agent so far in the egocentric and world-space
-        reference frames respectively.
+        reference frames respectively. If `ego_only` is `True`, only the
+        `"egocentric_update"` and `"egocentric_mask"` are returned.
         """
         with torch.no_grad():
             assert self.min_xyz is not None
 
-            camera_xyz = torch.from_numpy(camera_xyz - self.min_xyz).to(self.device)
             map_size = self.ground_truth_semantic_map.shape[0]
+            # Only the window of tiled maps within the agent's vision range is
+            # read/updated (see `BinnedPointCloudMapBuilder.update`)
+            window = (slice(None), slice(None))
+            if isinstance(self.ground_truth_semantic_map, TiledMap):
+                window = _vision_range_window(
+                    camera_xyz=camera_xyz - self.min_xyz,
+                    vision_range_in_map_units=self.vision_range_in_map_units,
+                    fov=self.fov,
+                    resolution_in_cm=self.resolution_in_cm,
+                    map_size=map_size,
+                )
+            row_start, row_end, _ = window[0].indices(map_size)
+            col_start, col_end, _ = window[1].indices(map_size)
+
+            camera_xyz = torch.from_numpy(camera_xyz - self.min_xyz).to(self.device)
 
             depth_frame = torch.from_numpy(depth_frame).to(self.device)
             depth_frame[
                 depth_frame
                 > self.vision_range_in_map_units * self.resolution_in_cm / 100
-            ] = np.NaN
+            ] = np.nan
 
             world_space_point_cloud = depth_frame_to_world_space_xyz(
                 depth_frame=depth_frame,
@@ -412,20 +774,20 @@ class SemanticMapBuilder(object):
                     map_size=map_size,
                     resolution_in_cm=self.resolution_in_cm,
                     flip_row_col=True,
+                    map_window=window,
                 )
                 > 0.001
             )
+            if isinstance(self.ground_truth_semantic_map, TiledMap):
+                ground_truth_window = self.ground_truth_semantic_map.window(*window)
+            else:
+                ground_truth_window = self.ground_truth_semantic_map
+            world_update = torch.logical_and(
+                torch.from_numpy(ground_truth_window).to(self.device),
+                world_newly_explored,
+            )
             world_update_and_mask = torch.cat(
-                (
-                    torch.logical_and(
-                        torch.from_numpy(self.ground_truth_semantic_map).to(
-                            self.device
-                        ),
-                        world_newly_explored,
-                    ),
-                    world_newly_explored,
-                ),
-                dim=-1,
+                (world_update, world_newly_explored), dim=-1,
             ).float()
             world_update_and_mask_for_sample = world_update_and_mask.unsqueeze(
                 0
@@ -477,42 +839,63 @@ class SemanticMapBuilder(object):
                 (rot_mat, offset_to_top_of_image + offset_to_center_the_agent,), dim=1,
             )
 
-            ego_update_and_mask = F.grid_sample(
-                world_update_and_mask_for_sample.to(self.device),
-                F.affine_grid(
-                    rotation_and_translate_mat.to(self.device).unsqueeze(0),
-                    world_update_and_mask_for_sample.shape,
-                    align_corners=False,
-                ),
-                align_corners=False,
-            )
-
-            # All that's left now is to crop out the portion of the transformed tensor that we actually
-            # care about (i.e. the portion corresponding to the agent's `self.vision_range_in_map_units`.
+            # All that's left now is to sample the portion of the transformed tensor that we actually
+            # care about (i.e. the portion corresponding to the agent's `self.vision_range_in_map_units`).
             vr = self.vision_range_in_map_units
             half_vr = vr // 2
             center = self.map_size_in_cm // (2 * self.resolution_in_cm)
-            cropped = ego_update_and_mask[
-                :, :, :vr, (center - half_vr) : (center + half_vr)
-            ]
+            if isinstance(self.ground_truth_semantic_map, TiledMap):
+                grid = self._windowed_sampling_grid(
+                    rotation_and_translate_mat=rotation_and_translate_mat,
+                    out_rows=slice(0, vr),
+                    out_cols=slice(center - half_vr, center + half_vr),
+                    window=(slice(row_start, row_end), slice(col_start, col_end)),
+                )
+            else:
+                grid = F.affine_grid(
+                    rotation_and_translate_mat.to(self.device).unsqueeze(0),
+                    world_update_and_mask_for_sample.shape,
+                    align_corners=False,
+                )[:, :vr, (center - half_vr) : (center + half_vr)]
 
-            np.logical_or(
-                self.explored_mask,
-                world_newly_explored.cpu().numpy(),
-                out=self.explored_mask,
+            cropped = F.grid_sample(
+                world_update_and_mask_for_sample.to(self.device),
+                grid,
+                align_corners=False,
             )
 
-            return {
+            outputs = {
                 "egocentric_update": cropped[0, :-1].permute(1, 2, 0).cpu().numpy(),
                 "egocentric_mask": (cropped[0, -1:].view(vr, vr, 1) > 0.001)
                 .cpu()
                 .numpy(),
-                "explored_mask": np.array(self.explored_mask),
-                "map": np.logical_and(
-                    self.explored_mask, (self.ground_truth_semantic_map > 0)
-                ),
             }
 
+            if isinstance(self.explored_mask, TiledMap):
+                self.explored_mask.logical_or_(
+                    world_newly_explored.cpu().numpy(), window=window
+                )
+            else:
+                np.logical_or(
+                    self.explored_mask,
+                    world_newly_explored.cpu().numpy(),
+                    out=self.explored_mask,
+                )
+            if ego_only:
+                return outputs
+
+            if isinstance(self.explored_mask, TiledMap):
+                explored_mask = self.explored_mask.to_dense()
+                ground_truth_semantic_map = self.ground_truth_semantic_map.to_dense()
+            else:
+                explored_mask = np.array(self.explored_mask)
+                ground_truth_semantic_map = self.ground_truth_semantic_map
+            outputs["explored_mask"] = explored_mask
+            outputs["map"] = np.logical_and(
+                explored_mask, (ground_truth_semantic_map > 0)
+            )
+            return outputs
+
     def reset(self, min_xyz: np.ndarray, object_hulls: Sequence[ObjectHull2d]):
         """Reset the map.
 
@@ -527,3 +910,411 @@ class SemanticMapBuilder(object):
         """
         self.min_xyz = min_xyz
         self.build_ground_truth_map(object_hulls=object_hulls)
+
+
+def _as_float_tensor(
+    x: Union[np.ndarray, torch.Tensor, Sequence[float]], device: torch.device
+) -> torch.Tensor:
+    if not isinstance(x, torch.Tensor):
+        x = torch.from_numpy(np.asarray(x, dtype=np.float32))
+    return x.to(device=device, dtype=torch.float32)
+
+
+class BatchedBinnedPointCloudMapBuilder(object):
+    """Batched version of `BinnedPointCloudMapBuilder` building the maps of
+    several agents at once.
+
+    The maps of all `batch_size` agents are kept in a single
+    `[batch_size, map_size, map_size, len(height_bins) + 1]` tensor on `device`
+    and every call to `update` takes a stacked batch of depth frames and camera
+    poses (one per agent), converting these to point clouds, projecting them
+    to the map and accumulating them with a single set of (batched) operations.
+    Inputs and outputs are tensors so that this class can be used on the
+    trainer side, e.g. with (batched) observations of depth sensors, rather
+    than within each task sampler's process.
+
+    # Attributes
+
+    See the documentation of `BinnedPointCloudMapBuilder`. Additionally:
+
+    batch_size : The number of agents whose maps are built.
+    binned_point_cloud_map : The `[batch_size, map_size, map_size, len(height_bins) + 1]` maps.
+    min_xyzs : The `[batch_size, 3]` minimum xyz coordinates of the agents' scenes
+        (see `reset`), `NaN` for agents whose maps have not yet been reset.
+    """
+
+    def __init__(
+        self,
+        fov: float,
+        vision_range_in_cm: int,
+        map_size_in_cm: int,
+        resolution_in_cm: int,
+        height_bins: Sequence[float],
+        batch_size: int,
+        device: torch.device = torch.device("cpu"),
+    ):
+        assert vision_range_in_cm % resolution_in_cm == 0
+
+        self.fov = fov
+        self.vision_range_in_map_units = vision_range_in_cm // resolution_in_cm
+        self.map_size_in_cm = map_size_in_cm
+        self.resolution_in_cm = resolution_in_cm
+        self.height_bins = height_bins
+        self.batch_size = batch_size
+        self.device = device
+
+        map_size = self.map_size_in_cm // self.resolution_in_cm
+        self.binned_point_cloud_map = torch.zeros(
+            (batch_size, map_size, map_size, len(self.height_bins) + 1),
+            dtype=torch.float32,
+            device=self.device,
+        )
+        self.min_xyzs = torch.full(
+            (batch_size, 3), float("nan"), dtype=torch.float32, device=self.device
+        )
+
+    def update(
+        self,
+        depth_frames: Union[np.ndarray, torch.Tensor],
+        camera_xyzs: Union[np.ndarray, torch.Tensor],
+        camera_rotations: Union[np.ndarray, torch.Tensor, Sequence[float]],
+        camera_horizons: Union[np.ndarray, torch.Tensor, Sequence[float]],
+    ) -> Dict[str, torch.Tensor]:
+        """Updates the maps with the input depth frames from the agents.
+
+        # Parameters
+        depth_frames : The `[batch_size, M, M]` depth frames (in meters) of the agents.
+        camera_xyzs : The `[batch_size, 3]` world-space positions of the agents' cameras.
+        camera_rotations : The `[batch_size]` rotations (in degrees) of the agents' cameras.
+        camera_horizons : The `[batch_size]` horizons (in degrees) of the agents' cameras.
+
+        # Returns
+        A dictionary with the same keys as the one returned by `BinnedPointCloudMapBuilder.update`
+        but where every value is a tensor (on `self.device`) with an additional leading
+        `batch_size` dimension.
+        """
+        with torch.no_grad():
+            assert not torch.isnan(
+                self.min_xyzs
+            ).any(), "Please call `reset` for all agents before `update`."
+
+            camera_xyzs = _as_float_tensor(camera_xyzs, self.device) - self.min_xyzs
+            camera_rotations = _as_float_tensor(camera_rotations, self.device)
+            camera_horizons = _as_float_tensor(camera_horizons, self.device)
+
+            depth_frames = _as_float_tensor(depth_frames, self.device)
+            depth_frames = torch.where(
+                depth_frames
+                > self.vision_range_in_map_units * self.resolution_in_cm / 100,
+                depth_frames.new_full((), float("nan")),
+                depth_frames,
+            )
+
+            world_space_point_clouds = depth_frame_to_world_space_xyz(
+                depth_frame=depth_frames,
+                camera_world_xyz=camera_xyzs,
+                rotation=camera_rotations,
+                horizon=camera_horizons,
+                fov=self.fov,
+            )
+
+            world_binned_map_updates = project_point_cloud_to_map(
+                xyz_points=world_space_point_clouds,
+                bin_axis="y",
+                bins=self.height_bins,
+                map_size=self.binned_point_cloud_map.shape[1],
+                resolution_in_cm=self.resolution_in_cm,
+                flip_row_col=True,
+            ).float()
+            self.binned_point_cloud_map += world_binned_map_updates
+
+            # Center the clouds on the agents
+            recentered_point_clouds = world_space_point_clouds - (
+                camera_xyzs * camera_xyzs.new([1.0, 0.0, 1.0])
+            ).view(-1, 1, 1, 3)
+            # Rotate the clouds so that positive-z is the direction the agents are looking
+            # (no negative since THOR rotations are already backwards)
+            theta = np.pi * camera_rotations / 180
+            cos_theta, sin_theta = torch.cos(theta), torch.sin(theta)
+            zeros, ones = torch.zeros_like(theta), torch.ones_like(theta)
+            # fmt: off
+            rotation_transforms = torch.stack(
+                [
+                    cos_theta, zeros, -sin_theta,
+                    zeros, ones, zeros,  # unchanged
+                    sin_theta, zeros, cos_theta,
+                ],
+                dim=-1,
+            ).view(-1, 3, 3)
+            # fmt: on
+            rotated_point_clouds = torch.einsum(
+                "bhwj,bij->bhwi", recentered_point_clouds, rotation_transforms
+            )
+            xoffset = (self.map_size_in_cm / 100) / 2
+            agent_centric_point_clouds = (
+                rotated_point_clouds + rotated_point_clouds.new([xoffset, 0, 0])
+            )
+
+            agent_centric_binned_maps = project_point_cloud_to_map(
+                xyz_points=agent_centric_point_clouds,
+                bin_axis="y",
+                bins=self.height_bins,
+                map_size=self.binned_point_cloud_map.shape[1],
+                resolution_in_cm=self.resolution_in_cm,
+                flip_row_col=True,
+            )
+            vr = self.vision_range_in_map_units
+            vr_div_2 = self.vision_range_in_map_units // 2
+            width_div_2 = agent_centric_binned_maps.shape[2] // 2
+            agent_centric_binned_maps = agent_centric_binned_maps[
+                :, :vr, (width_div_2 - vr_div_2) : (width_div_2 + vr_div_2), :
+            ]
+
+            return {
+                "egocentric_update": agent_centric_binned_maps,
+                "allocentric_update": world_binned_map_updates,
+                "map": self.binned_point_cloud_map,
+            }
+
+    def reset(
+        self,
+        min_xyzs: Union[np.ndarray, torch.Tensor],
+        agent_indices: Optional[Sequence[int]] = None,
+    ):
+        """Reset the maps.
+
+        # Parameters
+        min_xyzs : A `[len(agent_indices), 3]` array of the minimum xyz coordinates of the scenes of the
+            agents whose maps are reset (see `BinnedPointCloudMapBuilder.reset`).
+        agent_indices : The indices of the agents whose maps should be reset (e.g. those that have
+            just started a new episode). If `None`, the maps of all agents are reset.
+        """
+        if agent_indices is None:
+            agent_indices = list(range(self.batch_size))
+        agent_indices = torch.as_tensor(
+            agent_indices, dtype=torch.long, device=self.device
+        )
+
+        self.min_xyzs[agent_indices] = _as_float_tensor(min_xyzs, self.device).view(
+            -1, 3
+        )
+        self.binned_point_cloud_map[agent_indices] = 0
+
+
+class BatchedSemanticMapBuilder(object):
+    """Batched version of `SemanticMapBuilder` building the semantic maps of
+    several agents at once.
+
+    As for `BatchedBinnedPointCloudMapBuilder`, all maps and masks are kept in
+    `[batch_size, map_size, map_size, C]` tensors on `device`, and every call
+    to `update` projects the stacked depth frames of all agents and rotates
+    the resulting world-space updates into the agents' egocentric frames with
+    a single (batched) `affine_grid`/`grid_sample`.
+
+    # Attributes
+
+    See the documentation of `SemanticMapBuilder`. Additionally:
+
+    batch_size : The number of agents whose maps are built.
+    ground_truth_semantic_map : The `[batch_size, map_size, map_size, len(ordered_object_types)]`
+        ground truth semantic maps of the agents' scenes.
+    explored_mask : The `[batch_size, map_size, map_size, 1]` masks of the regions explored
+        by the agents.
+    min_xyzs : The `[batch_size, 3]` minimum xyz coordinates of the agents' scenes
+        (see `reset`), `NaN` for agents whose maps have not yet been reset.
+    """
+
+    def __init__(
+        self,
+        fov: float,
+        vision_range_in_cm: int,
+        map_size_in_cm: int,
+        resolution_in_cm: int,
+        ordered_object_types: Sequence[str],
+        batch_size: int,
+        device: torch.device = torch.device("cpu"),
+    ):
+        self.fov = fov
+        self.vision_range_in_map_units = vision_range_in_cm // resolution_in_cm
+        self.map_size_in_cm = map_size_in_cm
+        self.resolution_in_cm = resolution_in_cm
+        self.ordered_object_types = tuple(ordered_object_types)
+        self.batch_size = batch_size
+        self.device = device
+
+        self.object_type_to_index = {
+            ot: i for i, ot in enumerate(self.ordered_object_types)
+        }
+
+        map_size = self.map_size_in_cm // self.resolution_in_cm
+        self.ground_truth_semantic_map = torch.zeros(
+            (batch_size, map_size, map_size, len(self.ordered_object_types)),
+            dtype=torch.bool,
+            device=self.device,
+        )
+        self.explored_mask = torch.zeros(
+            (batch_size, map_size, map_size, 1), dtype=torch.bool, device=self.device
+        )
+        self.min_xyzs = torch.full(
+            (batch_size, 3), float("nan"), dtype=torch.float32, device=self.device
+        )
+
+    def update(
+        self,
+        depth_frames: Union[np.ndarray, torch.Tensor],
+        camera_xyzs: Union[np.ndarray, torch.Tensor],
+        camera_rotations: Union[np.ndarray, torch.Tensor, Sequence[float]],
+        camera_horizons: Union[np.ndarray, torch.Tensor, Sequence[float]],
+    ) -> Dict[str, torch.Tensor]:
+        """Updates the maps with the input depth frames from the agents.
+
+        See the documentation of `BatchedBinnedPointCloudMapBuilder.update` for the
+        inputs, the returned dictionary has the same keys as the one returned by
+        `SemanticMapBuilder.update` but every value is a tensor (on `self.device`)
+        with an additional leading `batch_size` dimension.
+        """
+        with torch.no_grad():
+            assert not torch.isnan(
+                self.min_xyzs
+            ).any(), "Please call `reset` for all agents before `update`."
+
+            camera_xyzs = _as_float_tensor(camera_xyzs, self.device) - self.min_xyzs
+            camera_rotations = _as_float_tensor(camera_rotations, self.device)
+            camera_horizons = _as_float_tensor(camera_horizons, self.device)
+            map_size = self.ground_truth_semantic_map.shape[1]
+
+            depth_frames = _as_float_tensor(depth_frames, self.device)
+            depth_frames = torch.where(
+                depth_frames
+                > self.vision_range_in_map_units * self.resolution_in_cm / 100,
+                depth_frames.new_full((), float("nan")),
+                depth_frames,
+            )
+
+            world_space_point_clouds = depth_frame_to_world_space_xyz(
+                depth_frame=depth_frames,
+                camera_world_xyz=camera_xyzs,
+                rotation=camera_rotations,
+                horizon=camera_horizons,
+                fov=self.fov,
+            )
+
+            world_newly_explored = (
+                project_point_cloud_to_map(
+                    xyz_points=world_space_point_clouds,
+                    bin_axis="y",
+                    bins=[],
+                    map_size=map_size,
+                    resolution_in_cm=self.resolution_in_cm,
+                    flip_row_col=True,
+                )
+                > 0.001
+            )
+            world_update_and_mask_for_sample = (
+                torch.cat(
+                    (
+                        torch.logical_and(
+                            self.ground_truth_semantic_map, world_newly_explored
+                        ),
+                        world_newly_explored,
+                    ),
+                    dim=-1,
+                )
+                .float()
+                .permute(0, 3, 1, 2)
+            )
+
+            # As in `SemanticMapBuilder.update`, the world-space updates are rotated into the
+            # agents' egocentric frames by grid sampling, rotating the sampled square by the
+            # (negated) rotation of each agent and translating it so that it is centered
+            # on the agent and then moved in the agent's forward direction.
+            theta = -np.pi * camera_rotations / 180
+            cos_theta, sin_theta = torch.cos(theta), torch.sin(theta)
+            rot_mats = torch.stack(
+                [cos_theta, -sin_theta, sin_theta, cos_theta], dim=-1
+            ).view(-1, 2, 2)
+
+            scaler = 2 * (100 / (self.resolution_in_cm * map_size))
+            offsets_to_center_the_agents = (
+                scaler * camera_xyzs[:, [0, 2]].unsqueeze(-1) - 1
+            )
+            offsets_to_top_of_image = rot_mats[:, :, 1:]  # == rot_mats @ [0, 1]^T
+            rotation_and_translate_mats = torch.cat(
+                (rot_mats, offsets_to_top_of_image + offsets_to_center_the_agents),
+                dim=2,
+            )
+
+            ego_update_and_mask = F.grid_sample(
+                world_update_and_mask_for_sample,
+                F.affine_grid(
+                    rotation_and_translate_mats,
+                    world_update_and_mask_for_sample.shape,
+                    align_corners=False,
+                ),
+                align_corners=False,
+            )
+
+            vr = self.vision_range_in_map_units
+            half_vr = vr // 2
+            center = self.map_size_in_cm // (2 * self.resolution_in_cm)
+            cropped = ego_update_and_mask[
+                :, :, :vr, (center - half_vr) : (center + half_vr)
+            ]
+
+            self.explored_mask |= world_newly_explored
+
+            return {
+                "egocentric_update": cropped[:, :-1].permute(0, 2, 3, 1),
+                "egocentric_mask": (cropped[:, -1:].permute(0, 2, 3, 1) > 0.001),
+                "explored_mask": self.explored_mask.clone(),
+                "map": torch.logical_and(
+                    self.explored_mask, self.ground_truth_semantic_map
+                ),
+            }
+
+    def reset(
+        self,
+        min_xyzs: Union[np.ndarray, torch.Tensor],
+        object_hulls: Sequence[Sequence[ObjectHull2d]],
+        agent_indices: Optional[Sequence[int]] = None,
+    ):
+        """Reset the maps.
+
+        # Parameters
+        min_xyzs : A `[len(agent_indices), 3]` array of the minimum xyz coordinates of the scenes of the
+            agents whose maps are reset (see `SemanticMapBuilder.reset`).
+        object_hulls : For each agent whose map is reset, the object hulls corresponding to
+            objects in its scene.
+        agent_indices : The indices of the agents whose maps should be reset. If `None`,
+            the maps of all agents are reset.
+        """
+        if agent_indices is None:
+            agent_indices = list(range(self.batch_size))
+        agent_indices = list(agent_indices)
+
+        min_xyzs = np.asarray(
+            min_xyzs.cpu() if isinstance(min_xyzs, torch.Tensor) else min_xyzs,
+            dtype=np.float32,
+        ).reshape((-1, 3))
+        assert len(min_xyzs) == len(object_hulls) == len(agent_indices)
+
+        map_size = self.ground_truth_semantic_map.shape[1]
+        ground_truth_semantic_maps = np.zeros(
+            (len(agent_indices), map_size, map_size, len(self.ordered_object_types)),
+            dtype=np.uint8,
+        )
+        for it, (min_xyz, agent_object_hulls) in enumerate(zip(min_xyzs, object_hulls)):
+            _build_ground_truth_semantic_map(
+                semantic_map=ground_truth_semantic_maps[it],
+                object_hulls=agent_object_hulls,
+                object_type_to_index=self.object_type_to_index,
+                min_xyz=min_xyz,
+                resolution_in_cm=self.resolution_in_cm,
+            )
+
+        indices = torch.as_tensor(agent_indices, dtype=torch.long, device=self.device)
+        self.min_xyzs[indices] = torch.from_numpy(min_xyzs).to(self.device)
+        self.ground_truth_semantic_map[indices] = torch.from_numpy(
+            ground_truth_semantic_maps > 0
+        ).to(self.device)
+        self.explored_mask[indices] = False
@@ -22,18 +22,69 @@
 # OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
 # SOFTWARE.
 
+import functools
 import math
-from typing import Optional, Sequence, cast
+from typing import Optional, Sequence, Tuple, Union
 
 import numpy as np
 import torch
 
 
+def _camera_to_world_transforms(
+    rotation: Union[float, Sequence[float], np.ndarray, torch.Tensor],
+    horizon: Union[float, Sequence[float], np.ndarray, torch.Tensor],
+    like: torch.Tensor,
+) -> torch.Tensor:
+    """The (3x3) transformations points undergo due to the camera's horizon
+    and rotation, batched (Bx3x3) if `rotation` and `horizon` are sequences
+    of length B."""
+
+    def as_angles(x):
+        # In radians (and negated), on the device and with the dtype of `like`
+        return torch.as_tensor(x, dtype=like.dtype, device=like.device) * (
+            -math.pi / 180
+        )
+
+    # First compute the transformation that points undergo
+    # due to the camera's horizon
+    psi = as_angles(horizon)
+    cos_psi = torch.cos(psi)
+    sin_psi = torch.sin(psi)
+    zeros = torch.zeros_like(psi)
+    ones = torch.ones_like(psi)
+    horizon_transform = torch.stack(
+        [
+            torch.stack([ones, zeros, zeros], dim=-1),  # unchanged
+            torch.stack([zeros, cos_psi, sin_psi], dim=-1),
+            torch.stack([zeros, -sin_psi, cos_psi], dim=-1),
+        ],
+        dim=-2,
+    )
+
+    # Next compute the transformation that points undergo
+    # due to the agent's rotation about the y-axis
+    phi = as_angles(rotation)
+    cos_phi = torch.cos(phi)
+    sin_phi = torch.sin(phi)
+    zeros = torch.zeros_like(phi)
+    ones = torch.ones_like(phi)
+    rotation_transform = torch.stack(
+        [
+            torch.stack([cos_phi, zeros, -sin_phi], dim=-1),
+            torch.stack([zeros, ones, zeros], dim=-1),  # unchanged
+            torch.stack([sin_phi, zeros, cos_phi], dim=-1),
+        ],
+        dim=-2,
+    )
+
+    return rotation_transform @ horizon_transform
+
+
 def camera_space_xyz_to_world_xyz(
     camera_space_xyzs: torch.Tensor,
     camera_world_xyz: torch.Tensor,
-    rotation: float,
-    horizon: float,
+    rotation: Union[float, Sequence[float], np.ndarray, torch.Tensor],
+    horizon: Union[float, Sequence[float], np.ndarray, torch.Tensor],
 ) -> torch.Tensor:
     """Transforms xyz coordinates in the camera's coordinate frame to world-
     space (global) xyz frame.
@@ -56,84 +107,49 @@ def camera_space_xyz_to_world_xyz(
     # Parameters
     camera_space_xyzs : A 3xN matrix of xyz coordinates in the camera's reference frame.
         Here `x, y, z = camera_space_xyzs[:, i]` should equal the xyz coordinates for the ith point.
-    camera_world_xyz : The camera's xyz position in the world reference frame.
-    rotation : The world-space rotation (in degrees) of the camera.
-    horizon : The horizon (in degrees) of the camera.
+        Can also be a batch (Bx3xN) of such matrices, one for each of B cameras.
+    camera_world_xyz : The camera's xyz position in the world reference frame (a Bx3 matrix
+        if `camera_space_xyzs` is batched).
+    rotation : The world-space rotation (in degrees) of the camera (a sequence of B rotations
+        if `camera_space_xyzs` is batched).
+    horizon : The horizon (in degrees) of the camera (a sequence of B horizons
+        if `camera_space_xyzs` is batched).
 
     # Returns
     3xN tensor with entry [:, i] is the xyz world-space coordinate corresponding to the camera-space
-    coordinate camera_space_xyzs[:, i]
+    coordinate camera_space_xyzs[:, i] (or a Bx3xN tensor if the inputs are batched).
     """
     # Adapted from https://github.com/devendrachaplot/Neural-SLAM.
 
-    # First compute the transformation that points undergo
-    # due to the camera's horizon
-    psi = -horizon * np.pi / 180
-    cos_psi = np.cos(psi)
-    sin_psi = np.sin(psi)
-    # fmt: off
-    horizon_transform = camera_space_xyzs.new(
-        [
-            [1, 0, 0], # unchanged
-            [0, cos_psi, sin_psi],
-            [0, -sin_psi, cos_psi,],
-        ],
-    )
-    # fmt: on
-
-    # Next compute the transformation that points undergo
-    # due to the agent's rotation about the y-axis
-    phi = -rotation * np.pi / 180
-    cos_phi = np.cos(phi)
-    sin_phi = np.sin(phi)
-    # fmt: off
-    rotation_transform = camera_space_xyzs.new(
-        [
-            [cos_phi, 0, -sin_phi],
-            [0, 1, 0], # unchanged
-            [sin_phi, 0, cos_phi],],
+    # Apply the horizon and rotation transformations
+    view_points = (
+        _camera_to_world_transforms(
+            rotation=rotation, horizon=horizon, like=camera_space_xyzs
+        )
+        @ camera_space_xyzs
     )
-    # fmt: on
-
-    # Apply the above transformations
-    view_points = (rotation_transform @ horizon_transform) @ camera_space_xyzs
 
     # Translate the points w.r.t. the camera's position in world space.
-    world_points = view_points + camera_world_xyz[:, None]
+    world_points = view_points + camera_world_xyz[..., None]
     return world_points
 
 
-def depth_frame_to_camera_space_xyz(
-    depth_frame: torch.Tensor, mask: Optional[torch.Tensor], fov: float = 90
-) -> torch.Tensor:
-    """Transforms a input depth map into a collection of xyz points (i.e. a
-    point cloud) in the camera's coordinate frame.
+@functools.lru_cache(32)
+def _camera_space_rays(resolution: int, fov: float, device: torch.device):
+    """The 3x(resolution*resolution) xyz coordinates (in the camera's
+    coordinate frame) of the points at unit depth of every pixel of a square
+    frame, i.e. the point cloud of a depth frame of ones.
 
-    # Parameters
-    depth_frame : A square depth map, i.e. an MxM matrix with entry `depth_frame[i, j]` equaling
-        the distance from the camera to nearest surface at pixel (i,j).
-    mask : An optional boolean mask of the same size (MxM) as the input depth. Only values
-        where this mask are true will be included in the returned matrix of xyz coordinates. If
-        `None` then no pixels will be masked out (so the returned matrix of xyz points will have
-        dimension 3x(M*M)
-    fov: The field of view of the camera.
-
-    # Returns
-
-    A 3xN matrix with entry [:, i] equalling a the xyz coordinates (in the camera's coordinate
-    frame) of a point in the point cloud corresponding to the input depth frame.
+    These only depend on the resolution and fov of the camera and are cached
+    (per device), the returned tensor should hence not be modified in place.
     """
-    assert (
-        len(depth_frame.shape) == 2 and depth_frame.shape[0] == depth_frame.shape[1]
-    ), f"depth has shape {depth_frame.shape}, we only support (N, N) shapes for now."
-
-    resolution = depth_frame.shape[0]
-    if mask is None:
-        mask = torch.ones_like(depth_frame, dtype=bool)
-
     # pixel centers
     camera_space_yx_offsets = (
-        torch.stack(torch.where(mask))
+        torch.stack(
+            torch.where(
+                torch.ones((resolution, resolution), dtype=torch.bool, device=device)
+            )
+        )
         + 0.5  # Offset by 0.5 so that we are in the middle of the pixel
     )
 
@@ -146,7 +162,7 @@ def depth_frame_to_camera_space_xyz(
     # Put points on the clipping plane
     camera_space_yx_offsets *= (2.0 / resolution) * math.tan((fov / 2) / 180 * math.pi)
 
-    camera_space_xyz = torch.cat(
+    return torch.cat(
         [
             camera_space_yx_offsets[1:, :],  # This is x
             camera_space_yx_offsets[:1, :],  # This is y
@@ -155,14 +171,50 @@ def depth_frame_to_camera_space_xyz(
         axis=0,
     )
 
-    return camera_space_xyz * depth_frame[mask][None, :]
+
+def depth_frame_to_camera_space_xyz(
+    depth_frame: torch.Tensor, mask: Optional[torch.Tensor], fov: float = 90
+) -> torch.Tensor:
+    """Transforms a input depth map into a collection of xyz points (i.e. a
+    point cloud) in the camera's coordinate frame.
+
+    # Parameters
+    depth_frame : A square depth map, i.e. an MxM matrix with entry `depth_frame[i, j]` equaling
+        the distance from the camera to nearest surface at pixel (i,j). Can also be a batch
+        (BxMxM) of depth maps if `mask` is `None`.
+    mask : An optional boolean mask of the same size (MxM) as the input depth. Only values
+        where this mask are true will be included in the returned matrix of xyz coordinates. If
+        `None` then no pixels will be masked out (so the returned matrix of xyz points will have
+        dimension 3x(M*M)
+    fov: The field of view of the camera.
+
+    # Returns
+
+    A 3xN matrix with entry [:, i] equalling a the xyz coordinates (in the camera's coordinate
+    frame) of a point in the point cloud corresponding to the input depth frame (or a Bx3x(M*M)
+    tensor for a batch of depth frames).
+    """
+    assert (
+        len(depth_frame.shape) in [2, 3]
+        and depth_frame.shape[-2] == depth_frame.shape[-1]
+        and (mask is None or len(depth_frame.shape) == 2)
+    ), f"depth has shape {depth_frame.shape}, we only support (N, N) (or (B, N, N) without masks) shapes for now."
+
+    camera_space_rays = _camera_space_rays(
+        resolution=depth_frame.shape[-1], fov=fov, device=depth_frame.device
+    )
+
+    if mask is None:
+        return camera_space_rays * depth_frame.reshape(*depth_frame.shape[:-2], 1, -1)
+
+    return camera_space_rays[:, mask.view(-1)] * depth_frame[mask][None, :]
 
 
 def depth_frame_to_world_space_xyz(
     depth_frame: torch.Tensor,
     camera_world_xyz: torch.Tensor,
-    rotation: float,
-    horizon: float,
+    rotation: Union[float, Sequence[float], np.ndarray, torch.Tensor],
+    horizon: Union[float, Sequence[float], np.ndarray, torch.Tensor],
     fov: float,
 ):
     """Transforms a input depth map into a collection of xyz points (i.e. a
@@ -183,22 +235,21 @@ def depth_frame_to_world_space_xyz(
 
     # Parameters
     depth_frame : A square depth map, i.e. an MxM matrix with entry `depth_frame[i, j]` equaling
-        the distance from the camera to nearest surface at pixel (i,j).
-    mask : An optional boolean mask of the same size (MxM) as the input depth. Only values
-        where this mask are true will be included in the returned matrix of xyz coordinates. If
-        `None` then no pixels will be masked out (so the returned matrix of xyz points will have
-        dimension 3x(M*M)
-    camera_space_xyzs : A 3xN matrix of xyz coordinates in the camera's reference frame.
-        Here `x, y, z = camera_space_xyzs[:, i]` should equal the xyz coordinates for the ith point.
-    camera_world_xyz : The camera's xyz position in the world reference frame.
-    rotation : The world-space rotation (in degrees) of the camera.
-    horizon : The horizon (in degrees) of the camera.
+        the distance from the camera to nearest surface at pixel (i,j). Can also be a batch
+        (BxMxM) of depth maps in which case the below parameters should be batched as well.
+    camera_world_xyz : The camera's xyz position in the world reference frame (a Bx3 matrix
+        for a batch of depth maps).
+    rotation : The world-space rotation (in degrees) of the camera (a sequence of B rotations
+        for a batch of depth maps).
+    horizon : The horizon (in degrees) of the camera (a sequence of B horizons
+        for a batch of depth maps).
     fov: The field of view of the camera.
 
     # Returns
 
-    A 3xN matrix with entry [:, i] equalling a the xyz coordinates (in the world coordinate
-    frame) of a point in the point cloud corresponding to the input depth frame.
+    An MxMx3 tensor with entry [i, j, :] equalling the xyz coordinates (in the world coordinate
+    frame) of the point of the point cloud corresponding to pixel (i, j) of the input depth
+    frame (or a BxMxMx3 tensor for a batch of depth frames).
     """
 
     camera_space_xyz = depth_frame_to_camera_space_xyz(
@@ -212,7 +263,11 @@ def depth_frame_to_world_space_xyz(
         horizon=horizon,
     )
 
-    return world_points.view(3, *depth_frame.shape).permute(1, 2, 0)
+    if len(depth_frame.shape) == 2:
+        return world_points.view(3, *depth_frame.shape).permute(1, 2, 0)
+    return world_points.view(depth_frame.shape[0], 3, *depth_frame.shape[1:]).permute(
+        0, 2, 3, 1
+    )
 
 
 def project_point_cloud_to_map(
@@ -222,6 +277,7 @@ def project_point_cloud_to_map(
     map_size: int,
     resolution_in_cm: int,
     flip_row_col: bool,
+    map_window: Optional[Tuple[slice, slice]] = None,
 ):
     """Bins an input point cloud into a map tensor with the bins equaling the
     channels.
@@ -244,81 +300,82 @@ def project_point_cloud_to_map(
         in space.
     flip_row_col: Should the rows/cols of the map be flipped? See the 'Returns' section below for more
         info.
+    map_window: If not `None`, the `(rows, cols)` slices of the window of the map to compute (points
+        outside of this window are ignored), e.g. to avoid allocating a full map for a point cloud
+        known to lie within a small region of it.
 
     # Returns
     A collection of maps of shape (... x map_size x map_size x (len(bins)+1)), note that bin_axis
     has been moved to the last index of this returned map, the other two axes stay in their original
     order unless `flip_row_col` has been called in which case they are reversed (useful as often
-    rows should correspond to y or z instead of x).
+    rows should correspond to y or z instead of x). If `map_window` is given, only the corresponding
+    (... x window_rows x window_cols x (len(bins)+1)) window of these maps is returned.
     """
     bin_dim = ["x", "y", "z"].index(bin_axis)
 
     start_shape = xyz_points.shape
-    xyz_points = xyz_points.reshape([-1, *start_shape[-3:]])
-    num_clouds, h, w, _ = xyz_points.shape
+    num_points_per_cloud = start_shape[-3] * start_shape[-2]
+    xyz_points = xyz_points.reshape(-1, num_points_per_cloud, 3)
+    num_clouds = xyz_points.shape[0]
 
     if not flip_row_col:
-        new_order = [i for i in [0, 1, 2] if i != bin_dim] + [bin_dim]
+        row_col_dims = [i for i in [0, 1, 2] if i != bin_dim]
     else:
-        new_order = [i for i in [2, 1, 0] if i != bin_dim] + [bin_dim]
-
-    uvw_points = cast(
-        torch.Tensor, torch.stack([xyz_points[..., i] for i in new_order], dim=-1)
-    )
+        row_col_dims = [i for i in [2, 1, 0] if i != bin_dim]
 
     num_bins = len(bins) + 1
 
-    isnotnan = ~torch.isnan(xyz_points[..., 0])
+    if map_window is None:
+        map_window = (slice(None), slice(None))
+    row_start, row_end, _ = map_window[0].indices(map_size)
+    col_start, col_end, _ = map_window[1].indices(map_size)
+    height = max(row_end - row_start, 0)
+    width = max(col_end - col_start, 0)
+    if height * width == 0:
+        return torch.zeros(
+            (*start_shape[:-3], height, width, num_bins),
+            dtype=torch.float64,
+            device=xyz_points.device,
+        )
 
-    uvw_points_binned: torch.Tensor = torch.cat(
-        (
-            torch.round(100 * uvw_points[..., :-1] / resolution_in_cm).long(),
-            torch.bucketize(
-                uvw_points[..., -1:].contiguous(), boundaries=uvw_points.new(bins)
-            ),
-        ),
-        dim=-1,
+    # Row/column/bin indices (within the window) of every point, points that are NaN
+    # or fall outside of the window are given zero weight when counting
+    rows = (
+        torch.round(100 * xyz_points[..., row_col_dims[0]] / resolution_in_cm).long()
+        - row_start
     )
-
-    maxes = (
-        xyz_points.new()
-        .long()
-        .new([map_size, map_size, num_bins])
-        .reshape((1, 1, 1, 3))
+    cols = (
+        torch.round(100 * xyz_points[..., row_col_dims[1]] / resolution_in_cm).long()
+        - col_start
     )
-
-    isvalid = torch.logical_and(
-        torch.logical_and(
-            (uvw_points_binned >= 0).all(-1), (uvw_points_binned < maxes).all(-1),
-        ),
-        isnotnan,
+    bin_inds = torch.bucketize(
+        xyz_points[..., bin_dim].contiguous(), boundaries=xyz_points.new(bins)
     )
-
-    uvw_points_binned_with_index_mat = torch.cat(
-        (
-            torch.repeat_interleave(
-                torch.arange(0, num_clouds).to(xyz_points.device), h * w
-            ).reshape(-1, 1),
-            uvw_points_binned.reshape(-1, 3),
-        ),
-        dim=1,
+    isvalid = (
+        ~torch.isnan(xyz_points[..., 0])
+        & (rows >= 0)
+        & (rows < height)
+        & (cols >= 0)
+        & (cols < width)
     )
 
-    uvw_points_binned_with_index_mat[~isvalid.reshape(-1), :] = 0
-    ind = (
-        uvw_points_binned_with_index_mat[:, 0] * (map_size * map_size * num_bins)
-        + uvw_points_binned_with_index_mat[:, 1] * (map_size * num_bins)
-        + uvw_points_binned_with_index_mat[:, 2] * num_bins
-        + uvw_points_binned_with_index_mat[:, 3]
+    # Linearized (cloud, row, col, bin) indices, counted with a single bincount
+    cloud_offsets = torch.arange(
+        0,
+        num_clouds * height * width * num_bins,
+        height * width * num_bins,
+        device=xyz_points.device,
+    ).view(-1, 1)
+    ind = (cloud_offsets + (rows * width + cols) * num_bins + bin_inds).masked_fill_(
+        ~isvalid, 0
     )
-    ind[~isvalid.reshape(-1)] = 0
     count = torch.bincount(
         ind.view(-1),
-        isvalid.view(-1).long(),
-        minlength=num_clouds * map_size * map_size * num_bins,
+        isvalid.view(-1).double(),
+        minlength=num_clouds * height * width * num_bins,
     )
 
-    return count.view(*start_shape[:-3], map_size, map_size, num_bins)
+    return count.view(*start_shape[:-3], height, width, num_bins)
 
 
 ################
@@ -474,56 +531,40 @@ def _cpu_only_project_point_cloud_to_map(
     bin_dim = ["x", "y", "z"].index(bin_axis)
 
     start_shape = xyz_points.shape
-    xyz_points = xyz_points.reshape([-1, *start_shape[-3:]])
-    num_clouds, h, w, _ = xyz_points.shape
+    num_points_per_cloud = start_shape[-3] * start_shape[-2]
+    xyz_points = xyz_points.reshape((-1, num_points_per_cloud, 3))
+    num_clouds = xyz_points.shape[0]
 
     if not flip_row_col:
-        new_order = [i for i in [0, 1, 2] if i != bin_dim] + [bin_dim]
+        row_col_dims = [i for i in [0, 1, 2] if i != bin_dim]
     else:
-        new_order = [i for i in [2, 1, 0] if i != bin_dim] + [bin_dim]
-
-    uvw_points: np.ndarray = np.stack([xyz_points[..., i] for i in new_order], axis=-1)
+        row_col_dims = [i for i in [2, 1, 0] if i != bin_dim]
 
     num_bins = len(bins) + 1
 
-    isnotnan = ~np.isnan(xyz_points[..., 0])
-
-    uvw_points_binned = np.concatenate(
-        (
-            np.round(100 * uvw_points[..., :-1] / resolution_in_cm).astype(np.int32),
-            np.digitize(uvw_points[..., -1:], bins=bins).astype(np.int32),
-        ),
-        axis=-1,
+    with np.errstate(invalid="ignore"):
+        rows = np.round(
+            100 * xyz_points[..., row_col_dims[0]] / resolution_in_cm
+        ).astype(np.int64)
+        cols = np.round(
+            100 * xyz_points[..., row_col_dims[1]] / resolution_in_cm
+        ).astype(np.int64)
+    bin_inds = np.digitize(xyz_points[..., bin_dim], bins=bins)
+    isvalid = (
+        ~np.isnan(xyz_points[..., 0])
+        & (rows >= 0)
+        & (rows < map_size)
+        & (cols >= 0)
+        & (cols < map_size)
     )
 
-    maxes = np.array([map_size, map_size, num_bins]).reshape((1, 1, 1, 3))
-
-    isvalid = np.logical_and.reduce(
-        (
-            (uvw_points_binned >= 0).all(-1),
-            (uvw_points_binned < maxes).all(-1),
-            isnotnan,
-        )
-    )
-
-    uvw_points_binned_with_index_mat = np.concatenate(
-        (
-            np.repeat(np.arange(0, num_clouds), h * w).reshape(-1, 1),
-            uvw_points_binned.reshape(-1, 3),
-        ),
-        axis=1,
-    )
-
-    uvw_points_binned_with_index_mat[~isvalid.reshape(-1), :] = 0
-    ind = np.ravel_multi_index(
-        uvw_points_binned_with_index_mat.transpose(),
-        (num_clouds, map_size, map_size, num_bins),
+    ind = (
+        np.arange(num_clouds).reshape((-1, 1)) * (map_size * map_size * num_bins)
+        + (rows * map_size + cols) * num_bins
+        + bin_inds
     )
-    ind[~isvalid.reshape(-1)] = 0
     count = np.bincount(
-        ind.ravel(),
-        isvalid.ravel().astype(np.int32),
-        minlength=num_clouds * map_size * map_size * num_bins,
-    )
+        ind[isvalid], minlength=num_clouds * map_size * map_size * num_bins
+    ).astype(np.float64)
 
     return count.reshape([*start_shape[:-3], map_size, map_size, num_bins])
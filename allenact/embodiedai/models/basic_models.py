@@ -256,6 +256,7 @@ class RNNStateEncoder(nn.Module):
         num_layers: int = 1,
         rnn_type: str = "GRU",
         trainable_masked_hidden_state: bool = False,
+        packed_sequences: bool = False,
     ):
         """An RNN for encoding the state in RL. Supports masking the hidden
         state during various timesteps in the forward lass.
@@ -268,11 +269,16 @@ class RNNStateEncoder(nn.Module):
         rnn_type : The RNN cell type.  Must be GRU or LSTM.
         trainable_masked_hidden_state : If `True` the initial hidden state (used at the start of a Task)
             is trainable (as opposed to being a vector of zeros).
+        packed_sequences : If `True`, multi-step forward passes reorganize the input into per-episode segments
+            and run them in a single call over a packed sequence (see `packed_seq_forward`) instead of
+            splitting the sequence at every step where any sampler starts a new episode. This mostly pays off with
+            cuDNN (GPU) RNN kernels; PyTorch's CPU implementation of packed RNNs is usually slower than the default.
         """
 
         super().__init__()
         self._num_recurrent_layers = num_layers
         self._rnn_type = rnn_type
+        self.packed_sequences = packed_sequences
 
         self.rnn = getattr(torch.nn, rnn_type)(
             input_size=input_size, hidden_size=hidden_size, num_layers=num_layers
@@ -559,6 +565,123 @@ class RNNStateEncoder(nn.Module):
             nagents,
         )
 
+    def packed_seq_forward(  # type: ignore
+        self,
+        x: torch.FloatTensor,
+        hidden_states: torch.FloatTensor,
+        masks: torch.FloatTensor,
+    ) -> Tuple[
+        torch.FloatTensor, Union[torch.FloatTensor, Tuple[torch.FloatTensor, ...]]
+    ]:
+        """Forward for a sequence of length T, equivalent to `seq_forward`.
+
+        Rather than splitting the sequence at every step where any sampler
+        starts a new episode (which, with many samplers, degenerates into
+        step-by-step execution), the rollout is reorganized into per-episode
+        segments which are run through the RNN in a single call over a
+        `PackedSequence`.
+
+        # Parameters
+
+        x : (Steps, Samplers, Agents, -1) tensor.
+        hidden_states : The starting hidden states.
+        masks : A (Steps, Samplers, Agents) tensor.
+            The masks to be applied to hidden state at every timestep, equal to 0 whenever the previous step finalized
+            the task, 1 elsewhere.
+        """
+        (
+            x,
+            hidden_states,
+            masks,
+            mem_agent,
+            obs_agent,
+            nsteps,
+            nsamplers,
+            nagents,
+        ) = self.adapt_input(x, hidden_states, masks)
+
+        nseqs = nsamplers * nagents
+        device = x.device
+
+        # Sampler-major ordering of all (sampler, step) pairs. Every sampler starts a segment at t=0 and a new one
+        # whenever its mask is zero.
+        starts = masks.t() == 0.0  # [sampler, step]
+        starts[:, 0] = True
+        starts = starts.reshape(-1)
+
+        segment_ids = torch.cumsum(starts.long(), dim=0) - 1  # [sampler * step]
+        nsegments = int(segment_ids[-1].item()) + 1
+        lengths = torch.bincount(segment_ids, minlength=nsegments)
+        segment_offsets = torch.cumsum(lengths, dim=0) - lengths
+        positions = (
+            torch.arange(nseqs * nsteps, device=device) - segment_offsets[segment_ids]
+        )
+
+        start_inds = starts.nonzero().squeeze(-1)
+        segment_samplers = start_inds // nsteps
+        segment_start_steps = start_inds % nsteps
+
+        # Segments starting at t=0 continue from the given hidden states, all others start from the masked state
+        segment_masks = torch.where(
+            segment_start_steps == 0,
+            masks[0].index_select(0, segment_samplers),
+            torch.zeros_like(segment_samplers, dtype=masks.dtype),
+        )
+
+        unpacked_hidden_states = self._unpack_hidden(
+            cast(torch.FloatTensor, hidden_states)
+        )
+        if isinstance(unpacked_hidden_states, tuple):
+            segment_hidden_states = tuple(
+                v.index_select(1, segment_samplers) for v in unpacked_hidden_states
+            )
+        else:
+            segment_hidden_states = unpacked_hidden_states.index_select(
+                1, segment_samplers
+            )
+
+        padded_x = x.new_zeros((int(lengths.max().item()), nsegments, x.shape[-1]))
+        padded_x[positions, segment_ids] = x.transpose(0, 1).reshape(nseqs * nsteps, -1)
+
+        rnn_scores, segment_hidden_states = self.rnn(
+            nn.utils.rnn.pack_padded_sequence(
+                padded_x, lengths.cpu(), enforce_sorted=False
+            ),
+            self._mask_hidden(
+                segment_hidden_states,
+                cast(torch.FloatTensor, segment_masks.view(1, -1, 1)),
+            ),
+        )
+        padded_scores, _ = nn.utils.rnn.pad_packed_sequence(rnn_scores)
+
+        outputs = (
+            padded_scores[positions, segment_ids]
+            .view(nseqs, nsteps, -1)
+            .transpose(0, 1)
+            .contiguous()
+        )
+
+        # The final hidden state of each sampler is that of its last segment
+        last_segments = segment_ids.view(nseqs, nsteps)[:, -1]
+        if isinstance(segment_hidden_states, tuple):
+            unpacked_hidden_states = tuple(
+                v.index_select(1, last_segments) for v in segment_hidden_states
+            )
+        else:
+            unpacked_hidden_states = segment_hidden_states.index_select(
+                1, last_segments
+            )
+
+        return self.adapt_result(
+            cast(torch.FloatTensor, outputs),
+            self._pack_hidden(unpacked_hidden_states),
+            mem_agent,
+            obs_agent,
+            nsteps,
+            nsamplers,
+            nagents,
+        )
+
     def forward(  # type: ignore
         self,
         x: torch.FloatTensor,
@@ -570,6 +693,8 @@ class RNNStateEncoder(nn.Module):
         nsteps = masks.shape[0]
         if nsteps == 1:
             return self.single_forward(x, hidden_states, masks)
+        if self.packed_sequences:
+            return self.packed_seq_forward(x, hidden_states, masks)
         return self.seq_forward(x, hidden_states, masks)
 
 
@@ -1,5 +1,13 @@
+import gzip
+import json
 import math
-from typing import Dict, Any, Union, Callable, Optional
+import os
+import sqlite3
+from collections import OrderedDict
+from typing import Dict, Any, Union, Callable, Optional, List, Tuple, Iterator
+
+import numpy as np
+from scipy.spatial import cKDTree
 
 from allenact.utils.system import get_logger
 
@@ -85,6 +93,13 @@ def get_distance_to_object(
                 )
 
     if len(dists) == 0:
+        nearest_pos = find_nearest_point_in_cache(cache, pos)
+        if len(nearest_pos) != 0:
+            dist = _get_shortest_path_distance_to_object_from_cache(
+                cache, nearest_pos, target_class
+            )
+            if dist >= 0:
+                return dist
         raise RuntimeError("Your cache is incomplete!")
 
     total_weight = sum(weights)
@@ -113,9 +128,106 @@ def _get_shortest_path_distance_to_object_from_cache(
         return -1.0
 
 
+class CachePositionIndex(object):
+    """KD-tree over the positions (i.e. keys) of a JSON distance cache used to
+    find the cached position closest, in L1 distance, to a query point in
+    O(log N) time.
+
+    # Attributes
+
+    keys : The position strings of the cache (in the cache's iteration order).
+    points : Array of shape `[len(keys), 3]` with the (x, y, z) coordinates of `keys`.
+    tree : The `cKDTree` built over `points` (`None` for an empty cache).
+    """
+
+    def __init__(self, cache: Dict[str, Any]):
+        self.keys = list(cache.keys())
+        self.points = np.array(
+            [
+                [pos["x"], pos["y"], pos["z"]]
+                for pos in map(str_to_pos_for_cache, self.keys)
+            ],
+            dtype=np.float64,
+        ).reshape(-1, 3)
+        self.tree = cKDTree(self.points) if len(self.keys) > 0 else None
+
+    def nearest_index(self, point: Dict[str, float]) -> int:
+        """Index (into `keys`) of the cached position closest to `point` or
+        -1 if the cache is empty."""
+        if self.tree is None:
+            return -1
+        _, index = self.tree.query([point["x"], point["y"], point["z"]], p=1)
+        return int(index)
+
+    def nearest(self, point: Dict[str, float]) -> Dict[str, float]:
+        """The cached position closest to `point` (empty if the cache is
+        empty)."""
+        index = self.nearest_index(point)
+        return {} if index == -1 else str_to_pos_for_cache(self.keys[index])
+
+
+class PositionIndexedCache(dict):
+    """JSON distance cache (i.e. dictionary from position strings to targets
+    to distances) owning the `CachePositionIndex` of its positions.
+
+    The index is built on first use and dropped whenever positions are added
+    to or removed from the cache, so that it is freed together with the cache
+    and never outlives the positions it indexes.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._position_index: Optional[CachePositionIndex] = None
+
+    @property
+    def position_index(self) -> CachePositionIndex:
+        if self._position_index is None:
+            self._position_index = CachePositionIndex(self)
+        return self._position_index
+
+    def __setitem__(self, key, value):
+        if key not in self:
+            self._position_index = None
+        super().__setitem__(key, value)
+
+    def __delitem__(self, key):
+        super().__delitem__(key)
+        self._position_index = None
+
+    def pop(self, *args):
+        self._position_index = None
+        return super().pop(*args)
+
+    def popitem(self):
+        self._position_index = None
+        return super().popitem()
+
+    def clear(self):
+        self._position_index = None
+        super().clear()
+
+    def update(self, *args, **kwargs):
+        self._position_index = None
+        super().update(*args, **kwargs)
+
+    def setdefault(self, key, default=None):
+        if key not in self:
+            self._position_index = None
+        return super().setdefault(key, default)
+
+
 def find_nearest_point_in_cache(
     cache: Dict[str, Any], point: Dict[str, float]
 ) -> Dict[str, float]:
+    """The cached position closest (in L1 distance) to `point` (empty if the
+    cache is empty).
+
+    Lookups in `PositionIndexedCache`s use their KD-tree index, plain
+    dictionaries are scanned.
+    """
+    if isinstance(cache, PositionIndexedCache):
+        return cache.position_index.nearest(point)
+
     best_delta = float("inf")
     closest_point: Dict[str, float] = {}
     for p in cache:
@@ -131,14 +243,390 @@ def find_nearest_point_in_cache(
     return closest_point
 
 
+class GridDistanceCache(object):
+    """Array-backed, grid-indexed shortest-path distance cache for a single
+    scene.
+
+    Replaces the nested-dictionary (JSON) caches used with `get_distance` and
+    `get_distance_to_object`. Cached positions are stored as rows of a
+    float32 `points` array and located in O(1) through an integer `grid`
+    indexed by `(y level, round(x / grid_size), round(z / grid_size))`.
+    Distances are stored in dense float32 matrices (NaN marks a missing
+    entry) so that a lookup is a few array reads rather than string
+    formatting and dictionary traversals.
+
+    Caches are saved as a directory of `.npy` files (see `save`) and, by
+    default, loaded memory-mapped (see `load`) so that all worker processes
+    using the same scene share a single copy through the OS page cache.
+
+    # Attributes
+
+    points : Float32 array of shape `[num_points, 3]` with the (x, y, z)
+        coordinates of all cached positions. The first `num_sources` of these
+        are the positions from which distances were computed (the keys of the
+        JSON cache), the remainder only appear as targets.
+    num_sources : Number of source positions (rows of the distance matrices).
+    grid : Int32 array of shape `[num_y_levels, num_x, num_z]` mapping grid
+        cells to indices into `points` (or -1 if the cell is not cached).
+    y_levels : Float32 array with the (sorted) distinct y coordinates of the
+        cached positions.
+    grid_origin : The (x, z) grid indices corresponding to `grid[:, 0, 0]`.
+    grid_size : Spacing of the grid in meters.
+    point_distances : Float32 array of shape `[num_sources, num_points]` with
+        the shortest-path distances between positions.
+    object_types : The object types to which distances have been cached.
+    object_distances : Float32 array of shape `[num_sources, len(object_types)]`
+        with the shortest-path distances from positions to object types.
+    """
+
+    META_FILE = "meta.json"
+    ARRAY_NAMES = ("points", "grid", "y_levels", "point_distances", "object_distances")
+
+    def __init__(
+        self,
+        points: np.ndarray,
+        num_sources: int,
+        grid: np.ndarray,
+        y_levels: np.ndarray,
+        grid_origin: Tuple[int, int],
+        grid_size: float,
+        point_distances: np.ndarray,
+        object_types: List[str],
+        object_distances: np.ndarray,
+    ):
+        self.points = points
+        self.num_sources = num_sources
+        self.grid = grid
+        self.y_levels = y_levels
+        self.grid_origin = (int(grid_origin[0]), int(grid_origin[1]))
+        self.grid_size = grid_size
+        self.point_distances = point_distances
+        self.object_types = list(object_types)
+        self.object_distances = object_distances
+
+        self._y_levels_list = [float(y) for y in self.y_levels]
+        self._source_tree: Optional[cKDTree] = None
+        self._object_type_to_index = {ot: it for it, ot in enumerate(self.object_types)}
+
+    @classmethod
+    def from_json_cache(
+        cls, cache: Dict[str, Any], grid_size: float = 0.25
+    ) -> "GridDistanceCache":
+        """Converts a JSON distance cache into a `GridDistanceCache`.
+
+        # Parameters
+
+        cache : The JSON cache, i.e. a dictionary such that
+            `cache[pos_to_str_for_cache(position)][target]["distance"]` is the
+            shortest-path distance from `position` to `target`, where `target`
+            is either a position string or an object type.
+        grid_size : Spacing of the grid the cached positions lie on.
+        """
+
+        def parse_pos(s: str) -> Optional[Tuple[float, float, float]]:
+            try:
+                pos = str_to_pos_for_cache(s)
+            except (ValueError, IndexError):
+                return None
+            return pos["x"], pos["y"], pos["z"]
+
+        point_to_index: Dict[str, int] = {}
+        coords: List[Tuple[float, float, float]] = []
+        for pos_str in cache:
+            parsed = parse_pos(pos_str)
+            assert parsed is not None, f"Invalid position key {pos_str} in cache."
+            point_to_index[pos_str] = len(coords)
+            coords.append(parsed)
+        num_sources = len(coords)
+
+        object_type_to_index: Dict[str, int] = {}
+        for targets in cache.values():
+            for target_str in targets:
+                if target_str in point_to_index or target_str in object_type_to_index:
+                    continue
+                parsed = parse_pos(target_str)
+                if parsed is None:
+                    object_type_to_index[target_str] = len(object_type_to_index)
+                else:
+                    point_to_index[target_str] = len(coords)
+                    coords.append(parsed)
+
+        points = np.array(coords, dtype=np.float32).reshape(-1, 3)
+        point_distances = np.full((num_sources, len(coords)), np.nan, dtype=np.float32)
+        object_distances = np.full(
+            (num_sources, len(object_type_to_index)), np.nan, dtype=np.float32
+        )
+        for pos_str, targets in cache.items():
+            row = point_to_index[pos_str]
+            for target_str, value in targets.items():
+                if target_str in object_type_to_index:
+                    col = object_type_to_index[target_str]
+                    object_distances[row, col] = value["distance"]
+                else:
+                    col = point_to_index[target_str]
+                    point_distances[row, col] = value["distance"]
+
+        y_levels = np.unique(points[:, 1])
+        cells = np.round(points[:, [0, 2]] / grid_size).astype(np.int64)
+        if len(cells) > 0:
+            grid_origin = cells.min(0)
+            grid_shape = (len(y_levels),) + tuple(cells.max(0) - grid_origin + 1)
+        else:
+            grid_origin = np.zeros(2, dtype=np.int64)
+            grid_shape = (0, 0, 0)
+        grid = np.full(grid_shape, -1, dtype=np.int32)
+        y_inds = np.searchsorted(y_levels, points[:, 1])
+        # Iterate in reverse so that, if several points fall into a cell, the
+        # one with the lowest index (i.e. preferably a source) is kept.
+        for it in range(len(points) - 1, -1, -1):
+            ix, iz = cells[it] - grid_origin
+            grid[y_inds[it], ix, iz] = it
+
+        return cls(
+            points=points,
+            num_sources=num_sources,
+            grid=grid,
+            y_levels=y_levels,
+            grid_origin=tuple(grid_origin),
+            grid_size=grid_size,
+            point_distances=point_distances,
+            object_types=sorted(
+                object_type_to_index, key=lambda ot: object_type_to_index[ot]
+            ),
+            object_distances=object_distances,
+        )
+
+    def save(self, directory: str) -> None:
+        """Saves the cache as a directory of `.npy` files (which can be
+        memory-mapped by `load`) and a `meta.json` file."""
+        os.makedirs(directory, exist_ok=True)
+        for name in self.ARRAY_NAMES:
+            np.save(os.path.join(directory, name + ".npy"), getattr(self, name))
+        with open(os.path.join(directory, self.META_FILE), "w") as f:
+            json.dump(
+                {
+                    "num_sources": self.num_sources,
+                    "grid_origin": list(self.grid_origin),
+                    "grid_size": self.grid_size,
+                    "object_types": self.object_types,
+                },
+                f,
+            )
+
+    @classmethod
+    def load(cls, directory: str, mmap: bool = True) -> "GridDistanceCache":
+        """Loads a cache saved with `save`.
+
+        # Parameters
+
+        directory : The directory the cache was saved to.
+        mmap : If `True` the arrays are memory-mapped (read-only) instead of
+            read into memory so that all processes loading the same cache
+            share its pages.
+        """
+        with open(os.path.join(directory, cls.META_FILE), "r") as f:
+            meta = json.load(f)
+        arrays = {
+            name: np.load(
+                os.path.join(directory, name + ".npy"), mmap_mode="r" if mmap else None
+            )
+            for name in cls.ARRAY_NAMES
+        }
+        return cls(
+            num_sources=meta["num_sources"],
+            grid_origin=meta["grid_origin"],
+            grid_size=meta["grid_size"],
+            object_types=meta["object_types"],
+            **arrays,
+        )
+
+    def _y_level(self, y: float) -> int:
+        for level, level_y in enumerate(self._y_levels_list):
+            if abs(level_y - y) < 1e-3:
+                return level
+        return -1
+
+    def _cell_index(self, y_level: int, ix: int, iz: int) -> int:
+        ix -= self.grid_origin[0]
+        iz -= self.grid_origin[1]
+        if y_level < 0 or not (
+            0 <= ix < self.grid.shape[1] and 0 <= iz < self.grid.shape[2]
+        ):
+            return -1
+        return int(self.grid[y_level, ix, iz])
+
+    def point_index(self, pos: Dict[str, float]) -> int:
+        """Index (into `points`) of the cached position in the grid cell
+        containing `pos` or -1 if there is none."""
+        return self._cell_index(
+            self._y_level(pos["y"]),
+            int(round(pos["x"] / self.grid_size)),
+            int(round(pos["z"] / self.grid_size)),
+        )
+
+    def _corner_indices(self, pos: Dict[str, float]) -> Iterator[int]:
+        y_level = self._y_level(pos["y"])
+        x = pos["x"] / self.grid_size
+        z = pos["z"] / self.grid_size
+        for rounder_func_0 in [math.ceil, math.floor]:
+            for rounder_func_1 in [math.ceil, math.floor]:
+                yield self._cell_index(y_level, rounder_func_0(x), rounder_func_1(z))
+
+    def find_nearest_source(self, pos: Dict[str, float]) -> int:
+        """Index of the source position closest (in L1 distance) to `pos`."""
+        if self._source_tree is None:
+            self._source_tree = cKDTree(
+                np.asarray(self.points[: self.num_sources], dtype=np.float64)
+            )
+        _, index = self._source_tree.query([pos["x"], pos["y"], pos["z"]], p=1)
+        return int(index)
+
+    def _point_distance(self, source: int, target: int) -> float:
+        if not (0 <= source < self.num_sources and target >= 0):
+            return -1.0
+        dist = float(self.point_distances[source, target])
+        return -1.0 if math.isnan(dist) else dist
+
+    def get_distance(self, pos: Dict[str, float], target: Dict[str, float]) -> float:
+        """Array-backed equivalent of `get_distance`.
+
+        The grid corners around `pos` are tried first, then the closest cached
+        position to `pos` and, finally, the closest cached position to `target`.
+        """
+        target_index = self.point_index(target)
+        for pos_index in self._corner_indices(pos):
+            sp = self._point_distance(pos_index, target_index)
+            if sp != -1.0:
+                return sp
+
+        if self.num_sources > 0:
+            pos_index = self.find_nearest_source(pos)
+            sp = self._point_distance(pos_index, target_index)
+            if sp != -1.0:
+                return sp
+
+            sp = self._point_distance(pos_index, self.find_nearest_source(target))
+            if sp != -1.0:
+                return sp
+
+        raise RuntimeError("Your cache is incomplete!")
+
+    def _object_distance(self, source: int, object_index: int) -> float:
+        if not 0 <= source < self.num_sources:
+            return -1.0
+        dist = float(self.object_distances[source, object_index])
+        return -1.0 if math.isnan(dist) else dist
+
+    def get_distance_to_object(self, pos: Dict[str, float], target_class: str) -> float:
+        """Array-backed equivalent of `get_distance_to_object`.
+
+        The grid corners around `pos` are tried first, then the closest cached
+        position to `pos`.
+        """
+        object_index = self._object_type_to_index.get(target_class)
+        if object_index is None:
+            raise RuntimeError("Your cache is incomplete!")
+
+        dists = []
+        weights = []
+        for point_index in self._corner_indices(pos):
+            dist = self._object_distance(point_index, object_index)
+            if dist >= 0:
+                dists.append(dist)
+                weights.append(
+                    1.0
+                    / (
+                        math.sqrt(
+                            (pos["x"] - float(self.points[point_index, 0])) ** 2
+                            + (pos["z"] - float(self.points[point_index, 2])) ** 2
+                        )
+                        + 1e6
+                    )
+                )
+
+        if len(dists) == 0:
+            if self.num_sources > 0:
+                dist = self._object_distance(
+                    self.find_nearest_source(pos), object_index
+                )
+                if dist >= 0:
+                    return dist
+            raise RuntimeError("Your cache is incomplete!")
+
+        total_weight = sum(weights)
+        weights = [w / total_weight for w in weights]
+
+        return sum(d * w for d, w in zip(dists, weights))
+
+
 class DynamicDistanceCache(object):
-    def __init__(self, rounding: Optional[int] = None):
-        self.cache: Dict[str, Any] = {}
+    """Cache of distances computed on demand (e.g. by querying a simulator
+    for shortest paths).
+
+    Distances are kept in memory per scene. If `max_size` is given, the cache
+    is bounded: once it holds more than `max_size` distances, the least
+    recently used distances of the least recently used scenes are evicted
+    first (so that the distances of the scene currently in use are dropped
+    last). Distances can optionally be shared between all processes on a
+    machine through an sqlite database (see `shared_cache_path`), and the
+    in-memory cache can be snapshotted to disk and warm-loaded later (see
+    `save_snapshot` and `load_snapshot`).
+
+    # Attributes
+
+    cache : Dictionary mapping scene names to (LRU ordered) dictionaries from
+        `(position string, target string)` tuples to distances.
+    rounding : Number of decimals positions are rounded to before being used as keys.
+    max_size : Maximum number of distances kept in memory (`None` for unbounded).
+    shared_cache_path : Path to the sqlite database shared between processes (if any).
+    size : Current number of distances kept in memory.
+    hits : Number of lookups answered without calling the native distance function.
+    shared_hits : Number of the `hits` that were answered by the shared database.
+    misses : Number of lookups that required calling the native distance function.
+    num_accesses : Total number of lookups.
+    """
+
+    def __init__(
+        self,
+        rounding: Optional[int] = None,
+        max_size: Optional[int] = None,
+        shared_cache_path: Optional[str] = None,
+    ):
+        """Initializer.
+
+        # Parameters
+
+        rounding : Number of decimals positions are rounded to before being used as keys.
+        max_size : Maximum number of distances kept in memory (`None` for unbounded).
+        shared_cache_path : If given, the path to an sqlite database (created if
+            missing) through which distances are shared between all processes
+            (and runs) using the same path. Distances missing from the
+            in-memory cache are looked up in the database before calling the
+            native distance function, whose results are written back to it.
+        """
+        assert max_size is None or max_size > 0, "`max_size` must be positive."
+
+        self.cache: "OrderedDict[str, OrderedDict[Tuple[str, str], float]]" = (
+            OrderedDict()
+        )
         self.rounding = rounding
+        self.max_size = max_size
+        self.shared_cache_path = shared_cache_path
+        self.size = 0
         self.hits = 0
+        self.shared_hits = 0
         self.misses = 0
         self.num_accesses = 0
 
+        self._shared_db: Optional[sqlite3.Connection] = None
+        self._shared_db_pid: Optional[int] = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_shared_db"] = None
+        state["_shared_db_pid"] = None
+        return state
+
     def find_distance(
         self,
         scene_name: str,
@@ -149,29 +637,127 @@ class DynamicDistanceCache(object):
         ],
     ) -> float:
         # Convert the position to its rounded string representation
-        position_str = scene_name + self._pos_to_str(position)
+        position_str = self._pos_to_str(position)
         # If the target is also a position, convert it to its rounded string representation
         if isinstance(target, str):
             target_str = target
         else:
             target_str = self._pos_to_str(target)
+        key = (position_str, target_str)
 
-        if position_str not in self.cache:
-            self.cache[position_str] = {}
-        if target_str not in self.cache[position_str]:
-            self.cache[position_str][target_str] = native_distance_function(
-                position, target
-            )
-            self.misses += 1
+        scene_cache = self.cache.get(scene_name)
+        if scene_cache is None:
+            scene_cache = self.cache[scene_name] = OrderedDict()
         else:
-            self.hits += 1
+            self.cache.move_to_end(scene_name)
+
         self.num_accesses += 1
+        if key in scene_cache:
+            scene_cache.move_to_end(key)
+            distance = scene_cache[key]
+            self.hits += 1
+        else:
+            distance = self._shared_lookup(scene_name, key)
+            if distance is not None:
+                self.shared_hits += 1
+                self.hits += 1
+            else:
+                distance = native_distance_function(position, target)
+                self.misses += 1
+                self._shared_insert(scene_name, key, distance)
+            self._insert(scene_name, key, distance)
+
         if self.num_accesses % 1000 == 0:
-            get_logger().debug("Cache Miss-Hit Ratio: %.4f" % (self.misses / self.hits))
-        return self.cache[position_str][target_str]
+            get_logger().debug(
+                "Cache Hit Ratio: %.4f (%d hits from shared cache, %d misses)"
+                % (self.hits / self.num_accesses, self.shared_hits, self.misses)
+            )
+        return distance
+
+    def invalidate(self, scene_name: Optional[str] = None):
+        """Drops all in-memory distances (or only those of `scene_name`).
+
+        Distances in the shared database, if any, are kept.
+        """
+        if scene_name is None:
+            self.cache = OrderedDict()
+            self.size = 0
+        elif scene_name in self.cache:
+            self.size -= len(self.cache.pop(scene_name))
+
+    def save_snapshot(self, path: str):
+        """Saves the in-memory distances to a gzipped JSON file."""
+        json_bytes = json.dumps(
+            {
+                scene_name: [[*key, distance] for key, distance in scene_cache.items()]
+                for scene_name, scene_cache in self.cache.items()
+            }
+        ).encode("utf-8")
+        with gzip.GzipFile(path, "w") as f:
+            f.write(json_bytes)
+
+    def load_snapshot(self, path: str):
+        """Warm-loads the distances saved with `save_snapshot` (respecting
+        `max_size`)."""
+        with gzip.GzipFile(path, "r") as f:
+            snapshot = json.loads(f.read().decode("utf-8"))
+        for scene_name, entries in snapshot.items():
+            if scene_name not in self.cache:
+                self.cache[scene_name] = OrderedDict()
+            for position_str, target_str, distance in entries:
+                self._insert(scene_name, (position_str, target_str), distance)
 
-    def invalidate(self):
-        self.cache = []
+    def _insert(self, scene_name: str, key: Tuple[str, str], distance: float):
+        scene_cache = self.cache.get(scene_name)
+        if scene_cache is None:
+            scene_cache = self.cache[scene_name] = OrderedDict()
+        if key not in scene_cache:
+            self.size += 1
+        scene_cache[key] = distance
+        scene_cache.move_to_end(key)
+
+        if self.max_size is not None:
+            while self.size > self.max_size:
+                oldest_scene, oldest_scene_cache = next(iter(self.cache.items()))
+                oldest_scene_cache.popitem(last=False)
+                self.size -= 1
+                if len(oldest_scene_cache) == 0:
+                    del self.cache[oldest_scene]
+
+    def _get_shared_db(self) -> Optional[sqlite3.Connection]:
+        if self.shared_cache_path is None:
+            return None
+        if self._shared_db is None or self._shared_db_pid != os.getpid():
+            # Connections must not be shared across forked processes
+            db = sqlite3.connect(
+                self.shared_cache_path, timeout=60.0, isolation_level=None
+            )
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS distances (scene TEXT, position TEXT,"
+                " target TEXT, distance REAL, PRIMARY KEY (scene, position, target))"
+            )
+            self._shared_db = db
+            self._shared_db_pid = os.getpid()
+        return self._shared_db
+
+    def _shared_lookup(self, scene_name: str, key: Tuple[str, str]) -> Optional[float]:
+        db = self._get_shared_db()
+        if db is None:
+            return None
+        row = db.execute(
+            "SELECT distance FROM distances WHERE scene=? AND position=? AND target=?",
+            (scene_name, *key),
+        ).fetchone()
+        return None if row is None else row[0]
+
+    def _shared_insert(self, scene_name: str, key: Tuple[str, str], distance: float):
+        db = self._get_shared_db()
+        if db is not None:
+            db.execute(
+                "INSERT OR IGNORE INTO distances VALUES (?, ?, ?, ?)",
+                (scene_name, *key, distance),
+            )
 
     def _pos_to_str(self, pos: Dict[str, Any]) -> str:
         if self.rounding:
@@ -447,6 +447,9 @@ class OffPolicyPipelineComponent(NamedTuple):
         a `cur_worker` int value,
         a `rollouts_per_worker` list of number of samplers per training worker,
         and an optional random `seed` shared by all workers, which can be None.
+    num_prefetch_batches: If positive, batches are drawn from the data iterator and copied to the training device
+        by a background thread, up to `num_prefetch_batches` batches ahead of the off-policy updates (see
+        `allenact.utils.prefetch_utils.PrefetchingIterator`).
     """
 
     data_iterator_builder: Callable[..., Iterator]
@@ -456,6 +459,7 @@ class OffPolicyPipelineComponent(NamedTuple):
     data_iterator_kwargs_generator: Callable[
         [int, Sequence[int], Optional[int]], Dict
     ] = lambda cur_worker, rollouts_per_worker, seed: {}
+    num_prefetch_batches: int = 0
 
 
 class TrainingSettings(object):
@@ -480,6 +484,11 @@ class TrainingSettings(object):
     metric_accumulate_interval : The frequency with which training/validation metrics are accumulated
         (in total agent steps). Metrics accumulated in an interval are logged (if `should_log` is `True`)
         and used by the stage's early stopping criterion (if any).
+    bptt_chunk_length : Optional number of steps used for truncated backpropagation through time. If given, each
+        sampler's rollout is split into chunks of (at most) this length, starting from the stored intermediate
+        memory, and `num_mini_batch` mini-batches are drawn over (sampler, chunk) pairs (see
+        `RolloutStorage.recurrent_generator`). This bounds the memory of the backward pass independently of
+        `num_steps`, at the cost of storing memory for every rollout step.
     """
 
     num_mini_batch: Optional[int]
@@ -492,6 +501,7 @@ class TrainingSettings(object):
     advance_scene_rollout_period: Optional[int]
     save_interval: Optional[int]
     metric_accumulate_interval: Optional[int]
+    bptt_chunk_length: Optional[int]
 
     # noinspection PyUnresolvedReferences
     def __init__(
@@ -506,6 +516,7 @@ class TrainingSettings(object):
         advance_scene_rollout_period: Optional[int] = None,
         save_interval: Optional[int] = None,
         metric_accumulate_interval: Optional[int] = None,
+        bptt_chunk_length: Optional[int] = None,
         **kwargs: Any,
     ):
         all_vars = prepare_locals_for_super(locals(), ignore_kwargs=True)
@@ -549,6 +560,7 @@ class PipelineStage(TrainingSettings):
     advance_scene_rollout_period: See docs for `TrainingSettings`.
     save_interval : See docs for `TrainingSettings`.
     metric_accumulate_interval : See docs for `TrainingSettings`.
+    bptt_chunk_length : See docs for `TrainingSettings`.
     """
 
     def __init__(
@@ -571,6 +583,7 @@ class PipelineStage(TrainingSettings):
         advance_scene_rollout_period: Optional[int] = None,
         save_interval: Optional[int] = None,
         metric_accumulate_interval: Optional[int] = None,
+        bptt_chunk_length: Optional[int] = None,
     ):
         self._update_repeats: Optional[int] = None
 
@@ -697,6 +710,7 @@ class TrainingPipeline(TrainingSettings):
     advance_scene_rollout_period: See docs for `TrainingSettings`.
     save_interval : See docs for `TrainingSettings`.
     metric_accumulate_interval : See docs for `TrainingSettings`.
+    bptt_chunk_length : See docs for `TrainingSettings`.
     should_log: `True` if metrics accumulated during training should be logged to the console as well
         as to a tensorboard file.
     lr_scheduler_builder : Optional builder object to instantiate the learning rate scheduler used
@@ -721,6 +735,7 @@ class TrainingPipeline(TrainingSettings):
         metric_accumulate_interval: int,
         should_log: bool = True,
         lr_scheduler_builder: Optional[Builder[optim.lr_scheduler._LRScheduler]] = None,  # type: ignore
+        bptt_chunk_length: Optional[int] = None,
     ):
         """Initializer.
 
@@ -0,0 +1,182 @@
+"""Utilities for preparing batches of (off-policy) data ahead of time."""
+
+import queue
+import threading
+from typing import Any, Iterator, Optional, Tuple, Union
+
+import torch
+
+from allenact.utils.tensor_utils import to_device_recursively
+
+
+def pin_memory_recursively(input: Any) -> Any:
+    """Recursively pins the memory of the CPU tensors in `input` (so that they
+    can be copied to CUDA devices asynchronously)."""
+    if isinstance(input, torch.Tensor):
+        return input if input.is_cuda or input.is_pinned() else input.pin_memory()
+    elif isinstance(input, tuple):
+        return tuple(pin_memory_recursively(subinput) for subinput in input)
+    elif isinstance(input, list):
+        return [pin_memory_recursively(subinput) for subinput in input]
+    elif isinstance(input, dict):
+        return {key: pin_memory_recursively(input[key]) for key in input}
+    return input
+
+
+def _record_stream_recursively(input: Any, stream: "torch.cuda.Stream") -> None:
+    if isinstance(input, torch.Tensor):
+        if input.is_cuda:
+            input.record_stream(stream)
+    elif isinstance(input, (tuple, list)):
+        for subinput in input:
+            _record_stream_recursively(subinput, stream)
+    elif isinstance(input, dict):
+        for key in input:
+            _record_stream_recursively(input[key], stream)
+
+
+def _prepare_batch(
+    batch: Any,
+    device: Optional[torch.device],
+    pin_memory: bool,
+    stream: Optional["torch.cuda.Stream"],
+) -> Tuple[Any, Optional["torch.cuda.Event"]]:
+    if device is None:
+        return batch, None
+
+    if stream is None:
+        return to_device_recursively(batch, device=device, inplace=True), None
+
+    if pin_memory:
+        batch = pin_memory_recursively(batch)
+    with torch.cuda.stream(stream):
+        batch = to_device_recursively(
+            batch, device=device, inplace=True, non_blocking=True
+        )
+        event = torch.cuda.Event()
+        event.record(stream)
+    return batch, event
+
+
+def _prefetch_worker(
+    iterator: Iterator,
+    out_queue: "queue.Queue",
+    stop_event: threading.Event,
+    device: Optional[torch.device],
+    pin_memory: bool,
+) -> None:
+    # Only holds what it needs (and not the `PrefetchingIterator` itself), so
+    # that unreferenced `PrefetchingIterator`s are still garbage collected (and
+    # closed)
+    stream: Optional[torch.cuda.Stream] = None
+    if device is not None and device.type == "cuda":
+        torch.cuda.set_device(device)
+        stream = torch.cuda.Stream(device=device)
+
+    while not stop_event.is_set():
+        try:
+            item: Any = _prepare_batch(next(iterator), device, pin_memory, stream)
+        except BaseException as e:
+            item = e
+
+        while not stop_event.is_set():
+            try:
+                out_queue.put(item, timeout=1.0)
+                break
+            except queue.Full:
+                continue
+
+        if isinstance(item, BaseException):
+            return
+
+
+class PrefetchingIterator(Iterator):
+    """Wraps a data iterator so that its batches are prepared ahead of time.
+
+    A background thread draws up to `num_prefetch` batches from the wrapped
+    iterator and, if `device` is a CUDA device, pins their memory and copies
+    them to `device` with non-blocking copies issued on a separate CUDA
+    stream. Batches are thus generated (and transferred) while the training
+    thread runs forward and backward passes. Exceptions raised by the wrapped
+    iterator (including `StopIteration`) are re-raised by `__next__` in order.
+
+    The wrapped iterator is only ever accessed from the background thread,
+    which is started on the first call to `__next__` and stopped by `close`
+    (which also closes the wrapped iterator, if it can be closed).
+    """
+
+    def __init__(
+        self,
+        iterator: Iterator,
+        num_prefetch: int = 2,
+        device: Optional[Union[str, torch.device, int]] = None,
+        pin_memory: bool = True,
+    ):
+        """Initializer.
+
+        # Parameters
+
+        iterator : The data iterator to wrap.
+        num_prefetch : Maximum number of batches prepared ahead of time.
+        device : Device to which batches are moved (they are returned as
+            generated by `iterator` if `None`).
+        pin_memory : Whether or not batches should be pinned before being copied
+            to a CUDA `device`.
+        """
+        assert num_prefetch > 0, "`num_prefetch` must be positive."
+        self.iterator = iterator
+        self.num_prefetch = num_prefetch
+        self.device = torch.device(device) if device is not None else None
+        self.pin_memory = pin_memory
+
+        self._queue: "queue.Queue" = queue.Queue(maxsize=num_prefetch)
+        self._thread: Optional[threading.Thread] = None
+        self._stop_event = threading.Event()
+        self._exhausted = False
+
+    def __next__(self) -> Any:
+        if self._exhausted:
+            raise StopIteration()
+
+        if self._thread is None:
+            self._thread = threading.Thread(
+                target=_prefetch_worker,
+                args=(
+                    self.iterator,
+                    self._queue,
+                    self._stop_event,
+                    self.device,
+                    self.pin_memory,
+                ),
+                daemon=True,
+            )
+            self._thread.start()
+
+        item = self._queue.get()
+        if isinstance(item, BaseException):
+            self._exhausted = True
+            raise item
+
+        batch, event = item
+        if event is not None:
+            current_stream = torch.cuda.current_stream(self.device)
+            current_stream.wait_event(event)
+            _record_stream_recursively(batch, current_stream)
+        return batch
+
+    def close(self) -> None:
+        """Stops the background thread (batches already prepared are
+        discarded) and closes the wrapped iterator."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self._exhausted = True
+
+        close = getattr(self.iterator, "close", None)
+        if callable(close):
+            close()
+
+    def __del__(self):
+        if "_stop_event" in self.__dict__:
+            self.close()
@@ -3,7 +3,7 @@
 # This source code is licensed under the MIT license found in the
 # LICENSE file in the root directory of this source tree.
 
-from typing import Union, Tuple, List, cast, Iterable, Callable
+from typing import Union, Tuple, List, cast, Iterable, Callable, Optional
 from collections import OrderedDict
 
 import numpy as np
@@ -233,3 +233,132 @@ def action_list(
         return action
 
     return [tolist(unflatten(action_space, ac)) for ac in flat_actions[0]]
+
+
+class CompiledSpace(object):
+    """Flatten/unflatten/action_list converters precompiled for a fixed space.
+
+    For `Discrete`, `Box` and (possibly nested) `Tuple`/`Dict` spaces of
+    these, split sizes, shapes and dtypes are resolved once at construction
+    so that each call avoids recursing through the space. Any other space
+    falls back to the generic `flatten`, `unflatten` and `action_list`.
+
+    Instances are meant to be kept by the owner of the space (e.g. the
+    rollout storage or the engine) and reused across steps.
+    """
+
+    def __init__(self, space: gym.Space):
+        self.space = space
+        self.flatdim = flatdim(space)
+
+        compiled = self._compile(space)
+        self.is_compiled = compiled is not None
+        if compiled is not None:
+            self._flatten, self._unflatten, self._tolist = compiled
+
+    @staticmethod
+    def _compile(
+        space: gym.Space,
+    ) -> Optional[Tuple[Callable, Callable, Callable[[torch.Tensor], List]]]:
+        if isinstance(space, gym.Discrete):
+
+            def discrete_flatten(torch_x):
+                # Assume tensor input does NOT contain a dimension for action
+                if isinstance(torch_x, torch.Tensor):
+                    return torch_x.unsqueeze(-1)
+                return torch.tensor(torch_x).view(1)
+
+            def discrete_unflatten(torch_x):
+                res = torch_x.view(torch_x.shape[:-1]).long()
+                return res if len(res.shape) > 0 else res.item()
+
+            def discrete_tolist(flat_x):
+                return flat_x.view(-1).long().tolist()
+
+            return discrete_flatten, discrete_unflatten, discrete_tolist
+
+        if isinstance(space, gym.Box):
+            shape = tuple(space.shape)
+            ndims = len(shape)
+
+            def box_flatten(torch_x):
+                if ndims > 0:
+                    return torch_x.view(torch_x.shape[:-ndims] + (-1,))
+                return torch_x.view(torch_x.shape + (-1,))
+
+            def box_unflatten(torch_x):
+                return torch_x.view(torch_x.shape[:-1] + shape).float()
+
+            def box_tolist(flat_x):
+                return flat_x.view((flat_x.shape[0],) + shape).float().tolist()
+
+            return box_flatten, box_unflatten, box_tolist
+
+        if isinstance(space, (gym.Tuple, gym.Dict)):
+            is_dict = isinstance(space, gym.Dict)
+            keys = list(space.spaces.keys()) if is_dict else None
+            subspaces = list(space.spaces.values()) if is_dict else list(space.spaces)
+
+            subs = [CompiledSpace._compile(s) for s in subspaces]
+            if any(sub is None for sub in subs):
+                return None
+            dims = [flatdim(s) for s in subspaces]
+            flattens, unflattens, tolists = [list(fns) for fns in zip(*subs)]
+
+            if is_dict:
+
+                def group_flatten(torch_x):
+                    return torch.cat(
+                        [fl(torch_x[key]) for fl, key in zip(flattens, keys)], dim=-1
+                    )
+
+                def group_unflatten(torch_x):
+                    parts = torch.split(torch_x, dims, dim=-1)
+                    return OrderedDict(
+                        [
+                            (key, unfl(part))
+                            for key, unfl, part in zip(keys, unflattens, parts)
+                        ]
+                    )
+
+                def group_tolist(flat_x):
+                    parts = torch.split(flat_x, dims, dim=-1)
+                    columns = [tl(part) for tl, part in zip(tolists, parts)]
+                    return [OrderedDict(zip(keys, row)) for row in zip(*columns)]
+
+            else:
+
+                def group_flatten(torch_x):
+                    return torch.cat(
+                        [fl(x_part) for fl, x_part in zip(flattens, torch_x)], dim=-1
+                    )
+
+                def group_unflatten(torch_x):
+                    parts = torch.split(torch_x, dims, dim=-1)
+                    return tuple(unfl(part) for unfl, part in zip(unflattens, parts))
+
+                def group_tolist(flat_x):
+                    parts = torch.split(flat_x, dims, dim=-1)
+                    return list(zip(*[tl(part) for tl, part in zip(tolists, parts)]))
+
+            return group_flatten, group_unflatten, group_tolist
+
+        return None
+
+    def flatten(self, torch_x):
+        """Equivalent to `flatten(self.space, torch_x)`."""
+        if self.is_compiled:
+            return self._flatten(torch_x)
+        return flatten(self.space, torch_x)
+
+    def unflatten(self, torch_x):
+        """Equivalent to `unflatten(self.space, torch_x)`."""
+        if self.is_compiled:
+            return self._unflatten(torch_x)
+        return unflatten(self.space, torch_x)
+
+    def action_list(self, flat_actions: torch.Tensor) -> List[ActionType]:
+        """Equivalent to `action_list(self.space, flat_actions)`."""
+        if self.is_compiled:
+            return self._tolist(flat_actions[0])
+        return action_list(self.space, flat_actions)
@@ -23,40 +23,68 @@ from allenact.utils.system import get_logger
 
 
 def to_device_recursively(
-    input: Any, device: Union[str, torch.device, int], inplace: bool = True
+    input: Any,
+    device: Union[str, torch.device, int],
+    inplace: bool = True,
+    non_blocking: bool = False,
 ):
-    """Recursively places tensors on the appropriate device."""
+    """Recursively places tensors on the appropriate device.
+
+    If `non_blocking` is `True`, copies of (pinned) CPU tensors to CUDA
+    devices are asynchronous with respect to the host.
+    """
     if input is None:
         return input
     elif isinstance(input, torch.Tensor):
-        return input.to(device)  # type: ignore
+        return input.to(device, non_blocking=non_blocking)  # type: ignore
     elif isinstance(input, tuple):
         return tuple(
-            to_device_recursively(input=subinput, device=device, inplace=inplace)
+            to_device_recursively(
+                input=subinput,
+                device=device,
+                inplace=inplace,
+                non_blocking=non_blocking,
+            )
             for subinput in input
         )
     elif isinstance(input, list):
         if inplace:
             for i in range(len(input)):
                 input[i] = to_device_recursively(
-                    input=input[i], device=device, inplace=inplace
+                    input=input[i],
+                    device=device,
+                    inplace=inplace,
+                    non_blocking=non_blocking,
                 )
             return input
         else:
             return [
-                to_device_recursively(input=subpart, device=device, inplace=inplace)
+                to_device_recursively(
+                    input=subpart,
+                    device=device,
+                    inplace=inplace,
+                    non_blocking=non_blocking,
+                )
                 for subpart in input
             ]
     elif isinstance(input, dict):
         if inplace:
             for key in input:
                 input[key] = to_device_recursively(
-                    input=input[key], device=device, inplace=inplace
+                    input=input[key],
+                    device=device,
+                    inplace=inplace,
+                    non_blocking=non_blocking,
                 )
             return input
         else:
             return {
-                k: to_device_recursively(input=input[k], device=device, inplace=inplace)
+                k: to_device_recursively(
+                    input=input[k],
+                    device=device,
+                    inplace=inplace,
+                    non_blocking=non_blocking,
+                )
                 for k in input
             }
     elif isinstance(input, set):
@@ -64,11 +92,19 @@ def to_device_recursively(
             for element in list(input):
                 input.remove(element)
                 input.add(
-                    to_device_recursively(element, device=device, inplace=inplace)
+                    to_device_recursively(
+                        element,
+                        device=device,
+                        inplace=inplace,
+                        non_blocking=non_blocking,
+                    )
                 )
         else:
             return set(
-                to_device_recursively(k, device=device, inplace=inplace) for k in input
+                to_device_recursively(
+                    k, device=device, inplace=inplace, non_blocking=non_blocking
+                )
+                for k in input
             )
     elif isinstance(input, np.ndarray) or np.isscalar(input) or isinstance(input, str):
         return input
@@ -911,7 +911,11 @@ class VizSuite(AbstractViz):
                     if epid in rollout_data:
                         # Select current episode and remove episode/sampler axis
                         datum = (
-                            res.narrow(dim=episode_dim, start=it, length=1)
+                            res.narrow(
+                                dim=episode_dim,
+                                start=rollout.stored_sampler_index(it),
+                                length=1,
+                            )
                             .squeeze(axis=episode_dim)
                             .to("cpu")
                             .detach()
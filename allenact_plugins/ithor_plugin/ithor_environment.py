@@ -3,6 +3,7 @@
 import copy
 import functools
 import math
+import os
 import random
 from typing import Tuple, Dict, List, Set, Union, Any, Optional, Mapping, cast
 
@@ -14,6 +15,7 @@ from scipy.spatial.transform import Rotation
 
 from allenact.utils.system import get_logger
 from allenact_plugins.ithor_plugin.ithor_constants import VISIBILITY_DISTANCE, FOV
+from allenact_plugins.ithor_plugin.ithor_navigation_graph import CompiledNavigationGraph
 from allenact_plugins.ithor_plugin.ithor_util import round_to_factor
 
 
@@ -43,6 +45,7 @@ class IThorEnvironment(object):
         make_agents_visible: bool = True,
         object_open_speed: float = 1.0,
         simplify_physics: bool = False,
+        navigation_graph_cache_dir: Optional[str] = None,
     ) -> None:
         """Initializer.
 
@@ -72,6 +75,9 @@ class IThorEnvironment(object):
         simplify_physics : Whether or not to simplify physics when applicable. Currently this only simplies object
             interactions when opening drawers (when simplified, objects within a drawer do not slide around on
             their own when the drawer is opened or closed, instead they are effectively glued down).
+        navigation_graph_cache_dir : If given, a directory in which the (compiled) navigation graphs used to compute
+            shortest paths are saved and from which they are loaded, so that each scene's graph is only built once
+            (rather than once per process and run).
         """
 
         self._start_player_screen_width = player_screen_width
@@ -95,6 +101,7 @@ class IThorEnvironment(object):
         self.object_open_speed = object_open_speed
         self._always_return_visible_range = False
         self.simplify_physics = simplify_physics
+        self.navigation_graph_cache_dir = navigation_graph_cache_dir
 
         self.start(None)
         # noinspection PyTypeHints
@@ -911,6 +918,7 @@ class IThorEnvironment(object):
     # Following is used for computing shortest paths between states
     ###
     _CACHED_GRAPHS: Dict[str, nx.DiGraph] = {}
+    _CACHED_COMPILED_GRAPHS: Dict[str, CompiledNavigationGraph] = {}
 
     GRAPH_ACTIONS_SET = {"LookUp", "LookDown", "RotateLeft", "RotateRight", "MoveAhead"}
 
@@ -974,6 +982,10 @@ class IThorEnvironment(object):
                 break
         if to_remove_key is not None:
             self.graph.remove_edge(source_key, to_remove_key)
+            if self.scene_name in self._CACHED_COMPILED_GRAPHS:
+                self._CACHED_COMPILED_GRAPHS[self.scene_name].remove_edge(
+                    source_key, to_remove_key
+                )
 
     def _add_from_to_edge(
         self,
@@ -1038,29 +1050,56 @@ class IThorEnvironment(object):
         if s in graph:
             return
 
-        existing_nodes = set(graph.nodes())
         graph.add_node(s)
 
         for o in self.possible_neighbor_offsets():
             t = (s[0] + o[0], s[1] + o[1], s[2] + o[2], s[3] + o[3])
-            if t in existing_nodes:
+            if t in graph:
                 self._add_from_to_edge(graph, s, t)
                 self._add_from_to_edge(graph, t, s)
 
+    def _navigation_graph_cache_path(self) -> Optional[str]:
+        if self.navigation_graph_cache_dir is None:
+            return None
+        return os.path.join(
+            self.navigation_graph_cache_dir,
+            "{}__grid_{:.2f}.npz".format(self.scene_name, self._grid_size),
+        )
+
     @property
     def graph(self):
         if self.scene_name not in self._CACHED_GRAPHS:
-            g = nx.DiGraph()
-            points = self.reachable_points_with_rotations_and_horizons()
-            for p in points:
-                self._add_node_to_graph(g, self.get_key(p))
-
-            self._CACHED_GRAPHS[self.scene_name] = g
+            cache_path = self._navigation_graph_cache_path()
+            if cache_path is not None and os.path.exists(cache_path):
+                compiled_graph = CompiledNavigationGraph.load(cache_path)
+                self._CACHED_GRAPHS[self.scene_name] = compiled_graph.to_graph()
+                self._CACHED_COMPILED_GRAPHS[self.scene_name] = compiled_graph
+            else:
+                g = nx.DiGraph()
+                points = self.reachable_points_with_rotations_and_horizons()
+                for p in points:
+                    self._add_node_to_graph(g, self.get_key(p))
+
+                self.graph = g
+                if cache_path is not None:
+                    os.makedirs(self.navigation_graph_cache_dir, exist_ok=True)
+                    self.compiled_graph.save(cache_path)
         return self._CACHED_GRAPHS[self.scene_name]
 
     @graph.setter
     def graph(self, g):
         self._CACHED_GRAPHS[self.scene_name] = g
+        self._CACHED_COMPILED_GRAPHS.pop(self.scene_name, None)
+
+    @property
+    def compiled_graph(self) -> CompiledNavigationGraph:
+        """Array-backed version of `graph` used to answer shortest path
+        queries."""
+        if self.scene_name not in self._CACHED_COMPILED_GRAPHS:
+            self._CACHED_COMPILED_GRAPHS[
+                self.scene_name
+            ] = CompiledNavigationGraph.from_graph(self.graph)
+        return self._CACHED_COMPILED_GRAPHS[self.scene_name]
 
     def _check_contains_key(self, key: Tuple[float, float, int, int], add_if_not=True):
         if key not in self.graph:
@@ -1069,16 +1108,20 @@ class IThorEnvironment(object):
             )
             if add_if_not:
                 self._add_node_to_graph(self.graph, key)
+                # The compiled graph has to be rebuilt to include the new node
+                self._CACHED_COMPILED_GRAPHS.pop(self.scene_name, None)
 
     def shortest_state_path(self, source_state_key, goal_state_key):
         self._check_contains_key(source_state_key)
         self._check_contains_key(goal_state_key)
-        # noinspection PyBroadException
-        try:
-            path = nx.shortest_path(self.graph, source_state_key, goal_state_key)
-            return path
-        except Exception as _:
+        compiled_graph = self.compiled_graph
+        path = compiled_graph.shortest_path(
+            compiled_graph.node_to_index[source_state_key],
+            compiled_graph.node_to_index[goal_state_key],
+        )
+        if path is None:
             return None
+        return [compiled_graph.nodes[node] for node in path]
 
     def action_transitioning_between_keys(self, s, t):
         self._check_contains_key(s)
@@ -1100,13 +1143,20 @@ class IThorEnvironment(object):
         self._check_contains_key(source_state_key)
         self._check_contains_key(goal_state_key)
 
-        next_state_key = self.shortest_path_next_state(source_state_key, goal_state_key)
-        return self.graph.get_edge_data(source_state_key, next_state_key)["action"]
+        if source_state_key == goal_state_key:
+            raise RuntimeError("called next state on the same source and goal state")
+        compiled_graph = self.compiled_graph
+        return compiled_graph.next_action(
+            compiled_graph.node_to_index[source_state_key],
+            compiled_graph.node_to_index[goal_state_key],
+        )
 
     def shortest_path_length(self, source_state_key, goal_state_key):
         self._check_contains_key(source_state_key)
         self._check_contains_key(goal_state_key)
-        try:
-            return nx.shortest_path_length(self.graph, source_state_key, goal_state_key)
-        except nx.NetworkXNoPath as _:
-            return float("inf")
+        compiled_graph = self.compiled_graph
+        length = compiled_graph.shortest_path_length(
+            compiled_graph.node_to_index[source_state_key],
+            compiled_graph.node_to_index[goal_state_key],
+        )
+        return int(length) if math.isfinite(length) else float("inf")
@@ -0,0 +1,218 @@
+from collections import OrderedDict
+from typing import Tuple, Dict, List, Optional, Sequence, cast
+
+import networkx as nx
+import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import shortest_path
+
+NodeKey = Tuple[float, float, int, int]
+
+
+class CompiledNavigationGraph(object):
+    """Array-backed version of the (networkx) navigation graphs used for
+    computing expert actions in `IThorEnvironment`.
+
+    Edges are stored in compressed sparse row (CSR) form and shortest paths
+    are answered through goal-rooted breadth-first-search distance tables
+    (computed lazily with `scipy.sparse.csgraph` and memoized), so that, once
+    the table for a goal is available, expert queries only require array
+    lookups. Compiled graphs can be saved to (and loaded from) `.npz` files
+    to avoid rebuilding them for every process and run.
+
+    # Attributes
+
+    nodes : The node keys, i.e. the `(x, z, rotation, horizon)` tuples returned
+        by `IThorEnvironment.get_key`.
+    node_to_index : Mapping from node keys to their index in `nodes`.
+    indptr : CSR row pointers; the edges leaving node `i` are
+        `indices[indptr[i]:indptr[i + 1]]`.
+    indices : CSR column indices (i.e. the target nodes of the edges).
+    edge_actions : For every edge, the index (into `action_names`) of the
+        action transitioning between its source and target.
+    action_names : Names of the actions labelling the edges.
+    edge_mask : Whether or not each edge is (still) part of the graph, see `remove_edge`.
+    max_cached_goals : Maximum number of memoized distance tables.
+    """
+
+    def __init__(
+        self,
+        nodes: Sequence[NodeKey],
+        indptr: np.ndarray,
+        indices: np.ndarray,
+        edge_actions: np.ndarray,
+        action_names: Sequence[str],
+        max_cached_goals: int = 1024,
+    ):
+        self.nodes: List[NodeKey] = list(nodes)
+        self.node_to_index: Dict[NodeKey, int] = {
+            node: it for it, node in enumerate(self.nodes)
+        }
+        self.indptr = indptr
+        self.indices = indices
+        self.edge_actions = edge_actions
+        self.action_names = list(action_names)
+        self.edge_mask = np.ones(len(indices), dtype=np.bool_)
+        self.max_cached_goals = max_cached_goals
+
+        self._reverse_adjacency: Optional[csr_matrix] = None
+        self._distance_tables: "OrderedDict[int, np.ndarray]" = OrderedDict()
+
+    @property
+    def num_nodes(self) -> int:
+        return len(self.nodes)
+
+    @classmethod
+    def from_graph(cls, graph: nx.DiGraph, **kwargs) -> "CompiledNavigationGraph":
+        """Compiles a navigation graph whose edges have an `"action"`
+        attribute."""
+        nodes = list(graph.nodes())
+        node_to_index = {node: it for it, node in enumerate(nodes)}
+        action_names = sorted({action for _, _, action in graph.edges(data="action")})
+        action_to_index = {action: it for it, action in enumerate(action_names)}
+
+        indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+        indices = []
+        edge_actions = []
+        for it, node in enumerate(nodes):
+            for target, edge_data in graph[node].items():
+                indices.append(node_to_index[target])
+                edge_actions.append(action_to_index[edge_data["action"]])
+            indptr[it + 1] = len(indices)
+
+        return cls(
+            nodes=nodes,
+            indptr=indptr,
+            indices=np.array(indices, dtype=np.int64),
+            edge_actions=np.array(edge_actions, dtype=np.int64),
+            action_names=action_names,
+            **kwargs,
+        )
+
+    def to_graph(self) -> nx.DiGraph:
+        """The networkx version of the graph (respecting `edge_mask`)."""
+        graph = nx.DiGraph()
+        graph.add_nodes_from(self.nodes)
+        graph.add_edges_from(
+            (self.nodes[s], self.nodes[t], {"action": self.action_names[a]})
+            for s, t, a, keep in zip(
+                self._edge_sources().tolist(),
+                self.indices.tolist(),
+                self.edge_actions.tolist(),
+                self.edge_mask.tolist(),
+            )
+            if keep
+        )
+        return graph
+
+    def save(self, path: str) -> None:
+        """Saves the graph (respecting `edge_mask`) to an `.npz` file."""
+        counts = np.bincount(
+            self._edge_sources()[self.edge_mask], minlength=self.num_nodes
+        )
+        np.savez(
+            path,
+            nodes=np.array(self.nodes, dtype=np.float64).reshape(-1, 4),
+            indptr=np.concatenate(([0], np.cumsum(counts))).astype(np.int64),
+            indices=self.indices[self.edge_mask],
+            edge_actions=self.edge_actions[self.edge_mask],
+            action_names=np.array(self.action_names),
+        )
+
+    @classmethod
+    def load(cls, path: str, **kwargs) -> "CompiledNavigationGraph":
+        """Loads a graph saved with `save`."""
+        with np.load(path, allow_pickle=False) as data:
+            nodes = [
+                (x, z, int(rot), int(hor)) for x, z, rot, hor in data["nodes"].tolist()
+            ]
+            return cls(
+                nodes=nodes,
+                indptr=data["indptr"],
+                indices=data["indices"],
+                edge_actions=data["edge_actions"],
+                action_names=data["action_names"].tolist(),
+                **kwargs,
+            )
+
+    def _edge_sources(self) -> np.ndarray:
+        return np.repeat(np.arange(self.num_nodes), np.diff(self.indptr))
+
+    def _edge_index(self, source: int, target: int) -> Optional[int]:
+        for edge in range(self.indptr[source], self.indptr[source + 1]):
+            if self.edge_mask[edge] and self.indices[edge] == target:
+                return edge
+        return None
+
+    def remove_edge(self, source_key: NodeKey, target_key: NodeKey) -> None:
+        """Removes an edge (if present) and clears all memoized distance
+        tables."""
+        edge = self._edge_index(
+            self.node_to_index[source_key], self.node_to_index[target_key]
+        )
+        if edge is not None:
+            self.edge_mask[edge] = False
+            self._reverse_adjacency = None
+            self._distance_tables.clear()
+
+    def distances_to(self, goal: int) -> np.ndarray:
+        """Number of actions required to reach node `goal` from every node
+        (`inf` if unreachable)."""
+        table = self._distance_tables.get(goal)
+        if table is not None:
+            self._distance_tables.move_to_end(goal)
+            return table
+
+        if self._reverse_adjacency is None:
+            sources = self._edge_sources()
+            self._reverse_adjacency = csr_matrix(
+                (
+                    np.ones(int(self.edge_mask.sum())),
+                    (self.indices[self.edge_mask], sources[self.edge_mask]),
+                ),
+                shape=(self.num_nodes, self.num_nodes),
+            )
+        table = cast(
+            np.ndarray,
+            shortest_path(
+                self._reverse_adjacency,
+                method="D",
+                directed=True,
+                unweighted=True,
+                indices=goal,
+            ),
+        )
+        self._distance_tables[goal] = table
+        if len(self._distance_tables) > self.max_cached_goals:
+            self._distance_tables.popitem(last=False)
+        return table
+
+    def next_edge(self, source: int, goal: int) -> Optional[int]:
+        """Index of an edge leaving `source` along a shortest path to `goal`
+        (`None` if `source == goal` or `goal` is unreachable)."""
+        dists = self.distances_to(goal)
+        if source == goal or not np.isfinite(dists[source]):
+            return None
+        for edge in range(self.indptr[source], self.indptr[source + 1]):
+            if self.edge_mask[edge] and dists[self.indices[edge]] == dists[source] - 1:
+                return edge
+        return None
+
+    def shortest_path(self, source: int, goal: int) -> Optional[List[int]]:
+        """Node indices along a shortest path from `source` to `goal` (`None`
+        if there is no such path)."""
+        if not np.isfinite(self.distances_to(goal)[source]):
+            return None
+        path = [source]
+        while path[-1] != goal:
+            path.append(int(self.indices[self.next_edge(path[-1], goal)]))
+        return path
+
+    def shortest_path_length(self, source: int, goal: int) -> float:
+        return float(self.distances_to(goal)[source])
+
+    def next_action(self, source: int, goal: int) -> Optional[str]:
+        """Name of the first action along a shortest path from `source` to
+        `goal`."""
+        edge = self.next_edge(source, goal)
+        return None if edge is None else self.action_names[self.edge_actions[edge]]
@@ -323,6 +323,7 @@ class BinnedPointCloudMapTHORSensor(
         height_bins: Sequence[float] = (0.02, 2),
         ego_only: bool = True,
         uuid: str = "binned_pc_map",
+        tile_size_in_map_units: Optional[int] = None,
         **kwargs: Any,
     ):
         self.fov = fov
@@ -338,6 +339,7 @@ class BinnedPointCloudMapTHORSensor(
             map_size_in_cm=map_size_in_cm,
             resolution_in_cm=resolution_in_cm,
             height_bins=height_bins,
+            tile_size_in_map_units=tile_size_in_map_units,
         )
 
         map_space = gym.spaces.Box(
@@ -396,6 +398,7 @@ class BinnedPointCloudMapTHORSensor(
             ),
             camera_rotation=metadata["agent"]["rotation"]["y"],
             camera_horizon=metadata["agent"]["cameraHorizon"],
+            ego_only=self.ego_only,
         )
         return {k: map_dict[k] for k in self.observation_space.spaces.keys()}
 
@@ -412,6 +415,7 @@ class SemanticMapTHORSensor(Sensor[RoboThorEnvironment, Task[RoboThorEnvironment
         ego_only: bool = True,
         uuid: str = "semantic_map",
         device: torch.device = torch.device("cpu"),
+        tile_size_in_map_units: Optional[int] = None,
         **kwargs: Any,
     ):
         self.fov = fov
@@ -429,6 +433,7 @@ class SemanticMapTHORSensor(Sensor[RoboThorEnvironment, Task[RoboThorEnvironment
             resolution_in_cm=resolution_in_cm,
             ordered_object_types=ordered_object_types,
             device=device,
+            tile_size_in_map_units=tile_size_in_map_units,
         )
 
         def get_map_space(nchannels: int, size: int):
@@ -510,6 +515,7 @@ class SemanticMapTHORSensor(Sensor[RoboThorEnvironment, Task[RoboThorEnvironment
                 ),
                 camera_rotation=metadata["agent"]["rotation"]["y"],
                 camera_horizon=metadata["agent"]["cameraHorizon"],
+                ego_only=self.ego_only,
             )
             return {
                 k: map_dict[k] > 0.001 if map_dict[k].dtype != np.bool else map_dict[k]
@@ -1,6 +1,7 @@
 import os
 import queue
 import random
+import weakref
 from collections import defaultdict
 from typing import Dict, Tuple, Any, cast, Iterator, List, Union, Optional
 
@@ -17,6 +18,7 @@ from allenact.algorithms.offpolicy_sync.losses.abstract_offpolicy_loss import (
 )
 from allenact.algorithms.onpolicy_sync.policy import ActorCriticModel, ObservationType
 from allenact.utils.misc_utils import partition_limits
+from allenact.utils.prefetch_utils import PrefetchingIterator
 from allenact.utils.system import get_logger
 from allenact_plugins.minigrid_plugin.minigrid_sensors import MiniGridMissionSensor
 
@@ -285,6 +287,254 @@ class ExpertTrajectoryIterator(Iterator):
         }
 
 
+def convert_demos_to_memmap(
+    demos: List[Tuple[str, bytes, List[int], MiniGridEnv.Actions]], output_dir: str
+) -> None:
+    """Converts (pickled) expert demonstrations, as loaded by
+    `babyai.utils.load_demos`, into a columnar format that
+    `MemmapExpertTrajectoryIterator` can memory-map.
+
+    The following arrays are saved as `.npy` files in `output_dir`:
+    `images` (all decompressed observations of all demonstrations, concatenated
+    along their first dimension), `actions` (the corresponding expert actions),
+    `episode_offsets` (demonstration `i` corresponds to steps
+    `episode_offsets[i]:episode_offsets[i + 1]`) and `missions` (the tokenized
+    mission of every demonstration, padded with zeros).
+    """
+    assert len(demos) > 0, "No demonstrations to convert."
+    os.makedirs(output_dir, exist_ok=True)
+
+    episode_offsets = np.zeros(len(demos) + 1, dtype=np.int64)
+    episode_offsets[1:] = np.cumsum([len(demo[3]) for demo in demos])
+    np.save(os.path.join(output_dir, "episode_offsets.npy"), episode_offsets)
+
+    instr_preprocessor = MiniGridMissionSensor(instr_len=1).instr_preprocessor
+    mission_to_tokens: Dict[str, np.ndarray] = {}
+    mission_tokens = []
+    for demo in demos:
+        if demo[0] not in mission_to_tokens:
+            mission_to_tokens[demo[0]] = (
+                instr_preprocessor([{"mission": demo[0]}]).view(-1).long().numpy()
+            )
+        mission_tokens.append(mission_to_tokens[demo[0]])
+    missions = np.zeros(
+        (len(demos), max(len(tokens) for tokens in mission_tokens)), dtype=np.int64
+    )
+    for it, tokens in enumerate(mission_tokens):
+        missions[it, : len(tokens)] = tokens
+    np.save(os.path.join(output_dir, "missions.npy"), missions)
+
+    images: Optional[np.ndarray] = None
+    actions = np.zeros(episode_offsets[-1], dtype=np.int64)
+    for it, demo in enumerate(demos):
+        demo_images = pickle.loads(blosc.blosc_extension.decompress(demo[1], False))
+        assert len(demo_images) == len(demo[2]) == len(demo[3])
+        if images is None:
+            # Written incrementally so that the whole dataset never needs to be in memory
+            images = np.lib.format.open_memmap(
+                os.path.join(output_dir, "images.npy"),
+                mode="w+",
+                dtype=demo_images.dtype,
+                shape=(int(episode_offsets[-1]),) + demo_images.shape[1:],
+            )
+        images[episode_offsets[it] : episode_offsets[it + 1]] = demo_images
+        actions[episode_offsets[it] : episode_offsets[it + 1]] = [
+            int(action) for action in demo[3]
+        ]
+    images.flush()
+    del images
+    np.save(os.path.join(output_dir, "actions.npy"), actions)
+
+
+class MemmapExpertTrajectoryIterator(Iterator):
+    """Iterator over expert demonstrations converted with
+    `convert_demos_to_memmap`.
+
+    Produces the same batches as `ExpertTrajectoryIterator` but, rather than
+    decompressing demonstrations and pushing individual steps through queues,
+    it copies contiguous ranges of memory-mapped arrays directly into
+    preallocated `[steps, samplers, ...]` batches. As the dataset is
+    memory-mapped, all workers (and processes) share a single copy through the
+    OS page cache. Batches can be assembled ahead of time by a background
+    thread (see `num_prefetch_batches`), which is stopped by `close`.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        nrollouts: int,
+        rollout_len: int,
+        instr_len: Optional[int],
+        restrict_max_steps_in_dataset: Optional[int] = None,
+        num_data_length_clusters: int = 8,
+        current_worker: Optional[int] = None,
+        num_workers: Optional[int] = None,
+        num_prefetch_batches: int = 2,
+    ):
+        super(MemmapExpertTrajectoryIterator, self).__init__()
+        self.images = np.load(os.path.join(path, "images.npy"), mmap_mode="r")
+        self.actions = np.load(os.path.join(path, "actions.npy"), mmap_mode="r")
+        self.episode_offsets = np.load(os.path.join(path, "episode_offsets.npy"))
+
+        episode_lengths = np.diff(self.episode_offsets)
+        episode_inds = np.arange(len(episode_lengths))
+        if restrict_max_steps_in_dataset is not None:
+            steps_before = np.cumsum(episode_lengths) - episode_lengths
+            episode_inds = episode_inds[steps_before < restrict_max_steps_in_dataset]
+
+        if num_workers is not None:
+            parts = partition_limits(len(episode_inds), num_workers)
+            episode_inds = episode_inds[
+                parts[current_worker] : parts[current_worker + 1]
+            ]
+
+        self.num_data_lengths = min(
+            num_data_length_clusters, len(episode_inds) // nrollouts
+        )
+        sorted_inds = sorted(
+            episode_inds.tolist(), key=lambda ind: (episode_lengths[ind], ind)
+        )
+        data_limits = partition_limits(
+            num_items=len(sorted_inds), num_parts=self.num_data_lengths
+        )
+        self.trajectory_inds = [
+            sorted_inds[data_limits[i] : data_limits[i + 1]]
+            for i in range(self.num_data_lengths)
+        ]
+        for i in range(self.num_data_lengths):
+            random.shuffle(self.trajectory_inds[i])
+        assert nrollouts <= sum(
+            len(ti) for ti in self.trajectory_inds
+        ), "Too many rollouts requested."
+
+        self.nrollouts = nrollouts
+        self.rollout_len = rollout_len
+        self.instr_len = instr_len
+
+        self.mission_tokens: Optional[np.ndarray] = None
+        if instr_len is not None:
+            missions = np.load(os.path.join(path, "missions.npy"))
+            self.mission_tokens = np.zeros((len(missions), instr_len), dtype=np.int64)
+            n = min(instr_len, missions.shape[1])
+            self.mission_tokens[:, :n] = missions[:, :n]
+
+        self.current_data_length = [
+            random.randint(0, self.num_data_lengths - 1) for _ in range(nrollouts)
+        ]
+        # As in `ExpertTrajectoryIterator`, every sampler starts with an episode
+        # (and only draws the next one once it needs more steps)
+        self.current_episode: List[Optional[int]] = [
+            self.next_episode(sampler) for sampler in range(nrollouts)
+        ]
+        self.current_step = [0] * nrollouts
+
+        self.num_prefetch_batches = num_prefetch_batches
+        self._prefetcher: Optional[PrefetchingIterator] = None
+        if num_prefetch_batches > 0:
+            self._prefetcher = PrefetchingIterator(
+                _memmap_batches(weakref.ref(self)), num_prefetch=num_prefetch_batches
+            )
+
+    def next_episode(self, sampler: int) -> Optional[int]:
+        start = self.current_data_length[sampler]
+        cond = True
+        while cond:
+            self.current_data_length[sampler] = (
+                self.current_data_length[sampler] + 1
+            ) % self.num_data_lengths
+            cond = (
+                len(self.trajectory_inds[self.current_data_length[sampler]]) == 0
+                and self.current_data_length[sampler] != start
+            )
+
+        if len(self.trajectory_inds[self.current_data_length[sampler]]) == 0:
+            return None
+
+        return self.trajectory_inds[self.current_data_length[sampler]].pop()
+
+    def build_batch(self) -> Dict[str, torch.Tensor]:
+        images = np.empty(
+            (self.rollout_len, self.nrollouts) + self.images.shape[1:],
+            dtype=self.images.dtype,
+        )
+        actions = np.empty((self.rollout_len, self.nrollouts), dtype=np.int64)
+        masks = np.ones((self.rollout_len, self.nrollouts, 1), dtype=np.float32)
+        missions = (
+            None
+            if self.mission_tokens is None
+            else np.empty(
+                (self.rollout_len, self.nrollouts, self.instr_len), dtype=np.int64
+            )
+        )
+
+        for sampler in range(self.nrollouts):
+            step = 0
+            while step < self.rollout_len:
+                episode = self.current_episode[sampler]
+                if episode is None:
+                    episode = self.next_episode(sampler)
+                    if episode is None:
+                        raise StopIteration()
+                    self.current_episode[sampler] = episode
+                    self.current_step[sampler] = 0
+                if self.current_step[sampler] == 0:
+                    masks[step, sampler] = 0.0
+
+                start = self.episode_offsets[episode] + self.current_step[sampler]
+                n = min(
+                    self.rollout_len - step, self.episode_offsets[episode + 1] - start
+                )
+                images[step : step + n, sampler] = self.images[start : start + n]
+                actions[step : step + n, sampler] = self.actions[start : start + n]
+                if missions is not None:
+                    missions[step : step + n, sampler] = self.mission_tokens[episode]
+
+                step += n
+                self.current_step[sampler] += n
+                if start + n == self.episode_offsets[episode + 1]:
+                    self.current_episode[sampler] = None
+
+        batch = {
+            "masks": torch.from_numpy(masks),
+            "minigrid_ego_image": torch.from_numpy(images),
+            "expert_action": torch.from_numpy(actions),
+        }
+        if missions is not None:
+            batch["minigrid_mission"] = torch.from_numpy(missions)
+        return batch
+
+    def __next__(self) -> Dict[str, torch.Tensor]:
+        if self._prefetcher is None:
+            return self.build_batch()
+        return next(self._prefetcher)
+
+    def close(self):
+        """Stops the prefetching thread (if any)."""
+        if self._prefetcher is not None:
+            self._prefetcher.close()
+
+    def __del__(self):
+        if "_prefetcher" in self.__dict__:
+            self.close()
+
+
+def _memmap_batches(
+    iterator_ref: "weakref.ReferenceType[MemmapExpertTrajectoryIterator]",
+) -> Iterator[Dict[str, torch.Tensor]]:
+    # Only weakly references its `MemmapExpertTrajectoryIterator` (so that
+    # prefetching does not keep it alive)
+    while True:
+        iterator = iterator_ref()
+        if iterator is None:
+            return
+        try:
+            batch = iterator.build_batch()
+        except StopIteration:
+            return
+        del iterator
+        yield batch
+
+
 def create_minigrid_offpolicy_data_iterator(
     path: str,
     nrollouts: int,
@@ -293,13 +543,35 @@ def create_minigrid_offpolicy_data_iterator(
     restrict_max_steps_in_dataset: Optional[int] = None,
     current_worker: Optional[int] = None,
     num_workers: Optional[int] = None,
-) -> ExpertTrajectoryIterator:
+    num_prefetch_batches: int = 2,
+) -> Union[ExpertTrajectoryIterator, MemmapExpertTrajectoryIterator]:
+    """Creates an iterator over the expert demonstrations in `path`.
+
+    If `path` is a directory created with `convert_demos_to_memmap` (e.g.
+    with `allenact_plugins/minigrid_plugin/scripts/convert_demos_to_memmap.py`)
+    a `MemmapExpertTrajectoryIterator` (prefetching `num_prefetch_batches`
+    batches in a background thread) is returned, otherwise `path` is loaded
+    with `babyai.utils.load_demos` and an `ExpertTrajectoryIterator` is
+    returned.
+    """
     path = os.path.abspath(path)
 
     assert (current_worker is None) == (
         num_workers is None
     ), "both current_worker and num_workers must be simultaneously defined or undefined"
 
+    if os.path.isdir(path):
+        return MemmapExpertTrajectoryIterator(
+            path=path,
+            nrollouts=nrollouts,
+            rollout_len=rollout_len,
+            instr_len=instr_len,
+            restrict_max_steps_in_dataset=restrict_max_steps_in_dataset,
+            current_worker=current_worker,
+            num_workers=num_workers,
+            num_prefetch_batches=num_prefetch_batches,
+        )
+
     if path not in _DATASET_CACHE:
         get_logger().info(
             "Loading minigrid dataset from {} for first time...".format(path)
@@ -28,6 +28,7 @@ class MiniGridTask(Task[CrossingEnv]):
         MiniGridEnv.Actions.__members__[name].value for name in _ACTION_NAMES
     )
     _CACHED_GRAPHS: Dict[str, nx.DiGraph] = {}
+    _CACHED_EXPERT_TABLES: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
     _NEIGHBOR_OFFSETS = tuple(
         [(-1, 0, 0), (0, -1, 0), (0, 0, -1), (1, 0, 0), (0, 1, 0), (0, 0, 1),]
     )
@@ -54,6 +55,7 @@ class MiniGridTask(Task[CrossingEnv]):
             env=env, sensors=sensors, task_info=task_info, max_steps=max_steps, **kwargs
         )
         self._graph: Optional[nx.DiGraph] = None
+        self._expert_table: Optional[Tuple[np.ndarray, np.ndarray]] = None
         self._minigrid_done = False
         self._task_cache_uid = task_cache_uid
         self.corrupt_expert_within_actions_of_goal = (
@@ -134,6 +136,29 @@ class MiniGridTask(Task[CrossingEnv]):
     def graph(self, graph: nx.DiGraph):
         self._graph = graph
 
+    @property
+    def expert_table_created(self):
+        return self._expert_table is not None
+
+    @property
+    def expert_table(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Arrays `(distances, actions)`, see `generate_expert_table`, cached
+        per task (seed) just as `graph`."""
+        if self._expert_table is None:
+            if self._task_cache_uid is not None:
+                if self._task_cache_uid not in self._CACHED_EXPERT_TABLES:
+                    self._CACHED_EXPERT_TABLES[
+                        self._task_cache_uid
+                    ] = self.generate_expert_table()
+                self._expert_table = self._CACHED_EXPERT_TABLES[self._task_cache_uid]
+            else:
+                self._expert_table = self.generate_expert_table()
+        return self._expert_table
+
+    @expert_table.setter
+    def expert_table(self, expert_table: Tuple[np.ndarray, np.ndarray]):
+        self._expert_table = expert_table
+
     @classmethod
     def possible_neighbor_offsets(cls) -> Tuple[Tuple[int, int, int], ...]:
         # Tuples of format:
@@ -279,29 +304,88 @@ class MiniGridTask(Task[CrossingEnv]):
 
         return graph
 
+    def generate_expert_table(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Computes the optimal (expert) action for every agent state with a
+        single breadth-first search from the goal over the fully observable
+        grid.
+
+        The search runs backwards over (x, y, rotation) states whose cells are
+        "empty" or "goal" (as in `generate_graph`), expanding a whole frontier
+        at a time with array operations.
+
+        # Returns
+
+        Integer arrays `(distances, actions)` of shape `[width, height, 4]`
+        such that `distances[x, y, rotation]` is the number of actions required
+        to reach the goal from the corresponding agent state (0 on the goal and
+        -1 if the goal cannot be reached) and `actions[x, y, rotation]` is the
+        index (into `class_action_names()`) of an action along a shortest path
+        (-1 if there is none).
+        """
+        object_types = self.env.grid.encode()[:, :, 0]
+        width, height = object_types.shape
+        valid = np.isin(object_types, [OBJECT_TO_IDX["empty"], OBJECT_TO_IDX["goal"]])
+
+        distances = np.full((width, height, 4), -1, dtype=np.int64)
+        actions = np.full((width, height, 4), -1, dtype=np.int64)
+        frontier = np.repeat(
+            (object_types == OBJECT_TO_IDX["goal"])[:, :, None], 4, axis=2
+        )
+        distances[frontier] = 0
+
+        action_names = self.class_action_names()
+        dist = 0
+        while frontier.any():
+            # States from which a single forward move reaches the frontier
+            forward = np.zeros_like(frontier)
+            for rot, (dx, dy) in enumerate(DIR_TO_VEC):
+                forward[
+                    max(-dx, 0) : width - max(dx, 0),
+                    max(-dy, 0) : height - max(dy, 0),
+                    rot,
+                ] = frontier[
+                    max(dx, 0) : width + min(dx, 0),
+                    max(dy, 0) : height + min(dy, 0),
+                    rot,
+                ]
+            # Turning left (right) decreases (increases) the agent's direction by one
+            left = np.roll(frontier, 1, axis=2)
+            right = np.roll(frontier, -1, axis=2)
+
+            frontier = np.zeros_like(frontier)
+            for action, predecessors in [
+                ("forward", forward),
+                ("left", left),
+                ("right", right),
+            ]:
+                new_states = predecessors & valid[:, :, None] & (distances == -1)
+                distances[new_states] = dist + 1
+                actions[new_states] = action_names.index(action)
+                frontier |= new_states
+            dist += 1
+
+        return distances, actions
+
     def query_expert(self, **kwargs) -> Tuple[int, bool]:
         if self._minigrid_done:
             get_logger().warning("Episode is completed, but expert is still queried.")
             return -1, False
 
-        paths = []
+        distances, actions = self.expert_table
         agent_x, agent_y = self.env.agent_pos
         agent_rot = self.env.agent_dir
-        source_state_key = (agent_x, agent_y, agent_rot)
-        assert source_state_key in self.graph
-
-        paths.append(nx.shortest_path(self.graph, source_state_key, "unified_goal"))
+        dist = int(distances[agent_x, agent_y, agent_rot])
 
-        if len(paths) == 0:
+        if dist == -1:
             return -1, False
 
-        shortest_path_ind = int(np.argmin([len(p) for p in paths]))
-
+        # Counted as the number of edges to "unified_goal" in `self.graph`
+        path_length = dist + 1
         if self.closest_agent_has_been_to_goal is None:
-            self.closest_agent_has_been_to_goal = len(paths[shortest_path_ind]) - 1
+            self.closest_agent_has_been_to_goal = path_length
         else:
             self.closest_agent_has_been_to_goal = min(
-                len(paths[shortest_path_ind]) - 1, self.closest_agent_has_been_to_goal
+                path_length, self.closest_agent_has_been_to_goal
             )
 
         if (
@@ -314,25 +398,14 @@ class MiniGridTask(Task[CrossingEnv]):
                 True,
             )
 
-        if len(paths[shortest_path_ind]) == 2:
-            # Since "unified_goal" is 1 step away from actual goals
-            # if a path like [actual_goal, unified_goal] exists, then
-            # you are already at a goal.
+        if dist == 0:
             get_logger().warning(
                 "Shortest path computations suggest we are at"
                 " the target but episode does not think so."
             )
             return -1, False
 
-        next_key_on_shortest_path = paths[shortest_path_ind][1]
-        return (
-            self.class_action_names().index(
-                self.graph.get_edge_data(source_state_key, next_key_on_shortest_path)[
-                    "action"
-                ]
-            ),
-            True,
-        )
+        return int(actions[agent_x, agent_y, agent_rot]), True
 
 
 class AskForHelpSimpleCrossingTask(MiniGridTask):
@@ -341,6 +414,7 @@ class AskForHelpSimpleCrossingTask(MiniGridTask):
         MiniGridEnv.Actions.__members__[name].value for name in _ACTION_NAMES
     )
     _CACHED_GRAPHS: Dict[str, nx.DiGraph] = {}
+    _CACHED_EXPERT_TABLES: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
 
     def __init__(
         self,
@@ -528,6 +602,8 @@ class MiniGridTaskSampler(TaskSampler):
 
         if repeating and self._last_task.graph_created:
             task.graph = self._last_task.graph
+        if repeating and self._last_task.expert_table_created:
+            task.expert_table = self._last_task.expert_table
 
         self._last_task = task
         return task
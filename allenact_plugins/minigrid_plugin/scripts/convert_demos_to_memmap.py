@@ -0,0 +1,42 @@
+"""Converts pickled BabyAI/MiniGrid expert demonstrations (e.g. those
+downloaded with
+`allenact_plugins/babyai_plugin/scripts/download_babyai_expert_demos.py`)
+into the memory-mappable format used by `MemmapExpertTrajectoryIterator`.
+
+Run from the top-level directory with, e.g.,
+
+```bash
+python allenact_plugins/minigrid_plugin/scripts/convert_demos_to_memmap.py \
+    allenact_plugins/babyai_plugin/data/demos/BabyAI-GoToLocal-v0.pkl
+```
+
+which saves the converted dataset to the `BabyAI-GoToLocal-v0` directory next
+to the `.pkl` file. Passing this directory as the `path` of
+`create_minigrid_offpolicy_data_iterator` will then use the converted dataset.
+"""
+
+import argparse
+import os
+
+import babyai
+
+from allenact_plugins.minigrid_plugin.minigrid_offpolicy import convert_demos_to_memmap
+
+if __name__ == "__main__":
+    # noinspection PyTypeChecker
+    parser = argparse.ArgumentParser(
+        description="convert_demos_to_memmap",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "demos_paths", type=str, nargs="+", help="Paths to the `.pkl` demos to convert."
+    )
+    args = parser.parse_args()
+
+    for demos_path in args.demos_paths:
+        output_dir = os.path.splitext(demos_path)[0]
+        print("Converting {} to {}...".format(demos_path, output_dir))
+        convert_demos_to_memmap(
+            demos=babyai.utils.load_demos(demos_path), output_dir=output_dir
+        )
+        print("Done.")
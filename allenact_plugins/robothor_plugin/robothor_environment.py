@@ -1,10 +1,10 @@
 import copy
-import glob
 import math
+import os
 import pickle
 import random
 import warnings
-from typing import Any, Optional, Dict, List, Union, Tuple, Collection
+from typing import Any, Optional, Dict, List, Union, Tuple, Collection, Mapping
 
 from ai2thor.fifo_server import FifoServer
 import ai2thor.server
@@ -19,6 +19,10 @@ from allenact.utils.cache_utils import (
 )
 from allenact.utils.experiment_utils import recursive_update
 from allenact.utils.system import get_logger
+from allenact_plugins.robothor_plugin.robothor_view_cache import (
+    CompactViewCache,
+    available_view_cache_scenes,
+)
 
 
 class RoboThorEnvironment:
@@ -32,9 +36,19 @@ class RoboThorEnvironment:
 
     controller : The AI2-THOR controller.
     config : The AI2-THOR controller configuration
+    distance_cache : Cache of the shortest-path distances computed by
+        `distance_to_object_type` and `distance_to_point` (`None` if
+        `all_metadata_available` is `False`). Can be configured (e.g. bounded
+        or shared between processes) with the `distance_cache_kwargs`
+        initializer argument, which is passed to `DynamicDistanceCache`.
     """
 
-    def __init__(self, all_metadata_available: bool = True, **kwargs):
+    def __init__(
+        self,
+        all_metadata_available: bool = True,
+        distance_cache_kwargs: Optional[Dict[str, Any]] = None,
+        **kwargs,
+    ):
         self.config = dict(
             rotateStepDegrees=30.0,
             visibilityDistance=1.0,
@@ -72,7 +86,9 @@ class RoboThorEnvironment:
             }
             assert len(self.scene_to_reachable_positions[self.scene_name]) > 10
 
-            self.distance_cache = DynamicDistanceCache(rounding=1)
+            self.distance_cache = DynamicDistanceCache(
+                **{"rounding": 1, **(distance_cache_kwargs or {})}
+            )
 
         self.agent_count = self.config["agentCount"]
 
@@ -522,8 +538,17 @@ class RoboThorCachedEnvironment:
 
     controller : The AI2THOR controller.
     config : The AI2THOR controller configuration
+    view_cache : The view cache of the current scene, mapping position strings
+        to rotations to events. Scenes are loaded either from pickled caches
+        (`{env_root_dir}/{scene}.pkl`) or, if available, from compact
+        memory-mapped caches (`{env_root_dir}/{scene}/`, see `CompactViewCache`
+        and `scripts/convert_view_caches.py`) which are opened once per process
+        and share their frames between processes through the page cache.
     """
 
+    # Compact view caches opened in this process, by path
+    _CACHED_COMPACT_VIEW_CACHES: Dict[str, CompactViewCache] = {}
+
     def __init__(self, **kwargs):
         self.config = dict(
             rotateStepDegrees=30.0,
@@ -536,12 +561,12 @@ class RoboThorCachedEnvironment:
             height=480,
         )
         self.env_root_dir = kwargs["env_root_dir"]
-        random_scene = random.choice(list(glob.glob(self.env_root_dir + "/*.pkl")))
-        handle = open(random_scene, "rb")
-        self.view_cache = pickle.load(handle)
-        handle.close()
-        self.agent_position = list(self.view_cache.keys())[0]
-        self.agent_rotation = list(self.view_cache[self.agent_position].keys())[0]
+        self.view_cache: Mapping[str, Mapping[float, Any]] = {}
+        self._scene_name: Optional[str] = None
+        self._reachable_points: List[Dict[str, float]] = []
+        self._load_view_cache(
+            random.choice(available_view_cache_scenes(self.env_root_dir))
+        )
         self.known_good_locations: Dict[str, Any] = {
             self.scene_name: copy.deepcopy(self.currently_reachable_points)
         }
@@ -565,14 +590,32 @@ class RoboThorCachedEnvironment:
         )  # round to nearest 90 degree angle
         return True
 
+    def _load_view_cache(self, scene_name: str) -> None:
+        path = os.path.join(self.env_root_dir, scene_name)
+        if CompactViewCache.exists(path):
+            if path not in self._CACHED_COMPACT_VIEW_CACHES:
+                self._CACHED_COMPACT_VIEW_CACHES[path] = CompactViewCache.load(path)
+            view_cache = self._CACHED_COMPACT_VIEW_CACHES[path]
+            self.view_cache = view_cache
+            self._scene_name = view_cache.scene_name
+            self._reachable_points = view_cache.reachable_points
+        else:
+            with open(path + ".pkl", "rb") as handle:
+                self.view_cache = pickle.load(handle)
+            self._scene_name = None
+            self._reachable_points = [
+                str_to_pos_for_cache(pos) for pos in self.view_cache
+            ]
+
+        self.agent_position = next(iter(self.view_cache.keys()))
+        self.agent_rotation = next(iter(self.view_cache[self.agent_position].keys()))
+        if self._scene_name is None:
+            self._scene_name = self.last_event.metadata["sceneName"]
+
     def reset(self, scene_name: str = None) -> None:
         """Resets scene to a known initial state."""
         try:
-            handle = open(self.env_root_dir + "/" + scene_name + ".pkl", "rb")
-            self.view_cache = pickle.load(handle)
-            handle.close()
-            self.agent_position = list(self.view_cache.keys())[0]
-            self.agent_rotation = list(self.view_cache[self.agent_position].keys())[0]
+            self._load_view_cache(scene_name)
             self.known_good_locations[self.scene_name] = copy.deepcopy(
                 self.currently_reachable_points
             )
@@ -587,15 +630,14 @@ class RoboThorCachedEnvironment:
     @property
     def currently_reachable_points(self) -> List[Dict[str, float]]:
         """List of {"x": x, "y": y, "z": z} locations in the scene that are
-        currently reachable."""
-        return [str_to_pos_for_cache(pos) for pos in self.view_cache]
+        currently reachable (precomputed when loading the scene, should not be
+        modified)."""
+        return self._reachable_points
 
     @property
     def scene_name(self) -> str:
         """Current ai2thor scene."""
-        return self.view_cache[self.agent_position][self.agent_rotation].metadata[
-            "sceneName"
-        ]
+        return self._scene_name
 
     @property
     def current_frame(self) -> np.ndarray:
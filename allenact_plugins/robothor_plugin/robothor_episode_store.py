@@ -0,0 +1,164 @@
+import json
+import os
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple, cast
+
+import numpy as np
+
+
+class EpisodeStore(object):
+    """Indexed store of the episodes of a (RoboTHOR ObjectNav/PointNav)
+    dataset.
+
+    Episodes are saved as JSON-encoded records in a single (memory-mapped)
+    file together with their byte offsets and, for every scene, the range of
+    record indices holding its episodes. Opening a store only reads this index
+    so that episodes are decoded one at a time, when they are sampled, rather
+    than loading and parsing the episodes of all scenes at once (see
+    `ObjectNavDatasetTaskSampler`).
+
+    # Attributes
+
+    records : The concatenated JSON records (as bytes).
+    offsets : Byte offsets of the records, episode `i` being encoded in
+        `records[offsets[i]:offsets[i + 1]]`.
+    scene_ranges : Mapping from each scene to the `(first, end)` range of the
+        indices of its episodes.
+    scene_object_types : Mapping from each scene to the (sorted) target object
+        types of its episodes (empty for PointNav datasets).
+    """
+
+    RECORDS_FILE = "records.bin"
+    OFFSETS_FILE = "offsets.npy"
+    INDEX_FILE = "index.json"
+
+    def __init__(
+        self,
+        records: np.ndarray,
+        offsets: np.ndarray,
+        scene_ranges: Dict[str, Tuple[int, int]],
+        scene_object_types: Dict[str, List[str]],
+    ):
+        self.records = records
+        self.offsets = offsets
+        self.scene_ranges = scene_ranges
+        self.scene_object_types = scene_object_types
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.exists(os.path.join(path, EpisodeStore.INDEX_FILE))
+
+    @staticmethod
+    def write(scene_to_episodes: Iterable[Tuple[str, Iterable[Dict]]], path: str):
+        """Writes a store from `(scene, episodes)` pairs (streaming the
+        episodes of one scene at a time to disk)."""
+        os.makedirs(path, exist_ok=True)
+
+        offsets = [0]
+        scene_ranges: Dict[str, Tuple[int, int]] = {}
+        scene_object_types: Dict[str, List[str]] = {}
+        with open(os.path.join(path, EpisodeStore.RECORDS_FILE), "wb") as f:
+            for scene, episodes in scene_to_episodes:
+                assert scene not in scene_ranges, "Duplicate scene {}".format(scene)
+                first = len(offsets) - 1
+                object_types = set()
+                for episode in episodes:
+                    record = json.dumps(episode).encode("utf-8")
+                    f.write(record)
+                    offsets.append(offsets[-1] + len(record))
+                    if "object_type" in episode:
+                        object_types.add(episode["object_type"])
+                scene_ranges[scene] = (first, len(offsets) - 1)
+                scene_object_types[scene] = sorted(object_types)
+
+        np.save(
+            os.path.join(path, EpisodeStore.OFFSETS_FILE),
+            np.array(offsets, dtype=np.int64),
+        )
+        with open(os.path.join(path, EpisodeStore.INDEX_FILE), "w") as f:
+            json.dump(
+                {
+                    "scene_ranges": scene_ranges,
+                    "scene_object_types": scene_object_types,
+                },
+                f,
+            )
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "EpisodeStore":
+        with open(os.path.join(path, cls.INDEX_FILE), "r") as f:
+            index = json.load(f)
+
+        records_path = os.path.join(path, cls.RECORDS_FILE)
+        if not mmap or os.path.getsize(records_path) == 0:
+            records = np.fromfile(records_path, dtype=np.uint8)
+        else:
+            records = np.memmap(records_path, dtype=np.uint8, mode="r")
+
+        return cls(
+            records=records,
+            offsets=np.load(os.path.join(path, cls.OFFSETS_FILE)),
+            scene_ranges={
+                scene: cast(Tuple[int, int], tuple(r))
+                for scene, r in index["scene_ranges"].items()
+            },
+            scene_object_types=index["scene_object_types"],
+        )
+
+    @property
+    def scenes(self) -> List[str]:
+        return list(self.scene_ranges.keys())
+
+    def num_episodes(self, scene: str) -> int:
+        first, end = self.scene_ranges[scene]
+        return end - first
+
+    def episode(self, scene: str, index: int) -> Dict:
+        """Decodes the `index`-th episode of `scene`."""
+        first, end = self.scene_ranges[scene]
+        if not 0 <= index < end - first:
+            raise IndexError(
+                "Episode index {} out of range for scene {} ({} episodes).".format(
+                    index, scene, end - first
+                )
+            )
+        start, stop = self.offsets[first + index], self.offsets[first + index + 1]
+        return json.loads(self.records[start:stop].tobytes().decode("utf-8"))
+
+    def prefetch(self, scene: str) -> None:
+        """Reads the records of `scene` (so that they are in the page cache
+        when its episodes are decoded)."""
+        first, end = self.scene_ranges[scene]
+        self.records[self.offsets[first] : self.offsets[end]].tobytes()
+
+    def scene_episodes(self, scene: str) -> "SceneEpisodes":
+        return SceneEpisodes(store=self, scene=scene)
+
+
+class SceneEpisodes(Sequence[Dict]):
+    """Lazy sequence view of the episodes of a scene in an `EpisodeStore`
+    (decoding each episode upon access)."""
+
+    def __init__(self, store: EpisodeStore, scene: str):
+        self.store = store
+        self.scene = scene
+
+    def __len__(self) -> int:
+        return self.store.num_episodes(self.scene)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        return self.store.episode(self.scene, index)
+
+
+def episode_store_path(scene_directory: str) -> str:
+    """Path to the (optional) `EpisodeStore` of a dataset split whose episodes
+    are saved in `{scene_directory}/episodes/{scene}.json.gz` files."""
+    return os.path.join(scene_directory, "episodes_store")
+
+
+def load_episode_store(scene_directory: str) -> Optional[EpisodeStore]:
+    path = episode_store_path(scene_directory)
+    return EpisodeStore.load(path) if EpisodeStore.exists(path) else None
@@ -0,0 +1,153 @@
+import math
+import random
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Sequence, Union, cast
+
+from allenact.utils.system import get_logger
+
+
+class SceneScheduler(object):
+    """Chooses the scenes of the tasks sampled by a task sampler.
+
+    Loading a new scene (i.e. resetting the environment's controller with a
+    different scene) is by far the most expensive part of sampling a task, so
+    samplers should batch their tasks by scene. With an integer `scene_period`,
+    `scene_period` consecutive tasks are set in each scene (visiting the scenes
+    in a random order, reshuffled after every pass), with `scene_period=None`
+    a random scene is chosen for every task and, with `scene_period="manual"`,
+    the scene only changes when `next_scene` is called with
+    `force_advance_scene=True`.
+
+    When a worker process runs several task samplers with the same integer
+    `scene_period`, they would otherwise all switch scenes (and stall) at the
+    same time. If `stagger_scene_switches` is `True`, the first scene of every
+    scheduler created in a process is instead visited for a shortened period,
+    using a different (low-discrepancy) offset for each scheduler, so that the
+    scene switches of the samplers in a process are spread out.
+
+    # Attributes
+
+    scenes : The scenes to choose from.
+    scene_period : See above.
+    scene_order : Order in which scenes are visited (indices into `scenes`).
+    scene_id : Position of the current scene in `scene_order`.
+    scene_counter : Number of tasks sampled in the current scene.
+    scene_switch_offset : Number of tasks skipped in the first scene (see
+        `stagger_scene_switches`).
+    """
+
+    _num_staggered_schedulers = 0
+
+    def __init__(
+        self,
+        scenes: Sequence[str],
+        scene_period: Optional[Union[int, str]] = None,
+        stagger_scene_switches: bool = False,
+    ):
+        self.scenes = scenes
+        self.scene_period = scene_period
+        self.scene_order: List[int] = []
+        self.scene_id = 0
+        self.scene_counter = 0
+
+        self.scene_switch_offset = 0
+        if stagger_scene_switches and isinstance(scene_period, int):
+            rank = SceneScheduler._num_staggered_schedulers
+            SceneScheduler._num_staggered_schedulers += 1
+            # Fractional parts of multiples of the golden ratio are evenly spread in [0, 1)
+            self.scene_switch_offset = int(
+                math.modf(rank * (math.sqrt(5) - 1) / 2)[0] * scene_period
+            )
+
+        self.reset()
+
+    def reset(self):
+        self.scene_counter = self.scene_switch_offset
+        self.scene_order = list(range(len(self.scenes)))
+        random.shuffle(self.scene_order)
+        self.scene_id = 0
+
+    @property
+    def current_scene(self) -> str:
+        return self.scenes[int(self.scene_order[self.scene_id])]
+
+    def next_scene(self, force_advance_scene: bool = False) -> str:
+        """The scene of the next task."""
+        if force_advance_scene:
+            if self.scene_period != "manual":
+                get_logger().warning(
+                    "When sampling scene, have `force_advance_scene == True`"
+                    "but `self.scene_period` is not equal to 'manual',"
+                    "this may cause unexpected behavior."
+                )
+            self.scene_id = (1 + self.scene_id) % len(self.scenes)
+            if self.scene_id == 0:
+                random.shuffle(self.scene_order)
+
+        if self.scene_period is None:
+            # Random scene
+            self.scene_id = random.randint(0, len(self.scenes) - 1)
+        elif self.scene_period == "manual":
+            pass
+        elif self.scene_counter >= cast(int, self.scene_period):
+            if self.scene_id == len(self.scene_order) - 1:
+                # Randomize scene order for next iteration
+                random.shuffle(self.scene_order)
+                # Move to next scene
+                self.scene_id = 0
+            else:
+                # Move to next scene
+                self.scene_id += 1
+            # Reset scene counter
+            self.scene_counter = 1
+        elif isinstance(self.scene_period, int):
+            # Stay in current scene
+            self.scene_counter += 1
+        else:
+            raise NotImplementedError(
+                "Invalid scene_period {}".format(self.scene_period)
+            )
+
+        return self.current_scene
+
+
+class ScenePrefetcher(object):
+    """Runs `prefetch_fn(scene)` (e.g. loading the episodes or distance cache
+    of a scene) on a background thread, so that the data of the next scene is
+    ready by the time a task sampler switches to it.
+
+    Each scene is prefetched at most once (until `forget` is called for it) and
+    failures are only logged, as the data will then be loaded upon use.
+    """
+
+    def __init__(self, prefetch_fn: Callable[[str], Any]):
+        self.prefetch_fn = prefetch_fn
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._futures: Dict[str, Future] = {}
+
+    def prefetch(self, scene: str) -> None:
+        if scene in self._futures:
+            return
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1)
+        self._futures[scene] = self._executor.submit(self.prefetch_fn, scene)
+
+    def wait(self, scene: str) -> None:
+        """Blocks until the prefetching of `scene` (if any) is done."""
+        future = self._futures.get(scene)
+        if future is None:
+            return
+        exception = future.exception()
+        if exception is not None:
+            get_logger().warning(
+                "Failed to prefetch scene {} ({}).".format(scene, exception)
+            )
+
+    def forget(self, scene: str) -> None:
+        self._futures.pop(scene, None)
+
+    def close(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self._futures.clear()
@@ -1,17 +1,32 @@
 import copy
 import gzip
 import json
+import os
 import random
-from typing import List, Optional, Union, Dict, Any, cast, Tuple
+import time
+from typing import List, Optional, Union, Dict, Any, cast, Tuple, Sequence
 
 import gym
+import numpy as np
 
 from allenact.base_abstractions.sensor import Sensor
 from allenact.base_abstractions.task import TaskSampler
-from allenact.utils.cache_utils import str_to_pos_for_cache
+from allenact.utils.cache_utils import (
+    str_to_pos_for_cache,
+    GridDistanceCache,
+    PositionIndexedCache,
+)
 from allenact.utils.experiment_utils import set_seed, set_deterministic_cudnn
 from allenact.utils.system import get_logger
 from allenact_plugins.robothor_plugin.robothor_environment import RoboThorEnvironment
+from allenact_plugins.robothor_plugin.robothor_episode_store import (
+    EpisodeStore,
+    load_episode_store,
+)
+from allenact_plugins.robothor_plugin.robothor_scene_scheduler import (
+    SceneScheduler,
+    ScenePrefetcher,
+)
 from allenact_plugins.robothor_plugin.robothor_tasks import (
     ObjectNavTask,
     PointNavTask,
@@ -36,6 +51,7 @@ class ObjectNavTaskSampler(TaskSampler):
         allow_flipping: bool = False,
         dataset_first: int = -1,
         dataset_last: int = -1,
+        stagger_scene_switches: bool = False,
         **kwargs,
     ) -> None:
         self.rewards_config = rewards_config
@@ -56,12 +72,14 @@ class ObjectNavTaskSampler(TaskSampler):
             ), "When not using a dataset, scenes ({}) must be a list".format(
                 self.scenes
             )
-            self.scene_counter: Optional[int] = None
-            self.scene_order: Optional[List[str]] = None
-            self.scene_id: Optional[int] = None
             self.scene_period: Optional[
                 Union[str, int]
             ] = scene_period  # default makes a random choice
+            self.scene_scheduler = SceneScheduler(
+                scenes=self.scenes,
+                scene_period=scene_period,
+                stagger_scene_switches=stagger_scene_switches,
+            )
             self.max_tasks: Optional[int] = None
             self.reset_tasks = max_tasks
         else:
@@ -133,45 +151,12 @@ class ObjectNavTaskSampler(TaskSampler):
         return True
 
     def sample_scene(self, force_advance_scene: bool):
-        if force_advance_scene:
-            if self.scene_period != "manual":
-                get_logger().warning(
-                    "When sampling scene, have `force_advance_scene == True`"
-                    "but `self.scene_period` is not equal to 'manual',"
-                    "this may cause unexpected behavior."
-                )
-            self.scene_id = (1 + self.scene_id) % len(self.scenes)
-            if self.scene_id == 0:
-                random.shuffle(self.scene_order)
-
-        if self.scene_period is None:
-            # Random scene
-            self.scene_id = random.randint(0, len(self.scenes) - 1)
-        elif self.scene_period == "manual":
-            pass
-        elif self.scene_counter >= cast(int, self.scene_period):
-            if self.scene_id == len(self.scene_order) - 1:
-                # Randomize scene order for next iteration
-                random.shuffle(self.scene_order)
-                # Move to next scene
-                self.scene_id = 0
-            else:
-                # Move to next scene
-                self.scene_id += 1
-            # Reset scene counter
-            self.scene_counter = 1
-        elif isinstance(self.scene_period, int):
-            # Stay in current scene
-            self.scene_counter += 1
-        else:
-            raise NotImplementedError(
-                "Invalid scene_period {}".format(self.scene_period)
-            )
+        scene = self.scene_scheduler.next_scene(force_advance_scene)
 
         if self.max_tasks is not None:
             self.max_tasks -= 1
 
-        return self.scenes[int(self.scene_order[self.scene_id])]
+        return scene
 
     # def sample_episode(self, scene):
     #     self.scene_counters[scene] = (self.scene_counters[scene] + 1) % len(self.scene_to_episodes[scene])
@@ -187,6 +172,7 @@ class ObjectNavTaskSampler(TaskSampler):
         if not self.scenes_is_dataset:
             scene = self.sample_scene(force_advance_scene)
 
+            scene_load_start = time.time()
             if self.env is not None:
                 if scene.replace("_physics", "") != self.env.scene_name.replace(
                     "_physics", ""
@@ -195,6 +181,7 @@ class ObjectNavTaskSampler(TaskSampler):
             else:
                 self.env = self._create_environment()
                 self.env.reset(scene_name=scene)
+            scene_load_time = time.time() - scene_load_start
 
             pose = self.env.randomize_agent_location()
 
@@ -230,6 +217,7 @@ class ObjectNavTaskSampler(TaskSampler):
             task_info = copy.deepcopy(self.dataset_episodes[next_task_id])
 
             scene = task_info["scene"]
+            scene_load_start = time.time()
             if self.env is not None:
                 if scene.replace("_physics", "") != self.env.scene_name.replace(
                     "_physics", ""
@@ -238,6 +226,7 @@ class ObjectNavTaskSampler(TaskSampler):
             else:
                 self.env = self._create_environment()
                 self.env.reset(scene_name=scene)
+            scene_load_time = time.time() - scene_load_start
 
             self.env.step(
                 {
@@ -259,6 +248,7 @@ class ObjectNavTaskSampler(TaskSampler):
             self.max_tasks -= 1
 
         # task_info["actions"] = []  # TODO populated by Task(Generic[EnvType]).step(...) but unused
+        task_info["scene_load_time"] = scene_load_time
 
         if self.allow_flipping and random.random() > 0.5:
             task_info["mirrored"] = True
@@ -277,10 +267,7 @@ class ObjectNavTaskSampler(TaskSampler):
 
     def reset(self):
         if not self.scenes_is_dataset:
-            self.scene_counter = 0
-            self.scene_order = list(range(len(self.scenes)))
-            random.shuffle(self.scene_order)
-            self.scene_id = 0
+            self.scene_scheduler.reset()
         self.max_tasks = self.reset_tasks
 
     def set_seed(self, seed: int):
@@ -305,21 +292,26 @@ class ObjectNavDatasetTaskSampler(TaskSampler):
         allow_flipping=False,
         env_class=RoboThorEnvironment,
         randomize_materials_in_training: bool = False,
+        prefetch_next_scene: bool = True,
         **kwargs,
     ) -> None:
         self.rewards_config = rewards_config
         self.env_args = env_args
         self.scenes = scenes
-        self.episodes = {
-            scene: ObjectNavDatasetTaskSampler.load_dataset(
-                scene, scene_directory + "/episodes"
-            )
-            for scene in scenes
-        }
+        self.scene_directory = scene_directory
+        # Episodes are loaded lazily, per scene, from the dataset's `EpisodeStore`
+        # (if it has been created with `scripts/convert_episode_datasets.py`) or
+        # from the `{scene}.json.gz` files otherwise.
+        self.episode_store: Optional[EpisodeStore] = load_episode_store(scene_directory)
+        self.episodes: Dict[str, Sequence[Dict]] = {}
+        self.episode_order: Optional[np.ndarray] = None
+        # The episodes of the next scene are loaded in the background while the
+        # tasks of the current scene are sampled
+        self.scene_prefetcher: Optional[ScenePrefetcher] = (
+            ScenePrefetcher(self.prefetch_scene) if prefetch_next_scene else None
+        )
         self.env_class = env_class
-        self.object_types = [
-            ep["object_type"] for scene in self.episodes for ep in self.episodes[scene]
-        ]
+        self._object_types: Optional[List[str]] = None
         self.env: Optional[RoboThorEnvironment] = None
         self.sensors = sensors
         self.max_steps = max_steps
@@ -328,12 +320,12 @@ class ObjectNavDatasetTaskSampler(TaskSampler):
         self.scene_counter: Optional[int] = None
         self.scene_order: Optional[List[str]] = None
         self.scene_id: Optional[int] = None
-        # get the total number of tasks assigned to this process
-        if loop_dataset:
-            self.max_tasks = None
-        else:
-            self.max_tasks = sum(len(self.episodes[scene]) for scene in self.episodes)
-        self.reset_tasks = self.max_tasks
+        # The total number of tasks assigned to this process (if not looping
+        # over the dataset) is only counted once needed (see `reset_tasks`) as,
+        # without an `EpisodeStore`, counting loads the episodes of all scenes.
+        self.loop_dataset = loop_dataset
+        self._reset_tasks: Optional[int] = None
+        self.num_sampled_tasks = 0
         self.scene_index = 0
         self.episode_index = 0
         self.randomize_materials_in_training = randomize_materials_in_training
@@ -353,7 +345,9 @@ class ObjectNavDatasetTaskSampler(TaskSampler):
         return env
 
     @staticmethod
-    def load_dataset(scene: str, base_directory: str) -> List[Dict]:
+    def load_dataset(
+        scene: str, base_directory: str, shuffle: bool = True
+    ) -> List[Dict]:
         filename = (
             "/".join([base_directory, scene])
             if base_directory[-1] != "/"
@@ -365,11 +359,97 @@ class ObjectNavDatasetTaskSampler(TaskSampler):
         fin.close()
         json_str = json_bytes.decode("utf-8")
         data = json.loads(json_str)
-        random.shuffle(data)
+        if shuffle:
+            random.shuffle(data)
         return data
 
+    def scene_episodes(self, scene: str) -> Sequence[Dict]:
+        """The (unshuffled) episodes of `scene`, loaded upon first use."""
+        if scene not in self.episodes:
+            if self.episode_store is not None:
+                self.episodes[scene] = self.episode_store.scene_episodes(scene)
+            else:
+                self.episodes[scene] = ObjectNavDatasetTaskSampler.load_dataset(
+                    scene, self.scene_directory + "/episodes", shuffle=False
+                )
+        return self.episodes[scene]
+
+    def num_scene_episodes(self, scene: str) -> int:
+        if self.episode_store is not None:
+            return self.episode_store.num_episodes(scene)
+        return len(self.scene_episodes(scene))
+
+    def prefetch_scene(self, scene: str) -> None:
+        """Loads the episodes of `scene` (or, when using an `EpisodeStore`,
+        reads their records)."""
+        if self.episode_store is not None:
+            self.episode_store.prefetch(scene)
+        else:
+            self.scene_episodes(scene)
+
+    def wait_for_scene_prefetch(self) -> None:
+        """Waits for the prefetching of the current scene (if any) to finish
+        and starts prefetching the next one."""
+        if self.scene_prefetcher is None:
+            return
+        scene = self.scenes[self.scene_index]
+        self.scene_prefetcher.wait(scene)
+        self.scene_prefetcher.forget(scene)
+        if len(self.scenes) > 1:
+            self.scene_prefetcher.prefetch(
+                self.scenes[(self.scene_index + 1) % len(self.scenes)]
+            )
+
+    @property
+    def object_types(self) -> List[str]:
+        """The target object types of the episodes in all scenes."""
+        if self._object_types is None:
+            if self.episode_store is not None:
+                object_types = {
+                    object_type
+                    for scene in self.scenes
+                    for object_type in self.episode_store.scene_object_types[scene]
+                }
+            else:
+                object_types = {
+                    ep["object_type"]
+                    for scene in self.scenes
+                    for ep in self.scene_episodes(scene)
+                }
+            self._object_types = sorted(object_types)
+        return self._object_types
+
+    @property
+    def reset_tasks(self) -> Optional[int]:
+        """The total number of tasks assigned to this process (`None` if
+        looping over the dataset), counted upon first use."""
+        if self.loop_dataset:
+            return None
+        if self._reset_tasks is None:
+            self._reset_tasks = sum(
+                self.num_scene_episodes(scene) for scene in self.scenes
+            )
+        return self._reset_tasks
+
+    @property
+    def max_tasks(self) -> Optional[int]:
+        """The number of tasks remaining (`None` if looping over the
+        dataset)."""
+        reset_tasks = self.reset_tasks
+        return None if reset_tasks is None else reset_tasks - self.num_sampled_tasks
+
+    def reset_episode_order(self):
+        """Samples the order in which the episodes of the current scene are
+        visited (as a permutation of their indices)."""
+        self.wait_for_scene_prefetch()
+        self.episode_order = np.random.permutation(
+            self.num_scene_episodes(self.scenes[self.scene_index])
+        )
+
     @staticmethod
-    def load_distance_cache_from_file(scene: str, base_directory: str) -> Dict:
+    def load_distance_cache_from_file(
+        scene: str, base_directory: str
+    ) -> PositionIndexedCache:
         filename = (
             "/".join([base_directory, scene])
             if base_directory[-1] != "/"
@@ -380,8 +460,17 @@ class ObjectNavDatasetTaskSampler(TaskSampler):
         json_bytes = fin.read()
         fin.close()
         json_str = json_bytes.decode("utf-8")
-        data = json.loads(json_str)
-        return data
+        # Owns the nearest-position index used by `cache_utils` on misses
+        return PositionIndexedCache(json.loads(json_str))
+
+    @staticmethod
+    def load_grid_distance_cache(
+        scene: str, base_directory: str, mmap: bool = True
+    ) -> GridDistanceCache:
+        """Loads the (memory-mapped) `GridDistanceCache` for `scene`, as
+        produced from the JSON caches by
+        `allenact_plugins/robothor_plugin/scripts/convert_distance_caches.py`."""
+        return GridDistanceCache.load(os.path.join(base_directory, scene), mmap=mmap)
 
     @property
     def __len__(self) -> Union[int, float]:
@@ -402,6 +491,8 @@ class ObjectNavDatasetTaskSampler(TaskSampler):
         return self._last_sampled_task
 
     def close(self) -> None:
+        if self.scene_prefetcher is not None:
+            self.scene_prefetcher.close()
         if self.env is not None:
             self.env.stop()
 
@@ -427,21 +518,30 @@ class ObjectNavDatasetTaskSampler(TaskSampler):
         return float("inf") if self.max_tasks is None else self.max_tasks
 
     def next_task(self, force_advance_scene: bool = False) -> Optional[ObjectNavTask]:
-        if self.max_tasks is not None and self.max_tasks <= 0:
-            return None
-
-        if self.episode_index >= len(self.episodes[self.scenes[self.scene_index]]):
+        if self.episode_order is None:
+            self.reset_episode_order()
+        while self.episode_index >= len(self.episode_order):
+            if not self.loop_dataset and self.scene_index == len(self.scenes) - 1:
+                # All tasks have been sampled (found without counting them)
+                return None
             self.scene_index = (self.scene_index + 1) % len(self.scenes)
             # shuffle the new list of episodes to train on
-            random.shuffle(self.episodes[self.scenes[self.scene_index]])
+            self.reset_episode_order()
             self.episode_index = 0
         scene = self.scenes[self.scene_index]
-        episode = self.episodes[scene][self.episode_index]
+        episode = self.scene_episodes(scene)[
+            int(self.episode_order[self.episode_index])
+        ]
+        scene_load_time = 0.0
         if self.env is None:
+            scene_load_start = time.time()
             self.env = self._create_environment()
+            scene_load_time = time.time() - scene_load_start
 
         if scene.replace("_physics", "") != self.env.scene_name.replace("_physics", ""):
+            scene_load_start = time.time()
             self.env.reset(scene_name=scene)
+            scene_load_time += time.time() - scene_load_start
         else:
             self.env.reset_object_filter()
 
@@ -468,6 +568,7 @@ class ObjectNavDatasetTaskSampler(TaskSampler):
             "scene": scene,
             "object_type": episode["object_type"],
             "materials_randomized": were_materials_randomized,
+            "scene_load_time": scene_load_time,
         }
         if len(task_info) == 0:
             get_logger().warning(
@@ -487,8 +588,7 @@ class ObjectNavDatasetTaskSampler(TaskSampler):
             task_info["mirrored"] = False
 
         self.episode_index += 1
-        if self.max_tasks is not None:
-            self.max_tasks -= 1
+        self.num_sampled_tasks += 1
         if not self.env.teleport(
             pose=episode["initial_position"],
             rotation=episode["initial_orientation"],
@@ -508,7 +608,8 @@ class ObjectNavDatasetTaskSampler(TaskSampler):
     def reset(self):
         self.episode_index = 0
         self.scene_index = 0
-        self.max_tasks = self.reset_tasks
+        self.episode_order = None
+        self.num_sampled_tasks = 0
 
     def set_seed(self, seed: int):
         self.seed = seed
@@ -531,6 +632,7 @@ class PointNavTaskSampler(TaskSampler):
         max_tasks: Optional[int] = None,
         seed: Optional[int] = None,
         deterministic_cudnn: bool = False,
+        stagger_scene_switches: bool = False,
         **kwargs,
     ) -> None:
         self.rewards_config = rewards_config
@@ -545,12 +647,14 @@ class PointNavTaskSampler(TaskSampler):
         self.max_steps = max_steps
         self._action_space = action_space
 
-        self.scene_counter: Optional[int] = None
-        self.scene_order: Optional[List[str]] = None
-        self.scene_id: Optional[int] = None
         self.scene_period: Optional[
             Union[str, int]
         ] = scene_period  # default makes a random choice
+        self.scene_scheduler = SceneScheduler(
+            scenes=self.scenes,
+            scene_period=scene_period,
+            stagger_scene_switches=stagger_scene_switches,
+        )
         self.max_tasks: Optional[int] = None
         self.reset_tasks = max_tasks
 
@@ -607,45 +711,12 @@ class PointNavTaskSampler(TaskSampler):
         return True
 
     def sample_scene(self, force_advance_scene: bool):
-        if force_advance_scene:
-            if self.scene_period != "manual":
-                get_logger().warning(
-                    "When sampling scene, have `force_advance_scene == True`"
-                    "but `self.scene_period` is not equal to 'manual',"
-                    "this may cause unexpected behavior."
-                )
-            self.scene_id = (1 + self.scene_id) % len(self.scenes)
-            if self.scene_id == 0:
-                random.shuffle(self.scene_order)
-
-        if self.scene_period is None:
-            # Random scene
-            self.scene_id = random.randint(0, len(self.scenes) - 1)
-        elif self.scene_period == "manual":
-            pass
-        elif self.scene_counter >= cast(int, self.scene_period):
-            if self.scene_id == len(self.scene_order) - 1:
-                # Randomize scene order for next iteration
-                random.shuffle(self.scene_order)
-                # Move to next scene
-                self.scene_id = 0
-            else:
-                # Move to next scene
-                self.scene_id += 1
-            # Reset scene counter
-            self.scene_counter = 1
-        elif isinstance(self.scene_period, int):
-            # Stay in current scene
-            self.scene_counter += 1
-        else:
-            raise NotImplementedError(
-                "Invalid scene_period {}".format(self.scene_period)
-            )
+        scene = self.scene_scheduler.next_scene(force_advance_scene)
 
         if self.max_tasks is not None:
             self.max_tasks -= 1
 
-        return self.scenes[int(self.scene_order[self.scene_id])]
+        return scene
 
     # def sample_episode(self, scene):
     #     self.scene_counters[scene] = (self.scene_counters[scene] + 1) % len(self.scene_to_episodes[scene])
@@ -659,6 +730,7 @@ class PointNavTaskSampler(TaskSampler):
 
         scene = self.sample_scene(force_advance_scene)
 
+        scene_load_start = time.time()
         if self.env is not None:
             if scene.replace("_physics", "") != self.env.scene_name.replace(
                 "_physics", ""
@@ -667,6 +739,7 @@ class PointNavTaskSampler(TaskSampler):
         else:
             self.env = self._create_environment()
             self.env.reset(scene_name=scene)
+        scene_load_time = time.time() - scene_load_start
 
         # task_info = copy.deepcopy(self.sample_episode(scene))
         # task_info['target'] = task_info['target_position']
@@ -699,6 +772,7 @@ class PointNavTaskSampler(TaskSampler):
             "initial_orientation": pose["rotation"]["y"],
             "target": target,
             "actions": [],
+            "scene_load_time": scene_load_time,
         }
 
         if too_close_to_target:
@@ -721,10 +795,7 @@ class PointNavTaskSampler(TaskSampler):
         return self._last_sampled_task
 
     def reset(self):
-        self.scene_counter = 0
-        self.scene_order = list(range(len(self.scenes)))
-        random.shuffle(self.scene_order)
-        self.scene_id = 0
+        self.scene_scheduler.reset()
         self.max_tasks = self.reset_tasks
 
         # for scene in self.scene_to_episodes:
@@ -754,18 +825,23 @@ class PointNavDatasetTaskSampler(TaskSampler):
         shuffle_dataset: bool = True,
         allow_flipping=False,
         env_class=RoboThorEnvironment,
+        prefetch_next_scene: bool = True,
         **kwargs,
     ) -> None:
         self.rewards_config = rewards_config
         self.env_args = env_args
         self.scenes = scenes
         self.shuffle_dataset: bool = shuffle_dataset
-        self.episodes = {
-            scene: ObjectNavDatasetTaskSampler.load_dataset(
-                scene, scene_directory + "/episodes"
-            )
-            for scene in scenes
-        }
+        self.scene_directory = scene_directory
+        # Episodes are loaded lazily, per scene (see `ObjectNavDatasetTaskSampler`).
+        self.episode_store: Optional[EpisodeStore] = load_episode_store(scene_directory)
+        self.episodes: Dict[str, Sequence[Dict]] = {}
+        self.episode_order: Optional[np.ndarray] = None
+        # The episodes of the next scene are loaded in the background while the
+        # tasks of the current scene are sampled
+        self.scene_prefetcher: Optional[ScenePrefetcher] = (
+            ScenePrefetcher(self.prefetch_scene) if prefetch_next_scene else None
+        )
         self.env_class = env_class
         self.env: Optional[RoboThorEnvironment] = None
         self.sensors = sensors
@@ -775,12 +851,10 @@ class PointNavDatasetTaskSampler(TaskSampler):
         self.scene_counter: Optional[int] = None
         self.scene_order: Optional[List[str]] = None
         self.scene_id: Optional[int] = None
-        # get the total number of tasks assigned to this process
-        if loop_dataset:
-            self.max_tasks = None
-        else:
-            self.max_tasks = sum(len(self.episodes[scene]) for scene in self.episodes)
-        self.reset_tasks = self.max_tasks
+        # Tasks are only counted once needed (see `ObjectNavDatasetTaskSampler`)
+        self.loop_dataset = loop_dataset
+        self._reset_tasks: Optional[int] = None
+        self.num_sampled_tasks = 0
         self.scene_index = 0
         self.episode_index = 0
 
@@ -798,6 +872,72 @@ class PointNavDatasetTaskSampler(TaskSampler):
         env = self.env_class(**self.env_args)
         return env
 
+    def scene_episodes(self, scene: str) -> Sequence[Dict]:
+        """The (unshuffled) episodes of `scene`, loaded upon first use."""
+        if scene not in self.episodes:
+            if self.episode_store is not None:
+                self.episodes[scene] = self.episode_store.scene_episodes(scene)
+            else:
+                self.episodes[scene] = ObjectNavDatasetTaskSampler.load_dataset(
+                    scene, self.scene_directory + "/episodes", shuffle=False
+                )
+        return self.episodes[scene]
+
+    def num_scene_episodes(self, scene: str) -> int:
+        if self.episode_store is not None:
+            return self.episode_store.num_episodes(scene)
+        return len(self.scene_episodes(scene))
+
+    def prefetch_scene(self, scene: str) -> None:
+        """Loads the episodes of `scene` (or, when using an `EpisodeStore`,
+        reads their records)."""
+        if self.episode_store is not None:
+            self.episode_store.prefetch(scene)
+        else:
+            self.scene_episodes(scene)
+
+    def wait_for_scene_prefetch(self) -> None:
+        """Waits for the prefetching of the current scene (if any) to finish
+        and starts prefetching the next one."""
+        if self.scene_prefetcher is None:
+            return
+        scene = self.scenes[self.scene_index]
+        self.scene_prefetcher.wait(scene)
+        self.scene_prefetcher.forget(scene)
+        if len(self.scenes) > 1:
+            self.scene_prefetcher.prefetch(
+                self.scenes[(self.scene_index + 1) % len(self.scenes)]
+            )
+
+    @property
+    def reset_tasks(self) -> Optional[int]:
+        """The total number of tasks assigned to this process (`None` if
+        looping over the dataset), counted upon first use."""
+        if self.loop_dataset:
+            return None
+        if self._reset_tasks is None:
+            self._reset_tasks = sum(
+                self.num_scene_episodes(scene) for scene in self.scenes
+            )
+        return self._reset_tasks
+
+    @property
+    def max_tasks(self) -> Optional[int]:
+        """The number of tasks remaining (`None` if looping over the
+        dataset)."""
+        reset_tasks = self.reset_tasks
+        return None if reset_tasks is None else reset_tasks - self.num_sampled_tasks
+
+    def reset_episode_order(self):
+        """Sets the order in which the episodes of the current scene are
+        visited (a random permutation of their indices if `shuffle_dataset`)."""
+        self.wait_for_scene_prefetch()
+        num_episodes = self.num_scene_episodes(self.scenes[self.scene_index])
+        if self.shuffle_dataset:
+            self.episode_order = np.random.permutation(num_episodes)
+        else:
+            self.episode_order = np.arange(num_episodes)
+
     @property
     def __len__(self) -> Union[int, float]:
         """Length.
@@ -817,6 +957,8 @@ class PointNavDatasetTaskSampler(TaskSampler):
         return self._last_sampled_task
 
     def close(self) -> None:
+        if self.scene_prefetcher is not None:
+            self.scene_prefetcher.close()
         if self.env is not None:
             self.env.stop()
 
@@ -832,18 +974,22 @@ class PointNavDatasetTaskSampler(TaskSampler):
         return True
 
     def next_task(self, force_advance_scene: bool = False) -> Optional[PointNavTask]:
-        if self.max_tasks is not None and self.max_tasks <= 0:
-            return None
-
-        if self.episode_index >= len(self.episodes[self.scenes[self.scene_index]]):
+        if self.episode_order is None:
+            self.reset_episode_order()
+        while self.episode_index >= len(self.episode_order):
+            if not self.loop_dataset and self.scene_index == len(self.scenes) - 1:
+                # All tasks have been sampled (found without counting them)
+                return None
             self.scene_index = (self.scene_index + 1) % len(self.scenes)
             # shuffle the new list of episodes to train on
-            if self.shuffle_dataset:
-                random.shuffle(self.episodes[self.scenes[self.scene_index]])
+            self.reset_episode_order()
             self.episode_index = 0
 
         scene = self.scenes[self.scene_index]
-        episode = self.episodes[scene][self.episode_index]
+        episode = self.scene_episodes(scene)[
+            int(self.episode_order[self.episode_index])
+        ]
+        scene_load_start = time.time()
         if self.env is not None:
             if scene.replace("_physics", "") != self.env.scene_name.replace(
                 "_physics", ""
@@ -852,6 +998,7 @@ class PointNavDatasetTaskSampler(TaskSampler):
         else:
             self.env = self._create_environment()
             self.env.reset(scene_name=scene, filtered_objects=[])
+        scene_load_time = time.time() - scene_load_start
 
         def to_pos(s):
             if isinstance(s, (Dict, Tuple)):
@@ -871,6 +1018,7 @@ class PointNavDatasetTaskSampler(TaskSampler):
             "shortest_path": episode["shortest_path"],
             "distance_to_target": episode["shortest_path_length"],
             "id": episode["id"],
+            "scene_load_time": scene_load_time,
         }
 
         if self.allow_flipping and random.random() > 0.5:
@@ -879,8 +1027,7 @@ class PointNavDatasetTaskSampler(TaskSampler):
             task_info["mirrored"] = False
 
         self.episode_index += 1
-        if self.max_tasks is not None:
-            self.max_tasks -= 1
+        self.num_sampled_tasks += 1
 
         if not self.env.teleport(
             pose=episode["initial_position"], rotation=episode["initial_orientation"]
@@ -901,7 +1048,8 @@ class PointNavDatasetTaskSampler(TaskSampler):
     def reset(self):
         self.episode_index = 0
         self.scene_index = 0
-        self.max_tasks = self.reset_tasks
+        self.episode_order = None
+        self.num_sampled_tasks = 0
 
     def set_seed(self, seed: int):
         self.seed = seed
@@ -933,6 +1081,7 @@ class NavToPartnerTaskSampler(TaskSampler):
         max_tasks: Optional[int] = None,
         seed: Optional[int] = None,
         deterministic_cudnn: bool = False,
+        stagger_scene_switches: bool = False,
         **kwargs,
     ) -> None:
         self.rewards_config = rewards_config
@@ -943,12 +1092,14 @@ class NavToPartnerTaskSampler(TaskSampler):
         self.max_steps = max_steps
         self._action_space = action_space
 
-        self.scene_counter: Optional[int] = None
-        self.scene_order: Optional[List[str]] = None
-        self.scene_id: Optional[int] = None
         self.scene_period: Optional[
             Union[str, int]
         ] = scene_period  # default makes a random choice
+        self.scene_scheduler = SceneScheduler(
+            scenes=self.scenes,
+            scene_period=scene_period,
+            stagger_scene_switches=stagger_scene_switches,
+        )
         self.max_tasks: Optional[int] = None
         self.reset_tasks = max_tasks
 
@@ -1004,45 +1155,12 @@ class NavToPartnerTaskSampler(TaskSampler):
         return True
 
     def sample_scene(self, force_advance_scene: bool):
-        if force_advance_scene:
-            if self.scene_period != "manual":
-                get_logger().warning(
-                    "When sampling scene, have `force_advance_scene == True`"
-                    "but `self.scene_period` is not equal to 'manual',"
-                    "this may cause unexpected behavior."
-                )
-            self.scene_id = (1 + self.scene_id) % len(self.scenes)
-            if self.scene_id == 0:
-                random.shuffle(self.scene_order)
-
-        if self.scene_period is None:
-            # Random scene
-            self.scene_id = random.randint(0, len(self.scenes) - 1)
-        elif self.scene_period == "manual":
-            pass
-        elif self.scene_counter >= cast(int, self.scene_period):
-            if self.scene_id == len(self.scene_order) - 1:
-                # Randomize scene order for next iteration
-                random.shuffle(self.scene_order)
-                # Move to next scene
-                self.scene_id = 0
-            else:
-                # Move to next scene
-                self.scene_id += 1
-            # Reset scene counter
-            self.scene_counter = 1
-        elif isinstance(self.scene_period, int):
-            # Stay in current scene
-            self.scene_counter += 1
-        else:
-            raise NotImplementedError(
-                "Invalid scene_period {}".format(self.scene_period)
-            )
+        scene = self.scene_scheduler.next_scene(force_advance_scene)
 
         if self.max_tasks is not None:
             self.max_tasks -= 1
 
-        return self.scenes[int(self.scene_order[self.scene_id])]
+        return scene
 
     def next_task(
         self, force_advance_scene: bool = False
@@ -1111,10 +1229,7 @@ class NavToPartnerTaskSampler(TaskSampler):
         return self._last_sampled_task
 
     def reset(self):
-        self.scene_counter = 0
-        self.scene_order = list(range(len(self.scenes)))
-        random.shuffle(self.scene_order)
-        self.scene_id = 0
+        self.scene_scheduler.reset()
         self.max_tasks = self.reset_tasks
 
     def set_seed(self, seed: int):
@@ -201,6 +201,8 @@ class PointNavTask(Task[RoboThorEnvironment]):
             "dist_to_target": dist2tget,
             "spl": 0 if spl is None else spl,
         }
+        if "scene_load_time" in self.task_info:
+            metrics["scene_load_time"] = self.task_info["scene_load_time"]
         return metrics
 
 
@@ -403,6 +405,8 @@ class ObjectNavTask(Task[RoboThorEnvironment]):
                 "dist_to_target": dist2tget,
                 "spl": 0 if spl is None else spl,
             }
+        if "scene_load_time" in self.task_info:
+            metrics["scene_load_time"] = self.task_info["scene_load_time"]
         return metrics
 
     def query_expert(self, end_action_only: bool = False, **kwargs) -> Tuple[int, bool]:
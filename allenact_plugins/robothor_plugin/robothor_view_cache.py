@@ -0,0 +1,244 @@
+import json
+import os
+from typing import Any, Dict, Iterator, List, Mapping, Optional, Union
+
+import numpy as np
+from numpy.lib.format import open_memmap
+
+from allenact.utils.cache_utils import str_to_pos_for_cache
+
+
+class CachedViewEvent(object):
+    """Stand-in for the `ai2thor.server.Event`s stored in (pickled) view
+    caches, exposing the `frame`, `depth_frame` and (lazily decoded) `metadata`
+    of a view of a `CompactViewCache`."""
+
+    def __init__(self, cache: "CompactViewCache", index: int):
+        self.cache = cache
+        self.index = index
+        self._metadata: Optional[Dict[str, Any]] = None
+
+    @property
+    def frame(self) -> np.ndarray:
+        return self.cache.frames[self.index]
+
+    @property
+    def depth_frame(self) -> Optional[np.ndarray]:
+        if self.cache.depth_frames is None:
+            return None
+        return self.cache.depth_frames[self.index]
+
+    @property
+    def metadata(self) -> Dict[str, Any]:
+        if self._metadata is None:
+            self._metadata = self.cache.view_metadata(self.index)
+        return self._metadata
+
+
+class _PositionViews(Mapping):
+    def __init__(self, cache: "CompactViewCache", rotation_to_index: Dict[float, int]):
+        self.cache = cache
+        self.rotation_to_index = rotation_to_index
+
+    def __getitem__(self, rotation) -> CachedViewEvent:
+        return self.cache.event(self.rotation_to_index[float(rotation)])
+
+    def __iter__(self) -> Iterator[float]:
+        return iter(self.rotation_to_index)
+
+    def __len__(self) -> int:
+        return len(self.rotation_to_index)
+
+
+class CompactViewCache(Mapping):
+    """Compact, memory-mapped version of the view caches (mapping position
+    strings to rotations to `ai2thor.server.Event`s) used by
+    `RoboThorCachedEnvironment`.
+
+    The frames of all views are stored in a single `uint8` array (and the depth
+    frames, if any, in a `float32` array) which are memory-mapped, read-only,
+    so that all processes on a machine share a single copy of them through the
+    page cache. The metadata of every view is stored as a separate JSON record,
+    only decoded when accessed, and the reachable points of the scene are
+    precomputed.
+
+    `CompactViewCache` objects are read-only mappings from position strings
+    to mappings from rotations to `CachedViewEvent`s, so they can be used in
+    place of the (unpickled) view cache dictionaries.
+
+    # Attributes
+
+    scene_name : The scene of the cache.
+    positions : The position strings of the cache (see
+        `allenact.utils.cache_utils.pos_to_str_for_cache`).
+    view_indices : Mapping from positions to rotations to the index of the
+        corresponding view.
+    reachable_points : The `{"x": x, "y": y, "z": z}` dictionaries
+        corresponding to `positions`.
+    frames : The `[num_views, height, width, 3]` RGB frames.
+    depth_frames : The `[num_views, height, width]` depth frames (`None` if the
+        cached events did not include depth).
+    metadata_records : The concatenated JSON-encoded metadata of the views.
+    metadata_offsets : Byte offsets of the metadata records.
+    """
+
+    FRAMES_FILE = "frames.npy"
+    DEPTH_FRAMES_FILE = "depth_frames.npy"
+    METADATA_FILE = "metadata.bin"
+    METADATA_OFFSETS_FILE = "metadata_offsets.npy"
+    INDEX_FILE = "index.json"
+
+    def __init__(
+        self,
+        scene_name: str,
+        view_indices: Dict[str, Dict[float, int]],
+        frames: np.ndarray,
+        depth_frames: Optional[np.ndarray],
+        metadata_records: np.ndarray,
+        metadata_offsets: np.ndarray,
+    ):
+        self.scene_name = scene_name
+        self.view_indices = view_indices
+        self.positions = list(view_indices.keys())
+        self.reachable_points = [str_to_pos_for_cache(pos) for pos in self.positions]
+        self.frames = frames
+        self.depth_frames = depth_frames
+        self.metadata_records = metadata_records
+        self.metadata_offsets = metadata_offsets
+
+        self._last_event: Optional[CachedViewEvent] = None
+
+    @property
+    def num_views(self) -> int:
+        return len(self.metadata_offsets) - 1
+
+    def __getitem__(self, position: str) -> _PositionViews:
+        return _PositionViews(self, self.view_indices[position])
+
+    def __contains__(self, position: Any) -> bool:
+        return position in self.view_indices
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self.positions)
+
+    def __len__(self) -> int:
+        return len(self.positions)
+
+    def view_metadata(self, index: int) -> Dict[str, Any]:
+        start, end = self.metadata_offsets[index], self.metadata_offsets[index + 1]
+        return json.loads(self.metadata_records[start:end].tobytes().decode("utf-8"))
+
+    def event(self, index: int) -> CachedViewEvent:
+        # The environment queries the same (current) view repeatedly, reuse it
+        # so that its metadata is only decoded once
+        if self._last_event is None or self._last_event.index != index:
+            self._last_event = CachedViewEvent(self, index)
+        return self._last_event
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.exists(os.path.join(path, CompactViewCache.INDEX_FILE))
+
+    @staticmethod
+    def write(view_cache: Mapping[str, Mapping[Union[float, int], Any]], path: str):
+        """Converts a view cache (mapping position strings to rotations to
+        events with `frame`, `depth_frame` and `metadata` attributes) and saves
+        it to the directory `path`."""
+        events = [
+            (pos, float(rot), event)
+            for pos, rotation_to_event in view_cache.items()
+            for rot, event in rotation_to_event.items()
+        ]
+        assert len(events) > 0, "Cannot save an empty view cache."
+        os.makedirs(path, exist_ok=True)
+
+        frame_shape = np.asarray(events[0][2].frame).shape
+        frames = open_memmap(
+            os.path.join(path, CompactViewCache.FRAMES_FILE),
+            mode="w+",
+            dtype=np.uint8,
+            shape=(len(events),) + frame_shape,
+        )
+        depth_frames = None
+        if getattr(events[0][2], "depth_frame", None) is not None:
+            depth_frames = open_memmap(
+                os.path.join(path, CompactViewCache.DEPTH_FRAMES_FILE),
+                mode="w+",
+                dtype=np.float32,
+                shape=(len(events),) + np.asarray(events[0][2].depth_frame).shape,
+            )
+
+        view_indices: Dict[str, Dict[float, int]] = {}
+        offsets = [0]
+        with open(os.path.join(path, CompactViewCache.METADATA_FILE), "wb") as f:
+            for it, (pos, rot, event) in enumerate(events):
+                view_indices.setdefault(pos, {})[rot] = it
+                frames[it] = event.frame
+                if depth_frames is not None:
+                    depth_frames[it] = event.depth_frame
+                record = json.dumps(event.metadata).encode("utf-8")
+                f.write(record)
+                offsets.append(offsets[-1] + len(record))
+        frames.flush()
+        del frames
+        if depth_frames is not None:
+            depth_frames.flush()
+            del depth_frames
+
+        np.save(
+            os.path.join(path, CompactViewCache.METADATA_OFFSETS_FILE),
+            np.array(offsets, dtype=np.int64),
+        )
+        with open(os.path.join(path, CompactViewCache.INDEX_FILE), "w") as f:
+            json.dump(
+                {
+                    "scene_name": events[0][2].metadata["sceneName"],
+                    # JSON keys are strings, rotations are saved as (ordered) pairs
+                    "view_indices": {
+                        pos: list(rotation_to_index.items())
+                        for pos, rotation_to_index in view_indices.items()
+                    },
+                },
+                f,
+            )
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True) -> "CompactViewCache":
+        with open(os.path.join(path, cls.INDEX_FILE), "r") as f:
+            index = json.load(f)
+
+        mmap_mode = "r" if mmap else None
+        depth_path = os.path.join(path, cls.DEPTH_FRAMES_FILE)
+        metadata_path = os.path.join(path, cls.METADATA_FILE)
+        if mmap:
+            metadata_records = np.memmap(metadata_path, dtype=np.uint8, mode="r")
+        else:
+            metadata_records = np.fromfile(metadata_path, dtype=np.uint8)
+
+        return cls(
+            scene_name=index["scene_name"],
+            view_indices={
+                pos: {float(rot): int(it) for rot, it in rotation_to_index}
+                for pos, rotation_to_index in index["view_indices"].items()
+            },
+            frames=np.load(os.path.join(path, cls.FRAMES_FILE), mmap_mode=mmap_mode),
+            depth_frames=(
+                np.load(depth_path, mmap_mode=mmap_mode)
+                if os.path.exists(depth_path)
+                else None
+            ),
+            metadata_records=metadata_records,
+            metadata_offsets=np.load(os.path.join(path, cls.METADATA_OFFSETS_FILE)),
+        )
+
+
+def available_view_cache_scenes(env_root_dir: str) -> List[str]:
+    """Names of the scenes with a view cache in `env_root_dir`, either pickled
+    (`{scene}.pkl`) or compact (`{scene}/`, see `CompactViewCache`)."""
+    scenes = set()
+    for name in os.listdir(env_root_dir):
+        if name.endswith(".pkl"):
+            scenes.add(name[: -len(".pkl")])
+        elif CompactViewCache.exists(os.path.join(env_root_dir, name)):
+            scenes.add(name)
+    return sorted(scenes)
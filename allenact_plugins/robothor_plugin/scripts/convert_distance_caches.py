@@ -0,0 +1,81 @@
+"""Converts gzipped JSON shortest-path distance caches (one `{scene}.json.gz`
+file per scene, as loaded by
+`ObjectNavDatasetTaskSampler.load_distance_cache_from_file`) into memory-mappable
+`GridDistanceCache` directories (one `{scene}` directory per scene), which can
+then be loaded with `ObjectNavDatasetTaskSampler.load_grid_distance_cache`.
+
+Run from the top-level directory with, e.g.,
+
+```bash
+python allenact_plugins/robothor_plugin/scripts/convert_distance_caches.py \
+    datasets/robothor-objectnav/train/distance_caches \
+    datasets/robothor-objectnav/train/grid_distance_caches
+```
+"""
+
+import argparse
+import glob
+import os
+
+from allenact.utils.cache_utils import GridDistanceCache
+from allenact_plugins.robothor_plugin.robothor_task_samplers import (
+    ObjectNavDatasetTaskSampler,
+)
+
+
+def convert_distance_caches(
+    json_cache_directory: str, output_directory: str, grid_size: float = 0.25
+):
+    paths = sorted(glob.glob(os.path.join(json_cache_directory, "*.json.gz")))
+    assert len(paths) > 0, "No `*.json.gz` caches found in {}".format(
+        json_cache_directory
+    )
+
+    for path in paths:
+        scene = os.path.basename(path)[: -len(".json.gz")]
+        print("Converting distance cache for {}...".format(scene))
+        cache = GridDistanceCache.from_json_cache(
+            ObjectNavDatasetTaskSampler.load_distance_cache_from_file(
+                scene=scene, base_directory=json_cache_directory
+            ),
+            grid_size=grid_size,
+        )
+        cache.save(os.path.join(output_directory, scene))
+        print(
+            "Saved {} positions and {} object types to {}.".format(
+                len(cache.points),
+                len(cache.object_types),
+                os.path.join(output_directory, scene),
+            )
+        )
+
+
+if __name__ == "__main__":
+    # noinspection PyTypeChecker
+    parser = argparse.ArgumentParser(
+        description="convert_distance_caches",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "json_cache_directory",
+        type=str,
+        help="Directory containing the `{scene}.json.gz` distance caches.",
+    )
+    parser.add_argument(
+        "output_directory",
+        type=str,
+        help="Directory to which the converted caches will be saved.",
+    )
+    parser.add_argument(
+        "--grid_size",
+        type=float,
+        default=0.25,
+        help="Spacing of the grid the cached positions lie on.",
+    )
+    args = parser.parse_args()
+
+    convert_distance_caches(
+        json_cache_directory=args.json_cache_directory,
+        output_directory=args.output_directory,
+        grid_size=args.grid_size,
+    )
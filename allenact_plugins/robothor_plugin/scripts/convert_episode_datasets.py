@@ -0,0 +1,68 @@
+"""Converts the gzipped JSON episode files of a dataset split (one
+`{scene}.json.gz` file per scene in `{split_directory}/episodes`) into an
+indexed `EpisodeStore` (saved to `{split_directory}/episodes_store`), from which
+`ObjectNavDatasetTaskSampler` and `PointNavDatasetTaskSampler` load episodes
+lazily.
+
+Run from the top-level directory with, e.g.,
+
+```bash
+python allenact_plugins/robothor_plugin/scripts/convert_episode_datasets.py \
+    datasets/robothor-objectnav/train datasets/robothor-objectnav/val
+```
+"""
+
+import argparse
+import glob
+import os
+
+from allenact_plugins.robothor_plugin.robothor_episode_store import (
+    EpisodeStore,
+    episode_store_path,
+)
+from allenact_plugins.robothor_plugin.robothor_task_samplers import (
+    ObjectNavDatasetTaskSampler,
+)
+
+
+def convert_episode_dataset(split_directory: str):
+    episodes_directory = os.path.join(split_directory, "episodes")
+    paths = sorted(glob.glob(os.path.join(episodes_directory, "*.json.gz")))
+    assert len(paths) > 0, "No `*.json.gz` episode files found in {}".format(
+        episodes_directory
+    )
+
+    def scene_to_episodes():
+        for path in paths:
+            scene = os.path.basename(path)[: -len(".json.gz")]
+            print("Converting episodes for {}...".format(scene))
+            yield scene, ObjectNavDatasetTaskSampler.load_dataset(
+                scene=scene, base_directory=episodes_directory, shuffle=False
+            )
+
+    output_path = episode_store_path(split_directory)
+    EpisodeStore.write(scene_to_episodes(), output_path)
+    store = EpisodeStore.load(output_path)
+    print(
+        "Saved {} episodes from {} scenes to {}.".format(
+            len(store.offsets) - 1, len(store.scenes), output_path
+        )
+    )
+
+
+if __name__ == "__main__":
+    # noinspection PyTypeChecker
+    parser = argparse.ArgumentParser(
+        description="convert_episode_datasets",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "split_directories",
+        type=str,
+        nargs="+",
+        help="Dataset split directories (containing an `episodes` directory).",
+    )
+    args = parser.parse_args()
+
+    for split_directory in args.split_directories:
+        convert_episode_dataset(split_directory)
@@ -0,0 +1,63 @@
+"""Converts the pickled view caches used by `RoboThorCachedEnvironment` (one
+`{scene}.pkl` file per scene) into compact, memory-mapped caches (one `{scene}`
+directory per scene, see `CompactViewCache`), which the environment then loads
+instead of the pickled ones.
+
+Run from the top-level directory with, e.g.,
+
+```bash
+python allenact_plugins/robothor_plugin/scripts/convert_view_caches.py \
+    /path/to/env_root_dir
+```
+"""
+
+import argparse
+import glob
+import os
+import pickle
+from typing import Optional
+
+from allenact_plugins.robothor_plugin.robothor_view_cache import CompactViewCache
+
+
+def convert_view_caches(env_root_dir: str, output_dir: Optional[str] = None):
+    output_dir = env_root_dir if output_dir is None else output_dir
+    paths = sorted(glob.glob(os.path.join(env_root_dir, "*.pkl")))
+    assert len(paths) > 0, "No `*.pkl` view caches found in {}".format(env_root_dir)
+
+    for path in paths:
+        scene = os.path.basename(path)[: -len(".pkl")]
+        print("Converting view cache for {}...".format(scene))
+        with open(path, "rb") as f:
+            view_cache = pickle.load(f)
+        CompactViewCache.write(view_cache, os.path.join(output_dir, scene))
+        print(
+            "Saved {} views of {} positions to {}.".format(
+                sum(len(rotations) for rotations in view_cache.values()),
+                len(view_cache),
+                os.path.join(output_dir, scene),
+            )
+        )
+
+
+if __name__ == "__main__":
+    # noinspection PyTypeChecker
+    parser = argparse.ArgumentParser(
+        description="convert_view_caches",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "env_root_dir",
+        type=str,
+        help="Directory containing the `{scene}.pkl` view caches.",
+    )
+    parser.add_argument(
+        "--output_dir",
+        type=str,
+        default=None,
+        help="Directory to which the converted caches will be saved (defaults to"
+        " `env_root_dir`, where `RoboThorCachedEnvironment` looks for them).",
+    )
+    args = parser.parse_args()
+
+    convert_view_caches(env_root_dir=args.env_root_dir, output_dir=args.output_dir)
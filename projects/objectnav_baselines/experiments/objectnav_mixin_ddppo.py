@@ -18,6 +18,7 @@ from allenact.embodiedai.aux_losses.losses import (
     CPCA4Loss,
     CPCA8Loss,
     CPCA16Loss,
+    MultiHorizonCPCALoss,
 )
 
 # noinspection PyUnresolvedReferences
@@ -46,6 +47,7 @@ class ObjectNavMixInPPOConfig(ObjectNavBaseConfig):
         # CPCA4Loss.UUID,
         # CPCA8Loss.UUID,
         # CPCA16Loss.UUID,
+        # MultiHorizonCPCALoss.UUID,  # CPCA1, 2, 4, 8 and 16 with a shared model
     ]
 
     ADD_PREV_ACTIONS = False
@@ -139,6 +141,12 @@ class ObjectNavMixInPPOConfig(ObjectNavBaseConfig):
                 CPCA16Loss(subsample_rate=0.2,),  # TODO: test its effects
                 0.05 * aux_loss_total_weight,  # should times 2
             ),
+            MultiHorizonCPCALoss.UUID: (
+                MultiHorizonCPCALoss(
+                    planning_steps=(1, 2, 4, 8, 16), subsample_rate=0.2,
+                ),
+                0.05 * aux_loss_total_weight,  # per horizon, should times 2
+            ),
         }
         named_losses.update(
             {uuid: total_aux_losses[uuid] for uuid in cls.AUXILIARY_UUIDS}
@@ -19,6 +19,7 @@ from allenact.embodiedai.aux_losses.losses import (
     CPCA4Loss,
     CPCA8Loss,
     CPCA16Loss,
+    MultiHorizonCPCALoss,
 )
 
 # noinspection PyUnresolvedReferences
@@ -48,6 +49,7 @@ class PointNavThorMixInPPOConfig(PointNavBaseConfig, ABC):
         # CPCA4Loss.UUID,
         # CPCA8Loss.UUID,
         # CPCA16Loss.UUID,
+        # MultiHorizonCPCALoss.UUID,  # CPCA1, 2, 4, 8 and 16 with a shared model
     ]
 
     ADD_PREV_ACTIONS = True
@@ -144,6 +146,12 @@ class PointNavThorMixInPPOConfig(PointNavBaseConfig, ABC):
                 CPCA16Loss(subsample_rate=0.2,),  # TODO: test its effects
                 0.05 * aux_loss_total_weight,  # should times 2
             ),
+            MultiHorizonCPCALoss.UUID: (
+                MultiHorizonCPCALoss(
+                    planning_steps=(1, 2, 4, 8, 16), subsample_rate=0.2,
+                ),
+                0.05 * aux_loss_total_weight,  # per horizon, should times 2
+            ),
         }
         named_losses.update(
             {uuid: total_aux_losses[uuid] for uuid in cls.AUXILIARY_UUIDS}
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+"""Benchmark of the steps of the `KFACOptimizer` with its default (all layers
+at once, synchronous) inverse updates against staggered, asynchronous and
+low-rank inverse updates, on the CPU, for a simple convolutional actor critic
+sized model.
+
+Run from the top-level directory with, e.g.,
+
+```bash
+python scripts/benchmark_kfac.py --hidden_size 512 --Tf 10
+```
+"""
+
+import argparse
+import time
+import warnings
+
+import torch
+import torch.nn as nn
+
+from allenact.algorithms.onpolicy_sync.losses.kfac import KFACOptimizer
+
+
+def get_argument_parser():
+    """Creates the argument parser."""
+
+    # noinspection PyTypeChecker
+    parser = argparse.ArgumentParser(
+        description="benchmark_kfac",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("--batch_size", type=int, default=128)
+    parser.add_argument("--hidden_size", type=int, default=512)
+    parser.add_argument("--Tf", type=int, default=10)
+    parser.add_argument("--low_rank_dim", type=int, default=64)
+    parser.add_argument(
+        "--steps", type=int, default=50, help="Number of timed optimizer steps.",
+    )
+    return parser
+
+
+def make_model(hidden_size: int):
+    torch.manual_seed(0)
+    return nn.Sequential(
+        nn.Conv2d(3, 32, 8, stride=4),
+        nn.ReLU(),
+        nn.Conv2d(32, 64, 4, stride=2),
+        nn.ReLU(),
+        nn.Flatten(),
+        nn.Linear(64 * 6 * 6, hidden_size),
+        nn.ReLU(),
+        nn.Linear(hidden_size, 7),
+    )
+
+
+def main():
+    args = get_argument_parser().parse_args()
+    warnings.filterwarnings("ignore", category=UserWarning)
+
+    configs = {
+        "default": {},
+        "staggered": dict(stagger_inverse_updates=True),
+        "async": dict(async_inverse_updates=True),
+        "staggered+async": dict(
+            stagger_inverse_updates=True, async_inverse_updates=True
+        ),
+        "low_rank": dict(
+            large_factor_approximation="low_rank",
+            large_factor_dim=256,
+            low_rank_dim=args.low_rank_dim,
+        ),
+    }
+
+    for name, kwargs in configs.items():
+        model = make_model(args.hidden_size)
+        optimizer = KFACOptimizer(model, Tf=args.Tf, **kwargs)
+        optimizer.acc_stats = True
+        torch.manual_seed(1)
+        inputs = torch.randn(args.batch_size, 3, 64, 64)
+
+        step_times = []
+        for it in range(args.steps + 1):
+            optimizer.zero_grad()
+            model(inputs).pow(2).mean().backward()
+            start = time.perf_counter()
+            optimizer.step()
+            if it > 0:  # skip the initial (synchronous) decompositions
+                step_times.append(time.perf_counter() - start)
+        optimizer.close()
+
+        step_times = torch.tensor(step_times)
+        print(
+            f"{name:>16}:"
+            f" mean step {1e3 * step_times.mean().item():8.3f}ms"
+            f"  max step {1e3 * step_times.max().item():8.3f}ms"
+        )
+
+
+if __name__ == "__main__":
+    main()
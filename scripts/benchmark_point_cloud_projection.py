@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+
+"""Benchmark of `project_point_cloud_to_map` (and its numpy twin
+`_cpu_only_project_point_cloud_to_map`) against the previous implementation,
+which built a `[num_points, 4]` matrix of (cloud, row, col, bin) indices
+before linearizing and counting them.
+
+The default arguments correspond to the maps built by the
+`BinnedPointCloudMapTHORSensor` (224x224 depth frames, 10.5m maps at a 5cm
+resolution). Run from the top-level directory with, e.g.,
+
+```bash
+python scripts/benchmark_point_cloud_projection.py --batch_sizes 1 8 32
+```
+"""
+
+import argparse
+import timeit
+from typing import Sequence
+
+import numpy as np
+import torch
+
+from allenact.embodiedai.mapping.mapping_utils.point_cloud_utils import (
+    _cpu_only_project_point_cloud_to_map,
+    project_point_cloud_to_map,
+)
+
+
+def get_argument_parser():
+    """Creates the argument parser."""
+
+    # noinspection PyTypeChecker
+    parser = argparse.ArgumentParser(
+        description="benchmark_point_cloud_projection",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "--batch_sizes",
+        type=int,
+        nargs="+",
+        default=[1, 8, 32],
+        help="Numbers of point clouds projected at once.",
+    )
+    parser.add_argument(
+        "--resolution", type=int, default=224, help="Resolution of the depth frames."
+    )
+    parser.add_argument(
+        "--map_size_in_cm", type=int, default=1050, help="Map size in cm."
+    )
+    parser.add_argument(
+        "--resolution_in_cm", type=int, default=5, help="Map resolution in cm."
+    )
+    parser.add_argument(
+        "--repeats", type=int, default=20, help="Number of timed calls per case."
+    )
+    parser.add_argument(
+        "--device", type=str, default="cpu", help="Device of the point clouds."
+    )
+    return parser
+
+
+def previous_project_point_cloud_to_map(
+    xyz_points: torch.Tensor,
+    bin_axis: str,
+    bins: Sequence[float],
+    map_size: int,
+    resolution_in_cm: int,
+    flip_row_col: bool,
+):
+    """`project_point_cloud_to_map` before counting points with a single
+    `bincount` over their linearized indices."""
+    bin_dim = ["x", "y", "z"].index(bin_axis)
+
+    start_shape = xyz_points.shape
+    xyz_points = xyz_points.reshape([-1, *start_shape[-3:]])
+    num_clouds, h, w, _ = xyz_points.shape
+
+    if not flip_row_col:
+        new_order = [i for i in [0, 1, 2] if i != bin_dim] + [bin_dim]
+    else:
+        new_order = [i for i in [2, 1, 0] if i != bin_dim] + [bin_dim]
+
+    uvw_points = torch.stack([xyz_points[..., i] for i in new_order], dim=-1)
+
+    num_bins = len(bins) + 1
+
+    isnotnan = ~torch.isnan(xyz_points[..., 0])
+
+    uvw_points_binned = torch.cat(
+        (
+            torch.round(100 * uvw_points[..., :-1] / resolution_in_cm).long(),
+            torch.bucketize(
+                uvw_points[..., -1:].contiguous(), boundaries=uvw_points.new(bins)
+            ),
+        ),
+        dim=-1,
+    )
+
+    maxes = (
+        xyz_points.new()
+        .long()
+        .new([map_size, map_size, num_bins])
+        .reshape((1, 1, 1, 3))
+    )
+
+    isvalid = torch.logical_and(
+        torch.logical_and(
+            (uvw_points_binned >= 0).all(-1), (uvw_points_binned < maxes).all(-1),
+        ),
+        isnotnan,
+    )
+
+    uvw_points_binned_with_index_mat = torch.cat(
+        (
+            torch.repeat_interleave(
+                torch.arange(0, num_clouds).to(xyz_points.device), h * w
+            ).reshape(-1, 1),
+            uvw_points_binned.reshape(-1, 3),
+        ),
+        dim=1,
+    )
+
+    uvw_points_binned_with_index_mat[~isvalid.reshape(-1), :] = 0
+    ind = (
+        uvw_points_binned_with_index_mat[:, 0] * (map_size * map_size * num_bins)
+        + uvw_points_binned_with_index_mat[:, 1] * (map_size * num_bins)
+        + uvw_points_binned_with_index_mat[:, 2] * num_bins
+        + uvw_points_binned_with_index_mat[:, 3]
+    )
+    ind[~isvalid.reshape(-1)] = 0
+    count = torch.bincount(
+        ind.view(-1),
+        isvalid.view(-1).long(),
+        minlength=num_clouds * map_size * map_size * num_bins,
+    )
+
+    return count.view(*start_shape[:-3], map_size, map_size, num_bins)
+
+
+def previous_cpu_only_project_point_cloud_to_map(
+    xyz_points: np.ndarray,
+    bin_axis: str,
+    bins: Sequence[float],
+    map_size: int,
+    resolution_in_cm: int,
+    flip_row_col: bool,
+):
+    """`_cpu_only_project_point_cloud_to_map` before counting points with a
+    single `bincount` over their linearized indices."""
+    bin_dim = ["x", "y", "z"].index(bin_axis)
+
+    start_shape = xyz_points.shape
+    xyz_points = xyz_points.reshape([-1, *start_shape[-3:]])
+    num_clouds, h, w, _ = xyz_points.shape
+
+    if not flip_row_col:
+        new_order = [i for i in [0, 1, 2] if i != bin_dim] + [bin_dim]
+    else:
+        new_order = [i for i in [2, 1, 0] if i != bin_dim] + [bin_dim]
+
+    uvw_points = np.stack([xyz_points[..., i] for i in new_order], axis=-1)
+
+    num_bins = len(bins) + 1
+
+    isnotnan = ~np.isnan(xyz_points[..., 0])
+
+    with np.errstate(invalid="ignore"):
+        uvw_points_binned = np.concatenate(
+            (
+                np.round(100 * uvw_points[..., :-1] / resolution_in_cm).astype(
+                    np.int32
+                ),
+                np.digitize(uvw_points[..., -1:], bins=bins).astype(np.int32),
+            ),
+            axis=-1,
+        )
+
+    maxes = np.array([map_size, map_size, num_bins]).reshape((1, 1, 1, 3))
+
+    isvalid = np.logical_and.reduce(
+        (
+            (uvw_points_binned >= 0).all(-1),
+            (uvw_points_binned < maxes).all(-1),
+            isnotnan,
+        )
+    )
+
+    uvw_points_binned_with_index_mat = np.concatenate(
+        (
+            np.repeat(np.arange(0, num_clouds), h * w).reshape(-1, 1),
+            uvw_points_binned.reshape(-1, 3),
+        ),
+        axis=1,
+    )
+
+    uvw_points_binned_with_index_mat[~isvalid.reshape(-1), :] = 0
+    ind = np.ravel_multi_index(
+        uvw_points_binned_with_index_mat.transpose(),
+        (num_clouds, map_size, map_size, num_bins),
+    )
+    ind[~isvalid.reshape(-1)] = 0
+    count = np.bincount(
+        ind.ravel(),
+        isvalid.ravel().astype(np.int32),
+        minlength=num_clouds * map_size * map_size * num_bins,
+    )
+
+    return count.reshape([*start_shape[:-3], map_size, map_size, num_bins])
+
+
+def make_point_clouds(batch_size: int, resolution: int, map_size_in_cm: int):
+    rng = np.random.RandomState(0)
+    xyz_points = rng.uniform(
+        0, map_size_in_cm / 100, (batch_size, resolution, resolution, 3)
+    ).astype(np.float32)
+    xyz_points[..., 1] = rng.uniform(0, 2.5, xyz_points.shape[:-1])
+    # Depths beyond the vision range are NaN
+    xyz_points[rng.rand(*xyz_points.shape[:-1]) < 0.3] = np.nan
+    return xyz_points
+
+
+def main():
+    args = get_argument_parser().parse_args()
+    kwargs = dict(
+        bin_axis="y",
+        bins=[0.02, 2],
+        map_size=args.map_size_in_cm // args.resolution_in_cm,
+        resolution_in_cm=args.resolution_in_cm,
+        flip_row_col=True,
+    )
+
+    for batch_size in args.batch_sizes:
+        xyz_points_np = make_point_clouds(
+            batch_size=batch_size,
+            resolution=args.resolution,
+            map_size_in_cm=args.map_size_in_cm,
+        )
+        xyz_points = torch.from_numpy(xyz_points_np).to(args.device)
+
+        cases = [
+            (
+                "torch",
+                lambda: previous_project_point_cloud_to_map(xyz_points, **kwargs),
+                lambda: project_point_cloud_to_map(xyz_points, **kwargs),
+            ),
+            (
+                "numpy",
+                lambda: previous_cpu_only_project_point_cloud_to_map(
+                    xyz_points_np, **kwargs
+                ),
+                lambda: _cpu_only_project_point_cloud_to_map(xyz_points_np, **kwargs),
+            ),
+        ]
+
+        print(f"batch size {batch_size}:")
+        for case_name, previous, current in cases:
+            assert np.array_equal(
+                np.asarray(torch.as_tensor(previous()).cpu()),
+                np.asarray(torch.as_tensor(current()).cpu()),
+            ), f"Mismatched {case_name} projections."
+
+            def timed(fn):
+                def step():
+                    fn()
+                    if args.device != "cpu":
+                        torch.cuda.synchronize()
+
+                return timeit.timeit(step, number=args.repeats) / args.repeats
+
+            previous_time = timed(previous)
+            current_time = timed(current)
+            print(
+                f"    {case_name:<6} previous {1e3 * previous_time:9.2f}ms"
+                f"  current {1e3 * current_time:9.2f}ms"
+                f"  speedup {previous_time / current_time:5.2f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
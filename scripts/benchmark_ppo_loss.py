@@ -0,0 +1,103 @@
+#!/usr/bin/env python3
+
+"""Benchmark of the `PPO` loss (`loss_per_step` followed by its reductions)
+against its fused TorchScript version (`PPO(..., use_fused_loss=True)`) on
+the CPU, timing the loss and its backward pass for a growing number of
+samplers.
+
+Run from the top-level directory with, e.g.,
+
+```bash
+python scripts/benchmark_ppo_loss.py --num_steps 128 --num_actions 6
+```
+"""
+
+import argparse
+import timeit
+
+import torch
+
+from allenact.algorithms.onpolicy_sync.losses.ppo import PPO, PPOConfig
+from allenact.base_abstractions.distributions import CategoricalDistr
+from allenact.base_abstractions.misc import ActorCriticOutput
+
+
+def get_argument_parser():
+    """Creates the argument parser."""
+
+    # noinspection PyTypeChecker
+    parser = argparse.ArgumentParser(
+        description="benchmark_ppo_loss",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("--num_steps", type=int, default=128, help="Rollout length.")
+    parser.add_argument(
+        "--num_samplers",
+        type=int,
+        nargs="+",
+        default=[1, 4, 16, 64],
+        help="Numbers of samplers to benchmark.",
+    )
+    parser.add_argument("--num_actions", type=int, default=6)
+    parser.add_argument("--show_ratios", action="store_true")
+    parser.add_argument(
+        "--repeats", type=int, default=100, help="Number of timed loss computations.",
+    )
+    return parser
+
+
+def main():
+    args = get_argument_parser().parse_args()
+    torch.manual_seed(0)
+
+    losses = {
+        fused: PPO(**PPOConfig, show_ratios=args.show_ratios, use_fused_loss=fused)
+        for fused in [False, True]
+    }
+
+    for nsamplers in args.num_samplers:
+        shape = (args.num_steps, nsamplers)
+        logits = torch.randn(*shape, args.num_actions, requires_grad=True)
+        values = torch.randn(*shape, 1, requires_grad=True)
+        batch = {
+            "actions": torch.randint(0, args.num_actions, shape),
+            "old_action_log_probs": -torch.rand(*shape),
+            "values": torch.randn(*shape, 1),
+            "returns": torch.randn(*shape, 1),
+            "norm_adv_targ": torch.randn(*shape, 1),
+        }
+
+        def run(loss):
+            def step():
+                actor_critic_output = ActorCriticOutput(
+                    distributions=CategoricalDistr(logits=logits),
+                    values=values,
+                    extras={},
+                )
+                loss_return = loss.loss(
+                    step_count=0, batch=batch, actor_critic_output=actor_critic_output
+                )
+                loss_return[0].backward()
+                return loss_return
+
+            loss_return = step()  # warm up (and compile)
+            step()
+            return (
+                timeit.timeit(step, number=args.repeats) / args.repeats,
+                loss_return,
+            )
+
+        unfused_time, unfused_return = run(losses[False])
+        fused_time, fused_return = run(losses[True])
+        assert unfused_return[1:] == fused_return[1:], "Fused losses differ."
+
+        print(
+            f"samplers {nsamplers:4d}:"
+            f" unfused {1e3 * unfused_time:7.3f}ms"
+            f"  fused {1e3 * fused_time:7.3f}ms"
+            f"  speedup {unfused_time / fused_time:5.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
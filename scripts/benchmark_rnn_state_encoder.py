@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+"""Benchmark of `RNNStateEncoder.seq_forward` (chunked at every step where
+any sampler starts a new episode) against `RNNStateEncoder.packed_seq_forward`
+(per-episode segments run over a packed sequence) for a growing number of
+samplers.
+
+Run from the top-level directory with, e.g.,
+
+```bash
+python scripts/benchmark_rnn_state_encoder.py --num_steps 128 --mean_episode_length 40
+```
+"""
+
+import argparse
+import timeit
+
+import torch
+
+from allenact.embodiedai.models.basic_models import RNNStateEncoder
+
+
+def get_argument_parser():
+    """Creates the argument parser."""
+
+    # noinspection PyTypeChecker
+    parser = argparse.ArgumentParser(
+        description="benchmark_rnn_state_encoder",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument("--num_steps", type=int, default=128, help="Rollout length.")
+    parser.add_argument(
+        "--num_samplers",
+        type=int,
+        nargs="+",
+        default=[1, 4, 16, 64, 128],
+        help="Numbers of samplers to benchmark.",
+    )
+    parser.add_argument(
+        "--mean_episode_length",
+        type=float,
+        default=40.0,
+        help="Mean episode length (episode ends are sampled independently per step).",
+    )
+    parser.add_argument("--hidden_size", type=int, default=512)
+    parser.add_argument("--rnn_type", type=str, default="GRU")
+    parser.add_argument("--device", type=str, default="cpu")
+    parser.add_argument(
+        "--repeats",
+        type=int,
+        default=10,
+        help="Number of timed forward/backward passes.",
+    )
+    return parser
+
+
+def main():
+    args = get_argument_parser().parse_args()
+    device = torch.device(args.device)
+
+    encoder = RNNStateEncoder(
+        input_size=args.hidden_size,
+        hidden_size=args.hidden_size,
+        rnn_type=args.rnn_type,
+    ).to(device)
+
+    for nsamplers in args.num_samplers:
+        x = torch.randn(args.num_steps, nsamplers, args.hidden_size).to(device)
+        hidden_states = torch.randn(
+            encoder.num_recurrent_layers, nsamplers, args.hidden_size
+        ).to(device)
+        masks = (
+            (torch.rand(args.num_steps, nsamplers, 1) > 1.0 / args.mean_episode_length)
+            .float()
+            .to(device)
+        )
+
+        def run(forward):
+            def step():
+                outputs, final_hidden = forward(x, hidden_states, masks)
+                (outputs.sum() + final_hidden.sum()).backward()
+                if device.type == "cuda":
+                    torch.cuda.synchronize(device)
+
+            step()  # warm up
+            return timeit.timeit(step, number=args.repeats) / args.repeats
+
+        chunked_time = run(encoder.seq_forward)
+        packed_time = run(encoder.packed_seq_forward)
+        nchunks = int((masks[1:] == 0).any(dim=1).sum().item()) + 1
+        print(
+            f"samplers {nsamplers:4d} ({nchunks:4d} chunks):"
+            f" chunked {1e3 * chunked_time:9.2f}ms"
+            f"  packed {1e3 * packed_time:9.2f}ms"
+            f"  speedup {chunked_time / packed_time:5.2f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
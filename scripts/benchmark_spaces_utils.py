@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+
+"""Benchmark of the generic (recursive) `allenact.utils.spaces_utils` action
+converters against their precompiled `CompiledSpace` counterparts.
+
+Covers the action spaces used with `TupleCategoricalDistr` (NavToPartner) and
+`SequentialDistr` (conditional MiniGrid tutorial). Run from the top-level
+directory with, e.g.,
+
+```bash
+python scripts/benchmark_spaces_utils.py --num_samplers 64 --num_steps 128
+```
+"""
+
+import argparse
+import timeit
+from collections import OrderedDict
+
+import torch
+from gym import spaces as gyms
+
+from allenact.utils import spaces_utils as su
+
+ACTION_SPACES = OrderedDict(
+    [
+        ("Discrete", gyms.Discrete(6)),
+        (
+            "NavToPartner (TupleCategoricalDistr)",
+            gyms.Tuple([gyms.Discrete(3), gyms.Discrete(3)]),
+        ),
+        (
+            "SequentialDistr",
+            gyms.Dict({"higher": gyms.Discrete(2), "lower": gyms.Discrete(4)}),
+        ),
+    ]
+)
+
+
+def get_argument_parser():
+    """Creates the argument parser."""
+
+    # noinspection PyTypeChecker
+    parser = argparse.ArgumentParser(
+        description="benchmark_spaces_utils",
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter,
+    )
+    parser.add_argument(
+        "--num_samplers", type=int, default=64, help="Number of task samplers."
+    )
+    parser.add_argument(
+        "--num_steps", type=int, default=128, help="Rollout length (for minibatches)."
+    )
+    parser.add_argument(
+        "--repeats", type=int, default=1000, help="Number of timed calls per case."
+    )
+    return parser
+
+
+def sample_actions(space: gyms.Space, num_steps: int, num_samplers: int):
+    flat = torch.stack(
+        [
+            su.flatten(space, su.torch_point(space, space.sample()))
+            for _ in range(num_steps * num_samplers)
+        ]
+    ).float()
+    return flat.view(num_steps, num_samplers, -1)
+
+
+def main():
+    args = get_argument_parser().parse_args()
+
+    for name, space in ACTION_SPACES.items():
+        compiled = su.CompiledSpace(space)
+        step_flat = sample_actions(space, 1, args.num_samplers)
+        rollout_flat = sample_actions(space, args.num_steps, args.num_samplers)
+        step_actions = su.unflatten(space, step_flat)
+
+        cases = [
+            (
+                "flatten",
+                lambda: su.flatten(space, step_actions),
+                lambda: compiled.flatten(step_actions),
+            ),
+            (
+                "action_list",
+                lambda: su.action_list(space, step_flat),
+                lambda: compiled.action_list(step_flat),
+            ),
+            (
+                "unflatten (minibatch)",
+                lambda: su.unflatten(space, rollout_flat),
+                lambda: compiled.unflatten(rollout_flat),
+            ),
+        ]
+
+        print(f"{name}: {space}")
+        for case_name, generic, fast in cases:
+            generic_time = timeit.timeit(generic, number=args.repeats) / args.repeats
+            fast_time = timeit.timeit(fast, number=args.repeats) / args.repeats
+            print(
+                f"    {case_name:<22} generic {1e6 * generic_time:9.2f}us"
+                f"  compiled {1e6 * fast_time:9.2f}us"
+                f"  speedup {generic_time / fast_time:5.2f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
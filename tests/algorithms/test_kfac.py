@@ -0,0 +1,124 @@
+import warnings
+
+import torch
+import torch.nn as nn
+
+from allenact.algorithms.onpolicy_sync.losses.kfac import KFACOptimizer, _symeig
+
+
+class TestKFACOptimizer(object):
+    @staticmethod
+    def make_model():
+        torch.manual_seed(0)
+        return nn.Sequential(
+            nn.Conv2d(3, 4, 3, padding=1),
+            nn.ReLU(),
+            nn.Flatten(),
+            nn.Linear(4 * 36, 8),
+            nn.Tanh(),
+            nn.Linear(8, 3),
+        )
+
+    def train(self, steps: int = 12, **kwargs):
+        model = self.make_model()
+        optimizer = KFACOptimizer(model, Tf=4, **kwargs)
+        optimizer.acc_stats = True
+        torch.manual_seed(1)
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")  # Deprecated module backward hooks
+            for _ in range(steps):
+                optimizer.zero_grad()
+                model(torch.randn(16, 3, 6, 6)).pow(2).mean().backward()
+                optimizer.step()
+        optimizer.close()
+        return optimizer, torch.cat([p.data.flatten() for p in model.parameters()])
+
+    @staticmethod
+    def reference_precondition(optimizer, m, grad):
+        # Preconditioning with the exact (damped) inverse Kronecker factors
+        la = optimizer.damping + optimizer.weight_decay
+        d_a, q_a = _symeig(optimizer.m_aa[m])
+        d_g, q_g = _symeig(optimizer.m_gg[m])
+        d_a.mul_((d_a > 1e-6).float())
+        d_g.mul_((d_g > 1e-6).float())
+        v = q_g.t() @ grad @ q_a
+        return q_g @ (v / (d_g.unsqueeze(1) * d_a.unsqueeze(0) + la)) @ q_a.t()
+
+    def test_inverse_updates(self):
+        optimizer, params = self.train()
+        assert len(optimizer.eig_denominators) == len(optimizer.modules)
+        torch.manual_seed(2)
+        for m in optimizer.modules:
+            # The cached decompositions are those of the last update (step 8)
+            grad = torch.randn_like(next(m.parameters())).view(
+                optimizer.m_gg[m].size(0), -1
+            )
+            assert torch.allclose(
+                optimizer._precondition(m, grad, optimizer.damping),
+                optimizer.Q_g[m]
+                @ (
+                    optimizer.Q_g[m].t()
+                    @ grad
+                    @ optimizer.Q_a[m]
+                    / optimizer.eig_denominators[m]
+                )
+                @ optimizer.Q_a[m].t(),
+            )
+
+        # Staggered and asynchronous updates only differ by the (staleness of
+        # the) decompositions used
+        for kwargs in [
+            dict(stagger_inverse_updates=True),
+            dict(async_inverse_updates=True),
+            dict(stagger_inverse_updates=True, async_inverse_updates=True),
+        ]:
+            other_optimizer, other_params = self.train(**kwargs)
+            assert other_optimizer._futures == {}
+            assert torch.isfinite(other_params).all()
+            assert torch.allclose(params, other_params, atol=0.05)
+
+        # The 6 (weight and bias) layers are updated at offsets 0, 0, 1, 2, 2, 3
+        staggered, _ = self.train(steps=1, stagger_inverse_updates=True)
+        assert len(staggered.modules) == 6
+        assert [staggered._inverse_update_due(i) for i in range(6)] == [
+            i == 5 for i in range(6)
+        ]
+
+    def test_large_factor_approximations(self):
+        # Only the `4 * 36`-dimensional input factor of the first linear layer
+        # is large
+        optimizer, params = self.train(
+            large_factor_approximation="diagonal", large_factor_dim=100
+        )
+        assert torch.isfinite(params).all()
+        for m in optimizer.modules:
+            large = m is optimizer.modules[2]
+            assert (optimizer.Q_a[m] is None) == large
+            assert optimizer.m_aa[m].dim() == (1 if large else 2)
+            assert optimizer.Q_g[m] is not None and optimizer.m_gg[m].dim() == 2
+
+        optimizer, params = self.train(
+            large_factor_approximation="low_rank", large_factor_dim=100, low_rank_dim=8
+        )
+        assert torch.isfinite(params).all()
+        m = optimizer.modules[2]
+        assert optimizer.Q_a[m].shape == (4 * 36, 8)
+
+        # A low rank factor of rank `low_rank_dim` is preconditioned exactly
+        torch.manual_seed(3)
+        factor = torch.randn(4 * 36, 8, dtype=torch.float64)
+        optimizer.m_aa[m] = factor @ factor.t()
+        optimizer.m_gg[m] = optimizer.m_gg[m].double()
+        optimizer._set_eigs(
+            m, optimizer._compute_eigs(m, optimizer.m_aa[m], optimizer.m_gg[m])
+        )
+        grad = torch.randn(8, 4 * 36, dtype=torch.float64)
+        assert torch.allclose(
+            optimizer._precondition(m, grad, optimizer.damping),
+            self.reference_precondition(optimizer, m, grad),
+        )
+
+
+if __name__ == "__main__":
+    TestKFACOptimizer().test_inverse_updates()
+    TestKFACOptimizer().test_large_factor_approximations()
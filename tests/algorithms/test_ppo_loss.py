@@ -0,0 +1,92 @@
+import itertools
+
+import torch
+
+from allenact.algorithms.onpolicy_sync.losses.ppo import PPO, PPOConfig
+from allenact.base_abstractions.distributions import CategoricalDistr
+from allenact.base_abstractions.misc import ActorCriticOutput
+
+
+class _OtherCategoricalDistr(CategoricalDistr):
+    # Not handled in closed form by the fused loss
+    pass
+
+
+class TestFusedPPOLoss(object):
+    num_steps = 10
+    num_samplers = 3
+    num_actions = 4
+
+    def make_inputs(self, trailing_action_dim: bool, mask_actions: bool):
+        shape = (self.num_steps, self.num_samplers)
+        raw_logits = torch.randn(*shape, self.num_actions, dtype=torch.float64)
+        if mask_actions:
+            raw_logits[:, :, -1] = float("-inf")
+        values = torch.randn(*shape, 1, dtype=torch.float64)
+        actions = torch.randint(0, self.num_actions - 1, shape)
+        if trailing_action_dim:
+            actions = actions.unsqueeze(-1)
+        batch = {
+            "actions": actions,
+            "old_action_log_probs": -torch.rand(actions.shape, dtype=torch.float64),
+            "values": values + 0.2 * torch.randn(*shape, 1, dtype=torch.float64),
+            "returns": torch.randn(*shape, 1, dtype=torch.float64),
+            "norm_adv_targ": torch.randn(*shape, 1, dtype=torch.float64),
+            "adv_targ": torch.randn(*shape, 1, dtype=torch.float64),
+        }
+        return raw_logits, values, batch
+
+    def test_fused_loss(self):
+        torch.manual_seed(0)
+        for (
+            trailing_action_dim,
+            mask_actions,
+            use_clipped_value_loss,
+            normalize_advantage,
+            distr_class,
+        ) in itertools.product(
+            [False, True],
+            [False, True],
+            [False, True],
+            [False, True],
+            [CategoricalDistr, _OtherCategoricalDistr],
+        ):
+            raw_logits, values, batch = self.make_inputs(
+                trailing_action_dim, mask_actions
+            )
+
+            outputs = []
+            for use_fused_loss in [False, True]:
+                logits = raw_logits.clone().requires_grad_()
+                value_preds = values.clone().requires_grad_()
+                loss = PPO(
+                    **PPOConfig,
+                    use_clipped_value_loss=use_clipped_value_loss,
+                    normalize_advantage=normalize_advantage,
+                    show_ratios=True,
+                    use_fused_loss=use_fused_loss,
+                )
+                loss_return = loss.loss(
+                    step_count=0,
+                    batch=batch,
+                    actor_critic_output=ActorCriticOutput(
+                        distributions=distr_class(logits=logits),
+                        values=value_preds,
+                        extras={},
+                    ),
+                )
+                loss_return[0].backward()
+                outputs.append((loss_return, logits.grad, value_preds.grad))
+
+            (
+                (unfused, logits_grad, values_grad),
+                (fused, fused_logits_grad, fused_values_grad,),
+            ) = outputs
+            assert torch.equal(unfused[0], fused[0])
+            assert unfused[1:] == fused[1:]
+            assert torch.allclose(logits_grad, fused_logits_grad)
+            assert torch.allclose(values_grad, fused_values_grad)
+
+
+if __name__ == "__main__":
+    TestFusedPPOLoss().test_fused_loss()
@@ -0,0 +1,292 @@
+import itertools
+import math
+from types import SimpleNamespace
+from typing import Optional
+
+import gym
+import pytest
+import torch
+
+from allenact.algorithms.onpolicy_sync.storage import RolloutStorage
+from allenact.base_abstractions.misc import Memory
+
+
+class TestRolloutStorage(object):
+    num_steps = 6
+    num_samplers = 4
+    hidden_size = 3
+
+    def make_storage(self, num_steps: Optional[int] = None, **kwargs) -> RolloutStorage:
+        actor_critic = SimpleNamespace(
+            accepts_flat_observations=False,
+            recurrent_memory_specification={
+                "rnn": (
+                    (("layer", 1), ("sampler", None), ("hidden", self.hidden_size)),
+                    torch.float32,
+                )
+            },
+            action_space=gym.spaces.Discrete(5),
+        )
+        return RolloutStorage(
+            num_steps=self.num_steps if num_steps is None else num_steps,
+            num_samplers=self.num_samplers,
+            actor_critic=actor_critic,
+            **kwargs
+        )
+
+    @staticmethod
+    def make_observations(num_samplers: int, value: float, extra_key: bool = False):
+        observations = {
+            "rgb": torch.full((num_samplers, 2, 2), value),
+            "goal": {"position": torch.full((num_samplers, 3), value)},
+        }
+        if extra_key:
+            observations["goal"]["rotation"] = torch.full((num_samplers, 1), value)
+        return observations
+
+    def make_memory(self, num_samplers: int, value: float) -> Memory:
+        return Memory(
+            [("rnn", (torch.full((1, num_samplers, self.hidden_size), value), 1))]
+        )
+
+    def insert(self, storage: RolloutStorage, samplers, value: float, **kwargs):
+        num_samplers = len(samplers)
+        storage.insert(
+            observations=self.make_observations(num_samplers, value, **kwargs)
+            if num_samplers > 0
+            else [],
+            memory=self.make_memory(num_samplers, value),
+            actions=torch.full((num_samplers, 1), value),
+            action_log_probs=torch.full((num_samplers, 1), -value),
+            value_preds=torch.full((num_samplers, 1), value),
+            rewards=torch.full((num_samplers, 1), value),
+            masks=torch.ones(num_samplers, 1),
+        )
+
+    def test_compiled_insert(self):
+        storage = self.make_storage(only_store_first_and_last_in_memory=False)
+        storage.insert_observations(self.make_observations(self.num_samplers, 0.0))
+        assert storage._flatten_plans["observations"] is not None
+
+        samplers = list(range(self.num_samplers))
+        self.insert(storage, samplers, 1.0)
+        self.insert(storage, samplers, 2.0)
+        for step in range(3):
+            observations = storage.pick_observation_step(step)
+            assert torch.all(observations["rgb"] == step)
+            assert torch.all(observations["goal"]["position"] == step)
+            if step > 0:
+                assert torch.all(storage.pick_memory_step(step)["rnn"][0] == step)
+
+        # A new nested key is stored (and the plan recompiled)
+        self.insert(storage, samplers, 3.0, extra_key=True)
+        observations = storage.pick_observation_step(3)
+        assert torch.all(observations["goal"]["rotation"] == 3.0)
+        assert any(
+            path == ("goal", "rotation")
+            for _, path in storage._flatten_plans["observations"]
+        )
+        self.insert(storage, samplers, 4.0, extra_key=True)
+        assert torch.all(storage.pick_observation_step(4)["goal"]["rotation"] == 4.0)
+        assert torch.all(storage.pick_observation_step(4)["rgb"] == 4.0)
+
+        # Inputs not matching the compiled plan are left to the generic insert
+        for observations in [
+            self.make_observations(self.num_samplers, 5.0),
+            dict(
+                self.make_observations(self.num_samplers, 5.0, extra_key=True),
+                depth=torch.zeros(self.num_samplers, 1),
+            ),
+            dict(
+                self.make_observations(self.num_samplers, 5.0, extra_key=True),
+                rgb={"left": torch.zeros(self.num_samplers, 2, 2)},
+            ),
+            dict(
+                self.make_observations(self.num_samplers, 5.0, extra_key=True),
+                goal=torch.zeros(self.num_samplers, 3),
+            ),
+            {},
+            [],
+        ]:
+            assert not storage._insert_tensors_compiled(
+                "observations", observations, time_step=5
+            )
+        assert torch.all(storage.pick_observation_step(5)["rgb"] == 0.0)
+
+    def test_insert_all_paused(self):
+        storage = self.make_storage()
+        storage.insert_observations(self.make_observations(self.num_samplers, 0.0))
+        self.insert(storage, list(range(self.num_samplers)), 1.0)
+
+        # As done by the engine once every sampler is paused
+        storage.sampler_select([1])
+        self.insert(storage, [1], 2.0)
+        storage.sampler_select([])
+        assert storage.num_active_samplers == 0
+        self.insert(storage, [], 3.0)
+        assert storage.step == 3
+        assert storage.pick_observation_step(3)["rgb"].shape == (1, 0, 2, 2)
+
+    def test_active_view_parity(self):
+        # Storage compacted on every pause (i.e. the dense layout) against
+        # storage excluding paused samplers through its index view (until more
+        # than half of them are paused, or until computing returns)
+        storages = [
+            self.make_storage(sampler_compaction_threshold=threshold)
+            for threshold in [0.0, 0.5, 1.0]
+        ]
+        stored_samplers = [
+            list(range(self.num_samplers)),
+            [0, 2, 3],
+            [0, 2, 3],
+            [2, 3],
+            [3],
+            [3],
+        ]
+        for storage in storages:
+            storage.insert_observations(self.make_observations(self.num_samplers, 0.0))
+        for step, samplers in enumerate(stored_samplers):
+            picked = []
+            for storage in storages:
+                if step > 0 and samplers != stored_samplers[step - 1]:
+                    previous = stored_samplers[step - 1]
+                    storage.sampler_select([previous.index(it) for it in samplers])
+                picked.append(
+                    (
+                        storage.pick_observation_step(storage.step),
+                        storage.pick_memory_step(storage.step),
+                        storage.pick_prev_actions_step(storage.step),
+                        storage.pick_masks_step(storage.step),
+                    )
+                )
+
+            dense = picked[0]
+            for view in picked[1:]:
+                assert torch.equal(dense[0]["rgb"], view[0]["rgb"])
+                assert torch.equal(
+                    dense[0]["goal"]["position"], view[0]["goal"]["position"]
+                )
+                assert torch.equal(dense[1]["rnn"][0], view[1]["rnn"][0])
+                assert torch.equal(dense[2], view[2])
+                assert torch.equal(dense[3], view[3])
+            for storage in storages:
+                self.insert(storage, samplers, step + 1.0)
+
+        assert [storage.actions.shape[1] for storage in storages] == [1, 1, 4]
+        for storage in storages:
+            storage.compute_returns(
+                torch.zeros(1, 1), use_gae=True, gamma=0.9, tau=0.95
+            )
+        for storage in storages[1:]:
+            for name in ["actions", "prev_actions", "masks", "rewards", "returns"]:
+                assert torch.equal(getattr(storages[0], name), getattr(storage, name))
+            for key in storages[0].observations:
+                assert torch.equal(
+                    storages[0].observations.tensor(key),
+                    storage.observations.tensor(key),
+                )
+            assert torch.equal(
+                storages[0].memory.tensor("rnn"), storage.memory.tensor("rnn")
+            )
+
+    def test_compact_narrowed(self):
+        storage = self.make_storage(sampler_compaction_threshold=1.0)
+        storage.insert_observations(self.make_observations(self.num_samplers, 0.0))
+        storage.narrow(self.num_steps - 1)  # E.g. a stage with shorter rollouts
+
+        samplers = list(range(self.num_samplers))
+        self.insert(storage, samplers, 1.0)
+        storage.sampler_select([1, 3])
+        self.insert(storage, [1, 3], 2.0)
+        self.insert(storage, [1, 3], 3.0)
+        assert storage.actions.shape[1] == self.num_samplers
+
+        # The rollout is interrupted, and its returns computed (compacting it)
+        storage.narrow()
+        assert storage.num_steps == 3
+        storage.compute_returns(torch.zeros(2, 1), use_gae=False, gamma=1.0, tau=1.0)
+        assert storage.returns[0, :, 0].tolist() == [6.0, 6.0]
+        storage.after_update()
+
+        assert storage.num_steps == self.num_steps - 1
+        assert storage.actions.shape == (self.num_steps - 1, 2, 1)
+        assert storage.value_preds.shape == (self.num_steps, 2, 1)
+        assert storage.observations.tensor("rgb").shape == (self.num_steps, 2, 2, 2)
+        assert torch.all(storage.pick_observation_step(0)["rgb"] == 3.0)
+        assert torch.all(storage.pick_memory_step(0)["rnn"][0] == 3.0)
+
+        # New steps are stored in (and read from) the compacted storage
+        self.insert(storage, [1, 3], 4.0)
+        assert torch.all(storage.pick_observation_step(1)["rgb"] == 4.0)
+        assert storage.rewards[0, :, 0].tolist() == [4.0, 4.0]
+
+        storage.unnarrow(unnarrow_to_maximum_size=True)
+        assert storage.num_steps == self.num_steps
+        assert storage.actions.shape == (self.num_steps, 2, 1)
+        assert storage.actions[0, :, 0].tolist() == [4.0, 4.0]
+        assert storage.prev_actions[1, :, 0].tolist() == [4.0, 4.0]
+        assert storage.observations.tensor("rgb").shape == (
+            self.num_steps + 1,
+            2,
+            2,
+            2,
+        )
+        assert torch.all(storage.observations.tensor("rgb")[1] == 4.0)
+        assert storage.memory.tensor("rnn").shape == (2, 1, 2, self.hidden_size)
+
+    def test_chunked_recurrent_generator(self):
+        for num_steps, num_active, chunk_length, num_mini_batch in itertools.product(
+            [6, 7, 3], [4, 3], [2, 4], [1, 2, 3, 5]
+        ):
+            storage = self.make_storage(
+                num_steps=num_steps, only_store_first_and_last_in_memory=False
+            )
+            storage.insert_observations(self.make_observations(self.num_samplers, 0.0))
+            samplers = list(range(self.num_samplers))
+            for step in range(num_steps):
+                if step == 1 and num_active < self.num_samplers:
+                    samplers = samplers[:num_active]
+                    storage.sampler_select(samplers)
+                self.insert(storage, samplers, step + 1.0)
+            storage.compute_returns(
+                torch.zeros(num_active, 1), use_gae=False, gamma=1.0, tau=1.0
+            )
+
+            # Advantages identifying their (step, sampler)
+            advantages = torch.arange(float(num_steps * num_active)).view(
+                num_steps, num_active, 1
+            )
+            generator = storage.recurrent_generator(
+                advantages=advantages,
+                adv_mean=torch.tensor(0.0),
+                adv_std=torch.tensor(1.0),
+                num_mini_batch=num_mini_batch,
+                bptt_chunk_length=chunk_length,
+            )
+            if num_mini_batch > num_active * math.ceil(num_steps / chunk_length):
+                with pytest.raises(AssertionError):
+                    next(generator)
+                continue
+
+            batches = list(generator)
+            assert len(batches) == num_mini_batch
+            covered = torch.cat([batch["adv_targ"].flatten() for batch in batches])
+            assert sorted(covered.tolist()) == advantages.flatten().tolist()
+            for batch in batches:
+                chunk_steps = batch["adv_targ"].shape[0]
+                assert chunk_steps <= chunk_length
+                # Chunks start from the memory (and observations) of their first step
+                first_steps = batch["adv_targ"][0, :, 0] // num_active
+                assert torch.equal(batch["memory"]["rnn"][0][0, :, 0], first_steps)
+                assert torch.equal(
+                    batch["observations"]["rgb"][:, :, 0, 0],
+                    batch["adv_targ"][:, :, 0] // num_active,
+                )
+
+
+if __name__ == "__main__":
+    TestRolloutStorage().test_compiled_insert()
+    TestRolloutStorage().test_insert_all_paused()
+    TestRolloutStorage().test_active_view_parity()
+    TestRolloutStorage().test_compact_narrowed()
+    TestRolloutStorage().test_chunked_recurrent_generator()
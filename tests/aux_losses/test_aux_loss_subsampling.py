@@ -0,0 +1,125 @@
+import pytest
+import torch
+
+from allenact.base_abstractions.misc import ActorCriticOutput
+from allenact.embodiedai.aux_losses.losses import (
+    AuxiliaryLoss,
+    CPCA8Loss,
+    CPCALoss,
+    MultiHorizonCPCALoss,
+)
+
+
+class _RecordingLoss(AuxiliaryLoss):
+    UUID = "Recording"
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(auxiliary_uuid=self.UUID, *args, **kwargs)
+        self.calls = []
+
+    def get_aux_loss(
+        self, aux_model, observations, obs_embeds, actions, beliefs, masks, **kwargs
+    ):
+        self.calls.append(dict(observations=observations, beliefs=beliefs, masks=masks))
+        loss = beliefs.mean()
+        return loss, {"total": loss.item()}
+
+
+class TestAuxiliaryLossSubsampling(object):
+    num_steps = 16
+    num_samplers = 8
+
+    def make_inputs(self):
+        # beliefs[t, n] == (t, n) so that subsampled steps/samplers can be identified
+        steps = torch.arange(self.num_steps).view(-1, 1).expand(-1, self.num_samplers)
+        samplers = (
+            torch.arange(self.num_samplers).view(1, -1).expand(self.num_steps, -1)
+        )
+        beliefs = torch.stack((steps, samplers), dim=-1).float()
+        batch = {
+            "observations": {"rgb": beliefs.clone(), "task_id": torch.tensor(3)},
+            "actions": torch.zeros(self.num_steps, self.num_samplers).long(),
+            "masks": torch.ones(self.num_steps, self.num_samplers, 1),
+        }
+        actor_critic_output = ActorCriticOutput(
+            distributions=None,
+            values=None,
+            extras={
+                _RecordingLoss.UUID: {
+                    "aux_model": None,
+                    "obs_embeds": beliefs.clone(),
+                    "beliefs": beliefs,
+                }
+            },
+        )
+        return dict(step_count=0, batch=batch, actor_critic_output=actor_critic_output)
+
+    def test_default(self):
+        loss = _RecordingLoss()
+        inputs = self.make_inputs()
+        for epoch in range(2):
+            value, _ = loss.loss(**inputs, epoch=epoch, num_epochs=2)
+            assert torch.equal(
+                value,
+                inputs["actor_critic_output"].extras["Recording"]["beliefs"].mean(),
+            )
+        assert loss.calls[0]["beliefs"].shape == (self.num_steps, self.num_samplers, 2)
+
+    def test_subsampled_steps_and_samplers(self):
+        torch.manual_seed(0)
+        loss = _RecordingLoss(sampler_subsample_fraction=0.25, max_subsampled_steps=5)
+        inputs = self.make_inputs()
+        for _ in range(10):
+            loss.loss(**inputs)
+
+        starts = set()
+        for call in loss.calls:
+            beliefs = call["beliefs"]
+            assert beliefs.shape == (5, 2, 2)
+            assert call["masks"].shape == (5, 2, 1)
+            assert torch.equal(call["observations"]["rgb"], beliefs)
+            assert call["observations"]["task_id"].item() == 3
+
+            steps, samplers = beliefs[:, 0, 0], beliefs[0, :, 1]
+            assert torch.equal(steps, steps[0] + torch.arange(5).float())
+            assert samplers[0] < samplers[1]
+            assert (beliefs[:, :, 1] == samplers.view(1, -1)).all()
+            starts.add(int(steps[0]))
+        assert len(starts) > 1
+
+    def test_first_epoch_only(self):
+        loss = _RecordingLoss(first_epoch_only=True)
+        inputs = self.make_inputs()
+        full_loss = inputs["actor_critic_output"].extras["Recording"]["beliefs"].mean()
+
+        value, info = loss.loss(**inputs, epoch=0, num_epochs=4)
+        assert torch.allclose(value, 4 * full_loss)
+        assert info["total"] == full_loss.item()
+        for epoch in range(1, 4):
+            value, info = loss.loss(**inputs, epoch=epoch, num_epochs=4)
+            assert value.item() == 0 and info == {}
+        assert len(loss.calls) == 1
+
+        # Without epoch information, e.g. when called outside of training
+        value, _ = loss.loss(**inputs)
+        assert torch.equal(value, full_loss)
+
+    def test_cpca_planning_steps(self):
+        # Windows of steps shorter than the CPC|A predictions are rejected
+        for make_loss in [
+            lambda steps: CPCALoss(planning_steps=4, max_subsampled_steps=steps),
+            lambda steps: CPCA8Loss(max_subsampled_steps=2 * steps),
+            lambda steps: MultiHorizonCPCALoss(
+                planning_steps=(1, 4, 2), max_subsampled_steps=steps
+            ),
+        ]:
+            with pytest.raises(AssertionError, match="planning_steps"):
+                make_loss(3)
+            assert make_loss(4).max_subsampled_steps in [4, 8]
+
+
+if __name__ == "__main__":
+    TestAuxiliaryLossSubsampling().test_default()
+    TestAuxiliaryLossSubsampling().test_subsampled_steps_and_samplers()
+    TestAuxiliaryLossSubsampling().test_first_epoch_only()
+    TestAuxiliaryLossSubsampling().test_cpca_planning_steps()
@@ -0,0 +1,92 @@
+import torch
+import torch.nn as nn
+
+from allenact.embodiedai.aux_losses.losses import (
+    CPCALoss,
+    MultiHorizonCPCALoss,
+    _cpca_valid_masks,
+)
+
+
+class _CPCAAuxModel(nn.Module):
+    # Same submodules as the CPC|A `AuxiliaryModel`s
+    def __init__(self, action_dim=4, obs_embed_dim=8, belief_dim=16):
+        super().__init__()
+        self.action_embedder = nn.Embedding(action_dim + 1, 4)
+        self.context_model = nn.GRU(4, belief_dim)
+        self.classifier = nn.Sequential(
+            nn.Linear(belief_dim + obs_embed_dim, 32), nn.ReLU(), nn.Linear(32, 1),
+        )
+
+
+class TestCPCALosses(object):
+    num_steps = 32
+    num_samplers = 6
+
+    def make_inputs(self):
+        torch.manual_seed(0)
+        masks = (torch.rand(self.num_steps, self.num_samplers, 1) > 0.15).float()
+        masks[0] = 0
+        masks[:, 3] = 0  # single step episodes only
+        return dict(
+            aux_model=_CPCAAuxModel(),
+            observations={},
+            obs_embeds=torch.randn(self.num_steps, self.num_samplers, 8),
+            actions=torch.randint(0, 4, (self.num_steps, self.num_samplers)),
+            beliefs=torch.randn(self.num_steps, self.num_samplers, 16),
+            masks=masks,
+        )
+
+    def test_valid_masks(self):
+        torch.manual_seed(0)
+        masks = (torch.rand(self.num_steps, self.num_samplers) > 0.2).float()
+        planning_steps = 5
+        valid_masks = _cpca_valid_masks(masks, planning_steps)
+        assert valid_masks.shape == (
+            self.num_steps,
+            planning_steps,
+            self.num_samplers,
+            1,
+        )
+
+        for t in range(self.num_steps):
+            for j in range(1, planning_steps + 1):
+                for n in range(self.num_samplers):
+                    valid = t + j < self.num_steps and bool(
+                        (masks[t + 1 : t + j + 1, n] != 0).all()
+                    )
+                    assert valid_masks[t, j - 1, n, 0] == float(valid)
+
+    def test_multi_horizon_loss(self):
+        inputs = self.make_inputs()
+        planning_steps = [1, 2, 4, 8, 16]
+        weights = [1.0, 0.5, 2.0, 1.0, 0.25]
+
+        # Without subsampling the losses only depend on the (seeded) negatives
+        torch.manual_seed(1)
+        loss, info = MultiHorizonCPCALoss(
+            planning_steps=planning_steps,
+            planning_steps_weights=weights,
+            subsample_rate=1.0,
+        ).get_aux_loss(**inputs)
+
+        expected_loss = 0
+        for steps, weight in zip(planning_steps, weights):
+            torch.manual_seed(1)
+            single_loss, single_info = CPCALoss(
+                planning_steps=steps, subsample_rate=1.0
+            ).get_aux_loss(**inputs)
+            expected_loss = expected_loss + weight * single_loss
+            for key in ["total", "positive_loss", "negative_loss"]:
+                assert abs(info["{}_{}".format(key, steps)] - single_info[key]) < 1e-5
+
+        assert torch.allclose(loss, expected_loss, atol=1e-5)
+        assert abs(info["total"] - loss.item()) < 1e-6
+
+        loss.backward()
+        assert inputs["aux_model"].context_model.weight_hh_l0.grad is not None
+
+
+if __name__ == "__main__":
+    TestCPCALosses().test_valid_masks()
+    TestCPCALosses().test_multi_horizon_loss()
@@ -0,0 +1,83 @@
+import torch
+import torch.nn as nn
+
+from allenact.embodiedai.aux_losses.losses import (
+    InverseDynamicsLoss,
+    TemporalDistanceLoss,
+    _propagate_final_beliefs_to_all_steps,
+)
+
+
+class TestEpisodeLosses(object):
+    num_steps = 20
+    num_samplers = 5
+
+    def make_masks(self):
+        torch.manual_seed(0)
+        masks = (torch.rand(self.num_steps, self.num_samplers) > 0.2).float()
+        masks[:, 1] = 1  # a single episode
+        masks[:, 2] = 0  # single step episodes only
+        return masks
+
+    def test_propagate_final_beliefs(self):
+        masks = self.make_masks()
+        beliefs = torch.randn(self.num_steps, self.num_samplers, 3)
+        final_beliefs, locs_batch = _propagate_final_beliefs_to_all_steps(
+            beliefs, masks, self.num_samplers, self.num_steps
+        )
+
+        expected_locs = []
+        for n in range(self.num_samplers):
+            starts = [0] + [t for t in range(1, self.num_steps) if masks[t, n] == 0]
+            ends = [t - 1 for t in starts[1:]] + [self.num_steps - 1]
+            for start, end in zip(starts, ends):
+                expected_locs.append([n, start, end])
+                for t in range(start, end + 1):
+                    assert torch.equal(final_beliefs[t, n], beliefs[end, n])
+        assert locs_batch.tolist() == expected_locs
+
+    def test_losses(self):
+        masks = self.make_masks().unsqueeze(-1)
+        inputs = dict(
+            observations={},
+            obs_embeds=torch.randn(self.num_steps, self.num_samplers, 8),
+            actions=torch.randint(0, 4, (self.num_steps, self.num_samplers)),
+            beliefs=torch.randn(self.num_steps, self.num_samplers, 16),
+            masks=masks,
+        )
+
+        # Sampled pairs of steps are within the same episode
+        sampled_features = []
+
+        def temporal_distance_model(features):
+            sampled_features.append(features)
+            return features.new_zeros(features.shape[:-1] + (1,))
+
+        loss, info = TemporalDistanceLoss(num_pairs=4).get_aux_loss(
+            aux_model=temporal_distance_model, **inputs
+        )
+        assert torch.isfinite(loss) and info["total"] == loss.item()
+        _, locs_batch = _propagate_final_beliefs_to_all_steps(
+            inputs["beliefs"], masks.squeeze(-1), self.num_samplers, self.num_steps
+        )
+        features = sampled_features[0]
+        assert features.shape == (locs_batch.shape[0], 4, 2 * 8 + 16)
+        for m, (n, start, end) in enumerate(locs_batch.tolist()):
+            episode_embeds = inputs["obs_embeds"][start : end + 1, n]
+            for embeds in [features[m, :, :8], features[m, :, 8:16]]:
+                assert (
+                    (embeds.unsqueeze(1) == episode_embeds.unsqueeze(0))
+                    .all(-1)
+                    .any(-1)
+                    .all()
+                )
+
+        loss, info = InverseDynamicsLoss(subsample_rate=1.0).get_aux_loss(
+            aux_model=nn.Linear(2 * 8 + 16, 4), **inputs
+        )
+        assert torch.isfinite(loss) and info["total"] == loss.item()
+
+
+if __name__ == "__main__":
+    TestEpisodeLosses().test_propagate_final_beliefs()
+    TestEpisodeLosses().test_losses()
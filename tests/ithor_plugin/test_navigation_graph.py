@@ -0,0 +1,101 @@
+import os
+import random
+import tempfile
+
+import networkx as nx
+import numpy as np
+
+from allenact_plugins.ithor_plugin.ithor_navigation_graph import CompiledNavigationGraph
+
+
+class TestCompiledNavigationGraph(object):
+    @staticmethod
+    def make_graph(seed: int = 0, grid_size: float = 0.25):
+        rng = random.Random(seed)
+        cells = {(ix, iz) for ix in range(6) for iz in range(5) if rng.random() < 0.8}
+        g = nx.DiGraph()
+        for ix, iz in cells:
+            for rot in [0, 90, 180, 270]:
+                s = (round(ix * grid_size, 2), round(iz * grid_size, 2), rot, 0)
+                g.add_edge(s, s[:2] + ((rot + 90) % 360, 0), action="RotateRight")
+                g.add_edge(s, s[:2] + ((rot - 90) % 360, 0), action="RotateLeft")
+                dx, dz = {0: (0, 1), 90: (1, 0), 180: (0, -1), 270: (-1, 0)}[rot]
+                if (ix + dx, iz + dz) in cells and rng.random() < 0.9:
+                    t = (
+                        round((ix + dx) * grid_size, 2),
+                        round((iz + dz) * grid_size, 2),
+                        rot,
+                        0,
+                    )
+                    g.add_edge(s, t, action="MoveAhead")
+        return g
+
+    @staticmethod
+    def same_graph(g0: nx.DiGraph, g1: nx.DiGraph):
+        return set(g0.nodes()) == set(g1.nodes()) and set(
+            g0.edges(data="action")
+        ) == set(g1.edges(data="action"))
+
+    @staticmethod
+    def check_matches_graph(compiled: CompiledNavigationGraph, g: nx.DiGraph):
+        rng = random.Random(1)
+        nodes = list(g.nodes())
+        for goal_key in rng.sample(nodes, 10):
+            expected_lengths = nx.shortest_path_length(g, target=goal_key)
+            goal = compiled.node_to_index[goal_key]
+            for source_key in nodes:
+                source = compiled.node_to_index[source_key]
+                length = compiled.shortest_path_length(source, goal)
+                if source_key not in expected_lengths:
+                    assert not np.isfinite(length)
+                    assert compiled.shortest_path(source, goal) is None
+                    continue
+
+                assert length == expected_lengths[source_key]
+                path = compiled.shortest_path(source, goal)
+                assert len(path) == length + 1
+                for s, t in zip(path[:-1], path[1:]):
+                    assert g.has_edge(compiled.nodes[s], compiled.nodes[t])
+                if source != goal:
+                    assert (
+                        compiled.next_action(source, goal)
+                        == g.get_edge_data(source_key, compiled.nodes[path[1]])[
+                            "action"
+                        ]
+                    )
+
+    def test_shortest_paths(self):
+        g = self.make_graph()
+        compiled = CompiledNavigationGraph.from_graph(g)
+        assert compiled.num_nodes == g.number_of_nodes()
+        assert len(compiled.indices) == g.number_of_edges()
+        self.check_matches_graph(compiled, g)
+
+        # Removing edges must be reflected in (memoized) distance tables
+        for s, t, action in list(g.edges(data="action")):
+            if action == "MoveAhead" and random.Random(hash(s)).random() < 0.3:
+                g.remove_edge(s, t)
+                compiled.remove_edge(s, t)
+        self.check_matches_graph(compiled, g)
+        assert self.same_graph(compiled.to_graph(), g)
+
+    def test_save_load(self):
+        g = self.make_graph(seed=2)
+        compiled = CompiledNavigationGraph.from_graph(g)
+        s, t = next((s, t) for s, t, a in g.edges(data="action") if a == "MoveAhead")
+        g.remove_edge(s, t)
+        compiled.remove_edge(s, t)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            path = os.path.join(tmpdir, "FloorPlan1.npz")
+            compiled.save(path)
+            loaded = CompiledNavigationGraph.load(path)
+
+        assert loaded.nodes == compiled.nodes
+        assert self.same_graph(loaded.to_graph(), g)
+        self.check_matches_graph(loaded, g)
+
+
+if __name__ == "__main__":
+    TestCompiledNavigationGraph().test_shortest_paths()
+    TestCompiledNavigationGraph().test_save_load()
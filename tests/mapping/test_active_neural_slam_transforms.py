@@ -0,0 +1,95 @@
+import torch
+
+from allenact.embodiedai.mapping.mapping_models.active_neural_slam import (
+    ActiveNeuralSLAM,
+    _RotationGridCache,
+    _move_egocentric_map_view_into_allocentric_position,
+)
+
+
+class TestActiveNeuralSLAMTransforms(object):
+    resolution_in_cm = 5
+    allocentric_map_height_width = (240, 240)
+
+    @staticmethod
+    def make_xzrs(rotations):
+        # Positions are multiples of the map resolution
+        positions = [[3.0, 4.0], [6.0, 5.0], [2.5, 7.05], [9.5, 1.0], [0.3, 11.5]]
+        return torch.tensor(
+            [xz + [rot] for xz, rot in zip(positions, rotations)], dtype=torch.float32,
+        )
+
+    def move(self, ego_maps, xzrs, **kwargs):
+        return _move_egocentric_map_view_into_allocentric_position(
+            map_probs_egocentric=ego_maps,
+            xzrs_allocentric=xzrs,
+            allocentric_map_height_width=self.allocentric_map_height_width,
+            resolution_in_cm=self.resolution_in_cm,
+            **kwargs
+        )
+
+    def test_move_egocentric_map_view(self):
+        torch.manual_seed(0)
+        ego_maps = torch.rand(5, 3, 40, 40)
+
+        xzrs = self.make_xzrs([0.0, 90.0, 180.0, 270.0, -90.0])
+        full_size = self.move(ego_maps, xzrs)
+        for rotation_grid_cache in [None, _RotationGridCache(90)]:
+            cropped = self.move(
+                ego_maps,
+                xzrs,
+                use_cropped_transform=True,
+                rotation_grid_cache=rotation_grid_cache,
+            )
+            assert torch.allclose(full_size, cropped, atol=1e-4)
+
+        # Cached grids are used for multiples of the rotation increment only
+        rotation_grid_cache = _RotationGridCache(30)
+        for rotations in [[30.0, -60.0, 330.0, 90.0, 720.0], [10.0, 0, 0, 0, 0]]:
+            xzrs = self.make_xzrs(rotations)
+            uncached = self.move(ego_maps, xzrs, use_cropped_transform=True)
+            for _ in range(2):
+                cached = self.move(
+                    ego_maps,
+                    xzrs,
+                    use_cropped_transform=True,
+                    rotation_grid_cache=rotation_grid_cache,
+                )
+                assert torch.allclose(uncached, cached, atol=1e-4)
+        assert len(rotation_grid_cache._grids) == 1
+
+    def test_allocentric_map_to_egocentric_view(self):
+        torch.manual_seed(0)
+        kwargs = dict(
+            frame_height=64,
+            frame_width=64,
+            n_map_channels=3,
+            resolution_in_cm=self.resolution_in_cm,
+            map_size_in_cm=1200,
+            vision_range_in_cm=200,
+            pretrained_resnet=False,
+        )
+        full_size_model = ActiveNeuralSLAM(**kwargs)
+        cropped_model = ActiveNeuralSLAM(
+            **kwargs,
+            use_cropped_map_transforms=True,
+            grid_cache_rotation_increment_in_degrees=30
+        )
+
+        allocentric_maps = torch.rand(5, 3, *self.allocentric_map_height_width)
+        xzrs = self.make_xzrs([0.0, 90.0, 33.3, 300.0, 30.0])
+        xzrs[2, :2] += 0.013
+        for padding_mode in ["zeros", "border"]:
+            full_size = full_size_model.allocentric_map_to_egocentric_view(
+                allocentric_maps, xzrs, padding_mode
+            )
+            cropped = cropped_model.allocentric_map_to_egocentric_view(
+                allocentric_maps, xzrs, padding_mode
+            )
+            assert full_size.shape == cropped.shape == (5, 3, 40, 40)
+            assert torch.allclose(full_size, cropped, atol=1e-4)
+
+
+if __name__ == "__main__":
+    TestActiveNeuralSLAMTransforms().test_move_egocentric_map_view()
+    TestActiveNeuralSLAMTransforms().test_allocentric_map_to_egocentric_view()
@@ -0,0 +1,163 @@
+import numpy as np
+import torch
+
+from allenact.embodiedai.mapping.mapping_utils.map_builders import (
+    BatchedBinnedPointCloudMapBuilder,
+    BatchedSemanticMapBuilder,
+    BinnedPointCloudMapBuilder,
+    ObjectHull2d,
+    SemanticMapBuilder,
+)
+
+
+class TestBatchedMapBuilders(object):
+    fov = 90
+    vision_range_in_cm = 40 * 5
+    map_size_in_cm = 1050
+    resolution_in_cm = 5
+    batch_size = 3
+
+    @staticmethod
+    def make_poses(rng: np.random.RandomState, batch_size: int):
+        depth_frames = rng.uniform(0.2, 3.0, (batch_size, 32, 32)).astype(np.float32)
+        camera_xyzs = np.stack(
+            [
+                rng.uniform(-1.0, 1.0, batch_size),
+                np.full(batch_size, 0.9),
+                rng.uniform(-1.0, 1.0, batch_size),
+            ],
+            axis=1,
+        ).astype(np.float32)
+        rotations = rng.choice([0.0, 90.0, 180.0, 270.0, 30.0], batch_size)
+        horizons = rng.choice([0.0, 30.0, -30.0], batch_size)
+        return depth_frames, camera_xyzs, rotations, horizons
+
+    def test_binned_point_cloud_map_builder(self):
+        rng = np.random.RandomState(0)
+        kwargs = dict(
+            fov=self.fov,
+            vision_range_in_cm=self.vision_range_in_cm,
+            map_size_in_cm=self.map_size_in_cm,
+            resolution_in_cm=self.resolution_in_cm,
+            height_bins=[0.02, 2],
+        )
+        builders = [
+            BinnedPointCloudMapBuilder(**kwargs) for _ in range(self.batch_size)
+        ]
+        batched_builder = BatchedBinnedPointCloudMapBuilder(
+            batch_size=self.batch_size, **kwargs
+        )
+
+        min_xyzs = np.array([[-5.0, 0.0, -5.0]] * self.batch_size, dtype=np.float32)
+        for builder, min_xyz in zip(builders, min_xyzs):
+            builder.reset(min_xyz)
+        batched_builder.reset(min_xyzs)
+
+        for step in range(4):
+            if step == 2:
+                # Reset a single agent's map
+                builders[1].reset(min_xyzs[1])
+                batched_builder.reset(min_xyzs[1:2], agent_indices=[1])
+
+            depth_frames, camera_xyzs, rotations, horizons = self.make_poses(
+                rng, self.batch_size
+            )
+            outputs = [
+                builder.update(
+                    depth_frame=depth_frames[it].copy(),
+                    camera_xyz=camera_xyzs[it],
+                    camera_rotation=rotations[it],
+                    camera_horizon=horizons[it],
+                )
+                for it, builder in enumerate(builders)
+            ]
+            batched_output = batched_builder.update(
+                depth_frames=torch.from_numpy(depth_frames),
+                camera_xyzs=camera_xyzs,
+                camera_rotations=rotations,
+                camera_horizons=horizons,
+            )
+
+            for key in ["egocentric_update", "allocentric_update", "map"]:
+                expected = np.stack([output[key] for output in outputs], 0)
+                assert batched_output[key].shape == expected.shape
+                # Points lying exactly on bin boundaries may be rounded differently
+                assert (
+                    np.abs(batched_output[key].numpy() - expected).sum()
+                    <= 1e-3 * expected.sum()
+                )
+
+    def test_semantic_map_builder(self):
+        rng = np.random.RandomState(1)
+        object_types = ["Bed", "Chair", "Table"]
+        kwargs = dict(
+            fov=self.fov,
+            vision_range_in_cm=self.vision_range_in_cm,
+            map_size_in_cm=self.map_size_in_cm,
+            resolution_in_cm=self.resolution_in_cm,
+            ordered_object_types=object_types,
+        )
+        builders = [SemanticMapBuilder(**kwargs) for _ in range(self.batch_size)]
+        batched_builder = BatchedSemanticMapBuilder(
+            batch_size=self.batch_size, **kwargs
+        )
+
+        min_xyzs = np.array([[-5.0, 0.0, -5.0]] * self.batch_size, dtype=np.float32)
+        object_hulls = [
+            [
+                ObjectHull2d(
+                    object_id="{}|{}".format(ot, it),
+                    object_type=ot,
+                    hull_points=[
+                        [x, z],
+                        [x + 0.5, z],
+                        [x + 0.5, z + 0.8],
+                        [x, z + 0.8],
+                    ],
+                )
+                for ot, (x, z) in zip(
+                    object_types, rng.uniform(-2, 1.5, (len(object_types), 2))
+                )
+            ]
+            for it in range(self.batch_size)
+        ]
+        for builder, min_xyz, hulls in zip(builders, min_xyzs, object_hulls):
+            builder.reset(min_xyz, hulls)
+        batched_builder.reset(min_xyzs, object_hulls)
+        assert np.array_equal(
+            batched_builder.ground_truth_semantic_map.numpy(),
+            np.stack([b.ground_truth_semantic_map > 0 for b in builders], 0),
+        )
+
+        for step in range(3):
+            depth_frames, camera_xyzs, rotations, horizons = self.make_poses(
+                rng, self.batch_size
+            )
+            outputs = [
+                builder.update(
+                    depth_frame=depth_frames[it].copy(),
+                    camera_xyz=camera_xyzs[it],
+                    camera_rotation=rotations[it],
+                    camera_horizon=horizons[it],
+                )
+                for it, builder in enumerate(builders)
+            ]
+            batched_output = batched_builder.update(
+                depth_frames=depth_frames,
+                camera_xyzs=camera_xyzs,
+                camera_rotations=rotations,
+                camera_horizons=horizons,
+            )
+
+            for key in ["egocentric_update", "egocentric_mask", "explored_mask", "map"]:
+                expected = np.stack([output[key] for output in outputs], 0)
+                actual = batched_output[key].numpy()
+                assert actual.shape == expected.shape
+                assert np.abs(actual.astype(np.float32) - expected).sum() <= 1e-3 * max(
+                    expected.sum(), 1
+                )
+
+
+if __name__ == "__main__":
+    TestBatchedMapBuilders().test_binned_point_cloud_map_builder()
+    TestBatchedMapBuilders().test_semantic_map_builder()
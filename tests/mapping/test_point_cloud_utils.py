@@ -0,0 +1,194 @@
+import numpy as np
+import torch
+
+from allenact.embodiedai.mapping.mapping_utils.point_cloud_utils import (
+    _camera_space_rays,
+    _cpu_only_depth_frame_to_world_space_xyz,
+    _cpu_only_project_point_cloud_to_map,
+    depth_frame_to_camera_space_xyz,
+    depth_frame_to_world_space_xyz,
+    project_point_cloud_to_map,
+)
+
+
+class TestDepthFrameToWorldSpaceXYZ(object):
+    def test_batched_depth_frames(self):
+        rng = np.random.RandomState(0)
+        depth_frames = rng.uniform(0.1, 5.0, (4, 16, 16))
+        camera_xyzs = rng.uniform(-3.0, 3.0, (4, 3))
+        rotations = np.array([0.0, 30.0, 90.0, 270.0])
+        horizons = np.array([0.0, 30.0, -30.0, 60.0])
+
+        _camera_space_rays.cache_clear()
+        expected = np.stack(
+            [
+                _cpu_only_depth_frame_to_world_space_xyz(
+                    depth_frame=depth_frame,
+                    camera_world_xyz=camera_xyz,
+                    rotation=rotation,
+                    horizon=horizon,
+                    fov=79,
+                )
+                for depth_frame, camera_xyz, rotation, horizon in zip(
+                    depth_frames, camera_xyzs, rotations, horizons
+                )
+            ]
+        )
+        singles = torch.stack(
+            [
+                depth_frame_to_world_space_xyz(
+                    depth_frame=torch.from_numpy(depth_frames[it]),
+                    camera_world_xyz=torch.from_numpy(camera_xyzs[it]),
+                    rotation=rotations[it],
+                    horizon=horizons[it],
+                    fov=79,
+                )
+                for it in range(len(depth_frames))
+            ]
+        )
+        batched = depth_frame_to_world_space_xyz(
+            depth_frame=torch.from_numpy(depth_frames),
+            camera_world_xyz=torch.from_numpy(camera_xyzs),
+            rotation=torch.from_numpy(rotations),
+            horizon=horizons.tolist(),
+            fov=79,
+        )
+        assert batched.shape == (4, 16, 16, 3)
+        assert np.allclose(singles.numpy(), expected, atol=1e-5)
+        assert torch.allclose(batched, singles, atol=1e-6)
+
+        # The camera space rays were only computed once
+        assert _camera_space_rays.cache_info().misses == 1
+
+        # Rotations are built with the dtype (and on the device) of the frames
+        batched_float = depth_frame_to_world_space_xyz(
+            depth_frame=torch.from_numpy(depth_frames).float(),
+            camera_world_xyz=torch.from_numpy(camera_xyzs).float(),
+            rotation=torch.from_numpy(rotations),
+            horizon=horizons,
+            fov=79,
+        )
+        assert batched_float.dtype == torch.float32
+        assert torch.allclose(batched_float.double(), batched, atol=1e-4)
+
+    def test_masked_depth_frame(self):
+        rng = np.random.RandomState(1)
+        depth_frame = torch.from_numpy(rng.uniform(0.1, 5.0, (8, 8)))
+        mask = depth_frame > 2.0
+
+        unmasked = depth_frame_to_camera_space_xyz(depth_frame, mask=None, fov=90)
+        masked = depth_frame_to_camera_space_xyz(depth_frame, mask=mask, fov=90)
+        assert torch.equal(masked, unmasked[:, mask.view(-1)])
+
+
+class TestProjectPointCloudToMap(object):
+    map_size = 12
+    resolution_in_cm = 25
+    bins = [0.5, 1.5]
+
+    @staticmethod
+    def make_point_clouds(rng: np.random.RandomState, shape=(2, 3, 8, 8)):
+        xyz_points = rng.uniform(-0.5, 3.5, shape + (3,))
+        # Points lying outside of the map or that are NaN should be ignored
+        xyz_points[rng.rand(*shape) < 0.1] = np.nan
+        return xyz_points
+
+    def count_points(self, xyz_points: np.ndarray, flip_row_col: bool):
+        """Per-point reference implementation."""
+        num_bins = len(self.bins) + 1
+        xyz_points = xyz_points.reshape((-1, *xyz_points.shape[-3:]))
+        counts = np.zeros((xyz_points.shape[0], self.map_size, self.map_size, num_bins))
+        for cloud_ind, cloud in enumerate(xyz_points):
+            for x, y, z in cloud.reshape(-1, 3):
+                if np.isnan(x):
+                    continue
+                row, col = np.round(100 * np.array([x, z]) / self.resolution_in_cm)
+                if flip_row_col:
+                    row, col = col, row
+                if 0 <= row < self.map_size and 0 <= col < self.map_size:
+                    bin_ind = np.digitize(y, bins=self.bins)
+                    counts[cloud_ind, int(row), int(col), bin_ind] += 1
+        return counts
+
+    def test_projection(self):
+        rng = np.random.RandomState(0)
+        xyz_points = self.make_point_clouds(rng)
+
+        for flip_row_col in [True, False]:
+            expected = self.count_points(xyz_points, flip_row_col=flip_row_col)
+            expected = expected.reshape((*xyz_points.shape[:-3], *expected.shape[-3:]))
+
+            for dtype in [torch.float32, torch.float64]:
+                counts = project_point_cloud_to_map(
+                    xyz_points=torch.from_numpy(xyz_points).to(dtype),
+                    bin_axis="y",
+                    bins=self.bins,
+                    map_size=self.map_size,
+                    resolution_in_cm=self.resolution_in_cm,
+                    flip_row_col=flip_row_col,
+                )
+                assert counts.dtype == torch.float64
+                assert np.array_equal(counts.numpy(), expected)
+
+            # Windows of the map (including an empty one)
+            for rows, cols in [
+                (slice(2, 7), slice(0, 12)),
+                (slice(5, None), slice(3, 4)),
+                (slice(4, 4), slice(None)),
+            ]:
+                window_counts = project_point_cloud_to_map(
+                    xyz_points=torch.from_numpy(xyz_points),
+                    bin_axis="y",
+                    bins=self.bins,
+                    map_size=self.map_size,
+                    resolution_in_cm=self.resolution_in_cm,
+                    flip_row_col=flip_row_col,
+                    map_window=(rows, cols),
+                )
+                assert np.array_equal(
+                    window_counts.numpy(), expected[..., rows, cols, :]
+                )
+
+            cpu_counts = _cpu_only_project_point_cloud_to_map(
+                xyz_points=xyz_points,
+                bin_axis="y",
+                bins=self.bins,
+                map_size=self.map_size,
+                resolution_in_cm=self.resolution_in_cm,
+                flip_row_col=flip_row_col,
+            )
+            assert cpu_counts.dtype == np.float64
+            assert np.array_equal(cpu_counts, expected)
+
+    def test_single_cloud_and_no_bins(self):
+        rng = np.random.RandomState(1)
+        xyz_points = self.make_point_clouds(rng, shape=(10, 10))
+
+        counts = project_point_cloud_to_map(
+            xyz_points=torch.from_numpy(xyz_points),
+            bin_axis="y",
+            bins=[],
+            map_size=self.map_size,
+            resolution_in_cm=self.resolution_in_cm,
+            flip_row_col=True,
+        )
+        assert counts.shape == (self.map_size, self.map_size, 1)
+        assert np.array_equal(
+            counts.numpy(),
+            _cpu_only_project_point_cloud_to_map(
+                xyz_points=xyz_points,
+                bin_axis="y",
+                bins=[],
+                map_size=self.map_size,
+                resolution_in_cm=self.resolution_in_cm,
+                flip_row_col=True,
+            ),
+        )
+        assert counts.sum() == self.count_points(xyz_points, flip_row_col=True).sum()
+
+
+if __name__ == "__main__":
+    TestDepthFrameToWorldSpaceXYZ().test_batched_depth_frames()
+    TestDepthFrameToWorldSpaceXYZ().test_masked_depth_frame()
+    TestProjectPointCloudToMap().test_projection()
+    TestProjectPointCloudToMap().test_single_cloud_and_no_bins()
@@ -0,0 +1,216 @@
+import numpy as np
+
+from allenact.embodiedai.mapping.mapping_utils.map_builders import (
+    BinnedPointCloudMapBuilder,
+    ObjectHull2d,
+    SemanticMapBuilder,
+    TiledMap,
+)
+
+
+class TestTiledMap(object):
+    def test_tiled_map(self):
+        rng = np.random.RandomState(0)
+        shape = (50, 70, 3)
+        tiled = TiledMap(shape=shape, dtype=np.float32, tile_size=16)
+        dense = np.zeros(shape, dtype=np.float32)
+
+        for _ in range(5):
+            update = np.zeros(shape)
+            r, c = rng.randint(0, 40), rng.randint(0, 60)
+            update[r : r + 10, c : c + 10] = rng.randint(0, 3, (10, 10, 3))
+            tiled.add_(update)
+            dense += update
+            assert np.array_equal(tiled.to_dense(), dense)
+
+        # Only touched tiles are allocated, including smaller tiles at the border
+        assert 0 < len(tiled.tiles) < 4 * 5
+        assert tiled.nbytes < dense.nbytes
+        assert tiled.window(slice(3, 45), slice(60, 100)).shape == (42, 10, 3)
+        assert np.array_equal(
+            tiled.window(slice(3, 45), slice(60, 100)), dense[3:45, 60:]
+        )
+        assert np.array_equal(np.array(tiled), dense)
+
+        values = rng.rand(*shape[:2]) > 0.9
+        tiled.set_channel_(1, values)
+        dense[:, :, 1] = values
+        assert np.array_equal(tiled.to_dense(), dense)
+
+        mask = TiledMap(shape=shape[:2] + (1,), dtype=bool, tile_size=16)
+        mask.logical_or_(dense[:, :, :1] > 0)
+        assert np.array_equal(mask.to_dense(), dense[:, :, :1] > 0)
+
+        # Updates of a window of the map
+        num_tiles = len(tiled.tiles)
+        update = np.zeros((8, 12, 3))
+        update[2:4, 5:7] = 1.0
+        tiled.add_(update, window=(slice(30, 38), slice(58, 70)))
+        dense[30:38, 58:] += update
+        assert np.array_equal(tiled.to_dense(), dense)
+        assert len(tiled.tiles) <= num_tiles + 1
+
+        tiled.clear()
+        assert tiled.nbytes == 0 and not tiled.to_dense().any()
+
+
+class TestTiledMapBuilders(object):
+    map_kwargs = dict(
+        fov=90, vision_range_in_cm=40 * 5, map_size_in_cm=1050, resolution_in_cm=5
+    )
+
+    @staticmethod
+    def make_poses(rng: np.random.RandomState, num_steps: int):
+        for _ in range(num_steps):
+            yield dict(
+                depth_frame=rng.uniform(0.2, 3.0, (32, 32)).astype(np.float32),
+                camera_xyz=np.array(
+                    [rng.uniform(-1.0, 1.0), 0.9, rng.uniform(-1.0, 1.0)]
+                ),
+                camera_rotation=rng.choice([0.0, 90.0, 180.0, 270.0, 30.0]),
+                camera_horizon=rng.choice([0.0, 30.0]),
+            )
+
+    def test_binned_point_cloud_map_builder(self):
+        dense_builder = BinnedPointCloudMapBuilder(
+            height_bins=[0.02, 2], **self.map_kwargs
+        )
+        tiled_builder = BinnedPointCloudMapBuilder(
+            height_bins=[0.02, 2], tile_size_in_map_units=32, **self.map_kwargs
+        )
+        min_xyz = np.array([-5.0, 0.0, -5.0])
+        for builder in [dense_builder, tiled_builder]:
+            builder.reset(min_xyz)
+
+        for pose in self.make_poses(np.random.RandomState(0), 5):
+            dense_output = dense_builder.update(
+                **{**pose, "depth_frame": pose["depth_frame"].copy()}
+            )
+            tiled_output = tiled_builder.update(**pose)
+            for key in ["egocentric_update", "allocentric_update", "map"]:
+                assert np.array_equal(dense_output[key], tiled_output[key])
+
+        assert (
+            tiled_builder.binned_point_cloud_map.nbytes
+            < dense_builder.binned_point_cloud_map.nbytes / 4
+        )
+
+    def test_semantic_map_builder(self):
+        object_types = ["Bed", "Chair", "Table"]
+        dense_builder = SemanticMapBuilder(
+            ordered_object_types=object_types, **self.map_kwargs
+        )
+        tiled_builder = SemanticMapBuilder(
+            ordered_object_types=object_types,
+            tile_size_in_map_units=32,
+            **self.map_kwargs
+        )
+
+        min_xyz = np.array([-5.0, 0.0, -5.0])
+        object_hulls = [
+            ObjectHull2d(
+                object_id="{}|{}".format(ot, it),
+                object_type=ot,
+                hull_points=[[x, z], [x + 0.5, z], [x + 0.5, z + 0.8], [x, z + 0.8]],
+            )
+            for it, (ot, (x, z)) in enumerate(
+                zip(2 * object_types, np.random.RandomState(1).uniform(-2, 1.5, (6, 2)))
+            )
+        ]
+        for builder in [dense_builder, tiled_builder]:
+            builder.reset(min_xyz, object_hulls)
+        assert np.array_equal(
+            tiled_builder.ground_truth_semantic_map.to_dense(),
+            dense_builder.ground_truth_semantic_map,
+        )
+
+        for pose in self.make_poses(np.random.RandomState(0), 5):
+            dense_output = dense_builder.update(
+                **{**pose, "depth_frame": pose["depth_frame"].copy()}
+            )
+            tiled_output = tiled_builder.update(**pose)
+            for key in ["egocentric_mask", "explored_mask", "map"]:
+                assert np.array_equal(dense_output[key], tiled_output[key])
+            # The egocentric update is only sampled from the window of the map within
+            # the agent's vision range (up to rounding)
+            assert np.allclose(
+                dense_output["egocentric_update"],
+                tiled_output["egocentric_update"],
+                atol=1e-4,
+            )
+
+    def test_ego_only(self):
+        object_types = ["Bed", "Chair"]
+        min_xyz = np.array([-5.0, 0.0, -5.0])
+        object_hulls = [
+            ObjectHull2d(
+                object_id="Bed|0",
+                object_type="Bed",
+                hull_points=[[0.0, 0.0], [0.5, 0.0], [0.5, 0.8], [0.0, 0.8]],
+            )
+        ]
+        for tile_size in [None, 32]:
+            builders = [
+                BinnedPointCloudMapBuilder(
+                    height_bins=[0.02, 2],
+                    tile_size_in_map_units=tile_size,
+                    **self.map_kwargs
+                )
+                for _ in range(2)
+            ]
+            for builder in builders:
+                builder.reset(min_xyz)
+            semantic_builders = [
+                SemanticMapBuilder(
+                    ordered_object_types=object_types,
+                    tile_size_in_map_units=tile_size,
+                    **self.map_kwargs
+                )
+                for _ in range(2)
+            ]
+            for builder in semantic_builders:
+                builder.reset(min_xyz, object_hulls)
+
+            for pose in self.make_poses(np.random.RandomState(2), 3):
+                outputs = [
+                    builder.update(
+                        **{**pose, "depth_frame": pose["depth_frame"].copy()},
+                        ego_only=ego_only
+                    )
+                    for builder, ego_only in zip(builders, [True, False])
+                ]
+                assert list(outputs[0].keys()) == ["egocentric_update"]
+                assert np.array_equal(
+                    outputs[0]["egocentric_update"], outputs[1]["egocentric_update"]
+                )
+
+                outputs = [
+                    builder.update(
+                        **{**pose, "depth_frame": pose["depth_frame"].copy()},
+                        ego_only=ego_only
+                    )
+                    for builder, ego_only in zip(semantic_builders, [True, False])
+                ]
+                assert sorted(outputs[0].keys()) == [
+                    "egocentric_mask",
+                    "egocentric_update",
+                ]
+                for key in outputs[0]:
+                    assert np.array_equal(outputs[0][key], outputs[1][key])
+
+            # The maps are still updated
+            assert np.array_equal(
+                np.array(builders[0].binned_point_cloud_map),
+                np.array(builders[1].binned_point_cloud_map),
+            )
+            assert np.array_equal(
+                np.array(semantic_builders[0].explored_mask),
+                np.array(semantic_builders[1].explored_mask),
+            )
+
+
+if __name__ == "__main__":
+    TestTiledMap().test_tiled_map()
+    TestTiledMapBuilders().test_binned_point_cloud_map_builder()
+    TestTiledMapBuilders().test_semantic_map_builder()
+    TestTiledMapBuilders().test_ego_only()
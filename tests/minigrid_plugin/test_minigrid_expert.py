@@ -0,0 +1,67 @@
+import networkx as nx
+from gym_minigrid.minigrid import DIR_TO_VEC
+
+from allenact_plugins.minigrid_plugin.minigrid_environments import FastCrossing
+from allenact_plugins.minigrid_plugin.minigrid_tasks import MiniGridTask
+
+
+class TestMiniGridExpert(object):
+    @staticmethod
+    def make_task(seed: int, size: int = 9, num_crossings: int = 2) -> MiniGridTask:
+        env = FastCrossing(size=size, num_crossings=num_crossings)
+        env.seed(seed)
+        env.reset()
+        return MiniGridTask(env=env, sensors=[], task_info={}, max_steps=100)
+
+    def test_expert_table_matches_graph(self):
+        for seed in range(5):
+            task = self.make_task(seed)
+            distances, actions = task.generate_expert_table()
+            graph = task.generate_graph()
+            path_lengths = nx.shortest_path_length(graph, target="unified_goal")
+
+            for state in graph.nodes():
+                if state == "unified_goal" or graph.nodes[state]["type"] not in [
+                    "empty",
+                    "goal",
+                ]:
+                    continue
+                x, y, rot = state
+                if state not in path_lengths:
+                    assert distances[x, y, rot] == -1 and actions[x, y, rot] == -1
+                    continue
+
+                # The graph counts one extra edge to "unified_goal"
+                assert distances[x, y, rot] == path_lengths[state] - 1
+                if distances[x, y, rot] == 0:
+                    continue
+
+                action = task.class_action_names()[actions[x, y, rot]]
+                if action == "forward":
+                    dx, dy = DIR_TO_VEC[rot]
+                    next_state = (x + dx, y + dy, rot)
+                else:
+                    next_state = (x, y, (rot + (1 if action == "right" else -1)) % 4)
+                assert graph.get_edge_data(state, next_state)["action"] == action
+                assert path_lengths[next_state] == path_lengths[state] - 1
+
+    def test_expert_reaches_goal(self):
+        for seed in range(5):
+            task = self.make_task(seed)
+            distances, _ = task.expert_table
+            x, y = task.env.agent_pos
+            expected_num_steps = distances[x, y, task.env.agent_dir]
+
+            while not task.is_done():
+                action, expert_was_successful = task.query_expert()
+                assert expert_was_successful
+                task.step(action)
+
+            assert task.cumulative_reward > 0
+            assert task.num_steps_taken() == expected_num_steps
+            assert task.closest_agent_has_been_to_goal == 2
+
+
+if __name__ == "__main__":
+    TestMiniGridExpert().test_expert_table_matches_graph()
+    TestMiniGridExpert().test_expert_reaches_goal()
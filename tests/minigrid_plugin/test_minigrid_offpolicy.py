@@ -0,0 +1,104 @@
+import random
+import tempfile
+
+import blosc
+import numpy as np
+import torch
+from gym_minigrid.minigrid import MiniGridEnv
+
+from allenact_plugins.minigrid_plugin.minigrid_offpolicy import (
+    ExpertTrajectoryIterator,
+    MemmapExpertTrajectoryIterator,
+    convert_demos_to_memmap,
+)
+
+
+class TestMemmapExpertTrajectoryIterator(object):
+    @staticmethod
+    def make_demos(num_demos: int = 12):
+        rng = np.random.RandomState(0)
+        missions = ["go to the red ball", "pick up the blue key"]
+        demos = []
+        for it in range(num_demos):
+            # Lengths increase with the index of demonstrations, so that both
+            # iterators cluster them alike
+            length = 2 + it // 2
+            images = rng.randint(0, 11, size=(length, 7, 7, 3)).astype(np.uint8)
+            demos.append(
+                (
+                    missions[it % 2],
+                    blosc.pack_array(images),
+                    rng.randint(0, 4, size=length).tolist(),
+                    [MiniGridEnv.Actions(a) for a in rng.randint(0, 3, size=length)],
+                )
+            )
+        return demos
+
+    def test_memmap_batches_match(self):
+        demos = self.make_demos()
+        with tempfile.TemporaryDirectory() as path:
+            convert_demos_to_memmap(demos, path)
+
+            for kwargs in [
+                dict(nrollouts=3, rollout_len=4, instr_len=5),
+                dict(nrollouts=2, rollout_len=3, instr_len=None),
+                dict(
+                    nrollouts=2,
+                    rollout_len=5,
+                    instr_len=3,
+                    restrict_max_steps_in_dataset=30,
+                    num_data_length_clusters=3,
+                ),
+                dict(
+                    nrollouts=2,
+                    rollout_len=2,
+                    instr_len=5,
+                    current_worker=1,
+                    num_workers=2,
+                ),
+            ]:
+                random.seed(0)
+                expert_batches = list(ExpertTrajectoryIterator(data=demos, **kwargs))
+                assert len(expert_batches) > 0
+
+                for num_prefetch_batches in [0, 2]:
+                    random.seed(0)
+                    iterator = MemmapExpertTrajectoryIterator(
+                        path=path, num_prefetch_batches=num_prefetch_batches, **kwargs
+                    )
+                    memmap_batches = list(iterator)
+                    iterator.close()
+
+                    assert len(memmap_batches) == len(expert_batches)
+                    for expert_batch, memmap_batch in zip(
+                        expert_batches, memmap_batches
+                    ):
+                        assert expert_batch.keys() == memmap_batch.keys()
+                        for key in expert_batch:
+                            assert expert_batch[key].shape == memmap_batch[key].shape
+                            assert torch.equal(
+                                expert_batch[key],
+                                memmap_batch[key].to(expert_batch[key].dtype),
+                            )
+
+    def test_close(self):
+        with tempfile.TemporaryDirectory() as path:
+            convert_demos_to_memmap(self.make_demos(), path)
+            iterator = MemmapExpertTrajectoryIterator(
+                path=path, nrollouts=2, rollout_len=2, instr_len=None
+            )
+            next(iterator)
+            thread = iterator._prefetcher._thread
+            assert thread.is_alive()
+            iterator.close()
+            assert not thread.is_alive()
+            try:
+                next(iterator)
+                assert False, "Closed iterator should raise `StopIteration`."
+            except StopIteration:
+                pass
+
+
+if __name__ == "__main__":
+    TestMemmapExpertTrajectoryIterator().test_memmap_batches_match()
+    TestMemmapExpertTrajectoryIterator().test_close()
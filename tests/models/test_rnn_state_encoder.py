@@ -0,0 +1,64 @@
+import itertools
+
+import torch
+
+from allenact.embodiedai.models.basic_models import RNNStateEncoder
+
+
+class TestRNNStateEncoder(object):
+    @staticmethod
+    def _inputs(encoder: RNNStateEncoder, nsteps: int, nsamplers: int, nagents: int):
+        agent_dims = (nagents,) if nagents > 1 else ()
+        x = torch.randn(nsteps, nsamplers, *agent_dims, 8)
+        hidden_states = torch.randn(
+            encoder.num_recurrent_layers, nsamplers, *agent_dims, 16
+        )
+        masks = (torch.rand(nsteps, nsamplers, 1) > 0.2).float()
+        masks[:, 0] = 1.0  # a sampler without any episode boundary
+        masks[:, 1] = 0.0  # a sampler with an episode boundary at every step
+        return x, hidden_states, masks
+
+    def test_packed_seq_forward(self):
+        torch.manual_seed(12345)
+        for rnn_type, trainable, nagents in itertools.product(
+            ["GRU", "LSTM"], [False, True], [1, 2]
+        ):
+            encoder = RNNStateEncoder(
+                input_size=8,
+                hidden_size=16,
+                num_layers=2,
+                rnn_type=rnn_type,
+                trainable_masked_hidden_state=trainable,
+            )
+            x, hidden_states, masks = self._inputs(
+                encoder, nsteps=12, nsamplers=5, nagents=nagents
+            )
+
+            outputs, final_hidden = encoder.seq_forward(x, hidden_states, masks)
+            packed_outputs, packed_final_hidden = encoder.packed_seq_forward(
+                x, hidden_states, masks
+            )
+
+            assert packed_outputs.shape == outputs.shape
+            assert packed_final_hidden.shape == final_hidden.shape
+            assert torch.allclose(packed_outputs, outputs, atol=1e-6)
+            assert torch.allclose(packed_final_hidden, final_hidden, atol=1e-6)
+
+    def test_packed_forward_dispatch(self):
+        torch.manual_seed(12345)
+        encoder = RNNStateEncoder(input_size=8, hidden_size=16, packed_sequences=True)
+        x, hidden_states, masks = self._inputs(
+            encoder, nsteps=10, nsamplers=4, nagents=1
+        )
+
+        outputs, final_hidden = encoder(x, hidden_states, masks)
+        expected_outputs, expected_final_hidden = encoder.seq_forward(
+            x, hidden_states, masks
+        )
+        assert torch.allclose(outputs, expected_outputs, atol=1e-6)
+        assert torch.allclose(final_hidden, expected_final_hidden, atol=1e-6)
+
+
+if __name__ == "__main__":
+    TestRNNStateEncoder().test_packed_seq_forward()  # type:ignore
+    TestRNNStateEncoder().test_packed_forward_dispatch()  # type:ignore
@@ -0,0 +1,68 @@
+import os
+import tempfile
+
+import numpy as np
+
+from allenact_plugins.robothor_plugin.robothor_episode_store import (
+    EpisodeStore,
+    episode_store_path,
+    load_episode_store,
+)
+
+
+class TestEpisodeStore(object):
+    @staticmethod
+    def make_episodes():
+        return {
+            "FloorPlan_Train1_1": [
+                {
+                    "id": "FloorPlan_Train1_1_{}_{}".format(object_type, it),
+                    "object_type": object_type,
+                    "initial_position": {"x": 0.25 * it, "y": 0.9, "z": -1.5},
+                    "shortest_path_length": 1.5 + it,
+                }
+                for it, object_type in enumerate(["Mug", "Television", "Mug"])
+            ],
+            "FloorPlan_Train1_2": [],
+            "FloorPlan_Train2_1": [
+                {"id": "FloorPlan_Train2_1_{}".format(it), "target_position": "é"}
+                for it in range(4)
+            ],
+        }
+
+    def test_write_load(self):
+        episodes = self.make_episodes()
+        with tempfile.TemporaryDirectory() as tmpdir:
+            assert load_episode_store(tmpdir) is None
+
+            EpisodeStore.write(episodes.items(), episode_store_path(tmpdir))
+            assert os.path.isdir(os.path.join(tmpdir, "episodes_store"))
+
+            for mmap in [True, False]:
+                store = EpisodeStore.load(episode_store_path(tmpdir), mmap=mmap)
+                assert isinstance(store.records, np.memmap) == mmap
+                assert store.scenes == list(episodes.keys())
+                assert store.scene_object_types == {
+                    "FloorPlan_Train1_1": ["Mug", "Television"],
+                    "FloorPlan_Train1_2": [],
+                    "FloorPlan_Train2_1": [],
+                }
+                for scene, scene_episodes in episodes.items():
+                    assert store.num_episodes(scene) == len(scene_episodes)
+                    lazy_episodes = store.scene_episodes(scene)
+                    assert len(lazy_episodes) == len(scene_episodes)
+                    assert list(lazy_episodes) == scene_episodes
+                    assert lazy_episodes[::-1] == scene_episodes[::-1]
+
+                try:
+                    store.episode("FloorPlan_Train1_1", 3)
+                    assert False, "Out of range episodes should raise `IndexError`."
+                except IndexError:
+                    pass
+                del store
+
+            assert load_episode_store(tmpdir).scenes == list(episodes.keys())
+
+
+if __name__ == "__main__":
+    TestEpisodeStore().test_write_load()
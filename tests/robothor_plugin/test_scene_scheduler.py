@@ -0,0 +1,91 @@
+import itertools
+import random
+import threading
+
+from allenact_plugins.robothor_plugin.robothor_scene_scheduler import (
+    SceneScheduler,
+    ScenePrefetcher,
+)
+
+
+class TestSceneScheduler(object):
+    scenes = ["FloorPlan_Train{}_1".format(it) for it in range(1, 6)]
+
+    def test_scene_period(self):
+        random.seed(0)
+        scheduler = SceneScheduler(scenes=self.scenes, scene_period=3)
+        sampled = [scheduler.next_scene() for _ in range(3 * len(self.scenes) * 2)]
+
+        batches = [list(batch) for _, batch in itertools.groupby(sampled)]
+        assert all(len(batch) == 3 for batch in batches)
+        # Every scene is visited once per pass
+        for it in range(0, len(batches), len(self.scenes)):
+            passed = [batch[0] for batch in batches[it : it + len(self.scenes)]]
+            assert sorted(passed) == sorted(self.scenes)
+
+        scheduler.scene_period = "manual"
+        scene = scheduler.next_scene()
+        assert all(scheduler.next_scene() == scene for _ in range(5))
+        assert scheduler.next_scene(force_advance_scene=True) != scene
+
+    def test_staggered_scene_switches(self):
+        SceneScheduler._num_staggered_schedulers = 0
+        period = 20
+        schedulers = [
+            SceneScheduler(
+                scenes=self.scenes, scene_period=period, stagger_scene_switches=True
+            )
+            for _ in range(4)
+        ]
+
+        switch_steps = []
+        for scheduler in schedulers:
+            sampled = [scheduler.next_scene() for _ in range(2 * period)]
+            steps = [it for it in range(1, len(sampled)) if sampled[it] != sampled[0]]
+            switch_steps.append(steps[0])
+            # Later scenes are visited for a full period
+            assert sampled[steps[0] : steps[0] + period] == [sampled[steps[0]]] * period
+
+        assert len(set(switch_steps)) == len(schedulers)
+        assert switch_steps[0] == period
+
+        # Offsets are kept when resetting
+        schedulers[1].reset()
+        sampled = [schedulers[1].next_scene() for _ in range(period)]
+        assert sampled.index(sampled[-1]) == switch_steps[1]
+
+
+class TestScenePrefetcher(object):
+    def test_prefetch(self):
+        calls = []
+        release = threading.Event()
+
+        def prefetch_fn(scene):
+            release.wait(timeout=10)
+            calls.append(scene)
+            if scene == "bad":
+                raise ValueError("Failed to load {}".format(scene))
+
+        prefetcher = ScenePrefetcher(prefetch_fn)
+        prefetcher.prefetch("A")
+        prefetcher.prefetch("A")
+        assert calls == []
+        release.set()
+        prefetcher.wait("A")
+        assert calls == ["A"]
+
+        prefetcher.prefetch("bad")
+        prefetcher.wait("bad")  # Failures are only logged
+        prefetcher.wait("never prefetched")
+
+        prefetcher.forget("A")
+        prefetcher.prefetch("A")
+        prefetcher.wait("A")
+        assert calls == ["A", "bad", "A"]
+        prefetcher.close()
+
+
+if __name__ == "__main__":
+    TestSceneScheduler().test_scene_period()
+    TestSceneScheduler().test_staggered_scene_switches()
+    TestScenePrefetcher().test_prefetch()
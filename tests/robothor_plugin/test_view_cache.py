@@ -0,0 +1,83 @@
+import os
+import pickle
+import tempfile
+from types import SimpleNamespace
+
+import numpy as np
+
+from allenact.utils.cache_utils import pos_to_str_for_cache
+from allenact_plugins.robothor_plugin.robothor_view_cache import (
+    CompactViewCache,
+    available_view_cache_scenes,
+)
+
+
+class TestCompactViewCache(object):
+    @staticmethod
+    def make_view_cache(with_depth: bool = True):
+        rng = np.random.RandomState(0)
+        view_cache = {}
+        for ix in range(3):
+            for iz in range(2):
+                pos = pos_to_str_for_cache({"x": 0.25 * ix, "y": 0.9, "z": 0.25 * iz})
+                view_cache[pos] = {
+                    rot: SimpleNamespace(
+                        frame=rng.randint(0, 256, (4, 5, 3)).astype(np.uint8),
+                        depth_frame=rng.rand(4, 5).astype(np.float32)
+                        if with_depth
+                        else None,
+                        metadata={
+                            "sceneName": "FloorPlan_Train1_1",
+                            "agent": {"rotation": {"y": rot}},
+                            "objects": [{"objectType": "Mug", "visible": ix == 1}],
+                        },
+                    )
+                    for rot in [0, 90.0, 180, 270.0]
+                }
+        return view_cache
+
+    def test_write_load(self):
+        for with_depth in [True, False]:
+            view_cache = self.make_view_cache(with_depth=with_depth)
+            with tempfile.TemporaryDirectory() as tmpdir:
+                CompactViewCache.write(
+                    view_cache, os.path.join(tmpdir, "FloorPlan_Train1_1")
+                )
+                with open(os.path.join(tmpdir, "FloorPlan_Train1_2.pkl"), "wb") as f:
+                    pickle.dump({}, f)
+                assert available_view_cache_scenes(tmpdir) == [
+                    "FloorPlan_Train1_1",
+                    "FloorPlan_Train1_2",
+                ]
+
+                for mmap in [True, False]:
+                    cache = CompactViewCache.load(
+                        os.path.join(tmpdir, "FloorPlan_Train1_1"), mmap=mmap
+                    )
+                    assert isinstance(cache.frames, np.memmap) == mmap
+                    assert cache.scene_name == "FloorPlan_Train1_1"
+                    assert cache.num_views == 4 * len(view_cache)
+                    assert list(cache.keys()) == list(view_cache.keys())
+                    assert cache.reachable_points[1] == {"x": 0.0, "y": 0.9, "z": 0.25}
+                    assert "not a position" not in cache
+
+                    for pos, rotations in view_cache.items():
+                        assert pos in cache
+                        assert list(cache[pos].keys()) == [0.0, 90.0, 180.0, 270.0]
+                        for rot, event in rotations.items():
+                            cached_event = cache[pos][float(rot)]
+                            assert np.array_equal(cached_event.frame, event.frame)
+                            if with_depth:
+                                assert np.array_equal(
+                                    cached_event.depth_frame, event.depth_frame
+                                )
+                            else:
+                                assert cached_event.depth_frame is None
+                            assert cached_event.metadata == event.metadata
+                            # Repeated queries of the same view reuse the event
+                            assert cache[pos][int(rot)] is cached_event
+                    del cache
+
+
+if __name__ == "__main__":
+    TestCompactViewCache().test_write_load()
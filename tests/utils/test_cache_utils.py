@@ -0,0 +1,229 @@
+import os
+import random
+import tempfile
+
+import numpy as np
+import pytest
+
+from allenact.utils import cache_utils
+
+
+class TestCachePositionIndex(object):
+    def test_nearest(self):
+        rng = np.random.RandomState(3)
+        points = rng.rand(200, 3) * 10
+        cache = cache_utils.PositionIndexedCache(
+            (cache_utils.pos_to_str_for_cache(dict(zip("xyz", map(float, p)))), {})
+            for p in points
+        )
+        for query in rng.rand(50, 3) * 12 - 1:
+            query = dict(zip("xyz", map(float, query)))
+            expected = cache_utils.str_to_pos_for_cache(
+                list(cache.keys())[
+                    np.abs(points - [query["x"], query["y"], query["z"]])
+                    .sum(1)
+                    .argmin()
+                ]
+            )
+            assert cache_utils.find_nearest_point_in_cache(cache, query) == expected
+            # Plain dictionaries are scanned
+            assert (
+                cache_utils.find_nearest_point_in_cache(dict(cache), query) == expected
+            )
+        index = cache.position_index
+
+        # Indices are only rebuilt once positions are added or removed
+        cache[next(iter(cache))] = {"Mug": {"distance": 1.0}}
+        assert cache.position_index is index
+        new_point = {"x": 100.0, "y": 100.0, "z": 100.0}
+        cache[cache_utils.pos_to_str_for_cache(new_point)] = {}
+        assert cache_utils.find_nearest_point_in_cache(cache, new_point) == new_point
+        assert cache.position_index is not index
+        del cache[cache_utils.pos_to_str_for_cache(new_point)]
+        assert cache_utils.find_nearest_point_in_cache(cache, new_point) != new_point
+
+        cache.clear()
+        assert cache_utils.find_nearest_point_in_cache(cache, new_point) == {}
+        assert cache_utils.find_nearest_point_in_cache({}, new_point) == {}
+
+
+class TestGridDistanceCache(object):
+    object_types = ["Television", "Mug"]
+
+    def make_json_cache(self, seed: int = 1):
+        rng = random.Random(seed)
+        positions = [
+            {"x": 0.25 * ix, "y": 0.9009997, "z": 0.25 * iz}
+            for ix in range(-4, 5)
+            for iz in range(-3, 4)
+            if rng.random() < 0.8
+        ]
+        cache = {}
+        for pos in positions:
+            targets = {}
+            for target in positions:
+                if rng.random() < 0.7:
+                    targets[cache_utils.pos_to_str_for_cache(target)] = {
+                        "distance": rng.random() * 10
+                    }
+            for object_type in self.object_types:
+                if rng.random() < 0.9:
+                    targets[object_type] = {"distance": rng.random() * 10}
+            cache[cache_utils.pos_to_str_for_cache(pos)] = targets
+        return cache, positions
+
+    def check_matches_json(self, grid_cache, json_cache, positions):
+        for pos in positions:
+            pos_str = cache_utils.pos_to_str_for_cache(pos)
+            for target in positions:
+                target_str = cache_utils.pos_to_str_for_cache(target)
+                if target_str in json_cache[pos_str]:
+                    assert np.isclose(
+                        grid_cache.get_distance(pos, target),
+                        cache_utils.get_distance(json_cache, pos, target),
+                    )
+
+            off_grid_pos = {"x": pos["x"] - 0.1, "y": pos["y"], "z": pos["z"] - 0.05}
+            for object_type in self.object_types:
+                try:
+                    expected = cache_utils.get_distance_to_object(
+                        json_cache, off_grid_pos, object_type
+                    )
+                except RuntimeError:
+                    continue
+                assert np.isclose(
+                    grid_cache.get_distance_to_object(off_grid_pos, object_type),
+                    expected,
+                )
+
+    def test_from_json_cache(self):
+        json_cache, positions = self.make_json_cache()
+        grid_cache = cache_utils.GridDistanceCache.from_json_cache(json_cache)
+
+        assert grid_cache.num_sources == len(positions)
+        assert grid_cache.object_types == self.object_types
+        for it, pos in enumerate(positions):
+            assert grid_cache.point_index(pos) == it
+
+        self.check_matches_json(grid_cache, json_cache, positions)
+
+        # Positions far outside of the grid fall back to the nearest cached position
+        far_pos = dict(positions[0], x=positions[0]["x"] - 100)
+        nearest = cache_utils.find_nearest_point_in_cache(json_cache, far_pos)
+        for target in positions:
+            target_str = cache_utils.pos_to_str_for_cache(target)
+            if target_str in json_cache[cache_utils.pos_to_str_for_cache(nearest)]:
+                assert np.isclose(
+                    grid_cache.get_distance(far_pos, target),
+                    cache_utils.get_distance(json_cache, nearest, target),
+                )
+
+    def test_off_grid_object_distance(self):
+        json_cache = {"1.0_0.9_1.0": {"Chair": {"distance": 2.0}}}
+        grid_cache = cache_utils.GridDistanceCache.from_json_cache(json_cache)
+
+        # None of the grid corners around these positions are cached
+        for pos in [
+            {"x": 3.1, "y": 0.9, "z": 3.1},
+            {"x": -2.6, "y": 0.9, "z": 1.1},
+        ]:
+            expected = cache_utils.get_distance_to_object(json_cache, pos, "Chair")
+            assert expected == 2.0
+            assert grid_cache.get_distance_to_object(pos, "Chair") == expected
+
+        for cache_lookup in [
+            lambda pos: cache_utils.get_distance_to_object(json_cache, pos, "Mug"),
+            lambda pos: grid_cache.get_distance_to_object(pos, "Mug"),
+        ]:
+            with pytest.raises(RuntimeError):
+                cache_lookup({"x": 3.1, "y": 0.9, "z": 3.1})
+
+    def test_save_load(self):
+        json_cache, positions = self.make_json_cache(seed=2)
+        grid_cache = cache_utils.GridDistanceCache.from_json_cache(json_cache)
+
+        with tempfile.TemporaryDirectory() as tmpdir:
+            scene_dir = os.path.join(tmpdir, "FloorPlan_Train1_1")
+            grid_cache.save(scene_dir)
+            for mmap in [True, False]:
+                loaded = cache_utils.GridDistanceCache.load(scene_dir, mmap=mmap)
+                assert isinstance(loaded.point_distances, np.memmap) == mmap
+                assert loaded.grid_origin == grid_cache.grid_origin
+                assert loaded.object_types == grid_cache.object_types
+                self.check_matches_json(loaded, json_cache, positions)
+                del loaded
+
+
+class TestDynamicDistanceCache(object):
+    @staticmethod
+    def counting_distance(calls):
+        def distance(pos, target):
+            calls.append((pos["x"], target))
+            return float(pos["x"])
+
+        return distance
+
+    @staticmethod
+    def pos(x):
+        return {"x": float(x), "y": 0.0, "z": 0.0}
+
+    def test_lru(self):
+        calls = []
+        distance = self.counting_distance(calls)
+        cache = cache_utils.DynamicDistanceCache(rounding=1, max_size=3)
+
+        assert cache.find_distance("A", self.pos(0), "Mug", distance) == 0.0
+        assert cache.find_distance("A", self.pos(1), "Mug", distance) == 1.0
+        assert cache.find_distance("B", self.pos(2), "Mug", distance) == 2.0
+        assert cache.find_distance("A", self.pos(0), "Mug", distance) == 0.0
+        assert len(calls) == 3 and cache.hits == 1 and cache.size == 3
+
+        # Entries of the least recently used scene ("B") are evicted first
+        cache.find_distance("A", self.pos(3), "Mug", distance)
+        assert "B" not in cache.cache and cache.size == 3
+        cache.find_distance("A", self.pos(4), "Mug", distance)
+        assert [key[0] for key in cache.cache["A"]] == [
+            cache._pos_to_str(self.pos(x)) for x in [0, 3, 4]
+        ]
+
+        cache.invalidate("A")
+        assert cache.size == 0 and len(cache.cache) == 0
+        cache.find_distance("A", self.pos(0), "Mug", distance)
+        cache.invalidate()
+        assert cache.size == 0 and len(cache.cache) == 0
+
+    def test_shared_and_snapshot(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            calls = []
+            distance = self.counting_distance(calls)
+            shared_path = os.path.join(tmpdir, "distances.sqlite3")
+            caches = [
+                cache_utils.DynamicDistanceCache(
+                    rounding=1, shared_cache_path=shared_path
+                )
+                for _ in range(2)
+            ]
+
+            for cache in caches:
+                for x in range(5):
+                    assert cache.find_distance("A", self.pos(x), "Mug", distance) == x
+            assert len(calls) == 5
+            assert caches[1].shared_hits == 5 and caches[1].misses == 0
+
+            snapshot_path = os.path.join(tmpdir, "distances.json.gz")
+            caches[0].save_snapshot(snapshot_path)
+            warm_cache = cache_utils.DynamicDistanceCache(rounding=1, max_size=3)
+            warm_cache.load_snapshot(snapshot_path)
+            assert warm_cache.size == 3
+            for x in range(2, 5):
+                warm_cache.find_distance("A", self.pos(x), "Mug", distance)
+            assert len(calls) == 5 and warm_cache.hits == 3
+
+
+if __name__ == "__main__":
+    TestCachePositionIndex().test_nearest()
+    TestGridDistanceCache().test_from_json_cache()
+    TestGridDistanceCache().test_off_grid_object_distance()
+    TestGridDistanceCache().test_save_load()
+    TestDynamicDistanceCache().test_lru()
+    TestDynamicDistanceCache().test_shared_and_snapshot()
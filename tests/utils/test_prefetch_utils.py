@@ -0,0 +1,130 @@
+import gc
+import threading
+import weakref
+
+import torch
+
+from allenact.utils.prefetch_utils import PrefetchingIterator, pin_memory_recursively
+
+
+class TestPrefetchingIterator(object):
+    @staticmethod
+    def batches(num_batches: int):
+        for it in range(num_batches):
+            yield {"x": torch.full((2, 3), float(it)), "meta": [torch.tensor(it), it]}
+
+    def test_order_and_exhaustion(self):
+        iterator = PrefetchingIterator(self.batches(10), num_prefetch=3, device="cpu")
+        for it, batch in enumerate(iterator):
+            assert torch.all(batch["x"] == it)
+            assert batch["meta"][0].item() == it and batch["meta"][1] == it
+        assert it == 9
+
+        try:
+            next(iterator)
+            assert False, "Exhausted iterator should raise `StopIteration`."
+        except StopIteration:
+            pass
+
+    def test_exceptions(self):
+        def failing_batches():
+            yield from self.batches(2)
+            raise ValueError("Failed to load batch.")
+
+        iterator = PrefetchingIterator(failing_batches(), num_prefetch=2)
+        assert torch.all(next(iterator)["x"] == 0)
+        assert torch.all(next(iterator)["x"] == 1)
+        try:
+            next(iterator)
+            assert False, "Exceptions should be propagated."
+        except ValueError:
+            pass
+
+    def test_prefetch_and_close(self):
+        num_generated = [0]
+        generated = threading.Semaphore(0)
+
+        def counting_batches():
+            while True:
+                num_generated[0] += 1
+                generated.release()
+                yield num_generated[0]
+
+        iterator = PrefetchingIterator(counting_batches(), num_prefetch=2)
+        assert next(iterator) == 1
+
+        # Two batches are prepared ahead (plus one waiting to be enqueued)
+        for _ in range(4):
+            assert generated.acquire(timeout=10)
+        assert not generated.acquire(timeout=0.2)
+
+        iterator.close()
+        assert iterator._thread is None and num_generated[0] == 4
+        try:
+            next(iterator)
+            assert False, "Closed iterator should raise `StopIteration`."
+        except StopIteration:
+            pass
+
+    def test_close_wrapped_iterator(self):
+        class ClosableBatches(object):
+            def __init__(self):
+                self.closed = False
+
+            def __iter__(self):
+                return self
+
+            def __next__(self):
+                return 0
+
+            def close(self):
+                self.closed = True
+
+        batches = ClosableBatches()
+        iterator = PrefetchingIterator(batches, num_prefetch=2)
+        assert next(iterator) == 0
+        iterator.close()
+        assert batches.closed
+
+        # Generators are closed too (also if their thread never started)
+        generator = self.batches(3)
+        PrefetchingIterator(generator).close()
+        try:
+            next(generator)
+            assert False, "Closed generator should raise `StopIteration`."
+        except StopIteration:
+            pass
+
+    def test_garbage_collection(self):
+        def endless_batches():
+            while True:
+                yield 0
+
+        iterator = PrefetchingIterator(endless_batches(), num_prefetch=2)
+        assert next(iterator) == 0
+        thread = iterator._thread
+        reference = weakref.ref(iterator)
+
+        # The worker thread does not keep its iterator alive
+        del iterator
+        gc.collect()
+        assert reference() is None
+        thread.join(timeout=10)
+        assert not thread.is_alive()
+
+    def test_pin_memory_recursively(self):
+        batch = {"x": torch.ones(2), "y": (torch.zeros(1), "label")}
+        if not torch.cuda.is_available():
+            return
+        pinned = pin_memory_recursively(batch)
+        assert pinned["x"].is_pinned() and pinned["y"][0].is_pinned()
+        assert pinned["y"][1] == "label"
+
+
+if __name__ == "__main__":
+    TestPrefetchingIterator().test_order_and_exhaustion()
+    TestPrefetchingIterator().test_exceptions()
+    TestPrefetchingIterator().test_prefetch_and_close()
+    TestPrefetchingIterator().test_close_wrapped_iterator()
+    TestPrefetchingIterator().test_garbage_collection()
+    TestPrefetchingIterator().test_pin_memory_recursively()
@@ -131,9 +131,53 @@ class TestSpaces(object):
         assert len(al[0]["tuple"]) == 2
         assert isinstance(al[0]["scalar"], int)
 
+    def test_compiled(self):
+        spaces = [
+            gyms.Discrete(6),
+            gyms.Box(-1, 1, (2, 3)),
+            # NavToPartner (`TupleCategoricalDistr`) action space
+            gyms.Tuple([gyms.Discrete(3), gyms.Discrete(3)]),
+            # `SequentialDistr` action space (see `minigrid_tutorial_conds`)
+            gyms.Dict({"higher": gyms.Discrete(2), "lower": gyms.Discrete(4)}),
+            gyms.Tuple([gyms.Box(-1, 1, ()), gyms.Tuple([gyms.Discrete(2)])]),
+            self.space,  # not compilable, uses fallback
+        ]
+        for space in spaces:
+            compiled = su.CompiledSpace(space)
+            assert compiled.is_compiled == (space is not self.space)
+
+            samples = [
+                su.torch_point(space, space.sample()) for _ in range(5)
+            ]  # samplers
+            flattened = torch.stack(
+                [su.flatten(space, sample) for sample in samples], dim=0
+            ).unsqueeze(
+                0
+            )  # add step
+            assert torch.equal(
+                torch.stack(
+                    [compiled.flatten(sample) for sample in samples], dim=0
+                ).unsqueeze(0),
+                flattened,
+            )
+
+            assert self.same(
+                compiled.unflatten(flattened), su.unflatten(space, flattened)
+            )
+            assert self.same(
+                compiled.unflatten(flattened[0, 0]),
+                su.unflatten(space, flattened[0, 0]),
+            )
+
+            expected = su.action_list(space, flattened)
+            al = compiled.action_list(flattened)
+            assert al == expected
+            assert [type(a) for a in al] == [type(a) for a in expected]
+
 
 if __name__ == "__main__":
     TestSpaces().test_conversion()  # type:ignore
     TestSpaces().test_flatten()  # type:ignore
     TestSpaces().test_batched()  # type:ignore
     TestSpaces().test_tolist()  # type:ignore
+    TestSpaces().test_compiled()  # type:ignore